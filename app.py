@@ -1,59 +1,27 @@
 #!/usr/bin/env python
-"""Checks the configuration of various osx options."""
+"""Checks the configuration of various osx options.
 
+This is the command line interface; the checks themselves are run by `runner`.
+"""
+
+import os
 import sys
 import time
 import datetime
-from os.path import expanduser
 import re
-from subprocess import Popen, PIPE, STDOUT
-from warnings import warn
-import json
+import signal
 import const #const.py
-import prompt #prompt.py
+import history #history.py
+import remediation #remediation.py
+import cassette #cassette.py
+import runner #runner.py
+import governor #governor.py
+import multiuser #multiuser.py
+import fleet #fleet.py
+import daemon #daemon.py
 
 const.DEFAULT_OUTPUT_LOCATION = "~/Documents/"
 const.DEFAULT_CONFIG_FILE = "osx-config.json"
-const.WARN_FOR_RECOMMENDED = True #TODO: command line flag
-const.WARN_FOR_EXPERIMENTAL = True #TODO: command line flag
-const.FIX_RECOMMENDED_BY_DEFAULT = True #TODO: command line flag
-const.FIX_EXPERIMENTAL_BY_DEFAULT = False #TODO: command line flag
-const.LOG_DEBUG_ALWAYS = True #TODO: command line flag
-
-const.VERSION = "v1.1.0 (ivysaur)"
-
-const.API_FILENAME = './scripts/api.sh'
-
-const.COLORS = {
-    'HEADER': '\033[95m',
-    'OKBLUE': '\033[94m',
-    'OKGREEN': '\033[92m',
-    'WARNING': '\033[93m',
-    'RED': '\033[91m',
-    'FAIL': '\033[91m',
-    'ENDC': '\033[0m',
-    'BOLD': '\033[1m',
-    'UNDERLINE': '\033[4m'
-}
-
-const.PASSED_STR = const.COLORS['OKGREEN'] + "PASSED!" + const.COLORS['ENDC']
-const.FAILED_STR = const.COLORS['FAIL'] + "FAILED!" + const.COLORS['ENDC']
-const.SKIPPED_STR = const.COLORS['OKBLUE'] + "SKIPPED!" + const.COLORS['ENDC']
-const.NO_SUDO_STR = ("%s%s%s" %
-                     (const.COLORS['WARNING'],
-                      ("Insufficient privileges to perform this check. "
-                       "Skipping."),
-                      const.COLORS['ENDC']))
-const.RECOMMENDED_STR = ("%s%s%s" % (const.COLORS['BOLD'],
-                                     'RECOMMENDED',
-                                     const.COLORS['ENDC']))
-const.EXPERIMENTAL_STR = ("%s%s%s" % (const.COLORS['BOLD'],
-                                      'EXPERIMENTAL',
-                                      const.COLORS['ENDC']))
-
-const.SUDO_STR = ("%s%ssudo%s" %
-                  (const.COLORS['BOLD'], const.COLORS['RED'],
-                   const.COLORS['ENDC']))
 
 def get_timestamp():
     """Genereate a current timestamp that won't break a filename."""
@@ -63,534 +31,253 @@ def get_timestamp():
 
 const.LOG_FILE_NAME = 'osx-config-check_%s.log' % get_timestamp()
 const.LOG_FILE_LOC = const.DEFAULT_OUTPUT_LOCATION + const.LOG_FILE_NAME
-
-glob_check_num = 1
-
-#counters
-glob_pass_no_fix = 0
-glob_pass_after_fix = 0
-glob_fail_fix_fail = 0
-glob_fail_fix_skipped = 0
-glob_fail_fix_declined = 0
-glob_check_skipped = 0
-
-class CheckResult(object):
-    """Each test can have one of three results, informing the next step."""
-    explicit_pass = 1
-    explicit_fail = 2
-    no_pass = 3
-    all_skipped = 4
-
-def check_result_to_str(val):
-    """Convert enum to string representation"""
-    if val == CheckResult.explicit_pass:
-        return const.PASSED_STR
-    elif val == CheckResult.explicit_fail:
-        return const.FAILED_STR
-    elif val == CheckResult.no_pass:
-        return const.FAILED_STR
-    elif val == CheckResult.all_skipped:
-        return const.SKIPPED_STR
-    else:
-        raise ValueError
-
-class Confidence(object):
-    """Likelihood that a configuration will create negative side-effects.
-
-    A lower integer value indicates less likelihood that a configuration will
-    cause problems with applications.
-    """
-    required = 1
-    recommended = 2
-    experimental = 3
-
-class ConfigCheck(object):
-    """Encapsulates configuration to check in operating system."""
-    def __init__(self, tests, description, confidence, fix=None, sudo_fix=None,
-                 manual_fix=None):
-        """
-        Args:
-
-            tests (List[dict]): The ordered list of tests to be performed, each
-                a `dict` with these attributes including command_pass and/or
-                command_fail:
-                    * type (str): "exact match" or "regex match"
-                    * command (str)
-                    * command_pass (Optional[str])
-                    * command_fail (Optional[str])
-                    * case_sensitive (bool)
-            description (str): A human-readable description of the configuration
-                being checked.
-            confidence (str): "required", "recommended", or "experimental"
-            fix (Optional[str]): The command to run if the configuration fails
-                the check.
-            sudo_fix (Optional[str]): A version of `fix` that requests
-                administrative privileges from the operating system. This will
-                only be executed if `fix` does not produce the desired config
-                change.
-            manual_fix (Optional[str]): Instructions to output to the user to
-                manually remediate if a config cannot be fixed automatically.
-        """
-        assert isinstance(tests, list)
-        assert len(tests) > 0
-        for test in tests:
-            assert isinstance(test, dict), "%s" % str(test)
-            assert test['type'] in ('exact match', 'regex match')
-            assert 'command' in test
-            assert 'command_pass' in test or 'command_fail' in test
-            test['case_sensitive'] = bool(test['case_sensitive'])
-        self.tests = tests
-
-        self.description = description
-        if confidence == 'required':
-            self.confidence = Confidence.required
-        elif confidence == 'recommended':
-            self.confidence = Confidence.recommended
-        elif confidence == 'experimental':
-            self.confidence = Confidence.experimental
-        else:
-            raise ValueError
-
-        #Optional args
-        self.fix = fix #default: None
-        self.sudo_fix = sudo_fix #default: None
-        self.manual_fix = manual_fix #default: None
-
-    def __str__(self):
-        return str(self.__dict__)
-
-    def __repr__(self):
-        return self.__str__()
+const.DEFAULT_HISTORY_DB = (const.DEFAULT_OUTPUT_LOCATION +
+                            'osx-config-check-history.sqlite')
+const.HISTORY_COMMANDS = ('history', 'regressions', 'slowest')
+const.FLEET_COMMAND = 'fleet'
+const.FLEET_HOSTS_SHOWN = 10 #failing hosts listed for each check
+const.DEFAULT_SOCKET_FILE = '~/.osx-config-check.sock'
+const.DEFAULT_PLAN_FILE = (const.DEFAULT_OUTPUT_LOCATION +
+                           'osx-config-check-plan_%s.json' % get_timestamp())
+const.DEFAULT_PROBE_CACHE = (const.DEFAULT_OUTPUT_LOCATION +
+                             'osx-config-check-probe-cache.json')
+const.DEFAULT_DURATIONS_FILE = (const.DEFAULT_OUTPUT_LOCATION +
+                                'osx-config-check-durations.json')
+const.DEFAULT_JOURNAL_FILE = (const.DEFAULT_OUTPUT_LOCATION +
+                              'osx-config-check-journal.json')
 
 def get_output_filename():
     """Get the filename of the file to write results to."""
     return (const.DEFAULT_OUTPUT_LOCATION + "config-check_" +
             time.strftime("%Y%m%d%H%M%S") + ".txt")
 
-def read_config(config_filename):
-    """Read the expected system configuration from the config file."""
-
-    config = None
-    with open(config_filename, 'r') as config_file:
-        config = json.loads(config_file.read())
-
-    config_checks = []
-
-    for config_check in config:
-        if '_comment' in config_check:
-            continue
-
-        #Config MUST specify a description of the check
-        description = config_check['description']
-        write_str("Description: %s" % description, debug=True)
-
-        #Config MUST indicate the confidence of the configuration check
-        confidence = config_check['confidence']
-
-        #Config MUST include at least one test obj
-        tests = config_check['tests']
-
-        #Config MUST specify a fix object
-        assert 'fix' in config_check
-        assert isinstance(config_check['fix'], dict)
-
-        #Fix object must specify at least one of these:
-        #command, sudo_command, manual
-        assert ('command' in config_check['fix'] or
-                'sudo_command' in config_check['fix'] or
-                'manual' in config_check['fix'])
-        fix = None
-        sudo_fix = None
-        manual_fix = None
-        if 'command' in config_check['fix']:
-            fix = config_check['fix']['command']
-        if 'sudo_command' in config_check['fix']:
-            sudo_fix = config_check['fix']['sudo_command']
-        if 'manual' in config_check['fix']:
-            manual_fix = config_check['fix']['manual']
-
-        config_check_obj = ConfigCheck(
-            tests=tests,
-            description=description,
-            confidence=confidence,
-            fix=fix,
-            sudo_fix=sudo_fix,
-            manual_fix=manual_fix)
-        config_checks.append(config_check_obj)
-
-    return config_checks
-
-def run_check(config_check, last_attempt=False, quiet_fail=False):
-    """Perform the specified configuration check against the OS.
-
-    Each config check may specify multiple test cases with early-succeed and/or
-    early-fail parameters.
-
-    These are the possible conditions resulting from run_check:
-    1. One of the tests explicitly passed.
-    2. One of the tests explicitly failed.
-    3. All of the tests were run and none of them passed or failed. (This
-        should be considered a fail.)
-    4. All of the tests were skipped because we're skipping sudo checks and
-        the only tests available require sudo privs.
-
-    Args:
-        config_check (`ConfigCheck`): The check to perform. May contain multiple
-            commands to test.
-        last_attempt (bool): Is this the last time the script checks this
-            configuration, or will we check again during this run?
-        quiet_fail (bool): Suppress print failed results to stdout?
-            Default: False.
-
-    Returns: `CheckResult`: The check explicitly passed, explicitly
-        failed, never passed, or all checks were skipped.
-
-    Raises: ValueError if result of _execute_check is not valid.
-    """
-    assert isinstance(config_check, ConfigCheck)
-
-    #Assume all tests have been skipped until demonstrated otherwise.
-    result = CheckResult.all_skipped
-    for test in config_check.tests:
-        #alert user if he might get prompted for admin privs due to sudo use
-        if 'sudo ' in test['command']:
-            if const.SKIP_SUDO_TESTS:
-                write_str("Skipping test because app skipping sudo tests.",
-                          debug=True)
-            else:
-                fancy_sudo_command = re.sub(
-                    "sudo", const.SUDO_STR, test['command'])
-                write_str(("The next configuration check requires elevated "
-                           "privileges; %syou may be prompted for your current "
-                           "OS X user's password  below%s. The command to be "
-                           "executed is: '%s'") %
-                          (const.COLORS['BOLD'], const.COLORS['ENDC'],
-                           fancy_sudo_command))
-
-        if 'sudo ' not in test['command'] or not const.SKIP_SUDO_TESTS:
-            command_pass = None
-            if 'command_pass' in test:
-                command_pass = str(test['command_pass'])
-            command_fail = None
-            if 'command_fail' in test:
-                command_fail = str(test['command_fail'])
-            result = _execute_check(command=test['command'],
-                                    comparison_type=test['type'],
-                                    case_sensitive=test['case_sensitive'],
-                                    command_pass=command_pass,
-                                    command_fail=command_fail)
-            if result == CheckResult.explicit_pass:
-                write_str("Test passed exlicitly for '%s'" % test['command'],
-                          debug=True)
-                break
-            elif result == CheckResult.explicit_fail:
-                write_str("Test failed exlicitly for '%s'" % test['command'],
-                          debug=True)
-                break
-            elif result == CheckResult.no_pass:
-                write_str("Test did not pass for '%s'" % test['command'],
-                          debug=True)
-                continue
-            else:
-                raise ValueError("Invalid return value from _execute_check.")
-
-    if result == CheckResult.explicit_pass or not quiet_fail:
-        write_str("\nCHECK #%d: %s... %s" % (glob_check_num,
-                                             config_check.description,
-                                             check_result_to_str(result)))
-
-    if (result not in (CheckResult.explicit_pass, CheckResult.all_skipped) and
-            last_attempt and do_warn(config_check)):
-        warn("Attempted fix %s" % const.FAILED_STR)
-
-    return result
-
-def log_to_file(string):
-    """Append string, followed by newline character, to log file.
-
-    Color codes will be stripped out of the string non-destructively before
-    writing.
-    """
-    string = re.sub(r"\033\[\d{1,2}m", "", string)
-    log_file_loc = const.LOG_FILE_LOC
-    if log_file_loc.startswith('~'):
-        log_file_loc = expanduser(log_file_loc)
-    with open(log_file_loc, 'a+') as log_file:
-        log_file.write("%s\n" % string)
-
-def _execute_check(command, comparison_type, case_sensitive, command_pass=None,
-                   command_fail=None):
-    """Helper function for `run_check` -- executes command and checks result.
-
-    This check can result in three conditions:
-    1. The check explicitly passed, and no subsequent tests need to be performed
-        for this check. Returns True.
-    2. The check explicitly failed, and no subsequent tests need to be performed
-        for this check. Raises ConfigCheckFailedExplicitly.
-    3. The check produced another result, and if there is another test
-        available, it
-
-    Args:
-        command (str): The command to execute to perform the check.
-        comparison_type (str): 'exact match' or 'regex match'
-        case_sensitive (bool): Whether the comparison to output is case
-            sensitive.
-        command_pass (str or None): The output of the command which constitutes
-            an explicit pass for the test, either as an exact string or regex
-            depending on `comparison_type`.
-        command_fail (str or None): The output of the command which constitutes
-            an explicit fail for the test, either as an exact string or regex
-            depending on `comparison_type`.
-
-    Returns:
-       `CheckResult`: explicit pass, explicit failure, or lacking of passing for
-            this test only.
-
-    Raises:
-        ValueError if `comparison_type` is not an expected value
-    """
-    #http://stackoverflow.com/questions/7129107/python-how-to-suppress-the-output-of-os-system
-    command = "source %s ; %s" % (const.API_FILENAME, command)
-    process = Popen(command, stdout=PIPE, stderr=STDOUT, shell=True)
-    stdout, _ = process.communicate()
-
-    stdout = stdout.strip()
-
-    write_str("Command executed to check config: '%s'" % str(command),
-              debug=True)
-    write_str("Result of command: '%s'" % str(stdout), debug=True)
-    write_str("Explicit pass condition for command: '%s'" % str(command_pass),
-              debug=True)
-    write_str("Explicit fail condition for command: '%s'" % str(command_fail),
-              debug=True)
-
-    if comparison_type == 'exact match':
-        if case_sensitive:
-            if command_fail is not None and stdout == command_fail:
-                return CheckResult.explicit_fail
-            if command_pass is not None and stdout == command_pass:
-                return CheckResult.explicit_pass
-            else:
-                return CheckResult.no_pass
-        else:
-            if (command_fail is not None and
-                    stdout.lower() == str(command_fail.lower())):
-                return CheckResult.explicit_fail
-            if (command_pass is not None and
-                    stdout.lower() == str(command_pass).lower()):
-                return CheckResult.explicit_pass
-            else:
-                return CheckResult.no_pass
-    elif comparison_type == 'regex match':
-        ignore_case = not case_sensitive
-        if (command_fail is not None and
-                is_match(command_fail, stdout, ignore_case=ignore_case)):
-            return CheckResult.explicit_fail
-        if (command_pass is not None and
-                is_match(command_pass, stdout, ignore_case=ignore_case)):
-            return CheckResult.explicit_pass
-        else:
-            return CheckResult.no_pass
-    else:
-        raise ValueError
-
-def do_warn(config_check):
-    """Determines whether the config failure merits warning."""
-    if config_check.confidence == Confidence.required:
-        return True
-    if (config_check.confidence == Confidence.recommended and
-            const.WARN_FOR_RECOMMENDED):
-        return True
-    if (config_check.confidence == Confidence.experimental and
-            const.WARN_FOR_EXPERIMENTAL):
-        return True
-    return False
-
-def _try_fix(config_check, use_sudo=False):
-    """Attempt to fix a misconfiguration.
-
-    Args:
-        config_check (`ConfigCheck`): The check to perform.
-        use_sudo (bool): Whether to use the sudo version of this command. If
-            no sudo version of this command has been specified in the config
-            file, this will simply return without executing anything.
-    """
-    command = config_check.sudo_fix if use_sudo else config_check.fix
-    if use_sudo:
-        write_str(("\tAttempting configuration fix with elevated privileges; %s"
-                   "you may be prompted for your OS X login password%s...") %
-                  (const.COLORS['BOLD'], const.COLORS['ENDC']))
-    stdoutdata = ""
-    stderrdata = ""
-    if command is not None:
-        command = "source %s ; %s" % (const.API_FILENAME, command)
-        process = Popen(command, stdout=PIPE, stderr=STDOUT, shell=True)
-        stdoutdata, stderrdata = process.communicate()
-
-    write_str("Command executed: '%s'" % str(command), debug=True)
-    write_str("Command STDOUT: '%s'" % str(stdoutdata), debug=True)
-    write_str("Command STDERR: '%s'" % str(stderrdata), debug=True)
-
-def do_fix_and_test(config_check):
-    """Attempt to fix misconfiguration, returning the result.
-
-    If a non-sudo fix is specified, this will be attempted first.
-    If a non-sudo fix fails or there is none specified and a sudo fix is
-    specified, this will be attempted next.
-    If all previous attempts have failed or none have been specified and
-    instructions for manually fixing the configuration have been specified,
-    these will be printed out at the end of execution by another function.
-
-    Args:
-        config_check (`ConfigCheck`): The check to perform.
-
-    Returns:
-        bool: Whether an attempted fix was successful.
-    """
-    write_str("Entered do_fix_and_test()", debug=True)
-
-    if config_check.fix is not None:
-        _try_fix(config_check, use_sudo=False)
-        check_result = run_check(
-            config_check, last_attempt=False, quiet_fail=True)
-        if check_result == CheckResult.explicit_pass:
-            return True
-
-    if config_check.sudo_fix is not None:
-        _try_fix(config_check, use_sudo=True)
-        check_result = run_check(
-            config_check, last_attempt=True, quiet_fail=False)
-        return bool(check_result == CheckResult.explicit_pass)
-    else:
-        return False
-
-def dprint_settings():
-    """Prints current global flags when debug printing is enabled."""
-    write_str("ENABLE_DEBUG_PRINT: %s" % str(const.ENABLE_DEBUG_PRINT),
-              debug=True)
-    write_str("WRITE_TO_LOG_FILE: %s" % str(const.WRITE_TO_LOG_FILE),
-              debug=True)
-    write_str("PROMPT_FOR_FIXES: %s" % str(const.PROMPT_FOR_FIXES), debug=True)
-    write_str("ATTEMPT_FIXES: %s" % str(const.ATTEMPT_FIXES), debug=True)
-    write_str("SKIP_SUDO_TESTS: %s" % str(const.SKIP_SUDO_TESTS), debug=True)
+def dprint_settings(options, output):
+    """Prints the options of the run when debug printing is enabled."""
+    for name, value in sorted(options.to_dict().items()):
+        output.write("%s: %s" % (name, str(value)), debug=True)
 
 def main():
     """Main function."""
-    global glob_check_num, glob_fail_fix_declined, glob_pass_after_fix, \
-           glob_fail_fix_fail, glob_fail_fix_skipped, glob_pass_no_fix, \
-           glob_check_skipped
-
     args = get_sys_args()
-    const.ENABLE_DEBUG_PRINT = args['debug-print']
-    const.WRITE_TO_LOG_FILE = args['write-to-log-file']
-    const.PROMPT_FOR_FIXES = not args['no-prompt']
-    const.ATTEMPT_FIXES = not args['report-only']
-    const.SKIP_SUDO_TESTS = args['skip-sudo-checks']
-
-    dprint_settings()
-
-    _print_banner()
-
-    config_checks = read_config(const.DEFAULT_CONFIG_FILE)
-    completely_failed_tests = []
-    for config_check in config_checks:
-        check_result = run_check(config_check)
-        if check_result in (CheckResult.explicit_fail, CheckResult.no_pass):
-            if not const.ATTEMPT_FIXES:
-                #report-only mode
-                glob_fail_fix_skipped += 1
-                glob_check_num += 1
-                continue
-
-            if config_check.fix is None and config_check.sudo_fix is None:
-                #no automatic fix available
-                if config_check.manual_fix is not None:
-                    completely_failed_tests.append(glob_check_num)
-                else:
-                    write_str(("Could not satisfy test #%d but no manual fix "
-                               "specified.") % glob_check_num, debug=True)
-            else:
-                #attempt fix, but prompt user first if appropriate
-                if const.PROMPT_FOR_FIXES:
-                    prompt_default = True
-                    descriptor = ''
-                    if config_check.confidence == Confidence.recommended:
-                        prompt_default = const.FIX_RECOMMENDED_BY_DEFAULT
-                        descriptor = const.RECOMMENDED_STR + ' '
-                    elif config_check.confidence == Confidence.experimental:
-                        prompt_default = const.FIX_EXPERIMENTAL_BY_DEFAULT
-                        descriptor = const.EXPERIMENTAL_STR + ' '
-
-                    next_fix_command = config_check.fix
-                    if next_fix_command is None:
-                        next_fix_command = config_check.sudo_fix
-
-                    question = (("\tApply the following %s fix? This will "
-                                 "execute  this command:\n\t\t'%s'") %
-                                (descriptor, next_fix_command))
-                    if prompt.query_yes_no(question=question,
-                                           default=_bool_to_yes_no(prompt_default)):
-                        fixed = do_fix_and_test(config_check)
-                        write_str("Value of fixed is: %s" % str(fixed),
-                                  debug=True)
-                        if fixed:
-                            glob_pass_after_fix += 1
-                        else:
-                            glob_fail_fix_fail += 1
-                            if config_check.manual_fix is not None:
-                                completely_failed_tests.append(glob_check_num)
-                            else:
-                                write_str(("Could not satisfy test #%d but no "
-                                           "manual fix specified.") %
-                                          glob_check_num, debug=True)
-                    else:
-                        #user declined fix
-                        glob_fail_fix_declined += 1
-                else:
-                    fixed = do_fix_and_test(config_check)
-                    write_str("Value of fixed is: %s" % str(fixed), debug=True)
-                    if fixed:
-                        glob_pass_after_fix += 1
-                    else:
-                        glob_fail_fix_fail += 1
-                        if config_check.manual_fix is not None:
-                            completely_failed_tests.append(glob_check_num)
-                        else:
-                            write_str(("Could not satisfy test #%d but no "
-                                       "manual fix specified.") %
-                                      glob_check_num, debug=True)
-
-        elif check_result == CheckResult.explicit_pass:
-            glob_pass_no_fix += 1
-        elif check_result == CheckResult.all_skipped:
-            glob_check_skipped += 1
-
-        glob_check_num += 1
-
-    print_tallies()
-
-    if len(completely_failed_tests) > 0:
-        write_str("==========================")
-        write_str(("%s%d tests could not be automatically fixed, but manual "
-                   "instructions are available. Please manually remediate these"
-                   " problems and re-run the tool:%s") %
-                  (const.COLORS['BOLD'], len(completely_failed_tests),
-                   const.COLORS['ENDC']))
-        for test_num in completely_failed_tests:
-            description = config_checks[test_num - 1].description
-            instructions = config_checks[test_num - 1].manual_fix
-            write_str("TEST #%d: %s" % (test_num, description))
-            write_str("%s" % _underline_hyperlink(instructions))
-            write_str("==========================")
-    else:
-        write_str("List of completely failed tests is empty.", debug=True)
-
-    if const.WRITE_TO_LOG_FILE:
+    if args['history-command'] is not None:
+        print_history(args)
+        return
+    if args['fleet'] is not None:
+        print_fleet(args)
+        return
+    if args['client']:
+        run_client(args)
+        return
+    options = runner.RunOptions(
+        debug_print=args['debug-print'],
+        log_file=const.LOG_FILE_LOC if args['write-to-log-file'] else None,
+        prompt_for_fixes=not args['no-prompt'],
+        attempt_fixes=not args['report-only'],
+        skip_sudo_tests=args['skip-sudo-checks'],
+        sudo_helper=args['sudo-helper'],
+        history_db=args['history-db'] if args['record-history'] else None,
+        two_phase=args['two-phase'],
+        jobs=args['jobs'],
+        plan_file=args['plan-file'],
+        apply_plan=args['apply-plan'],
+        record=args['record'],
+        replay=args['replay'],
+        probe_cache=_probe_cache_file(args),
+        durations_file=(const.DEFAULT_DURATIONS_FILE
+                        if args['replay'] is None else None),
+        time_budget=args['time-budget'],
+        metrics_file=args['metrics-file'],
+        journal_file=(const.DEFAULT_JOURNAL_FILE
+                      if args['replay'] is None else None),
+        resume=args['resume'],
+        resource_limits=_resource_limits(args))
+    output = runner.ConsoleOutput(debug_print=options.debug_print,
+                                  log_file=options.log_file)
+
+    dprint_settings(options, output)
+
+    _print_banner(output)
+
+    if args['daemon']:
+        run_daemon(args, options, output)
+        return
+    try:
+        if args['all-users']:
+            run_all_users(args, options, output)
+            return
+        config = const.DEFAULT_CONFIG_FILE
+        if args['check'] is not None or args['only'] is not None:
+            config = runner.read_config(config, output)
+            options.checks = runner.select_checks(config, args['check'],
+                                                  args['only'])
+            if len(options.checks) == 0:
+                output.write("%sNo check matches --check or --only.%s" %
+                             (const.COLORS['FAIL'], const.COLORS['ENDC']))
+                sys.exit(1)
+        check_runner = runner.Runner(config, options, output=output)
+        result = check_runner.run()
+    except (remediation.PlanError, cassette.CassetteError) as err:
+        output.write("%s%s%s" % (const.COLORS['FAIL'], err,
+                                 const.COLORS['ENDC']))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        if options.journal_file is not None and options.apply_plan is None:
+            output.write("\nInterrupted. Run this tool again with --resume to "
+                         "continue where this run stopped.")
+        sys.exit(130)
+
+    print_results(check_runner.config_checks, result, output)
+    _print_log_location(options.log_file)
+
+def run_all_users(args, options, output):
+    """Performs the system-scope checks once and the user-scope checks for
+    every local user, printing the results of each."""
+    try:
+        homes = multiuser.find_homes(args['homes-root'])
+    except OSError as err:
+        output.write("%sCould not list the home directories: %s%s" %
+                     (const.COLORS['FAIL'], err, const.COLORS['ENDC']))
+        sys.exit(1)
+    if os.geteuid() != 0:
+        output.write("%sNot running as root; the settings of other users may "
+                     "not be readable.%s" % (const.COLORS['WARNING'],
+                                             const.COLORS['ENDC']))
+    all_users_runner = multiuser.AllUsersRunner(const.DEFAULT_CONFIG_FILE,
+                                                homes, options, output=output)
+    result = all_users_runner.run()
+    config_checks = all_users_runner.config_checks
+    output.write("==========================")
+    output.write("%sSystem-wide results:%s" % (const.COLORS['BOLD'],
+                                               const.COLORS['ENDC']))
+    print_results(config_checks, result.system, output)
+    if len(homes) == 0:
+        output.write("%sNo home directories were found in '%s'.%s" %
+                     (const.COLORS['WARNING'],
+                      args['homes-root'] or const.DEFAULT_HOMES_ROOT,
+                      const.COLORS['ENDC']))
+    for home, user_result in result.users:
+        output.write("==========================")
+        output.write("%sResults for user %s (%s):%s" %
+                     (const.COLORS['BOLD'], home.name, home.path,
+                      const.COLORS['ENDC']))
+        print_results(config_checks, user_result, output)
+    _print_log_location(options.log_file)
+
+def run_daemon(args, options, output):
+    """Performs the runs requested with --client until interrupted."""
+    check_daemon = daemon.CheckDaemon(args['socket'],
+                                      const.DEFAULT_CONFIG_FILE, options,
+                                      output=output, summarize=print_results)
+    try:
+        check_daemon.listen()
+    except daemon.DaemonError as err:
+        output.write("%s%s%s" % (const.COLORS['FAIL'], err,
+                                 const.COLORS['ENDC']))
+        sys.exit(1)
+    #stopped by launchd or kill: remove the socket on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    output.write("Listening on '%s'. Run this tool with --client to perform "
+                 "the checks." % check_daemon.socket_path)
+    try:
+        check_daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        check_daemon.close()
+
+def run_client(args):
+    """Has the daemon perform the checks, printing the results it streams
+    back."""
+    log_file = const.LOG_FILE_LOC if args['write-to-log-file'] else None
+    output = runner.ConsoleOutput(debug_print=args['debug-print'],
+                                  log_file=log_file)
+    if not args['report-only'] and not args['no-prompt']:
+        output.write("%sThe daemon cannot prompt before applying fixes, so "
+                     "this run only reports. Add --disable-prompt to apply "
+                     "fixes without prompting.%s" % (const.COLORS['WARNING'],
+                                                     const.COLORS['ENDC']))
+    request = {'attempt_fixes': not args['report-only'] and args['no-prompt'],
+               'skip_sudo_tests': args['skip-sudo-checks'],
+               'check': args['check'],
+               'tags': args['only'],
+               'debug_print': args['debug-print']}
+    try:
+        daemon.request_run(args['socket'], request, output)
+    except daemon.DaemonError as err:
+        output.write("%s%s%s" % (const.COLORS['FAIL'], err,
+                                 const.COLORS['ENDC']))
+        sys.exit(1)
+    _print_log_location(log_file)
+
+def print_results(config_checks, result, output):
+    """Prints the tallies of a run and the checks that need attention."""
+    print_tallies(result, output)
+    print_not_evaluated(config_checks, result, output)
+    print_manual_fixes(config_checks, result, output)
+
+def _print_log_location(log_file):
+    if log_file is not None:
         print("Wrote results to %s'%s'%s. Please review the contents before "
               "submitting them to third parties, as they may contain sensitive "
               "information about your system." %
               (const.COLORS['BOLD'], const.LOG_FILE_LOC, const.COLORS['ENDC']))
 
+def _probe_cache_file(args):
+    """The probe cache to use, if any.
+
+    Results are not cached while commands are recorded or replayed, as the
+    cassette should reflect every command of the run.
+    """
+    if (args['no-probe-cache'] or args['record'] is not None or
+            args['replay'] is not None):
+        return None
+    return args['probe-cache']
+
+def _resource_limits(args):
+    """The resource limits of the run, if any: those of --background, with the
+    limits given explicitly taking precedence."""
+    limits = governor.BACKGROUND if args['background'] else None
+    overrides = dict((field, args[flag]) for field, flag in
+                     (('nice', 'nice'), ('io_priority', 'io-priority'),
+                      ('cpu_seconds', 'cpu-limit'),
+                      ('memory_mb', 'memory-limit'),
+                      ('max_heavy', 'heavy-jobs'))
+                     if args[flag] is not None)
+    if len(overrides) > 0:
+        limits = (governor.ResourceLimits() if limits is None
+                  else limits)._replace(**overrides)
+    return limits
+
+def print_not_evaluated(config_checks, result, output):
+    """Prints the checks left out because the time budget was spent."""
+    if len(result.not_evaluated) > 0:
+        output.write("==========================")
+        output.write("%s%d checks were not evaluated within the time "
+                     "budget:%s" % (const.COLORS['BOLD'],
+                                    len(result.not_evaluated),
+                                    const.COLORS['ENDC']))
+        for check_num in result.not_evaluated:
+            output.write("#%d: %s" % (check_num,
+                                      config_checks[check_num - 1].description))
+
+def print_manual_fixes(config_checks, result, output):
+    """Prints the instructions for checks that must be fixed manually."""
+    if len(result.manual_fixes) > 0:
+        output.write("==========================")
+        output.write(("%s%d tests could not be automatically fixed, but manual "
+                      "instructions are available. Please manually remediate "
+                      "these problems and re-run the tool:%s") %
+                     (const.COLORS['BOLD'], len(result.manual_fixes),
+                      const.COLORS['ENDC']))
+        for test_num in result.manual_fixes:
+            description = config_checks[test_num - 1].description
+            instructions = config_checks[test_num - 1].manual_fix
+            output.write("TEST #%d: %s" % (test_num, description))
+            output.write("%s" % _underline_hyperlink(instructions))
+            output.write("==========================")
+    else:
+        output.write("List of completely failed tests is empty.", debug=True)
+
 def _underline_hyperlink(string):
     """Insert underlines into hyperlinks"""
     return re.sub(
@@ -599,42 +286,7 @@ def _underline_hyperlink(string):
         string,
         flags=re.IGNORECASE)
 
-def _bool_to_yes_no(boolean):
-    return 'yes' if boolean else 'no'
-
-
-def write_str(msg, debug=False):
-    """Print and logs the specified message unless prohibited by settings.
-
-    Args:
-        msg (str): The message to be written.
-        debug (bool): Whether the message is normal or debug-only info.
-            Default: False
-    """
-    if debug:
-        dprint(msg)
-        if ((const.ENABLE_DEBUG_PRINT or const.LOG_DEBUG_ALWAYS) and
-                const.WRITE_TO_LOG_FILE):
-            log_to_file("DEBUG: %s" % msg)
-    else:
-        print "%s" % msg
-        if const.WRITE_TO_LOG_FILE:
-            log_to_file(msg)
-
-def dprint(msg):
-    """Print debug statements."""
-    if const.ENABLE_DEBUG_PRINT:
-        print "DEBUG: %s" % msg
-
-def is_match(regex, string, ignore_case=False):
-    """Check if regex matches string."""
-    regex_flags = re.DOTALL
-    if ignore_case:
-        regex_flags = re.DOTALL | re.IGNORECASE
-
-    return re.match(regex, string, regex_flags) is not None
-
-def _print_banner():
+def _print_banner(output):
     banner = (("---------------------------------------------------------------"
                "---------------------------\n"
                "%s%sosx-config-check%s %s\n"
@@ -648,11 +300,15 @@ def _print_banner():
                "---------------------------\n") %
               (const.COLORS['BOLD'], const.COLORS['OKBLUE'],
                const.COLORS['ENDC'], const.VERSION))
-    write_str(_underline_hyperlink(banner))
+    output.write(_underline_hyperlink(banner))
 
 def print_usage():
     """Prints usage for this command-line tool and exits."""
     print("Usage: python app.py [OPTIONS]\n"
+          "       python app.py history CHECK [--history-db FILE]\n"
+          "       python app.py regressions [--history-db FILE]\n"
+          "       python app.py slowest [N] [--history-db FILE]\n"
+          "       python app.py fleet CASSETTES [--skip-sudo-checks]\n"
           "OPTIONS:\n"
           "\t--debug-print        Enables verbose output for debugging the "
           "tool.\n"
@@ -664,15 +320,178 @@ def print_usage():
           "fixes.\n"
           "\t--skip-sudo-checks   Do not perform checks that require sudo "
           "privileges.\n"
-          "\t--help -h            Print this usage information.\n")
+          "\t--sudo-helper        Run all commands that require sudo "
+          "privileges in one helper process, so that you are prompted for "
+          "your password at most once.\n"
+          "\t--record-history     Record the results of this run in the run "
+          "history database.\n"
+          "\t--history-db FILE    Use FILE as the run history database. "
+          "Default: %s\n"
+          "\t--two-phase          Evaluate every check before offering any "
+          "fixes, write a remediation plan, then approve the fixes in bulk. "
+          "With --report-only, only the plan is written.\n"
+          "\t--jobs N             Evaluate up to N checks at a time with "
+          "--two-phase, perform the checks of up to N users at a time with "
+          "--all-users, and run up to N commands at a time in warm shells "
+          "with --daemon. Default: %d\n"
+          "\t--plan-file FILE     Write the remediation plan to FILE. "
+          "Default: %s\n"
+          "\t--apply-plan FILE    Apply the fixes approved in the remediation "
+          "plan FILE instead of checking every configuration.\n"
+          "\t--record FILE        Record the output, exit status and duration "
+          "of every command executed in the cassette FILE.\n"
+          "\t--replay FILE        Take the results of all commands from the "
+          "cassette FILE instead of executing them.\n"
+          "\t--probe-cache FILE   Keep the results of slow tests that may be "
+          "reused across runs in FILE. Default: %s\n"
+          "\t--no-probe-cache     Perform every test, ignoring cached "
+          "results.\n"
+          "\t--time-budget SECS   Perform the most important and cheapest "
+          "checks first and stop once SECS seconds are spent, based on how "
+          "long each check took in earlier runs.\n"
+          "\t--metrics-file FILE  Write the results of the run to FILE as "
+          "Prometheus metrics, e.g. for the node_exporter textfile "
+          "collector.\n"
+          "\t--background         Run commands at a low CPU and disk "
+          "priority, and at most one command of a heavy check at a time, so "
+          "that the run does not slow down other applications. The options "
+          "below override these limits.\n"
+          "\t--nice N             Run commands with the scheduling priority "
+          "N, from -20 (highest) to 19 (lowest).\n"
+          "\t--io-priority CLASS  Run commands with the disk priority CLASS: "
+          "normal, utility or throttle.\n"
+          "\t--cpu-limit SECS     Terminate commands that use more than SECS "
+          "seconds of CPU time.\n"
+          "\t--memory-limit MB    Keep commands from allocating more than MB "
+          "megabytes of memory.\n"
+          "\t--heavy-jobs N       Run at most N commands of heavy checks at a "
+          "time.\n"
+          "\t--all-users          Perform the checks that concern a user's "
+          "own settings for every user with a home directory, and the other "
+          "checks once. Run as root to read the settings of other users.\n"
+          "\t--homes-root DIR     Look for home directories in DIR with "
+          "--all-users. Default: %s\n"
+          "\t--resume             Continue a run that was interrupted, taking "
+          "the results of the checks it completed from its journal unless "
+          "their inputs have changed.\n"
+          "\t--check CHECK        Perform only the check CHECK, which is a "
+          "check number or part of a check's description.\n"
+          "\t--only TAGS          Perform only the checks with the "
+          "comma-separated TAGS: required, recommended or experimental; "
+          "system or user; light or heavy. A check needs one of the tags of "
+          "each kind given.\n"
+          "\t--daemon             Keep running with the config and warm "
+          "shells in memory, performing the checks whenever this tool is run "
+          "with --client. Changes to the config take effect without a "
+          "restart.\n"
+          "\t--client             Have the daemon perform the checks and "
+          "print the results. Fixes are only applied with "
+          "--disable-prompt.\n"
+          "\t--socket PATH        The socket of the daemon. Default: %s\n"
+          "\t--help -h            Print this usage information.\n"
+          "HISTORY QUERIES:\n"
+          "\thistory CHECK        Print every recorded result of the checks "
+          "matching CHECK, which is a check number as of the last recorded "
+          "run, or part of a check's description.\n"
+          "\tregressions          Print checks that passed in an earlier run "
+          "but fail now, and when they started failing.\n"
+          "\tslowest [N]          Print the N checks (default: 10) that took "
+          "the longest on average over the last 10 recorded runs.\n"
+          "FLEET EVALUATION:\n"
+          "\tfleet CASSETTES      Evaluate the checks against the cassettes "
+          "recorded on many hosts with --record, in the directory or file "
+          "CASSETTES, and print the hosts on which each check fails.\n" %
+          (const.DEFAULT_HISTORY_DB, const.DEFAULT_JOBS,
+           const.DEFAULT_OUTPUT_LOCATION +
+           'osx-config-check-plan_<timestamp>.json',
+           const.DEFAULT_PROBE_CACHE, const.DEFAULT_HOMES_ROOT,
+           const.DEFAULT_SOCKET_FILE))
     sys.exit()
 
-def print_tallies():
-    """Prints totals of the various possible outcomes of config checks."""
-    total_checks = glob_check_num - 1
-    total_passed = glob_pass_no_fix + glob_pass_after_fix
-    total_failed = (glob_fail_fix_fail + glob_fail_fix_skipped +
-                    glob_fail_fix_declined + glob_check_skipped)
+def print_history(args):
+    """Prints the result of a query against the run history database."""
+    run_history = history.RunHistory(args['history-db'])
+    try:
+        if args['history-command'] == 'history':
+            if args['history-arg'] is None:
+                print_usage()
+            matches = run_history.find_checks(args['history-arg'])
+            if len(matches) == 0:
+                print "No recorded checks match '%s'." % args['history-arg']
+            for key, description in matches:
+                print "%s%s%s [%s]" % (const.COLORS['BOLD'], description,
+                                       const.COLORS['ENDC'], key)
+                for started, check_num, outcome, duration in \
+                        run_history.check_history(key):
+                    print "\t%s  CHECK #%-3d %-18s %.2fs" % (
+                        _format_time(started), check_num, outcome, duration)
+        elif args['history-command'] == 'regressions':
+            regressions = run_history.regressions()
+            if len(regressions) == 0:
+                print "No checks have started failing since they last passed."
+            for key, description, last_pass, first_fail in regressions:
+                print "%s [%s]\n\tlast passed %s, failing since %s" % (
+                    description, key, _format_time(last_pass),
+                    _format_time(first_fail))
+        elif args['history-command'] == 'slowest':
+            limit = 10
+            if args['history-arg'] is not None:
+                try:
+                    limit = int(args['history-arg'])
+                except ValueError:
+                    print_usage()
+            for key, description, average, longest, runs in \
+                    run_history.slowest(limit):
+                print "%7.2fs avg %7.2fs max over %d runs: %s [%s]" % (
+                    average, longest, runs, description, key)
+    finally:
+        run_history.close()
+
+def print_fleet(args):
+    """Evaluates the checks against the cassettes of a fleet, and prints the
+    hosts on which each check fails."""
+    path = args['fleet']
+    filenames = [path]
+    if os.path.isdir(path):
+        filenames = [os.path.join(path, name)
+                     for name in sorted(os.listdir(path))
+                     if not name.startswith('.')]
+    try:
+        table = fleet.ProbeTable.from_cassettes(filenames)
+    except cassette.CassetteError as err:
+        print "%s%s%s" % (const.COLORS['FAIL'], err, const.COLORS['ENDC'])
+        sys.exit(1)
+    config_checks = runner.read_config(const.DEFAULT_CONFIG_FILE)
+    result = fleet.FleetEvaluator(
+        config_checks, skip_sudo_tests=args['skip-sudo-checks']).evaluate(table)
+    for check_num, config_check in enumerate(config_checks, 1):
+        failing = result.failing_hosts(check_num)
+        passed = result.count(check_num, runner.CheckResult.explicit_pass)
+        print "CHECK #%d: %s... passed on %d of %d hosts" % (
+            check_num, config_check.description, passed, len(table))
+        for host in failing[:const.FLEET_HOSTS_SHOWN]:
+            print "\t%s %s" % (const.FAILED_STR, host)
+        if len(failing) > const.FLEET_HOSTS_SHOWN:
+            print "\t... and %d more hosts" % (len(failing) -
+                                               const.FLEET_HOSTS_SHOWN)
+    print ("Evaluated %d checks on %d hosts in %.2fs, comparing %d distinct "
+           "outputs for %d test results." % (
+               len(config_checks), len(table), result.duration,
+               result.comparisons, result.evaluations))
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime(
+        '%Y-%m-%d %H:%M:%S')
+
+def print_tallies(result, output):
+    """Prints totals of the various possible outcomes of config checks.
+
+    Args:
+        result (`runner.RunResult`): The result of the run.
+        output (`runner.ConsoleOutput`): Where to print the totals.
+    """
+    total_checks = result.total_checks
+    count = result.count
 
     out = trim_block('''
     Configurations passed total:                 %s
@@ -683,16 +502,22 @@ def print_tallies():
     Configurations failed and fix skipped:       %s
     Configurations failed and fix declined:      %s
     Configuration checks skipped:                %s
-    ''' % (_number_and_pct(total_passed, total_checks, 'pass'),
-           _number_and_pct(total_failed, total_checks, 'fail'),
-           _number_and_pct(glob_pass_no_fix, total_checks, 'pass'),
-           _number_and_pct(glob_pass_after_fix, total_checks, 'pass'),
-           _number_and_pct(glob_fail_fix_fail, total_checks, 'fail'),
-           _number_and_pct(glob_fail_fix_skipped, total_checks, 'fail'),
-           _number_and_pct(glob_fail_fix_declined, total_checks, 'fail'),
-           _number_and_pct(glob_check_skipped, total_checks, 'skip')))
-
-    write_str(out)
+    ''' % (_number_and_pct(result.passed, total_checks, 'pass'),
+           _number_and_pct(result.failed, total_checks, 'fail'),
+           _number_and_pct(count(history.PASS_NO_FIX), total_checks, 'pass'),
+           _number_and_pct(count(history.PASS_AFTER_FIX), total_checks,
+                           'pass'),
+           _number_and_pct(count(history.FAIL_FIX_FAIL), total_checks, 'fail'),
+           _number_and_pct(count(history.FAIL_FIX_SKIPPED), total_checks,
+                           'fail'),
+           _number_and_pct(count(history.FAIL_FIX_DECLINED), total_checks,
+                           'fail'),
+           _number_and_pct(count(history.SKIPPED), total_checks, 'skip')))
+    if len(result.not_evaluated) > 0:
+        out += "\nConfiguration checks not evaluated:          %s" % (
+            _number_and_pct(len(result.not_evaluated), total_checks, 'skip'))
+
+    output.write(out)
 
 def _number_and_pct(num, total, result):
     assert result in ('pass', 'fail', 'skip')
@@ -706,6 +531,8 @@ def _number_and_pct(num, total, result):
     return "%s%d (%s)%s" % (color, num, _pct(num, total), end_color)
 
 def _pct(num, total):
+    if total == 0:
+        return "0.00%"
     return "{0:.2f}".format(100.0 * num / total) + '%'
 
 def trim_block(multiline_str):
@@ -726,13 +553,92 @@ def get_sys_args():
         * write-to-log-file (bool)
         * no-prompt (bool)
         * skip-sudo-checks (bool)
+        * sudo-helper (bool)
+        * record-history (bool)
+        * history-db (str)
+        * history-command (str or None): The history query to run instead of
+            checking the configuration, if any.
+        * history-arg (str or None): The argument to the history query.
+        * fleet (str or None): The cassettes of a fleet to evaluate instead
+            of checking the configuration, if any.
+        * two-phase (bool)
+        * jobs (int)
+        * plan-file (str)
+        * apply-plan (str or None): The remediation plan to apply instead of
+            checking every configuration, if any.
+        * record (str or None): The cassette to record commands in, if any.
+        * replay (str or None): The cassette to replay commands from, if any.
+        * probe-cache (str)
+        * no-probe-cache (bool)
+        * time-budget (float or None): The number of seconds the checks may
+            take, if limited.
+        * metrics-file (str or None): Where to write Prometheus metrics, if
+            anywhere.
+        * resume (bool)
+        * background (bool)
+        * nice (int or None)
+        * io-priority (str or None)
+        * cpu-limit (float or None)
+        * memory-limit (float or None)
+        * heavy-jobs (int or None)
+        * all-users (bool)
+        * homes-root (str or None): The directory containing the homes of
+            the users, if not the default one.
+        * check (str or None): The only check to perform, if any.
+        * only (List[str] or None): The tags of the checks to perform, if
+            not every check.
+        * daemon (bool)
+        * client (bool)
+        * socket (str)
     """
     args = {'debug-print': False,
             'report-only': False,
             'write-to-log-file': True,
             'no-prompt': False,
-            'skip-sudo-checks': False}
+            'skip-sudo-checks': False,
+            'sudo-helper': False,
+            'record-history': False,
+            'history-db': const.DEFAULT_HISTORY_DB,
+            'history-command': None,
+            'history-arg': None,
+            'fleet': None,
+            'two-phase': False,
+            'jobs': const.DEFAULT_JOBS,
+            'plan-file': const.DEFAULT_PLAN_FILE,
+            'apply-plan': None,
+            'record': None,
+            'replay': None,
+            'probe-cache': const.DEFAULT_PROBE_CACHE,
+            'no-probe-cache': False,
+            'time-budget': None,
+            'metrics-file': None,
+            'resume': False,
+            'background': False,
+            'nice': None,
+            'io-priority': None,
+            'cpu-limit': None,
+            'memory-limit': None,
+            'heavy-jobs': None,
+            'all-users': False,
+            'homes-root': None,
+            'check': None,
+            'only': None,
+            'daemon': False,
+            'client': False,
+            'socket': const.DEFAULT_SOCKET_FILE}
     unprocessed_args = sys.argv[1:]
+    if len(unprocessed_args) > 0 and \
+            unprocessed_args[0] in const.HISTORY_COMMANDS:
+        args['history-command'] = unprocessed_args.pop(0)
+        if len(unprocessed_args) > 0 and \
+                not unprocessed_args[0].startswith('-'):
+            args['history-arg'] = unprocessed_args.pop(0)
+    elif len(unprocessed_args) > 0 and \
+            unprocessed_args[0] == const.FLEET_COMMAND:
+        unprocessed_args.pop(0)
+        if len(unprocessed_args) == 0 or unprocessed_args[0].startswith('-'):
+            print_usage()
+        args['fleet'] = unprocessed_args.pop(0)
     while len(unprocessed_args) > 0:
         flag = unprocessed_args.pop(0)
         if flag == '--debug-print':
@@ -745,12 +651,141 @@ def get_sys_args():
             args['no-prompt'] = True
         elif flag == '--skip-sudo-checks':
             args['skip-sudo-checks'] = True
+        elif flag == '--sudo-helper':
+            args['sudo-helper'] = True
+        elif flag == '--record-history':
+            args['record-history'] = True
+        elif flag == '--history-db':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['history-db'] = unprocessed_args.pop(0)
+        elif flag == '--two-phase':
+            args['two-phase'] = True
+        elif flag == '--jobs':
+            if len(unprocessed_args) == 0 or \
+                    not unprocessed_args[0].isdigit() or \
+                    int(unprocessed_args[0]) < 1:
+                print_usage()
+            args['jobs'] = int(unprocessed_args.pop(0))
+        elif flag == '--plan-file':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['plan-file'] = unprocessed_args.pop(0)
+        elif flag == '--apply-plan':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['apply-plan'] = unprocessed_args.pop(0)
+        elif flag == '--record':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['record'] = unprocessed_args.pop(0)
+        elif flag == '--replay':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['replay'] = unprocessed_args.pop(0)
+        elif flag == '--probe-cache':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['probe-cache'] = unprocessed_args.pop(0)
+        elif flag == '--no-probe-cache':
+            args['no-probe-cache'] = True
+        elif flag == '--time-budget':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            try:
+                args['time-budget'] = float(unprocessed_args.pop(0))
+            except ValueError:
+                print_usage()
+            if args['time-budget'] <= 0:
+                print_usage()
+        elif flag == '--metrics-file':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['metrics-file'] = unprocessed_args.pop(0)
+        elif flag == '--resume':
+            args['resume'] = True
+        elif flag == '--background':
+            args['background'] = True
+        elif flag == '--nice':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            try:
+                args['nice'] = int(unprocessed_args.pop(0))
+            except ValueError:
+                print_usage()
+            if not -20 <= args['nice'] <= 19:
+                print_usage()
+        elif flag == '--io-priority':
+            if len(unprocessed_args) == 0 or \
+                    unprocessed_args[0] not in governor.IO_PRIORITIES:
+                print_usage()
+            args['io-priority'] = unprocessed_args.pop(0)
+        elif flag in ('--cpu-limit', '--memory-limit'):
+            if len(unprocessed_args) == 0:
+                print_usage()
+            try:
+                args[flag[2:]] = float(unprocessed_args.pop(0))
+            except ValueError:
+                print_usage()
+            if args[flag[2:]] <= 0:
+                print_usage()
+        elif flag == '--heavy-jobs':
+            if len(unprocessed_args) == 0 or \
+                    not unprocessed_args[0].isdigit() or \
+                    int(unprocessed_args[0]) < 1:
+                print_usage()
+            args['heavy-jobs'] = int(unprocessed_args.pop(0))
+        elif flag == '--all-users':
+            args['all-users'] = True
+        elif flag == '--homes-root':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['homes-root'] = unprocessed_args.pop(0)
+        elif flag == '--check':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['check'] = unprocessed_args.pop(0).decode('utf-8')
+        elif flag == '--only':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['only'] = unprocessed_args.pop(0).split(',')
+            for tag in args['only']:
+                if tag not in runner.CHECK_TAGS:
+                    print "ERROR: Unknown tag '%s'" % tag
+                    print_usage()
+        elif flag == '--daemon':
+            args['daemon'] = True
+        elif flag == '--client':
+            args['client'] = True
+        elif flag == '--socket':
+            if len(unprocessed_args) == 0:
+                print_usage()
+            args['socket'] = unprocessed_args.pop(0)
         elif flag == '-h' or flag == '--help':
             print_usage()
         else:
             print "ERROR: Unrecognized option '%s'" % flag
             print_usage()
 
+    if args['all-users'] and (args['apply-plan'] is not None or
+                              args['record'] is not None or
+                              args['replay'] is not None):
+        print("ERROR: --all-users cannot be combined with --apply-plan, "
+              "--record or --replay.")
+        print_usage()
+    if (args['check'] is not None or args['only'] is not None) and (
+            args['all-users'] or args['apply-plan'] is not None):
+        print("ERROR: --check and --only cannot be combined with --all-users "
+              "or --apply-plan.")
+        print_usage()
+    if (args['daemon'] or args['client']) and (
+            args['daemon'] == args['client'] or args['all-users'] or
+            args['resume'] or args['apply-plan'] is not None or
+            args['record'] is not None or args['replay'] is not None):
+        print("ERROR: --daemon and --client cannot be combined with each "
+              "other, --all-users, --resume, --apply-plan, --record or "
+              "--replay.")
+        print_usage()
     return args
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""Benchmarks and stress-tests scripts/chrome_defaults.py on large profiles.
+
+Real Chrome Preferences files can be megabytes, with deeply nested
+content_settings trees and long plugins_list arrays. This suite generates
+synthetic Preferences files of a given size, nesting depth and array length,
+and times each sub-command on them the way the checks use it:
+
+    read           a top-level setting stored after all of the filler
+    read-deep      the innermost setting of the content_settings tree
+    read-pattern   a path expression filtering the plugins_list array
+    write          a top-level setting, including the backup
+    delete         a nested setting, including the backup
+    write-array    the plugins_list elements matching a where clause,
+                   including the backup
+    backup         only the backup that every write makes
+
+Each operation is measured in a fresh process, so that its peak memory use is
+independent of the other operations. The file is restored before every
+repetition, and the backups are removed afterwards:
+
+    $ python benchmarks/chrome_preferences.py
+    profile           operation      median ms   min ms   peak RSS MB   added MB
+    0.1MB-d8-a50      read                 ...
+
+Added MB is the growth of the peak RSS caused by the operation, i.e. not
+counting the interpreter and chrome_defaults.py itself.
+
+The results can be saved as a JSON baseline and later runs compared with it;
+the comparison exits with status 1 if any operation became slower than the
+baseline by more than the threshold factor:
+
+    $ python benchmarks/chrome_preferences.py --save-baseline baseline.json
+    $ python benchmarks/chrome_preferences.py --compare baseline.json
+
+Usage: python benchmarks/chrome_preferences.py [--size MB] [--depth N]
+    [--array-length N] [--repeat N] [--save-baseline FILE]
+    [--compare FILE [--threshold FACTOR]]
+
+--size, --depth and --array-length benchmark a single profile instead of the
+default ones.
+"""
+
+import sys
+import os
+import json
+import glob
+import time
+import shutil
+import platform
+import tempfile
+import resource
+from subprocess import Popen, PIPE
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+BASELINE_FORMAT = 1
+
+#(size in MB, content_settings depth, plugins_list length)
+DEFAULT_PROFILES = ((0.1, 8, 50), (2, 32, 500), (16, 128, 5000))
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.5
+
+OPERATIONS = ('read', 'read-deep', 'read-pattern', 'write', 'delete',
+              'write-array', 'backup')
+
+def profile_name(size_mb, depth, array_length):
+    """The name of a synthetic profile in tables and baselines."""
+    return "%gMB-d%d-a%d" % (size_mb, depth, array_length)
+
+def deep_path(depth):
+    """The dotted path of the innermost setting of the content_settings
+    tree."""
+    return '.'.join(['profile.content_settings.exceptions'] +
+                    ['l%d' % level for level in range(depth)] + ['setting'])
+
+def make_preferences(size_mb, depth, array_length):
+    """Returns a synthetic Preferences object.
+
+    Args:
+        size_mb (float): The approximate size of the file as JSON, in MB. Most
+            of it is filler in "extensions.settings", which sorts before the
+            settings read by the benchmark, so reads have to skip over it.
+        depth (int): The nesting depth of the content_settings tree.
+        array_length (int): The number of elements in plugins_list.
+    """
+    tree = {'setting': 1, 'last_modified': '13120000000000000'}
+    for level in reversed(range(depth)):
+        tree = {'l%d' % level: tree,
+                'sibling%d' % level: {'setting': 2,
+                                      'last_modified': '13110000000000000'}}
+    plugins = [{'name': 'Plugin %d' % index,
+                'enabled': index % 2 == 0,
+                'path': '/Library/Internet Plug-Ins/Plugin%d.plugin' % index,
+                'version': '1.0.%d' % index}
+               for index in range(array_length)]
+    plugins[len(plugins) // 2:len(plugins) // 2 + 1] = [{
+        'name': 'Shockwave Flash', 'enabled': True,
+        'path': '/Library/Internet Plug-Ins/Flash Player.plugin',
+        'version': '23.0.0.185'}]
+    preferences = {
+        'profile': {'content_settings': {'exceptions': tree},
+                    'default_content_setting_values': {'popups': 1,
+                                                       'geolocation': 2}},
+        'plugins': {'plugins_list': plugins},
+        'search': {'suggest_enabled': True},
+        'extensions': {'settings': {}}}
+
+    size = len(json.dumps(preferences))
+    extensions = preferences['extensions']['settings']
+    index = 0
+    while size < size_mb * 1e6:
+        extension = {'manifest': {'name': 'Extension %d' % index,
+                                  'description': 'x' * 800,
+                                  'version': '1.%d' % index},
+                     'state': 1,
+                     'path': 'ext%032d' % index}
+        extensions['ext%032d' % index] = extension
+        size += len(json.dumps(extension)) + 40
+        index += 1
+    return preferences
+
+def _args(operation, filename, depth):
+    """The arguments of chrome_defaults.py for an operation."""
+    args = {'action': operation, 'preferences_filename': filename,
+            'chrome_property': None, 'jobs': 1, 'with_filename': False}
+    if operation == 'read':
+        args['chrome_property'] = 'search.suggest_enabled'
+    elif operation == 'read-deep':
+        args.update(action='read', chrome_property=deep_path(depth))
+    elif operation == 'read-pattern':
+        args.update(action='read', chrome_property=(
+            'plugins.plugins_list[name="Shockwave Flash"].enabled'))
+    elif operation == 'write':
+        args.update(chrome_property='search.suggest_enabled', value=False)
+    elif operation == 'delete':
+        args['chrome_property'] = (
+            'profile.default_content_setting_values.popups')
+    elif operation == 'write-array':
+        args.update(chrome_property='plugins.plugins_list',
+                    child_attrib='enabled', value=False,
+                    where_property='name', where_value='Shockwave Flash')
+    return args
+
+def _max_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss / 1024.0 / 1024.0 #bytes
+    return max_rss / 1024.0 #kilobytes
+
+def measure(filename, operation, depth, repeat):
+    """Performs an operation in this process, printing the measurements as
+    JSON.
+
+    `filename` is restored from `filename` + ".orig" before each repetition.
+    """
+    sys.path.insert(0, SCRIPTS_DIR)
+    import chrome_defaults #chrome_defaults.py
+    args = _args(operation, filename, depth)
+    rss_before = _max_rss_mb()
+    durations = []
+    stdout = sys.stdout
+    for _ in range(repeat):
+        shutil.copyfile(filename + '.orig', filename)
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            started = time.time()
+            if operation == 'backup':
+                chrome_defaults._make_backup(filename)
+            else:
+                try:
+                    chrome_defaults._run_action(args)
+                except SystemExit as err:
+                    if err.code not in (None, 0):
+                        raise
+            durations.append(time.time() - started)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        for backup in glob.glob(filename + '*.bak'):
+            os.remove(backup)
+    durations.sort()
+    print json.dumps({'median_ms': durations[len(durations) // 2] * 1e3,
+                      'min_ms': durations[0] * 1e3,
+                      'peak_rss_mb': _max_rss_mb(),
+                      'added_mb': _max_rss_mb() - rss_before})
+
+def _run_self(*args):
+    process = Popen([sys.executable, os.path.abspath(__file__)] + list(args),
+                    stdout=PIPE, cwd=REPO_DIR)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise RuntimeError("Measuring %s failed." % ' '.join(args))
+    return output
+
+def run_benchmarks(profiles, repeat):
+    """Measures every operation on each profile.
+
+    Returns:
+        dict: The results of each operation, by profile name and operation.
+    """
+    results = {}
+    print ("profile           operation      median ms   min ms   "
+           "peak RSS MB   added MB")
+    for size_mb, depth, array_length in profiles:
+        name = profile_name(size_mb, depth, array_length)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, 'Preferences')
+            with open(filename + '.orig', 'w') as preferences_file:
+                json.dump(make_preferences(size_mb, depth, array_length),
+                          preferences_file, sort_keys=True)
+            results[name] = {}
+            for operation in OPERATIONS:
+                result = json.loads(_run_self(
+                    '--measure', filename, operation, str(depth),
+                    str(repeat)).splitlines()[-1])
+                results[name][operation] = result
+                print "%-17s %-12s %11.1f %8.1f %13.1f %10.1f" % (
+                    name, operation, result['median_ms'], result['min_ms'],
+                    result['peak_rss_mb'], result['added_mb'])
+        finally:
+            shutil.rmtree(temp_dir)
+    return results
+
+def save_baseline(filename, results, repeat):
+    """Writes the results as a baseline for later comparisons."""
+    with open(filename, 'w') as baseline_file:
+        json.dump({'format': BASELINE_FORMAT,
+                   'created': time.time(),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'repeat': repeat,
+                   'results': results},
+                  baseline_file, indent=4, sort_keys=True)
+        baseline_file.write('\n')
+
+def compare(filename, results, threshold):
+    """Prints how the results compare with a baseline.
+
+    Returns:
+        bool: Whether any operation was slower than the baseline by more
+            than `threshold` times.
+    """
+    with open(filename, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('format') != BASELINE_FORMAT:
+        sys.exit("'%s' is not a baseline in format %d." %
+                 (filename, BASELINE_FORMAT))
+    print "\nprofile           operation    baseline ms   now ms    ratio"
+    regressed = False
+    for name in sorted(results):
+        for operation in OPERATIONS:
+            before = baseline['results'].get(name, {}).get(operation)
+            if before is None:
+                continue
+            now = results[name][operation]['median_ms']
+            ratio = now / max(before['median_ms'], 1e-3)
+            slower = ratio > threshold
+            regressed = regressed or slower
+            print "%-17s %-12s %11.1f %8.1f %8.2f%s" % (
+                name, operation, before['median_ms'], now, ratio,
+                '  SLOWER' if slower else '')
+    return regressed
+
+def _usage():
+    sys.exit(__doc__[__doc__.index('Usage:'):])
+
+def _main():
+    argv = sys.argv[1:]
+    if len(argv) == 5 and argv[0] == '--measure':
+        measure(argv[1], argv[2], int(argv[3]), int(argv[4]))
+        return
+
+    options = {'--size': None, '--depth': None, '--array-length': None,
+               '--repeat': DEFAULT_REPEAT, '--save-baseline': None,
+               '--compare': None, '--threshold': DEFAULT_THRESHOLD}
+    while len(argv) > 0:
+        flag = argv.pop(0)
+        if flag not in options or len(argv) == 0:
+            _usage()
+        try:
+            if flag in ('--size', '--threshold'):
+                options[flag] = float(argv.pop(0))
+            elif flag in ('--depth', '--array-length', '--repeat'):
+                options[flag] = int(argv.pop(0))
+            else:
+                options[flag] = argv.pop(0)
+        except ValueError:
+            _usage()
+
+    profiles = DEFAULT_PROFILES
+    if any(options[flag] is not None
+           for flag in ('--size', '--depth', '--array-length')):
+        default_size, default_depth, default_length = DEFAULT_PROFILES[1]
+        profiles = [(options['--size'] or default_size,
+                     options['--depth'] or default_depth,
+                     options['--array-length'] or default_length)]
+    results = run_benchmarks(profiles, options['--repeat'])
+    if options['--save-baseline'] is not None:
+        save_baseline(options['--save-baseline'], results, options['--repeat'])
+    if options['--compare'] is not None:
+        if compare(options['--compare'], results, options['--threshold']):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    _main()
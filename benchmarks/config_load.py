@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Benchmarks loading very large configs with `runner.read_config`.
+
+Synthetic configs are built by repeating the checks of osx-config.json with
+unique descriptions. A third of the repeated checks also get unique test and
+fix commands, the way checks for different preference keys would. Each config
+is generated and loaded in fresh processes so that the memory measurements are
+independent:
+
+    $ python benchmarks/config_load.py
+    checks   file MB   load s   peak RSS MB   RSS before MB   retained MB
+     10000      ...
+
+Peak RSS includes parsing the JSON file. RSS before is the peak before the
+config was loaded, i.e. the interpreter and runner.py itself. Retained is the
+size of the objects that make up the loaded checks, counting each shared
+object once.
+
+Usage: python benchmarks/config_load.py [NUM_CHECKS ...]
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+import resource
+from subprocess import Popen, PIPE
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (10000, 50000, 100000)
+
+def make_config(num_checks, template_filename):
+    """Returns a synthetic config with `num_checks` checks."""
+    with open(template_filename, 'r') as template_file:
+        templates = [check for check in json.load(template_file)
+                     if '_comment' not in check]
+    config = []
+    for check_num in range(num_checks):
+        check = json.loads(json.dumps(templates[check_num % len(templates)]))
+        check['description'] = "%s (synthetic #%d)" % (check['description'],
+                                                        check_num)
+        if check_num % 3 == 0:
+            suffix = " # key%d" % check_num
+            for test in check['tests']:
+                test['command'] += suffix
+            for field in ('command', 'sudo_command'):
+                if field in check['fix']:
+                    check['fix'][field] += suffix
+        config.append(check)
+    return config
+
+def deep_size(obj, seen=None):
+    """Returns the size in bytes of `obj` and every object it references."""
+    if seen is None:
+        seen = set()
+    size = 0
+    pending = [obj]
+    while len(pending) > 0:
+        obj = pending.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, int)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            pending.extend(obj)
+        if hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                pending.append(getattr(obj, slot))
+    return size
+
+def _max_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss / 1024.0 / 1024.0 #bytes
+    return max_rss / 1024.0 #kilobytes
+
+def measure(config_filename):
+    """Loads a config in this process, printing the measurements as JSON."""
+    sys.path.insert(0, REPO_DIR)
+    import runner #runner.py
+    rss_before = _max_rss_mb()
+    started = time.time()
+    config_checks = runner.read_config(config_filename)
+    load_seconds = time.time() - started
+    print json.dumps({'checks': len(config_checks),
+                      'load_seconds': load_seconds,
+                      'peak_rss_mb': _max_rss_mb(),
+                      'rss_before_mb': rss_before,
+                      'retained_mb': deep_size(config_checks) / 1e6})
+
+def _run_self(*args):
+    process = Popen([sys.executable, os.path.abspath(__file__)] + list(args),
+                    stdout=PIPE, cwd=REPO_DIR)
+    return process.communicate()[0]
+
+def _main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--measure':
+        measure(sys.argv[2])
+        return
+    if len(sys.argv) == 4 and sys.argv[1] == '--generate':
+        with open(sys.argv[3], 'w') as config_file:
+            json.dump(make_config(int(sys.argv[2]),
+                                  os.path.join(REPO_DIR, 'osx-config.json')),
+                      config_file)
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print ("checks   file MB   load s   peak RSS MB   RSS before MB   "
+           "retained MB")
+    for num_checks in sizes:
+        handle, config_filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            _run_self('--generate', str(num_checks), config_filename)
+            result = json.loads(
+                _run_self('--measure', config_filename).splitlines()[-1])
+            print "%6d   %7.1f   %6.2f   %11.1f   %13.1f   %11.1f" % (
+                result['checks'], os.path.getsize(config_filename) / 1e6,
+                result['load_seconds'], result['peak_rss_mb'],
+                result['rss_before_mb'], result['retained_mb'])
+        finally:
+            os.remove(config_filename)
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Benchmarks evaluating the checks of osx-config.json for a fleet of hosts.
+
+Synthetic probe outputs are generated for every test command of the config:
+each host outputs one of a handful of values per probe, the way the hosts of a
+fleet do. The checks are then evaluated for every host twice:
+
+    per host   each host on its own, evaluating its tests in order with
+               `runner.evaluate_output`, as replaying its cassette would
+    fleet      all hosts at once with `fleet.FleetEvaluator`
+
+    $ python benchmarks/fleet.py
+     hosts   per host s   fleet s   speedup   comparisons   test results
+      1000          ...
+
+The results of both are compared, and the benchmark exits with status 1 if
+they differ. Comparisons is the number of outputs the fleet evaluator compared
+with the conditions of a test; test results is the number of results of a
+test for a host that it used, i.e. the comparisons evaluating each host on its
+own takes.
+
+Usage: python benchmarks/fleet.py [NUM_HOSTS ...]
+"""
+
+import sys
+import os
+import time
+import random
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import runner #runner.py
+import fleet #fleet.py
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+#the outputs a probe may have on a host, besides its pass and fail conditions
+OTHER_OUTPUTS = ('', 'The domain/default pair does not exist\n', 'unknown\n')
+
+def make_table(config_checks, num_hosts, seed=0):
+    """Returns a `fleet.ProbeTable` of synthetic outputs of `num_hosts`
+    hosts."""
+    rand = random.Random(seed)
+    variants = {}
+    for config_check in config_checks:
+        for test in config_check.tests:
+            outputs = [str(condition) + '\n' for condition
+                       in (test.command_pass, test.command_fail)
+                       if condition is not None]
+            variants[fleet._probe(test)] = outputs + list(OTHER_OUTPUTS)
+    table = fleet.ProbeTable()
+    for index in range(num_hosts):
+        table.add_host('host-%d' % index, dict(
+            (probe, outputs[min(int(rand.expovariate(1.5)), len(outputs) - 1)])
+            for probe, outputs in variants.iteritems()))
+    return table
+
+def evaluate_per_host(config_checks, table):
+    """Returns the result of every check for each host, evaluated one host at
+    a time."""
+    columns = {}
+    results = []
+    for row in range(len(table)):
+        host_results = []
+        for config_check in config_checks:
+            result = runner.CheckResult.all_skipped
+            for test in config_check.tests:
+                probe = fleet._probe(test)
+                if probe not in columns:
+                    columns[probe] = table.column(probe)
+                values, codes = columns[probe]
+                result = runner.evaluate_output(test, values[codes[row]])
+                if result in (runner.CheckResult.explicit_pass,
+                              runner.CheckResult.explicit_fail):
+                    break
+            host_results.append(result)
+        results.append(host_results)
+    return results
+
+def _main():
+    config_checks = runner.read_config(os.path.join(REPO_DIR,
+                                                    'osx-config.json'))
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print (" hosts   per host s   fleet s   speedup   comparisons   "
+           "test results")
+    for num_hosts in sizes:
+        table = make_table(config_checks, num_hosts)
+        started = time.time()
+        expected = evaluate_per_host(config_checks, table)
+        per_host_seconds = time.time() - started
+        result = fleet.FleetEvaluator(config_checks).evaluate(table)
+        print "%6d   %10.2f   %7.2f   %6.0fx   %11d   %12d" % (
+            num_hosts, per_host_seconds, result.duration,
+            per_host_seconds / max(result.duration, 1e-6),
+            result.comparisons, result.evaluations)
+        by_host = zip(*[result.check_results(check_num) for check_num
+                        in range(1, len(config_checks) + 1)])
+        if [list(host_results) for host_results in by_host] != expected:
+            print "The results of the fleet evaluator differ."
+            sys.exit(1)
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,171 @@
+"""Recordings ("cassettes") of the commands executed by a run of app.py.
+
+With --record, every test, fix and restart command executed during a run is
+stored along with its exit status, output and duration. With --replay, a run
+takes the results of its commands from a cassette instead of executing them,
+so the checks of a config can be evaluated against a recorded machine in
+milliseconds and on any operating system, e.g. to reproduce a user's report or
+to try out changes to the config.
+
+A cassette is a gzip-compressed JSON file. Its "commands" object is the index:
+it maps each command to the results of its executions, in order, e.g.:
+
+    {
+        "format": 1,
+        "version": "v1.1.0 (ivysaur)",
+        "hostname": "alices-mac",
+        "created": 1476890000.0,
+        "commands": {
+            "source ./scripts/api.sh ; defaults read com.apple.Finder ...": [
+                [0, 0.012, "0\\n"],
+                [0, 0.011, "1\\n"]
+            ]
+        }
+    }
+
+Each result is an [exit status, duration in seconds, output] triple. The n-th
+execution of a command during a replay is served the n-th result recorded for
+it, so checks that are evaluated again after a fix see the output recorded
+after the fix. Executions beyond the number recorded are served the last
+result. Output is stored as Latin-1 text so that arbitrary bytes survive the
+round trip through JSON.
+"""
+
+import os
+import json
+import gzip
+import time
+import socket
+import tempfile
+import threading
+
+CASSETTE_FORMAT = 1
+
+class CassetteError(Exception):
+    """The cassette could not be read."""
+    pass
+
+class Cassette(object):
+    """The recorded results of commands, indexed by command."""
+
+    def __init__(self, commands=None, hostname=None):
+        """
+        Args:
+            commands (Optional[dict]): Each command mapped to a list of
+                (status, duration, output) tuples, in order of execution.
+            hostname (Optional[str]): The host the commands were executed on,
+                if known.
+        """
+        self.commands = {} if commands is None else commands
+        self.hostname = hostname
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(results) for results in self.commands.itervalues())
+
+    def add(self, command, status, duration, output):
+        """Appends the result of one execution of `command`.
+
+        Args:
+            command (str): The command executed.
+            status (int): Its exit status.
+            duration (float): How long it took, in seconds.
+            output (str): Its combined stdout and stderr.
+        """
+        command = _utf8(command)
+        with self._lock:
+            self.commands.setdefault(command, []).append(
+                (status, duration, output))
+
+    def lookup(self, command, occurrence):
+        """Returns the result of an execution of `command`.
+
+        Args:
+            command (str): The command.
+            occurrence (int): How many times the command was executed before.
+
+        Returns:
+            tuple: (int, float, str): The status, duration and output recorded
+                for that execution, or None if the command was not recorded.
+        """
+        results = self.commands.get(_utf8(command))
+        if not results:
+            return None
+        return results[min(occurrence, len(results) - 1)]
+
+def write_cassette(filename, cassette, version):
+    """Writes a cassette, replacing any existing file atomically.
+
+    Args:
+        filename (str): The file to write.
+        cassette (`Cassette`): The results to write.
+        version (str): The version of the tool writing the cassette.
+    """
+    filename = os.path.expanduser(filename)
+    document = {
+        'format': CASSETTE_FORMAT,
+        'version': version,
+        'hostname': cassette.hostname or socket.gethostname(),
+        'created': time.time(),
+        'commands': dict(
+            (_decode(command), [[status, duration, _decode(output)]
+                                for status, duration, output in results])
+            for command, results in cassette.commands.iteritems())}
+    cassette_dir = os.path.dirname(os.path.abspath(filename))
+    handle, temp_filename = tempfile.mkstemp(dir=cassette_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            with gzip.GzipFile(fileobj=temp_file, mode='wb') as gzip_file:
+                json.dump(document, gzip_file, separators=(',', ':'),
+                          sort_keys=True)
+        os.rename(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+def read_cassette(filename):
+    """Reads a cassette written by `write_cassette`.
+
+    Returns:
+        `Cassette`: The recorded results.
+    Raises:
+        CassetteError: If the file cannot be read or is not a cassette.
+    """
+    try:
+        with gzip.open(os.path.expanduser(filename), 'rb') as gzip_file:
+            document = json.load(gzip_file)
+    except (IOError, ValueError, EOFError) as err:
+        raise CassetteError("Could not read cassette '%s': %s" %
+                            (filename, err))
+    if (not isinstance(document, dict) or
+            document.get('format') != CASSETTE_FORMAT or
+            not isinstance(document.get('commands'), dict)):
+        raise CassetteError("'%s' is not a cassette in format %d." %
+                            (filename, CASSETTE_FORMAT))
+    commands = {}
+    try:
+        for command, results in document['commands'].iteritems():
+            commands[_encode(command)] = [
+                (int(status), float(duration), _encode(output))
+                for status, duration, output in results]
+    except (TypeError, ValueError, UnicodeError) as err:
+        raise CassetteError("Invalid results in cassette '%s': %s" %
+                            (filename, err))
+    hostname = document.get('hostname')
+    if isinstance(hostname, unicode):
+        hostname = hostname.encode('utf-8')
+    return Cassette(commands, hostname)
+
+def _utf8(string):
+    """Commands read from the config may be `unicode`."""
+    if isinstance(string, unicode):
+        return string.encode('utf-8')
+    return string
+
+def _decode(string):
+    """Converts the bytes of a command or its output to text for JSON."""
+    return _utf8(string).decode('latin-1')
+
+def _encode(text):
+    """Converts text read from JSON back to the original bytes."""
+    return text.encode('latin-1')
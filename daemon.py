@@ -0,0 +1,381 @@
+"""Keeps the checker resident, so that a run requested by a client starts at
+once.
+
+A run of app.py spends much of its time before the first check: starting
+Python, reading the config, and starting a shell that sources the API script
+for every command. A `CheckDaemon` does that work once and keeps the results
+in memory between runs:
+
+    * the checks of the config, read again only when the file changes, so
+      that edits on disk take effect without restarting the daemon; if the
+      new config cannot be read, the daemon keeps the previous one and warns
+      the client
+    * warm shells that have sourced the API script, see `shell_pool`; they are
+      restarted when the API script changes
+    * the probe cache (see `probe_cache`), which is still saved after every
+      run
+
+The daemon listens on a UNIX socket that only its user can connect to, and
+performs one run at a time. A client (`request_run`, or app.py --client) sends
+a run request and writes the messages of the run as the daemon streams them
+back.
+
+Protocol: the client sends one JSON object on a line, with these keys, all
+optional:
+
+    attempt_fixes (bool)    apply fixes, without prompting. Default: false
+    skip_sudo_tests (bool)  as with --skip-sudo-checks. Default: false
+    check (str)             perform only this check, see
+                            `runner.select_checks`. Default: every check
+    tags (List[str])        perform only the checks with these tags, see
+                            `runner.select_checks`. Default: every check
+    debug_print (bool)      also send debug messages. Default: false
+
+The daemon replies with one JSON object per line: {"message": str, "debug":
+bool} for each message of the run, then {"done": summary} with the numbers of
+checks that passed and failed, or {"error": str} if the run could not be
+performed.
+"""
+
+import os
+import copy
+import json
+import stat
+import errno
+import select
+import socket
+import threading
+import const #const.py
+import runner #runner.py
+import governor #governor.py
+import probe_cache #probe_cache.py
+import shell_pool #shell_pool.py
+
+const.DAEMON_POLL_INTERVAL = 0.5 #seconds between checks for a shutdown
+
+class DaemonError(Exception):
+    """The daemon could not listen or be reached, or could not perform a
+    run."""
+    pass
+
+class CheckDaemon(object):
+    """Performs runs requested by clients on a UNIX socket."""
+
+    def __init__(self, socket_path, config_filename, options=None,
+                 output=None, summarize=None):
+        """
+        Args:
+            socket_path (str): The socket to listen on.
+            config_filename (str): The config file, read again whenever it
+                changes.
+            options (Optional[`runner.RunOptions`]): The options of every
+                run, except for those a request sets. Default:
+                `runner.RunOptions()`
+            output (Optional[`runner.ConsoleOutput`]): Where to write the
+                messages of the daemon itself. Default: a `ConsoleOutput` for
+                the options.
+            summarize (Optional[function]): Called with the checks, the
+                `runner.RunResult` and the output of each run, to write a
+                summary for the client, e.g. the tallies. Default: none.
+        """
+        self.socket_path = os.path.expanduser(socket_path)
+        self.options = runner.RunOptions() if options is None else options
+        if output is None:
+            output = runner.ConsoleOutput(debug_print=self.options.debug_print,
+                                          log_file=self.options.log_file)
+        self.output = output
+        self.summarize = summarize
+        self.config = _ConfigFile(config_filename)
+        self.governor = governor.ResourceGovernor(self.options.resource_limits)
+        self.executor = shell_pool.ShellPool(
+            self.options.jobs,
+            runner.ShellExecutor(
+                use_sudo_helper=(self.options.sudo_helper and
+                                 not self.options.skip_sudo_tests),
+                output=output, resource_governor=self.governor),
+            self.governor)
+        self.cache = None
+        if self.options.probe_cache is not None:
+            self.cache = probe_cache.ProbeCache(self.options.probe_cache)
+        self.runs = 0 #runs performed
+        self._socket = None
+        self._closed = threading.Event()
+        self._run_lock = threading.Lock()
+
+    def listen(self):
+        """Reads the config and starts listening on the socket.
+
+        A socket left behind by a daemon that is no longer running is
+        replaced.
+
+        Raises:
+            DaemonError: If the config could not be read, another daemon is
+                listening on the socket, or the socket could not be created.
+        """
+        self.config.current()
+        _remove_stale_socket(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077) #only the daemon's user may connect
+        try:
+            listener.bind(self.socket_path)
+            listener.listen(5)
+        except socket.error as err:
+            listener.close()
+            raise DaemonError("Could not listen on '%s': %s" %
+                              (self.socket_path, err))
+        finally:
+            os.umask(umask)
+        self._socket = listener
+
+    def serve_forever(self):
+        """Serves clients, each in its own thread, until `close` is called."""
+        while not self._closed.is_set():
+            try:
+                readable, _, _ = select.select([self._socket], [], [],
+                                               const.DAEMON_POLL_INTERVAL)
+                if len(readable) == 0:
+                    continue
+                connection, _ = self._socket.accept()
+            except (select.error, socket.error):
+                continue #e.g. closed meanwhile
+            thread = threading.Thread(target=self.handle, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        """Stops serving, removes the socket and stops the warm shells."""
+        self._closed.set()
+        if self._socket is not None:
+            self._socket.close()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+        self.executor.shutdown()
+        self.executor.close()
+
+    def handle(self, connection):
+        """Reads a request from a client and streams the run back."""
+        try:
+            line = connection.makefile('rb').readline()
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                _send(connection, {'error': "The request is not valid."})
+                return
+            stream = StreamOutput(connection,
+                                  bool(request.get('debug_print', False)))
+            try:
+                summary = self.perform(request, stream)
+            except DaemonError as err:
+                stream.send({'error': str(err)})
+            else:
+                stream.send({'done': summary})
+        except socket.error:
+            pass #the client went away
+        finally:
+            connection.close()
+
+    def perform(self, request, output):
+        """Performs the run a client requested, writing its messages to
+        `output`.
+
+        Runs are performed one at a time; a request waits for the run before
+        it to finish.
+
+        Returns:
+            dict: The numbers of checks that passed and failed, of the checks
+                performed, and the seconds the run took.
+
+        Raises:
+            DaemonError: If the config could not be read, or the request
+                selects no check.
+        """
+        with self._run_lock:
+            config_checks, warning = self.config.current()
+            if warning is not None:
+                output.write("%s%s%s" % (const.COLORS['WARNING'], warning,
+                                         const.COLORS['ENDC']))
+            if self.executor.refresh():
+                self.output.write("The API script changed; restarted the "
+                                  "shells.", debug=True)
+            options = self._run_options(request, config_checks)
+            check_runner = runner.Runner(
+                config_checks, options, executor=self.executor, output=output,
+                ask=lambda question, default: False,
+                resource_governor=self.governor, cache=self.cache)
+            result = check_runner.run()
+            self.runs += 1
+            if self.summarize is not None:
+                self.summarize(config_checks, result, output)
+            return {'passed': result.passed, 'failed': result.failed,
+                    'total_checks': result.total_checks,
+                    'duration': result.duration}
+
+    def _run_options(self, request, config_checks):
+        """The options of the run a client requested."""
+        options = copy.copy(self.options)
+        options.attempt_fixes = bool(request.get('attempt_fixes', False))
+        options.prompt_for_fixes = False
+        options.skip_sudo_tests = (self.options.skip_sudo_tests or
+                                   bool(request.get('skip_sudo_tests', False)))
+        options.journal_file = None
+        options.resume = False
+        check = request.get('check')
+        tags = request.get('tags')
+        if check is not None or tags:
+            try:
+                options.checks = runner.select_checks(
+                    config_checks, None if check is None else unicode(check),
+                    tags)
+            except ValueError as err:
+                raise DaemonError(str(err))
+            if len(options.checks) == 0:
+                raise DaemonError("No check matches the request.")
+        return options
+
+class _ConfigFile(object):
+    """The checks of a config file, read again when the file changes."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.config_checks = None
+        self.reloads = 0 #times the file was read again after it changed
+        self._stamp = None
+
+    def current(self):
+        """Returns the checks of the config as of now.
+
+        Returns:
+            tuple: (List[`runner.ConfigCheck`], str or None): The checks, and
+                a warning if the file changed but could not be read, in which
+                case the checks are those read before.
+
+        Raises:
+            DaemonError: If the config could not be read, and was never read
+                before.
+        """
+        try:
+            stat_result = os.stat(self.filename)
+            stamp = (stat_result.st_mtime, stat_result.st_size,
+                     stat_result.st_ino)
+        except OSError:
+            stamp = None
+        if stamp is not None and stamp == self._stamp:
+            return self.config_checks, None
+        try:
+            config_checks = runner.read_config(self.filename)
+        except (IOError, ValueError, KeyError, TypeError,
+                AssertionError) as err:
+            message = "Could not read the config '%s': %s" % (
+                self.filename, err)
+            if self.config_checks is None:
+                raise DaemonError(message)
+            return self.config_checks, message + "; using the previous one."
+        if self.config_checks is not None:
+            self.reloads += 1
+        self._stamp = stamp
+        self.config_checks = config_checks
+        return config_checks, None
+
+class StreamOutput(object):
+    """Sends the messages of a run to a client; see `runner.ConsoleOutput`.
+
+    If the client went away, the run continues and its messages are dropped.
+    """
+
+    def __init__(self, connection, debug_print=False):
+        self.connection = connection
+        self.debug_print = debug_print
+        self.connected = True
+        self._lock = threading.Lock()
+
+    def write(self, msg, debug=False):
+        """Sends a message, unless it is for debugging and debug messages were
+        not requested."""
+        if debug and not self.debug_print:
+            return
+        if isinstance(msg, str):
+            msg = msg.decode('utf-8', 'replace')
+        self.send({'message': msg, 'debug': debug})
+
+    def send(self, reply):
+        """Sends one reply of the protocol."""
+        with self._lock:
+            if not self.connected:
+                return
+            try:
+                _send(self.connection, reply)
+            except socket.error:
+                self.connected = False
+
+def _send(connection, reply):
+    connection.sendall(json.dumps(reply) + '\n')
+
+def _remove_stale_socket(path):
+    """Removes the socket at `path` if no daemon is listening on it.
+
+    Raises:
+        DaemonError: If a daemon is listening on it, or it is not a socket.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise DaemonError("'%s' exists and is not a socket." % path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as err:
+        if err.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise DaemonError("Could not connect to '%s': %s" % (path, err))
+        os.remove(path)
+    else:
+        raise DaemonError("A daemon is already listening on '%s'." % path)
+    finally:
+        probe.close()
+
+def request_run(socket_path, request, output):
+    """Asks the daemon to perform a run, writing its messages to `output` as
+    they arrive.
+
+    Args:
+        socket_path (str): The socket the daemon listens on.
+        request (dict): The request, see the protocol in the module
+            docstring.
+        output (`runner.ConsoleOutput`): Where to write the messages.
+
+    Returns:
+        dict: The summary of the run.
+
+    Raises:
+        DaemonError: If no daemon is listening on the socket, or it could not
+            perform the run.
+    """
+    socket_path = os.path.expanduser(socket_path)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(socket_path)
+        except socket.error as err:
+            raise DaemonError("No daemon is listening on '%s': %s" %
+                              (socket_path, err))
+        _send(connection, request)
+        for line in connection.makefile('rb'):
+            reply = json.loads(line)
+            if 'message' in reply:
+                output.write(reply['message'].encode('utf-8'),
+                             debug=reply.get('debug', False))
+            elif 'error' in reply:
+                raise DaemonError(reply['error'])
+            elif 'done' in reply:
+                return reply['done']
+    except socket.error as err:
+        raise DaemonError("Lost the connection to the daemon: %s" % err)
+    finally:
+        connection.close()
+    raise DaemonError("The daemon closed the connection before the run "
+                      "finished.")
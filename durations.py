@@ -0,0 +1,92 @@
+"""Remembers how long each configuration check takes, across runs of app.py.
+
+The expected duration of a check is a moving average of the time its tests
+took in recent runs, so that it follows changes to the machine without being
+thrown off by a single slow run. Time spent applying fixes or waiting for the
+user is not counted. Checks are identified by `history.check_key`.
+
+app.py uses the expected durations to start the slowest checks first when
+evaluating checks in parallel, and to run the cheapest checks first when its
+time is limited with --time-budget.
+
+The durations are kept in a small JSON file, e.g.:
+
+    {"format": 1, "durations": {"3f1c2a9b0d4e": 1.25, "9a0b1c2d3e4f": 0.004}}
+"""
+
+import os
+import json
+import tempfile
+import threading
+
+DURATIONS_FORMAT = 1
+
+#weight of the latest run in the moving average
+SMOOTHING = 0.3
+
+class DurationHistory(object):
+    """The expected duration of each check, stored in a file between runs."""
+
+    def __init__(self, filename):
+        """Reads the durations, or starts afresh if they cannot be read.
+
+        Args:
+            filename (str): The durations file.
+        """
+        self.filename = os.path.expanduser(filename)
+        self.durations = {}
+        self.changed = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.filename, 'r') as durations_file:
+                document = json.load(durations_file)
+            if document.get('format') == DURATIONS_FORMAT:
+                self.durations = dict(
+                    (key, float(seconds))
+                    for key, seconds in document['durations'].iteritems())
+        except (IOError, ValueError, KeyError, TypeError, AttributeError):
+            pass #start afresh
+
+    def expected(self, key):
+        """Returns the expected duration of a check in seconds, or None if it
+        has not been timed yet."""
+        with self._lock:
+            return self.durations.get(key)
+
+    def update(self, key, seconds):
+        """Folds the time a check took in this run into its expected duration.
+        """
+        with self._lock:
+            previous = self.durations.get(key)
+            if previous is None:
+                self.durations[key] = seconds
+            else:
+                self.durations[key] = (SMOOTHING * seconds +
+                                       (1 - SMOOTHING) * previous)
+            self.changed = True
+
+    def save(self, keep=None):
+        """Writes the durations back atomically if they changed.
+
+        Args:
+            keep (Optional[set]): The keys of the checks that still exist; the
+                durations of other checks are dropped. Default: keep all.
+        """
+        with self._lock:
+            if not self.changed:
+                return
+            durations = dict((key, seconds) for key, seconds
+                             in self.durations.iteritems()
+                             if keep is None or key in keep)
+            self.changed = False
+        durations_dir = os.path.dirname(os.path.abspath(self.filename))
+        handle, temp_filename = tempfile.mkstemp(dir=durations_dir,
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump({'format': DURATIONS_FORMAT, 'durations': durations},
+                          temp_file, sort_keys=True)
+            os.rename(temp_filename, self.filename)
+        except:
+            os.remove(temp_filename)
+            raise
@@ -0,0 +1,260 @@
+"""Evaluates the checks of a config against the recorded probes of a fleet.
+
+An administrator who collects cassettes (see `cassette`) from thousands of
+Macs wants to know which checks fail on which hosts. Replaying each cassette
+separately compares the same outputs with the same conditions over and over,
+as most hosts of a fleet produce one of a handful of outputs for each test.
+
+A `ProbeTable` holds the outputs of the hosts in columns, one per test command
+("probe"), with a row per host. Each column is dictionary-encoded: it keeps
+every distinct output once, and for each host the code of its output. A
+`FleetEvaluator` evaluates each test once per distinct output rather than once
+per host, and maps the results to the hosts through the codes. The tests of a
+check are evaluated in order for the hosts not decided yet, the same way
+`runner.Runner.evaluate_tests` stops at the first test that passes or fails
+explicitly, and a test is not evaluated at all once every host is decided.
+
+The codes and results are NumPy arrays if NumPy is installed, which makes
+mapping results to hosts a vectorized operation on a column; otherwise they are
+lists, with the same results.
+
+The output of a host for a probe is the first output recorded for the
+command, i.e. before any fix was applied. A probe that was not recorded for a
+host has no output, as with --replay, so the results are those of replaying
+each cassette with --report-only.
+"""
+
+import os
+import time
+import const #const.py
+import cassette #cassette.py
+import runner #runner.py
+try:
+    import numpy
+except ImportError:
+    numpy = None #optional; lists are used instead
+
+class ProbeTable(object):
+    """The probe outputs of many hosts, one dictionary-encoded column per
+    probe."""
+
+    def __init__(self):
+        self.hosts = [] #the name of each host, by row
+        self._columns = {} #probe -> `_Column`
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def add_host(self, name, outputs):
+        """Adds a row for a host.
+
+        Args:
+            name (str): The name of the host.
+            outputs (dict): The output of each probe recorded for the host.
+        """
+        row = len(self.hosts)
+        self.hosts.append(name)
+        for probe, output in outputs.iteritems():
+            column = self._columns.get(probe)
+            if column is None:
+                column = self._columns[probe] = _Column()
+            column.set(row, output)
+
+    def add_cassette(self, recording, name=None):
+        """Adds a row for the host a cassette was recorded on.
+
+        Args:
+            recording (`cassette.Cassette`): The recorded commands.
+            name (Optional[str]): The name of the host. Default: the hostname
+                recorded in the cassette.
+        """
+        self.add_host(name if name is not None else recording.hostname,
+                      dict((command, results[0][2]) for command, results
+                           in recording.commands.iteritems()
+                           if len(results) > 0))
+
+    def column(self, probe):
+        """Returns the distinct outputs of a probe and the code of each host's
+        output.
+
+        Code 0 is no output, for hosts that did not record the probe.
+
+        Returns:
+            tuple: (List[str], codes): The codes are a NumPy array if NumPy
+                is installed, and a list otherwise.
+        """
+        column = self._columns.get(probe)
+        if column is None:
+            column = self._columns[probe] = _Column()
+        return column.values, column.frozen_codes(len(self.hosts))
+
+    @classmethod
+    def from_cassettes(cls, filenames):
+        """Reads the cassettes of a fleet, one row per cassette.
+
+        Raises:
+            cassette.CassetteError: If a cassette could not be read.
+        """
+        table = cls()
+        for filename in filenames:
+            recording = cassette.read_cassette(filename)
+            table.add_cassette(recording, recording.hostname or
+                               os.path.basename(filename))
+        return table
+
+class _Column(object):
+    """The dictionary-encoded outputs of one probe."""
+    __slots__ = ('values', 'codes', '_index', '_frozen')
+
+    def __init__(self):
+        self.values = [''] #each distinct output, by code
+        self.codes = [] #the code of each host's output, by row
+        self._index = {'': 0} #code of each distinct output
+        self._frozen = None
+
+    def set(self, row, output):
+        """Sets the output of a row after the rows set so far."""
+        code = self._index.get(output)
+        if code is None:
+            code = self._index[output] = len(self.values)
+            self.values.append(output)
+        self.codes.extend([0] * (row - len(self.codes)))
+        self.codes.append(code)
+        self._frozen = None
+
+    def frozen_codes(self, rows):
+        """Returns the codes of `rows` rows, for evaluation."""
+        if self._frozen is None or len(self._frozen) != rows:
+            self.codes.extend([0] * (rows - len(self.codes)))
+            self._frozen = (self.codes if numpy is None else
+                            numpy.array(self.codes, dtype=numpy.int32))
+        return self._frozen
+
+class FleetResult(object):
+    """The results of `FleetEvaluator.evaluate`."""
+
+    def __init__(self, hosts, config_checks):
+        self.hosts = hosts
+        self.config_checks = config_checks
+        #the `runner.CheckResult` of every host, by row, for each check
+        self.results = []
+        self.comparisons = 0 #distinct outputs compared with a test
+        self.evaluations = 0 #results of a test for a host used
+        self.duration = 0.0 #seconds the evaluation took
+
+    def check_results(self, check_num):
+        """Returns the `runner.CheckResult` of every host for a check."""
+        return [int(result) for result in self.results[check_num - 1]]
+
+    def failing_hosts(self, check_num):
+        """Returns the hosts on which a check did not pass, excluding those
+        on which all of its tests were skipped."""
+        return [host for host, result in zip(self.hosts,
+                                             self.check_results(check_num))
+                if result in (runner.CheckResult.explicit_fail,
+                              runner.CheckResult.no_pass)]
+
+    def count(self, check_num, *results):
+        """Returns the number of hosts with any of the given results for a
+        check."""
+        return sum(1 for result in self.check_results(check_num)
+                   if result in results)
+
+class FleetEvaluator(object):
+    """Evaluates the checks of a config against a `ProbeTable`."""
+
+    def __init__(self, config_checks, skip_sudo_tests=False):
+        """
+        Args:
+            config_checks (List[`runner.ConfigCheck`]): The checks.
+            skip_sudo_tests (bool): Whether to skip tests that require sudo,
+                as with --skip-sudo-checks.
+        """
+        self.config_checks = config_checks
+        self.skip_sudo_tests = skip_sudo_tests
+
+    def evaluate(self, table):
+        """Evaluates every check for every host of `table`.
+
+        Returns:
+            `FleetResult`
+        """
+        started = time.time()
+        result = FleetResult(list(table.hosts), self.config_checks)
+        for config_check in self.config_checks:
+            result.results.append(self._evaluate_check(config_check, table,
+                                                       result))
+        result.duration = time.time() - started
+        return result
+
+    def _evaluate_check(self, config_check, table, fleet_result):
+        """Returns the `runner.CheckResult` of every host for a check."""
+        results = _full(len(table), runner.CheckResult.all_skipped)
+        undecided = _undecided(results)
+        for test in config_check.tests:
+            if 'sudo ' in test.command and self.skip_sudo_tests:
+                continue
+            if not _any(undecided):
+                break
+            values, codes = table.column(_probe(test))
+            #each distinct output of the hosts not decided yet, compared once
+            test_results = [0] * len(values)
+            for code in _distinct(codes, undecided):
+                test_results[code] = runner.evaluate_output(test,
+                                                            values[code])
+                fleet_result.comparisons += 1
+            fleet_result.evaluations += _count(undecided)
+            results = _where(undecided, _take(test_results, codes), results)
+            undecided = _undecided(results)
+        return results
+
+def _probe(test):
+    """The probe of a test: its command as recorded in cassettes."""
+    command = const.API_PREFIX + test.command
+    if isinstance(command, unicode):
+        command = command.encode('utf-8')
+    return command
+
+#Column operations, on NumPy arrays if available and lists otherwise.
+
+def _full(length, value):
+    if numpy is None:
+        return [value] * length
+    return numpy.full(length, value, dtype=numpy.int8)
+
+def _undecided(results):
+    """Whether each result is neither an explicit pass nor fail."""
+    decided = (runner.CheckResult.explicit_pass,
+               runner.CheckResult.explicit_fail)
+    if numpy is None:
+        return [result not in decided for result in results]
+    return (results != decided[0]) & (results != decided[1])
+
+def _any(mask):
+    if numpy is None:
+        return any(mask)
+    return bool(mask.any())
+
+def _count(mask):
+    if numpy is None:
+        return sum(mask)
+    return int(mask.sum())
+
+def _distinct(codes, mask):
+    """The distinct codes of the rows selected by `mask`."""
+    if numpy is None:
+        return sorted(set(code for code, selected in zip(codes, mask)
+                          if selected))
+    return numpy.unique(codes[mask]).tolist()
+
+def _take(values, codes):
+    """The value of each code."""
+    if numpy is None:
+        return [values[code] for code in codes]
+    return numpy.array(values, dtype=numpy.int8)[codes]
+
+def _where(mask, if_true, if_false):
+    if numpy is None:
+        return [new if selected else old for selected, new, old
+                in zip(mask, if_true, if_false)]
+    return numpy.where(mask, if_true, if_false)
@@ -0,0 +1,160 @@
+"""Keeps the commands of checks from competing with the user's own work.
+
+When app.py runs in the background, e.g. from an MDM agent in the middle of the
+day, its commands should not slow down the applications in the foreground. A
+`ResourceGovernor` applies `ResourceLimits` to every process started to execute
+a command:
+
+    * nice: The scheduling priority, from -20 (highest) to 19 (lowest).
+    * io_priority: The disk I/O priority, one of `IO_PRIORITIES`. "utility"
+        lowers it, and "throttle" lets the command use the disk only when
+        nothing else does.
+    * cpu_seconds: The CPU time after which a command is terminated.
+    * memory_mb: The size of the address space a command may allocate.
+
+Commands that use sudo keep the limits, as sudo passes them on. Commands run
+by the privileged helper of --sudo-helper are not limited.
+
+Checks in the config have a cost class, see `COST_CLASSES`. The limits above
+apply to every command, while `max_heavy` caps how many commands of heavy
+checks run at once, e.g. when checks are evaluated in parallel.
+"""
+
+import os
+import sys
+import ctypes
+import ctypes.util
+import platform
+import resource
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
+
+COST_CLASSES = ('light', 'heavy')
+IO_PRIORITIES = ('normal', 'utility', 'throttle')
+
+#setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, policy) on OS X
+_IOPOL_TYPE_DISK = 0
+_IOPOL_SCOPE_PROCESS = 0
+_IOPOL_POLICIES = {'normal': 0, 'utility': 4, 'throttle': 3}
+#ioprio_set(IOPRIO_WHO_PROCESS, 0, class << 13 | data) on Linux
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_VALUES = {'normal': 2 << 13 | 4, 'utility': 2 << 13 | 7,
+                  'throttle': 3 << 13}
+_IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                        'aarch64': 30, 'armv7l': 314, 'ppc64le': 273}
+
+class ResourceLimits(namedtuple('ResourceLimits', ['nice', 'io_priority',
+                                                   'cpu_seconds', 'memory_mb',
+                                                   'max_heavy'])):
+    """The limits of a `ResourceGovernor`; None leaves a resource unlimited.
+
+    `max_heavy` is the maximum number of commands of heavy checks that run at
+    once.
+    """
+    __slots__ = ()
+
+    def __new__(cls, nice=None, io_priority=None, cpu_seconds=None,
+                memory_mb=None, max_heavy=None):
+        assert io_priority is None or io_priority in IO_PRIORITIES
+        assert max_heavy is None or max_heavy >= 1
+        return super(ResourceLimits, cls).__new__(
+            cls, nice, io_priority, cpu_seconds, memory_mb, max_heavy)
+
+#the limits of a background run that should stay unnoticed
+BACKGROUND = ResourceLimits(nice=10, io_priority='throttle', max_heavy=1)
+
+class ResourceGovernor(object):
+    """Applies `ResourceLimits` to the processes that execute commands."""
+
+    def __init__(self, limits=None):
+        """
+        Args:
+            limits (Optional[`ResourceLimits`]): Default: no limits.
+        """
+        self.limits = ResourceLimits() if limits is None else limits
+        self._heavy = None
+        if self.limits.max_heavy is not None:
+            self._heavy = threading.BoundedSemaphore(self.limits.max_heavy)
+        self._set_io_priority = None
+        if self.limits.io_priority is not None:
+            self._set_io_priority = _io_priority_setter(
+                self.limits.io_priority)
+
+    @property
+    def limits_processes(self):
+        """Whether any limits apply to the processes started."""
+        return (self.limits.nice is not None or
+                self._set_io_priority is not None or
+                self.limits.cpu_seconds is not None or
+                self.limits.memory_mb is not None)
+
+    def preexec_fn(self):
+        """Returns the function that applies the limits in a new process
+        before it executes a command, for `subprocess.Popen`, or None if there
+        are no limits to apply."""
+        if not self.limits_processes:
+            return None
+        return self._limit_process
+
+    def _limit_process(self):
+        """Applies the limits to the current process.
+
+        This runs in the child process between fork and exec, so limits that
+        cannot be applied are left out rather than failing the command.
+        """
+        if self.limits.nice is not None:
+            try:
+                os.nice(self.limits.nice - os.nice(0))
+            except OSError:
+                pass #raising the priority requires root
+        if self._set_io_priority is not None:
+            self._set_io_priority()
+        if self.limits.cpu_seconds is not None:
+            _lower_rlimit(resource.RLIMIT_CPU,
+                          max(1, int(self.limits.cpu_seconds)))
+        if self.limits.memory_mb is not None:
+            _lower_rlimit(resource.RLIMIT_AS,
+                          int(self.limits.memory_mb * 1024 * 1024))
+
+    @contextmanager
+    def slot(self, cost):
+        """Waits until a command of the given cost class may run.
+
+        Args:
+            cost (str): One of `COST_CLASSES`.
+        """
+        if cost != 'heavy' or self._heavy is None:
+            yield
+            return
+        with self._heavy:
+            yield
+
+def _lower_rlimit(limit, value):
+    """Lowers the soft limit of a resource, never above its hard limit."""
+    soft, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    if soft == resource.RLIM_INFINITY or value < soft:
+        try:
+            resource.setrlimit(limit, (value, hard))
+        except (ValueError, resource.error):
+            pass
+
+def _io_priority_setter(io_priority):
+    """Returns a function that sets the I/O priority of the current process,
+    or None if that is not supported on this platform."""
+    libc_name = ctypes.util.find_library('c')
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+    except OSError:
+        return None
+    if sys.platform == 'darwin' and hasattr(libc, 'setiopolicy_np'):
+        policy = _IOPOL_POLICIES[io_priority]
+        return lambda: libc.setiopolicy_np(_IOPOL_TYPE_DISK,
+                                           _IOPOL_SCOPE_PROCESS, policy)
+    syscall_num = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if sys.platform.startswith('linux') and syscall_num is not None:
+        value = _IOPRIO_VALUES[io_priority]
+        return lambda: libc.syscall(syscall_num, _IOPRIO_WHO_PROCESS, 0, value)
+    return None
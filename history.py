@@ -0,0 +1,297 @@
+"""Records the results of each run of app.py in a local SQLite database.
+
+Every run appends one row to `runs`. For each configuration check it also
+appends a row to `checks` with the final outcome, a row to `tests` for each test
+command evaluated, and a row to `fixes` for each fix command executed. Each row
+records when it started and how long it took. Checks are identified across runs
+by a hash of their description (see `check_key`) rather than by their number,
+because numbers shift whenever checks are added to or removed from the config.
+
+Rows are never modified after the run that wrote them, except that a run's
+finish time is filled in when it ends. `RunHistory.compact` deletes old runs
+so that the database stays bounded.
+"""
+
+import sqlite3
+import time
+import hashlib
+import socket
+from os.path import expanduser
+
+#Check outcomes, matching the tallies printed at the end of a run
+PASS_NO_FIX = 'pass_no_fix'
+PASS_AFTER_FIX = 'pass_after_fix'
+FAIL_FIX_FAIL = 'fail_fix_fail'
+FAIL_FIX_SKIPPED = 'fail_fix_skipped'
+FAIL_FIX_DECLINED = 'fail_fix_declined'
+FAIL_NO_FIX = 'fail_no_fix' #no automatic fix is available
+SKIPPED = 'skipped'
+NOT_EVALUATED = 'not_evaluated' #left out when the time budget was spent
+
+PASSING_OUTCOMES = (PASS_NO_FIX, PASS_AFTER_FIX)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    version TEXT,
+    hostname TEXT,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    check_num INTEGER NOT NULL,
+    check_key TEXT NOT NULL,
+    description TEXT NOT NULL,
+    confidence INTEGER,
+    outcome TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    check_key TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    outcome INTEGER NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fixes (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    check_key TEXT NOT NULL,
+    command TEXT NOT NULL,
+    sudo INTEGER NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checks_by_key ON checks (check_key, started);
+CREATE INDEX IF NOT EXISTS checks_by_run ON checks (run_id);
+CREATE INDEX IF NOT EXISTS tests_by_key ON tests (check_key, started);
+CREATE INDEX IF NOT EXISTS tests_by_run ON tests (run_id);
+CREATE INDEX IF NOT EXISTS fixes_by_key ON fixes (check_key, started);
+CREATE INDEX IF NOT EXISTS fixes_by_run ON fixes (run_id);
+CREATE INDEX IF NOT EXISTS runs_by_started ON runs (started);
+"""
+
+def check_key(description):
+    """Returns a short identifier for a check that is stable across runs."""
+    if isinstance(description, unicode):
+        description = description.encode('utf-8')
+    return hashlib.sha1(description).hexdigest()[:12]
+
+class RunHistory(object):
+    """Appends the results of runs to, and queries, a history database."""
+
+    def __init__(self, db_filename):
+        """
+        Args:
+            db_filename (str): The SQLite database to use. It is created if it
+                does not exist yet.
+        """
+        if db_filename.startswith('~'):
+            db_filename = expanduser(db_filename)
+        self.conn = sqlite3.connect(db_filename)
+        self.conn.executescript(_SCHEMA)
+        self.run_id = None
+        self._check_key = None
+        self._attempts = {} #check_key -> number of fixes recorded this run
+
+    def close(self):
+        """Commits any pending rows and closes the database."""
+        self.conn.commit()
+        self.conn.close()
+
+    def start_run(self, version, options):
+        """Begins recording a new run.
+
+        Args:
+            version (str): The version of this tool.
+            options (dict): The command line options in effect.
+        """
+        cursor = self.conn.execute(
+            "INSERT INTO runs (started, version, hostname, options) "
+            "VALUES (?, ?, ?, ?)",
+            (time.time(), version, socket.gethostname(),
+             repr(sorted(options.items()))))
+        self.run_id = cursor.lastrowid
+        self._attempts = {}
+        self.conn.commit()
+
+    def finish_run(self):
+        """Marks the current run as finished."""
+        self.conn.execute("UPDATE runs SET finished = ? WHERE id = ?",
+                          (time.time(), self.run_id))
+        self.conn.commit()
+
+    def start_check(self, description):
+        """Sets the check that subsequent tests and fixes belong to.
+
+        A check may be started again later in the same run, e.g. to verify
+        fixes that were applied to several checks at once. Its tests are then
+        recorded with the attempt number it had reached.
+        """
+        self._check_key = check_key(description)
+        self._attempts.setdefault(self._check_key, 0)
+
+    def record_test(self, command, outcome, started, duration):
+        """Records the evaluation of one test command of the current check.
+
+        Tests evaluated after a fix has been attempted are recorded with a
+        higher attempt number than the initial evaluation.
+
+        Args:
+            command (str): The test command.
+            outcome (int): The `CheckResult` of the test.
+            started (float): When the test began, in seconds since the epoch.
+            duration (float): How long the test took, in seconds.
+        """
+        self.conn.execute(
+            "INSERT INTO tests (run_id, check_key, attempt, command, outcome, "
+            "started, duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, self._check_key, self._attempts[self._check_key],
+             command, outcome,
+             started, duration))
+
+    def record_fix(self, command, use_sudo, started, duration):
+        """Records the execution of a fix command for the current check."""
+        self._attempts[self._check_key] += 1
+        self.conn.execute(
+            "INSERT INTO fixes (run_id, check_key, command, sudo, started, "
+            "duration) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.run_id, self._check_key, command, int(use_sudo), started,
+             duration))
+
+    def record_check(self, check_num, description, confidence, outcome,
+                     started, duration):
+        """Records the final outcome of a check, including any fixes.
+
+        Args:
+            check_num (int): The number of the check in this run.
+            description (str): The description of the check.
+            confidence (int): The `Confidence` of the check.
+            outcome (str): One of the outcome constants in this module.
+            started (float): When the check began, in seconds since the epoch.
+            duration (float): How long the check took, in seconds, including
+                fixes and waiting for the user to answer prompts.
+        """
+        self.conn.execute(
+            "INSERT INTO checks (run_id, check_num, check_key, description, "
+            "confidence, outcome, started, duration) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, check_num, check_key(description), description,
+             confidence, outcome, started, duration))
+        self.conn.commit()
+
+    def find_checks(self, search):
+        """Finds the checks matching a check number, key or description.
+
+        Args:
+            search (str): A check number as of the most recent run, a check key,
+                or a case-insensitive substring of the description.
+        Returns:
+            List[(str, str)]: (check_key, description) pairs.
+        """
+        if search.isdigit():
+            return self.conn.execute(
+                "SELECT check_key, description FROM checks WHERE run_id = "
+                "(SELECT MAX(run_id) FROM checks) AND check_num = ?",
+                (int(search),)).fetchall()
+        return self.conn.execute(
+            "SELECT DISTINCT check_key, description FROM checks "
+            "WHERE check_key = ? OR description LIKE ? ORDER BY description",
+            (search, '%' + search + '%')).fetchall()
+
+    def check_history(self, key):
+        """Returns each recorded outcome of a check, oldest first.
+
+        Returns:
+            List[(float, int, str, float)]: (started, check_num, outcome,
+                duration) tuples.
+        """
+        return self.conn.execute(
+            "SELECT started, check_num, outcome, duration FROM checks "
+            "WHERE check_key = ? ORDER BY started", (key,)).fetchall()
+
+    def regressions(self):
+        """Finds checks that passed before but fail as of their latest run.
+
+        Returns:
+            List[(str, str, float, float)]: (check_key, description, time of the
+                last pass, time of the first failure after it), most recent
+                regressions first.
+        """
+        rows = self.conn.execute(
+            "SELECT check_key, description, outcome, started FROM checks "
+            "ORDER BY check_key, started")
+        results = []
+        current_key = None
+        for key, description, outcome, started in rows:
+            if key != current_key:
+                if current_key is not None and regression is not None:
+                    results.append(regression)
+                current_key, last_pass, regression = key, None, None
+            if outcome in PASSING_OUTCOMES:
+                last_pass, regression = started, None
+            elif (outcome not in (SKIPPED, NOT_EVALUATED) and
+                  last_pass is not None):
+                if regression is None:
+                    regression = (key, description, last_pass, started)
+        if current_key is not None and regression is not None:
+            results.append(regression)
+        return sorted(results, key=lambda row: row[3], reverse=True)
+
+    def slowest(self, limit=10, runs=10):
+        """Finds the checks with the longest average duration.
+
+        Only test commands are timed, so that time spent waiting for the user
+        to answer prompts is not counted.
+
+        Args:
+            limit (int): The number of checks to return.
+            runs (int): The number of most recent runs to average over.
+        Returns:
+            List[(str, str, float, float, int)]: (check_key, description,
+                average seconds per run, longest seconds in a run, number of
+                runs), slowest first.
+        """
+        return self.conn.execute(
+            "SELECT t.check_key, c.description, AVG(t.total), MAX(t.total), "
+            "COUNT(*) FROM (SELECT run_id, check_key, SUM(duration) AS total "
+            "FROM tests WHERE run_id IN (SELECT id FROM runs ORDER BY id DESC "
+            "LIMIT ?) GROUP BY run_id, check_key) AS t JOIN "
+            "(SELECT check_key, description FROM checks GROUP BY check_key) "
+            "AS c ON c.check_key = t.check_key GROUP BY t.check_key "
+            "ORDER BY AVG(t.total) DESC LIMIT ?", (runs, limit)).fetchall()
+
+    def compact(self, max_runs, max_age_days):
+        """Deletes runs beyond the retention limits, along with their rows.
+
+        The database file is only shrunk (vacuumed) when a run was deleted.
+
+        Args:
+            max_runs (int): The number of most recent runs to keep.
+            max_age_days (float): Runs that started longer ago than this are
+                deleted.
+        Returns:
+            int: The number of runs deleted.
+        """
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        stale = [row[0] for row in self.conn.execute(
+            "SELECT id FROM runs WHERE started < ? OR id NOT IN "
+            "(SELECT id FROM runs ORDER BY id DESC LIMIT ?)",
+            (cutoff, max_runs))]
+        if len(stale) == 0:
+            return 0
+        for table in ('tests', 'fixes', 'checks'):
+            self.conn.executemany("DELETE FROM %s WHERE run_id = ?" % table,
+                                  [(run_id,) for run_id in stale])
+        self.conn.executemany("DELETE FROM runs WHERE id = ?",
+                              [(run_id,) for run_id in stale])
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        return len(stale)
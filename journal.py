@@ -0,0 +1,142 @@
+"""Checkpoints the progress of a run of app.py, so that it can be resumed.
+
+An interactive run can take many minutes, and it may be interrupted before it
+finishes. As each check is completed, its outcome is appended to a journal, one
+JSON object per line after a header line, e.g.:
+
+    {"format": 1, "started": 1476316800.0}
+    {"check": "3f1c2a9b0d4e", "inputs": "5d0c1e...", "outcome": "pass_no_fix",
+     "started": 1476316801.2, "duration": 0.4, "failing_targets": [],
+     "manual_fix": false}
+
+Each line is flushed to disk before the run moves on, so the journal lists
+every check completed before an interruption; a line cut short by the
+interruption is ignored. The journal is removed once a run finishes.
+
+With --resume, a run reads the journal left by the interrupted run and takes
+the outcome of each check listed there from the journal instead of performing
+the check again, as long as the check's inputs have not changed: its tests,
+fixes and confidence in the config, the invalidation keys of its cached tests
+(see `probe_cache`), and whether fixes are attempted and sudo tests skipped.
+Checks are identified by `history.check_key`.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import probe_cache #probe_cache.py
+
+JOURNAL_FORMAT = 1
+
+def inputs_key(config_check, attempt_fixes, skip_sudo_tests):
+    """Returns a string that changes whenever the inputs of a check do.
+
+    Args:
+        config_check (`runner.ConfigCheck`): The check.
+        attempt_fixes (bool): Whether the run attempts fixes.
+        skip_sudo_tests (bool): Whether the run skips tests that need sudo.
+    """
+    fields = repr((config_check.tests, config_check.confidence,
+                   config_check.fix, config_check.sudo_fix,
+                   config_check.manual_fix, config_check.restart,
+                   config_check.sudo_restart, attempt_fixes, skip_sudo_tests))
+    cache_keys = [key for test in config_check.tests if test.cache is not None
+                  for key in test.cache.keys]
+    if len(cache_keys) > 0:
+        fields += repr(probe_cache.fingerprint(cache_keys))
+    return hashlib.sha1(fields).hexdigest()[:16]
+
+class Journal(object):
+    """The outcomes of the checks completed so far in a run, kept in a file."""
+
+    def __init__(self, filename, started, resume=False):
+        """Opens the journal for a run.
+
+        Args:
+            filename (str): The journal file.
+            started (float): When the run started.
+            resume (bool): Whether to keep the outcomes in the journal of an
+                interrupted run. Otherwise, the journal is started afresh.
+
+        Raises:
+            IOError, OSError: If the journal cannot be written.
+        """
+        self.filename = os.path.expanduser(filename)
+        self.entries = {} #journal entry of each completed check, by check key
+        header = {'format': JOURNAL_FORMAT, 'started': started}
+        if resume:
+            header, self.entries = _read_journal(self.filename, header)
+        #rewrite the journal without any line cut short by an interruption
+        journal_dir = os.path.dirname(os.path.abspath(self.filename))
+        handle, temp_filename = tempfile.mkstemp(dir=journal_dir,
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                for entry in [header] + self.entries.values():
+                    temp_file.write(json.dumps(entry, sort_keys=True) + '\n')
+            os.rename(temp_filename, self.filename)
+        except:
+            os.remove(temp_filename)
+            raise
+        self._file = open(self.filename, 'a')
+
+    def completed(self, key, inputs):
+        """Returns the journal entry of a check completed with the same inputs,
+        or None if there is none.
+
+        The entry is a `dict` with the keys "outcome", "started", "duration",
+        "failing_targets" and "manual_fix" (whether the check was listed for
+        manual remediation).
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.get('inputs') != inputs:
+            return None
+        return entry
+
+    def record(self, key, inputs, outcome, started, duration, failing_targets,
+               manual_fix):
+        """Appends the outcome of a completed check to the journal."""
+        entry = {'check': key, 'inputs': inputs, 'outcome': outcome,
+                 'started': started, 'duration': duration,
+                 'failing_targets': list(failing_targets),
+                 'manual_fix': manual_fix}
+        self.entries[key] = entry
+        self._append(entry)
+
+    def close(self, finished):
+        """Closes the journal, removing it if the run finished."""
+        self._file.close()
+        if finished:
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry, sort_keys=True) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+def _read_journal(filename, new_header):
+    """Reads the header and the entries by check key of a journal.
+
+    Returns `new_header` and no entries if there is no journal in the current
+    format.
+    """
+    try:
+        with open(filename, 'r') as journal_file:
+            lines = journal_file.read().splitlines()
+        header = json.loads(lines[0])
+        if header.get('format') != JOURNAL_FORMAT:
+            return new_header, {}
+    except (IOError, IndexError, ValueError, AttributeError):
+        return new_header, {}
+    entries = {}
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+            entries[entry['check']] = entry
+        except (ValueError, KeyError, TypeError):
+            pass #cut short when the run was interrupted
+    return header, entries
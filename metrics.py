@@ -0,0 +1,116 @@
+"""Exports the results of a run of app.py as Prometheus metrics.
+
+With --metrics-file, a file in the Prometheus text exposition format is
+written at the end of every run, for the textfile collector of node_exporter
+to pick up, e.g.:
+
+    # HELP osx_config_check_check_passed Whether the check passed, with or ...
+    # TYPE osx_config_check_check_passed gauge
+    osx_config_check_check_passed{check="3f1c2a9b0d4e",confidence="required"} 1
+
+Checks are labelled by the hash of their description (see `history.check_key`)
+and their confidence. The totals match the tallies that app.py prints at the
+end of a run. The file is replaced atomically, so the collector never reads a
+partially written file.
+"""
+
+import os
+import time
+import tempfile
+import history #history.py
+
+METRIC_PREFIX = 'osx_config_check_'
+
+#every outcome, in the order of the tallies
+OUTCOMES = (history.PASS_NO_FIX, history.PASS_AFTER_FIX, history.FAIL_FIX_FAIL,
+            history.FAIL_FIX_SKIPPED, history.FAIL_FIX_DECLINED,
+            history.FAIL_NO_FIX, history.SKIPPED, history.NOT_EVALUATED)
+
+def format_metrics(result, confidence_to_str, finished=None):
+    """Formats the result of a run as Prometheus metrics.
+
+    Args:
+        result (`runner.RunResult`): The result of the run.
+        confidence_to_str (function): Converts the confidence of a check to
+            the string used in the config, see `runner.confidence_to_str`.
+        finished (Optional[float]): When the run finished. Default: now.
+
+    Returns:
+        str: The metrics in the text exposition format.
+    """
+    lines = []
+    def metric(name, help_text, samples):
+        lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, help_text))
+        lines.append("# TYPE %s%s gauge" % (METRIC_PREFIX, name))
+        for labels, value in samples:
+            label_text = ','.join('%s="%s"' % (label, _escape(label_value))
+                                  for label, label_value in labels)
+            if label_text != '':
+                label_text = '{%s}' % label_text
+            lines.append("%s%s%s %s" % (METRIC_PREFIX, name, label_text,
+                                        _format_value(value)))
+
+    check_labels = [(check, (('check', history.check_key(check.description)),
+                             ('confidence',
+                              confidence_to_str(check.confidence))))
+                    for check in result.checks]
+    metric('check_passed', "Whether the check passed, with or without a fix.",
+           [(labels, int(check.outcome in history.PASSING_OUTCOMES))
+            for check, labels in check_labels])
+    metric('check_failed', "Whether the check failed or was skipped, not "
+           "counting checks that have no automatic fix.",
+           [(labels, int(check.outcome not in history.PASSING_OUTCOMES and
+                         check.outcome not in (history.FAIL_NO_FIX,
+                                               history.NOT_EVALUATED)))
+            for check, labels in check_labels])
+    metric('check_outcome', "The outcome of the check, as a label.",
+           [(labels + (('outcome', check.outcome),), 1)
+            for check, labels in check_labels])
+    metric('check_duration_seconds', "How long the check took, including "
+           "fixes.", [(labels, check.duration)
+                      for check, labels in check_labels])
+
+    metric('checks', "The number of checks considered.",
+           [((), result.total_checks)])
+    metric('checks_passed', "The number of checks that passed.",
+           [((), result.passed)])
+    metric('checks_failed', "The number of checks that failed or were "
+           "skipped.", [((), result.failed)])
+    metric('checks_by_outcome', "The number of checks with each outcome.",
+           [((('outcome', outcome),), result.count(outcome))
+            for outcome in OUTCOMES])
+    metric('processes_spawned', "The number of processes started to execute "
+           "commands.", [((), result.processes_spawned)])
+    metric('run_duration_seconds', "How long the run took.",
+           [((), result.duration)])
+    metric('last_run_timestamp_seconds', "When the run finished.",
+           [((), time.time() if finished is None else finished)])
+    return '\n'.join(lines) + '\n'
+
+def write_metrics(filename, text):
+    """Writes metrics, replacing any existing file atomically.
+
+    The file is made readable by everyone, as node_exporter usually runs as
+    another user.
+    """
+    filename = os.path.expanduser(filename)
+    metrics_dir = os.path.dirname(os.path.abspath(filename))
+    handle, temp_filename = tempfile.mkstemp(dir=metrics_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as temp_file:
+            temp_file.write(text)
+        os.chmod(temp_filename, 0644)
+        os.rename(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+def _escape(value):
+    """Escapes a label value for the text exposition format."""
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,159 @@
+"""Performs the checks for every user of the computer, with --all-users.
+
+Many checks concern the settings of the user running app.py, such as the
+preferences of Safari or the profiles of Chrome, while others concern the whole
+computer. An administrator auditing a shared Mac wants the former checked for
+each user, not just for themselves.
+
+Each check has a scope, see `runner.ConfigCheck`: "system" or "user".
+`AllUsersRunner` performs the system-scope checks once, as a normal run would,
+then performs the user-scope checks once for each home directory found by
+`find_homes`, for several homes at once. The commands for a home run with HOME,
+USER and LOGNAME set to those of its user, so that "~" refers to that home,
+and as the owner of the home when app.py runs as root, so that `defaults`
+reads and writes that user's preferences. See `runner.ShellExecutor`.
+
+Every home has its own `runner.RunResult`, and the messages of its checks are
+prefixed with the name of its user. The run history, journal, probe cache,
+check durations, remediation plan and metrics only cover the system-scope
+checks, as they are kept for one user's settings.
+"""
+
+import os
+import sys
+import copy
+from collections import namedtuple
+import const #const.py
+import remediation #remediation.py
+import runner #runner.py
+
+const.DEFAULT_HOMES_ROOT = '/Users' if sys.platform == 'darwin' else '/home'
+#directories in the homes root that are not the home of a user
+const.NOT_HOMES = frozenset(['Shared', 'Guest', 'Deleted Users', 'lost+found'])
+
+class Home(namedtuple('Home', ['name', 'path', 'uid', 'gid'])):
+    """The home directory of a user: the user's name, the path of the
+    directory, and the user and group that own it."""
+    __slots__ = ()
+
+class AllUsersResult(namedtuple('AllUsersResult', ['system', 'users'])):
+    """The results of `AllUsersRunner.run`.
+
+    `system` is the `runner.RunResult` of the system-scope checks, and
+    `users` lists each `Home` with the `runner.RunResult` of its user-scope
+    checks.
+    """
+    __slots__ = ()
+
+def find_homes(root=None):
+    """Returns the home directories of the local users.
+
+    Every directory in `root` is the home of the user with its name, except
+    for hidden directories and those in `const.NOT_HOMES`.
+
+    Args:
+        root (Optional[str]): The directory containing the homes, e.g. one
+            with fake homes for testing. Default: `const.DEFAULT_HOMES_ROOT`
+
+    Returns:
+        List[`Home`]: Sorted by name.
+    """
+    root = const.DEFAULT_HOMES_ROOT if root is None else root
+    homes = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if (name.startswith('.') or name in const.NOT_HOMES or
+                not os.path.isdir(path)):
+            continue
+        stat = os.stat(path)
+        homes.append(Home(name, path, stat.st_uid, stat.st_gid))
+    return homes
+
+class PrefixedOutput(object):
+    """Writes messages to another output, prefixing each line."""
+
+    def __init__(self, output, prefix):
+        self.output = output
+        self.prefix = prefix
+
+    def write(self, msg, debug=False):
+        """Writes a message, see `runner.ConsoleOutput.write`."""
+        self.output.write('\n'.join(self.prefix + line if line != '' else line
+                                    for line in msg.split('\n')),
+                          debug=debug)
+
+class AllUsersRunner(object):
+    """Performs the system-scope checks once and the user-scope checks for
+    every home."""
+
+    def __init__(self, config, homes, options=None, output=None, ask=None):
+        """
+        Args:
+            config (str or List[`runner.ConfigCheck`]): The config file to
+                read, or the checks to perform.
+            homes (List[`Home`]): The homes to perform the user-scope checks
+                for, see `find_homes`.
+            options (Optional[`runner.RunOptions`]): The options of the run.
+                Commands cannot be recorded or replayed, nor remediation plans
+                applied. Default: `runner.RunOptions()`
+            output (Optional[`runner.ConsoleOutput`]): Where to write
+                messages. Default: a `runner.ConsoleOutput` for the options.
+            ask (Optional[function]): Asks the user whether to apply fixes,
+                see `runner.Runner`.
+        """
+        options = runner.RunOptions() if options is None else options
+        assert (options.record is None and options.replay is None and
+                options.apply_plan is None)
+        if output is None:
+            output = runner.ConsoleOutput(debug_print=options.debug_print,
+                                          log_file=options.log_file)
+        if isinstance(config, basestring):
+            config = runner.read_config(config, output)
+        self.config_checks = config
+        self.options = options
+        self.homes = list(homes)
+
+        scopes = dict((scope, set()) for scope in const.SCOPES)
+        for check_num, config_check in enumerate(config, 1):
+            scopes[config_check.scope].add(check_num)
+        system_options = copy.copy(options)
+        system_options.checks = scopes['system']
+        self.system_runner = runner.Runner(config, system_options,
+                                           output=output, ask=ask)
+        #the users share the system runner's limit on heavy commands
+        resource_governor = self.system_runner.governor
+        user_options = copy.copy(options)
+        user_options.checks = scopes['user']
+        for state in ('history_db', 'plan_file', 'probe_cache',
+                      'durations_file', 'metrics_file', 'journal_file'):
+            setattr(user_options, state, None)
+        user_options.resume = False
+        self.user_runners = []
+        for home in self.homes:
+            user_output = PrefixedOutput(output, "[%s] " % home.name)
+            executor = runner.ShellExecutor(
+                output=user_output, resource_governor=resource_governor,
+                home=home)
+            self.user_runners.append(runner.Runner(
+                config, user_options, executor=executor, output=user_output,
+                ask=ask, resource_governor=resource_governor))
+
+    @property
+    def prompts(self):
+        """Whether the runs may ask the user whether to apply fixes."""
+        return self.options.attempt_fixes and self.options.prompt_for_fixes
+
+    def run(self):
+        """Performs the checks.
+
+        The user-scope checks of up to `jobs` homes are performed at once,
+        unless the user may be asked whether to apply fixes.
+
+        Returns:
+            `AllUsersResult`
+        """
+        system_result = self.system_runner.run()
+        user_results = list(remediation.map_in_order(
+            lambda user_runner: user_runner.run(), self.user_runners,
+            self.options.jobs, in_parallel=lambda _: not self.prompts))
+        return AllUsersResult(system_result, zip(self.homes, user_results))
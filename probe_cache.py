@@ -0,0 +1,204 @@
+"""Caches the results of expensive test commands across runs of app.py.
+
+Some tests are slow but their results rarely change, such as whether Homebrew
+or Google Chrome is installed. A test in the config can declare that its result
+may be reused for a while:
+
+    {
+        type: "exact match"
+        command: echo $(homebrew_is_installed)
+        command_pass: "1"
+        case_sensitive: "false"
+        cache:
+        {
+            ttl: 86400
+            keys: ["binary:brew"]
+        }
+    }
+
+`ttl` is how long a result stays valid, in seconds. Each of the invalidation
+`keys` names an input of the test; the result is discarded as soon as any of
+them changes:
+
+    * "binary:NAME": The executable NAME found in the PATH, identified by its
+        resolved path and modification time.
+    * "file:PATH": The file or directory PATH (`~` is expanded), identified by
+        its modification time, e.g. an application bundle's Info.plist.
+
+When a fix is applied, the cached results of the check's own tests are
+discarded, as are those of any test with an input named in the fix command.
+
+The cache is a JSON file that is read at the start of a run and written back
+atomically at its end. Expired results are dropped when it is written.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+
+CACHE_FORMAT = 1
+
+class CacheSpec(namedtuple('CacheSpec', ['ttl', 'keys'])):
+    """How long the result of a test may be reused, and what invalidates it."""
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Creates a spec from the "cache" object of a test in the config."""
+        assert isinstance(spec, dict), "%s" % str(spec)
+        ttl = float(spec['ttl'])
+        assert ttl > 0
+        keys = tuple(spec.get('keys', ()))
+        for key in keys:
+            assert key.partition(':')[0] in ('binary', 'file'), key
+        return cls(ttl, keys)
+
+def test_key(test):
+    """Returns the identifier of a test's cached result.
+
+    It covers everything that decides the result of the test besides the
+    command's output, so tests that share a command are cached separately.
+    """
+    fields = repr((test.comparison_type, test.command, test.command_pass,
+                   test.command_fail, test.case_sensitive))
+    return hashlib.sha1(fields).hexdigest()[:16]
+
+def fingerprint(keys):
+    """Returns the current state of each invalidation key.
+
+    Returns:
+        List[str]: One string per key, which changes when the input does.
+    """
+    states = []
+    for key in keys:
+        kind, _, name = key.partition(':')
+        if kind == 'binary':
+            path = _which(name)
+        else:
+            path = os.path.expanduser(name)
+        try:
+            mtime = os.stat(path).st_mtime if path is not None else None
+        except OSError:
+            mtime = None
+        if mtime is None:
+            states.append("%s missing" % key)
+        else:
+            states.append("%s %s %r" % (key, os.path.realpath(path), mtime))
+    return states
+
+def _which(name):
+    """Finds an executable in the PATH, like the shell would."""
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+class ProbeCache(object):
+    """The cached results of tests, stored in a file between runs."""
+
+    def __init__(self, filename):
+        """Reads the cache, or starts an empty one if it cannot be read.
+
+        Args:
+            filename (str): The cache file.
+        """
+        self.filename = os.path.expanduser(filename)
+        self.entries = {}
+        self.changed = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.filename, 'r') as cache_file:
+                cache = json.load(cache_file)
+            if cache.get('format') == CACHE_FORMAT:
+                self.entries = dict(cache['entries'])
+        except (IOError, ValueError, KeyError, TypeError, AttributeError):
+            pass #a missing or damaged cache is only a cache miss
+
+    def lookup(self, test):
+        """Returns the cached result of a test, or None if there is none.
+
+        Args:
+            test (`runner.CheckTest`): A test whose `cache` spec is set.
+        """
+        key = test_key(test)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if (time.time() - entry['stored'] >= test.cache.ttl or
+                entry['fingerprint'] != fingerprint(test.cache.keys)):
+            with self._lock:
+                self.entries.pop(key, None)
+                self.changed = True
+            return None
+        return entry['result']
+
+    def store(self, test, result):
+        """Caches the result of a test whose `cache` spec is set."""
+        entry = {'result': result,
+                 'stored': time.time(),
+                 'ttl': test.cache.ttl,
+                 'inputs': list(test.cache.keys),
+                 'fingerprint': fingerprint(test.cache.keys)}
+        with self._lock:
+            self.entries[test_key(test)] = entry
+            self.changed = True
+
+    def purge_for_fix(self, tests, command):
+        """Discards the results a fix may have changed.
+
+        Args:
+            tests (List[`runner.CheckTest`]): The tests of the fixed check.
+            command (str): The fix command that was executed.
+
+        Returns:
+            int: The number of results discarded.
+        """
+        stale = set(test_key(test) for test in tests)
+        with self._lock:
+            for key, entry in self.entries.iteritems():
+                if any(name in command for name in
+                       (_input_name(input_key)
+                        for input_key in entry['inputs'])):
+                    stale.add(key)
+            stale &= set(self.entries)
+            for key in stale:
+                del self.entries[key]
+            if len(stale) > 0:
+                self.changed = True
+        return len(stale)
+
+    def save(self):
+        """Writes the cache back atomically if it changed, dropping expired
+        results."""
+        with self._lock:
+            if not self.changed:
+                return
+            now = time.time()
+            entries = dict((key, entry) for key, entry
+                           in self.entries.iteritems()
+                           if now - entry['stored'] < entry['ttl'])
+            self.changed = False
+        cache_dir = os.path.dirname(os.path.abspath(self.filename))
+        handle, temp_filename = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump({'format': CACHE_FORMAT, 'entries': entries},
+                          temp_file, sort_keys=True)
+            os.rename(temp_filename, self.filename)
+        except:
+            os.remove(temp_filename)
+            raise
+
+def _input_name(key):
+    """The name of an invalidation key's input as it would appear in a
+    command, e.g. "brew" for "binary:brew"."""
+    kind, _, name = key.partition(':')
+    if kind == 'file' and name.startswith('~'):
+        return name[1:]
+    return name
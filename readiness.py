@@ -0,0 +1,141 @@
+"""Waits for fixes to take effect before their checks are verified again.
+
+Some fixes take a moment to take effect, such as quitting an application, or
+a preference that is only written to disk once the application quits. A fixed
+delay such as `killall Safari ; sleep 1` is too long on a fast Mac and too
+short on a busy one, where the check is verified before the fix took effect
+and fails. A fix in the config can instead say when it has taken effect:
+
+    fix:
+    {
+        command: killall "Safari"
+        wait_until:
+        {
+            process_gone: Safari
+            timeout: 10
+        }
+    }
+
+`wait_until` has exactly one of these conditions:
+
+    * process_gone: NAME    No process named NAME is running, naming processes
+        the way `killall` does.
+    * file_updated: PATH    The contents of the file PATH (`~` is expanded)
+        differ from what they were before the fix.
+    * key_readable: "DOMAIN KEY"    `defaults read DOMAIN KEY` succeeds.
+    * command: COMMAND      COMMAND exits with status 0.
+
+`timeout` is the most seconds to wait. Default: `const.DEFAULT_WAIT_TIMEOUT`
+
+The condition is evaluated right after the fix and its restart command, if
+any, and then again after delays that double from `const.WAIT_FIRST_DELAY` up
+to `const.WAIT_MAX_DELAY`, until it holds or the timeout passes. Either way the
+check is verified next; a fix that did not take effect in time fails its
+check as before. The conditions are executed like the other commands of the
+check, so they are recorded in and replayed from cassettes, and run as the
+user whose settings are fixed.
+"""
+
+import time
+import pipes
+from collections import namedtuple
+import const #const.py
+
+const.DEFAULT_WAIT_TIMEOUT = 10.0 #seconds
+const.WAIT_FIRST_DELAY = 0.05 #seconds before the second evaluation
+const.WAIT_MAX_DELAY = 1.0 #longest delay between two evaluations, in seconds
+
+CONDITIONS = ('process_gone', 'file_updated', 'key_readable', 'command')
+
+class WaitCondition(namedtuple('WaitCondition',
+                               ['kind', 'argument', 'timeout'])):
+    """When a fix has taken effect: `kind` is one of `CONDITIONS`, and
+    `argument` is its value in the config."""
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Creates a condition from the "wait_until" object of a fix in the
+        config."""
+        assert isinstance(spec, dict), "%s" % str(spec)
+        kinds = [kind for kind in CONDITIONS if kind in spec]
+        assert len(kinds) == 1, "%s" % str(spec)
+        argument = spec[kinds[0]]
+        if kinds[0] == 'key_readable':
+            assert len(argument.split(None, 1)) == 2, argument
+        timeout = float(spec.get('timeout', const.DEFAULT_WAIT_TIMEOUT))
+        assert timeout > 0
+        return cls(kinds[0], argument, timeout)
+
+    def command(self):
+        """The command that evaluates the condition, see `holds`."""
+        if self.kind == 'process_gone':
+            return 'killall -0 %s' % pipes.quote(self.argument)
+        elif self.kind == 'file_updated':
+            return 'cksum %s' % _quote_path(self.argument)
+        elif self.kind == 'key_readable':
+            domain, key = self.argument.split(None, 1)
+            return 'defaults read %s %s' % (pipes.quote(domain),
+                                            pipes.quote(key))
+        return self.argument
+
+    def holds(self, status, output, before):
+        """Whether the condition holds, given the exit status and output of
+        its command, and its output before the fix, see `snapshot`."""
+        if self.kind == 'process_gone':
+            return status != 0 #killall found no process to signal
+        elif self.kind == 'file_updated':
+            return status == 0 and output != before
+        return status == 0
+
+def _quote_path(path):
+    """Quotes a path for the shell, leaving a leading `~` to be expanded."""
+    if path == '~':
+        return path
+    if path.startswith('~/'):
+        return '~/' + pipes.quote(path[2:])
+    return pipes.quote(path)
+
+def snapshot(condition, executor):
+    """Returns what `wait_until` compares the condition with after the fix:
+    the output of its command before the fix if the condition is
+    "file_updated", and otherwise ''.
+
+    Args:
+        condition (`WaitCondition`): The condition of the fix.
+        executor (`runner.Executor`): Executes the commands of the check.
+    """
+    if condition.kind != 'file_updated':
+        return ''
+    return executor.run_status(const.API_PREFIX + condition.command())[1]
+
+def wait_until(condition, executor, before='', sleep=time.sleep,
+               clock=time.time):
+    """Evaluates a condition with exponential backoff until it holds or its
+    timeout passes.
+
+    Args:
+        condition (`WaitCondition`): The condition of the fix.
+        executor (`runner.Executor`): Executes the commands of the check.
+        before (str): The result of `snapshot` before the fix.
+        sleep (function): Waits for a number of seconds.
+        clock (function): Returns the current time in seconds.
+
+    Returns:
+        tuple: (bool, int): Whether the condition held, and how many times it
+            was evaluated.
+    """
+    deadline = clock() + condition.timeout
+    delay = const.WAIT_FIRST_DELAY
+    evaluations = 0
+    while True:
+        status, output = executor.run_status(const.API_PREFIX +
+                                             condition.command())
+        evaluations += 1
+        if condition.holds(status, output, before):
+            return True, evaluations
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return False, evaluations
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, const.WAIT_MAX_DELAY)
@@ -0,0 +1,189 @@
+"""Support for evaluating every check before remediating any of them.
+
+In two-phase mode, app.py first evaluates all configuration checks without
+waiting for the user, running checks concurrently where that is safe. It then
+writes a remediation plan listing each failing check that has an automatic fix,
+lets the user approve the fixes in bulk, and only then applies them.
+
+The plan is a JSON file that can also be edited and applied later, e.g.:
+
+    {
+        "format": 1,
+        "version": "v1.1.0 (ivysaur)",
+        "created": 1476890000.0,
+        "checks": [
+            {
+                "check_num": 24,
+                "check_key": "3f1c2a9b0d4e",
+                "description": "Bluetooth is disabled.",
+                "confidence": "recommended",
+                "fix": null,
+                "sudo_fix": "sudo defaults write ...",
+                "manual_fix": null,
+                "approved": true
+            }
+        ]
+    }
+
+Only the checks whose "approved" attribute is true are fixed when a plan is
+applied. The fix commands that are run are always taken from the config file,
+not from the plan, so a plan cannot be used to run arbitrary commands.
+"""
+
+import os
+import json
+import time
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+PLAN_FORMAT = 1
+
+class PlanError(Exception):
+    """The remediation plan could not be read."""
+    pass
+
+class PlanEntry(object):
+    """A failing check and the fix proposed for it."""
+
+    _FIELDS = ('check_num', 'check_key', 'description', 'confidence', 'fix',
+               'sudo_fix', 'manual_fix', 'approved')
+
+    def __init__(self, check_num, check_key, description, confidence, fix=None,
+                 sudo_fix=None, manual_fix=None, approved=False):
+        """
+        Args:
+            check_num (int): The number of the check when it was evaluated.
+            check_key (str): The identifier of the check, see
+                `history.check_key`.
+            description (str): The description of the check.
+            confidence (str): "required", "recommended", or "experimental"
+            fix (Optional[str]): The fix command of the check.
+            sudo_fix (Optional[str]): The sudo fix command of the check.
+            manual_fix (Optional[str]): Instructions for fixing the check
+                manually.
+            approved (bool): Whether the fix should be applied.
+        """
+        self.check_num = check_num
+        self.check_key = check_key
+        self.description = description
+        self.confidence = confidence
+        self.fix = fix
+        self.sudo_fix = sudo_fix
+        self.manual_fix = manual_fix
+        self.approved = approved
+
+    def to_dict(self):
+        """Returns the entry as a `dict` for serialization."""
+        return dict((field, getattr(self, field)) for field in self._FIELDS)
+
+    @classmethod
+    def from_dict(cls, entry):
+        """Creates an entry from a `dict` read from a plan file.
+
+        Raises:
+            PlanError: If a required attribute is missing.
+        """
+        try:
+            return cls(check_num=int(entry['check_num']),
+                       check_key=entry['check_key'],
+                       description=entry['description'],
+                       confidence=entry['confidence'],
+                       fix=entry.get('fix'),
+                       sudo_fix=entry.get('sudo_fix'),
+                       manual_fix=entry.get('manual_fix'),
+                       approved=bool(entry.get('approved', False)))
+        except (KeyError, TypeError, ValueError, AttributeError) as err:
+            raise PlanError("Invalid plan entry %s: %s" % (repr(entry), err))
+
+def write_plan(plan_filename, entries, version):
+    """Writes a remediation plan, replacing any existing file atomically.
+
+    Args:
+        plan_filename (str): The file to write.
+        entries (List[`PlanEntry`]): The failing checks, in order.
+        version (str): The version of the tool writing the plan.
+    """
+    plan_filename = os.path.expanduser(plan_filename)
+    plan = {'format': PLAN_FORMAT,
+            'version': version,
+            'created': time.time(),
+            'checks': [entry.to_dict() for entry in entries]}
+    plan_dir = os.path.dirname(os.path.abspath(plan_filename))
+    handle, temp_filename = tempfile.mkstemp(dir=plan_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as temp_file:
+            json.dump(plan, temp_file, indent=4, sort_keys=True)
+            temp_file.write('\n')
+        os.rename(temp_filename, plan_filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+def read_plan(plan_filename):
+    """Reads a remediation plan written by `write_plan`.
+
+    Returns:
+        List[`PlanEntry`]: The failing checks, in order.
+    Raises:
+        PlanError: If the file cannot be read or is not a valid plan.
+    """
+    try:
+        with open(os.path.expanduser(plan_filename), 'r') as plan_file:
+            plan = json.load(plan_file)
+    except (IOError, ValueError) as err:
+        raise PlanError("Could not read plan '%s': %s" % (plan_filename, err))
+    if not isinstance(plan, dict) or plan.get('format') != PLAN_FORMAT:
+        raise PlanError("'%s' is not a remediation plan in format %d." %
+                        (plan_filename, PLAN_FORMAT))
+    if not isinstance(plan.get('checks'), list):
+        raise PlanError("'%s' does not list any checks." % plan_filename)
+    return [PlanEntry.from_dict(entry) for entry in plan['checks']]
+
+def map_in_order(function, items, jobs, in_parallel=None, priority=None):
+    """Applies `function` to each item, yielding the results in order.
+
+    Up to `jobs` items are processed concurrently by worker threads. Items for
+    which `in_parallel` returns False, such as checks that may prompt for a
+    password, are processed one at a time in the calling thread instead, while
+    the workers continue with the other items.
+
+    Args:
+        function (function): Called with each item.
+        items (list): The items to process.
+        jobs (int): The maximum number of worker threads.
+        in_parallel (Optional[function]): Called with each item; whether it
+            may be processed by a worker thread. Default: all items may.
+        priority (Optional[function]): Called with each item; the workers
+            start on the items with the highest priority first, e.g. the
+            slowest ones, so that a slow item is not left until last.
+            Default: the workers process the items in order.
+
+    Yields:
+        The result of `function` for each item, in the order of `items`.
+    """
+    if in_parallel is None:
+        in_parallel = lambda item: True
+    parallel = [jobs > 1 and in_parallel(item) for item in items]
+    if not any(parallel):
+        for item in items:
+            yield function(item)
+        return
+
+    pool = ThreadPool(min(jobs, parallel.count(True)))
+    try:
+        order = [index for index, is_parallel in enumerate(parallel)
+                 if is_parallel]
+        if priority is not None:
+            order.sort(key=lambda index: priority(items[index]), reverse=True)
+        pending = [None] * len(items)
+        for index in order:
+            pending[index] = pool.apply_async(function, (items[index],))
+        for item, result in zip(items, pending):
+            if result is None:
+                yield function(item)
+            else:
+                #a timeout keeps the wait interruptible with Ctrl-C
+                yield result.get(timeout=365 * 24 * 60 * 60)
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,2398 @@
+"""Runs the configuration checks of a config file and fixes failing checks.
+
+`Runner` performs the checks of a config file and returns a `RunResult` listing
+the outcome of every check. app.py is the command line interface to it, but it
+can be used on its own as well, e.g.:
+
+    import runner #runner.py
+    options = runner.RunOptions(attempt_fixes=False, skip_sudo_tests=True)
+    result = runner.Runner('osx-config.json', options).run()
+    for check in result.checks:
+        print check.check_num, check.description, check.outcome
+
+Commands are executed by an `Executor` and messages are written to an output
+sink such as `ConsoleOutput`; both can be replaced, e.g. to run checks against
+something other than the local shell. All of the state of a run is kept by its
+`Runner`, so separate runners can be used concurrently from several threads.
+"""
+
+import os
+import time
+import re
+import json
+import pipes
+import threading
+from os.path import expanduser
+from subprocess import Popen, PIPE, STDOUT
+from warnings import warn
+from collections import namedtuple
+import const #const.py
+import prompt #prompt.py
+import history #history.py
+import sudo_helper #sudo_helper.py
+import remediation #remediation.py
+import cassette #cassette.py
+import probe_cache #probe_cache.py
+import durations #durations.py
+import metrics #metrics.py
+import journal #journal.py
+import governor #governor.py
+import readiness #readiness.py
+
+const.VERSION = "v1.1.0 (ivysaur)"
+
+const.WARN_FOR_RECOMMENDED = True #TODO: command line flag
+const.WARN_FOR_EXPERIMENTAL = True #TODO: command line flag
+const.FIX_RECOMMENDED_BY_DEFAULT = True #TODO: command line flag
+const.FIX_EXPERIMENTAL_BY_DEFAULT = False #TODO: command line flag
+const.LOG_DEBUG_ALWAYS = True #TODO: command line flag
+const.HISTORY_MAX_RUNS = 500
+const.HISTORY_MAX_AGE_DAYS = 365
+const.DEFAULT_JOBS = 4
+const.READ_SIZE = 64 * 1024
+const.REGEX_MATCH_WINDOW = 1024 * 1024 #bytes of output a regex is matched on
+const.MAX_LOGGED_OUTPUT = 4 * 1024 #bytes of command output written to logs
+const.DEFAULT_EXPECTED_DURATION = 1.0 #seconds, for checks not timed yet
+const.TARGET_PLACEHOLDER = '{target}' #in fix commands, see `CheckTest`
+const.SCOPES = ('system', 'user') #see `ConfigCheck.scope`
+
+const.API_FILENAME = './scripts/api.sh'
+const.API_PREFIX = 'source %s ; ' % const.API_FILENAME
+#commands that the shell runs itself, or that change how it runs others
+const.SHELL_BUILTINS = frozenset([
+    '.', ':', '[', '[[', '!', '{', 'alias', 'bg', 'break', 'builtin', 'case',
+    'cd', 'command', 'continue', 'declare', 'echo', 'eval', 'exec', 'exit',
+    'export', 'false', 'fg', 'for', 'function', 'getopts', 'hash', 'if',
+    'jobs', 'kill', 'let', 'local', 'printf', 'pwd', 'read', 'readonly',
+    'return', 'select', 'set', 'shift', 'source', 'test', 'time', 'times',
+    'trap', 'true', 'type', 'typeset', 'ulimit', 'umask', 'unalias', 'unset',
+    'until', 'wait', 'while'])
+
+const.COLORS = {
+    'HEADER': '\033[95m',
+    'OKBLUE': '\033[94m',
+    'OKGREEN': '\033[92m',
+    'WARNING': '\033[93m',
+    'RED': '\033[91m',
+    'FAIL': '\033[91m',
+    'ENDC': '\033[0m',
+    'BOLD': '\033[1m',
+    'UNDERLINE': '\033[4m'
+}
+
+const.PASSED_STR = const.COLORS['OKGREEN'] + "PASSED!" + const.COLORS['ENDC']
+const.FAILED_STR = const.COLORS['FAIL'] + "FAILED!" + const.COLORS['ENDC']
+const.SKIPPED_STR = const.COLORS['OKBLUE'] + "SKIPPED!" + const.COLORS['ENDC']
+const.NO_SUDO_STR = ("%s%s%s" %
+                     (const.COLORS['WARNING'],
+                      ("Insufficient privileges to perform this check. "
+                       "Skipping."),
+                      const.COLORS['ENDC']))
+const.RECOMMENDED_STR = ("%s%s%s" % (const.COLORS['BOLD'],
+                                     'RECOMMENDED',
+                                     const.COLORS['ENDC']))
+const.EXPERIMENTAL_STR = ("%s%s%s" % (const.COLORS['BOLD'],
+                                      'EXPERIMENTAL',
+                                      const.COLORS['ENDC']))
+
+const.SUDO_STR = ("%s%ssudo%s" %
+                  (const.COLORS['BOLD'], const.COLORS['RED'],
+                   const.COLORS['ENDC']))
+
+class CheckResult(object):
+    """Each test can have one of three results, informing the next step."""
+    explicit_pass = 1
+    explicit_fail = 2
+    no_pass = 3
+    all_skipped = 4
+
+def check_result_to_str(val):
+    """Convert enum to string representation"""
+    if val == CheckResult.explicit_pass:
+        return const.PASSED_STR
+    elif val == CheckResult.explicit_fail:
+        return const.FAILED_STR
+    elif val == CheckResult.no_pass:
+        return const.FAILED_STR
+    elif val == CheckResult.all_skipped:
+        return const.SKIPPED_STR
+    else:
+        raise ValueError
+
+class Confidence(object):
+    """Likelihood that a configuration will create negative side-effects.
+
+    A lower integer value indicates less likelihood that a configuration will
+    cause problems with applications.
+    """
+    required = 1
+    recommended = 2
+    experimental = 3
+
+def confidence_to_str(val):
+    """Convert enum to the string used in the config file"""
+    if val == Confidence.required:
+        return 'required'
+    elif val == Confidence.recommended:
+        return 'recommended'
+    elif val == Confidence.experimental:
+        return 'experimental'
+    else:
+        raise ValueError
+
+def intern_string(value):
+    """Returns a shared copy of a string from the config.
+
+    Configs repeat many strings, such as commands and expected output. Equal
+    strings share a single object once interned. ASCII strings are also
+    converted from `unicode` to the more compact `str`.
+    """
+    if value.__class__ is str:
+        return intern(value)
+    if isinstance(value, unicode):
+        try:
+            value = value.encode('ascii')
+        except UnicodeEncodeError:
+            return _interned_unicode.setdefault(value, value)
+    return intern(value)
+
+_interned_unicode = {}
+
+class CheckTest(namedtuple('CheckTest', ['comparison_type', 'command',
+                                         'command_pass', 'command_fail',
+                                         'case_sensitive', 'cache',
+                                         'per_target'])):
+    """One test of a `ConfigCheck`; see `ConfigCheck.__init__` for the fields.
+
+    `comparison_type` is the "type" of the test in the config file, and
+    `cache` is a `probe_cache.CacheSpec` or None.
+
+    A `per_target` test checks several targets at once, such as the profiles
+    of a browser. Each line of its output is the name of a target, a tab and
+    the output for that target, and the output of each target is compared
+    separately. The test passes only if every target passes, and fails
+    explicitly if any target does. A fix command of the check that contains
+    `const.TARGET_PLACEHOLDER` is then run once for each target that did not
+    pass, with the placeholder replaced by the quoted name of the target, so
+    targets that are already configured correctly are left alone.
+    """
+    __slots__ = ()
+
+class ConfigCheck(object):
+    """Encapsulates configuration to check in operating system."""
+    __slots__ = ('tests', 'description', 'confidence', 'fix', 'sudo_fix',
+                 'manual_fix', 'restart', 'sudo_restart', 'cost', 'scope',
+                 'wait_until')
+
+    def __init__(self, tests, description, confidence, fix=None, sudo_fix=None,
+                 manual_fix=None, restart=None, sudo_restart=None,
+                 cost='light', scope=None, wait_until=None):
+        """
+        Args:
+
+            tests (List[dict]): The ordered list of tests to be performed, each
+                a `dict` with these attributes including command_pass and/or
+                command_fail:
+                    * type (str): "exact match" or "regex match"
+                    * command (str)
+                    * command_pass (Optional[str])
+                    * command_fail (Optional[str])
+                    * case_sensitive (bool)
+                    * cache (Optional[dict]): How long the result may be
+                        reused across runs, see `probe_cache`.
+                    * per_target (Optional[bool]): Whether the output lists
+                        several targets, see `CheckTest`.
+            description (str): A human-readable description of the configuration
+                being checked.
+            confidence (str): "required", "recommended", or "experimental"
+            fix (Optional[str]): The command to run if the configuration fails
+                the check.
+            sudo_fix (Optional[str]): A version of `fix` that requests
+                administrative privileges from the operating system. This will
+                only be executed if `fix` does not produce the desired config
+                change.
+            manual_fix (Optional[str]): Instructions to output to the user to
+                manually remediate if a config cannot be fixed automatically.
+            restart (Optional[str]): The command that restarts or reloads an
+                application or service so that `fix` takes effect. When fixes
+                are applied in a batch, each distinct restart command is run
+                only once, after all of the fixes.
+            sudo_restart (Optional[str]): The same as `restart`, for
+                `sudo_fix`.
+            cost (str): "light" or "heavy", see `governor.COST_CLASSES`.
+                Default: "light"
+            scope (Optional[str]): "system" if the check concerns the whole
+                computer, or "user" if it concerns the settings of the user
+                running it, such as the files in their home directory. With
+                --all-users, user-scope checks are performed once for each
+                user. Default: inferred from the tests, see `infer_scope`.
+            wait_until (Optional[dict]): When the fixes have taken effect and
+                the check can be verified, see `readiness`. Default: right
+                after the fix.
+        """
+        assert isinstance(tests, list)
+        assert len(tests) > 0
+        records = []
+        for test in tests:
+            assert isinstance(test, dict), "%s" % str(test)
+            assert test['type'] in ('exact match', 'regex match')
+            assert 'command' in test
+            assert 'command_pass' in test or 'command_fail' in test
+            #a cached result does not say which targets failed
+            assert not (test.get('per_target') and 'cache' in test), (
+                "A per_target test cannot be cached: %s" % test['command'])
+            records.append(CheckTest(test['type'], test['command'],
+                                     _expected_str(test.get('command_pass')),
+                                     _expected_str(test.get('command_fail')),
+                                     bool(test['case_sensitive']),
+                                     _cache_spec(test.get('cache')),
+                                     bool(test.get('per_target', False))))
+        self.tests = tuple(records)
+
+        self.description = description
+        if confidence == 'required':
+            self.confidence = Confidence.required
+        elif confidence == 'recommended':
+            self.confidence = Confidence.recommended
+        elif confidence == 'experimental':
+            self.confidence = Confidence.experimental
+        else:
+            raise ValueError
+
+        #Optional args
+        self.fix = fix #default: None
+        self.sudo_fix = sudo_fix #default: None
+        self.manual_fix = manual_fix #default: None
+        self.restart = restart #default: None
+        self.sudo_restart = sudo_restart #default: None
+        assert cost in governor.COST_CLASSES
+        self.cost = cost
+        self.scope = infer_scope(self.tests) if scope is None else scope
+        assert self.scope in const.SCOPES
+        self.wait_until = None #default: None
+        if wait_until is not None:
+            self.wait_until = readiness.WaitCondition.from_dict(wait_until)
+
+    def __str__(self):
+        return str(dict((name, getattr(self, name)) for name in self.__slots__))
+
+    def __repr__(self):
+        return self.__str__()
+
+def _expected_str(value):
+    """Expected output may be specified as a number in the config."""
+    if value is None or isinstance(value, basestring):
+        return value
+    return intern_string(str(value))
+
+#characters that make the shell do more than split a command into words
+_SHELL_SYNTAX = frozenset('|&;<>()$`\\*?[]{}~#!\n')
+_DOUBLE_QUOTED_SYNTAX = frozenset('$`\\')
+_SHELL_FREE_ARGV = {}
+_API_FUNCTIONS = []
+_API_FUNCTION_RE = re.compile(r'^\s*(?:function\s+(\w+)|(\w+)\s*\(\s*\))',
+                              re.MULTILINE)
+
+def shell_free_argv(command):
+    """Returns the arguments to execute a command with directly, or None if it
+    needs the shell.
+
+    A command needs the shell if it uses any syntax besides quoting and
+    separating words with whitespace, such as pipes, redirection, variables,
+    globs or several commands, or if it starts with a shell builtin, a
+    variable assignment or a function of the API script. Commands that do not
+    need the shell do not need the API script either, so the
+    `const.API_PREFIX` that sources it is ignored. The result is cached for
+    each command.
+
+    Args:
+        command (str): A command of a check.
+
+    Returns:
+        tuple or None: The program to execute and its arguments.
+    """
+    if command.startswith(const.API_PREFIX):
+        command = command[len(const.API_PREFIX):]
+    try:
+        return _SHELL_FREE_ARGV[command]
+    except KeyError:
+        pass
+    argv = _split_words(command)
+    if argv is not None and (len(argv) == 0 or '=' in argv[0] or
+                             argv[0] in const.SHELL_BUILTINS or
+                             argv[0] in _api_functions()):
+        argv = None
+    _SHELL_FREE_ARGV[command] = argv
+    return argv
+
+def _split_words(command):
+    """Splits a command into words the way the shell would, or returns None
+    if it uses any other shell syntax."""
+    words = []
+    word = None
+    quote = None
+    for char in command:
+        if quote is not None:
+            if char == quote:
+                quote = None
+            elif quote == '"' and char in _DOUBLE_QUOTED_SYNTAX:
+                return None
+            else:
+                word.append(char)
+        elif char in ' \t':
+            if word is not None:
+                words.append(''.join(word))
+                word = None
+        elif char in _SHELL_SYNTAX:
+            return None
+        else:
+            if word is None:
+                word = []
+            if char in '\'"':
+                quote = char
+            else:
+                word.append(char)
+    if quote is not None:
+        return None
+    if word is not None:
+        words.append(''.join(word))
+    return tuple(words)
+
+def _api_functions():
+    """The names of the functions defined by the API script."""
+    if len(_API_FUNCTIONS) == 0:
+        names = set()
+        try:
+            with open(const.API_FILENAME, 'r') as api_file:
+                for match in _API_FUNCTION_RE.finditer(api_file.read()):
+                    names.add(match.group(1) or match.group(2))
+        except IOError:
+            pass
+        _API_FUNCTIONS.append(frozenset(names))
+    return _API_FUNCTIONS[0]
+
+#a path in the home directory, or a preference domain of the current user
+_USER_SCOPE_SYNTAX = re.compile(
+    r'~|\$HOME\b|\$\{HOME\}|'
+    r'\bdefaults\s+(?:-currentHost\s+)?(?:read|read-type|write|delete)\s+'
+    r'(?![\'"]?[/$])')
+
+def infer_scope(tests):
+    """Returns the scope of a check whose config does not specify one.
+
+    A check is user-scope if any of its tests refers to the home directory,
+    or reads a preference domain with `defaults` by name rather than by the
+    path of a plist, as that reads the preferences of the current user.
+
+    Args:
+        tests (Sequence[`CheckTest`]): The tests of the check.
+
+    Returns:
+        str: "system" or "user".
+    """
+    if any(_USER_SCOPE_SYNTAX.search(test.command) for test in tests):
+        return 'user'
+    return 'system'
+
+def _cache_spec(spec):
+    """Converts the "cache" object of a test, if any."""
+    if spec is None:
+        return None
+    return probe_cache.CacheSpec.from_dict(spec)
+
+def _intern_values(obj):
+    """JSON object hook that interns the string values of each object."""
+    for key, value in obj.iteritems():
+        if value.__class__ is unicode:
+            obj[key] = intern_string(value)
+    return obj
+
+def read_config(config_filename, output=None):
+    """Read the expected system configuration from the config file.
+
+    Every string read from the config is interned, see `intern_string`.
+
+    Args:
+        config_filename (str): The JSON config file to read.
+        output (Optional[`ConsoleOutput`]): Where to write debug messages.
+            Default: nowhere.
+    """
+
+    config = None
+    with open(config_filename, 'r') as config_file:
+        #interning while parsing frees duplicate strings right away
+        config = json.loads(config_file.read(), object_hook=_intern_values)
+
+    config_checks = []
+
+    for config_check in config:
+        if '_comment' in config_check:
+            continue
+
+        #Config MUST specify a description of the check
+        description = config_check['description']
+        if output is not None:
+            output.write("Description: %s" % description, debug=True)
+
+        #Config MUST indicate the confidence of the configuration check
+        confidence = config_check['confidence']
+
+        #Config MUST include at least one test obj
+        tests = config_check['tests']
+
+        #Config MUST specify a fix object
+        assert 'fix' in config_check
+        assert isinstance(config_check['fix'], dict)
+
+        #Fix object must specify at least one of these:
+        #command, sudo_command, manual
+        assert ('command' in config_check['fix'] or
+                'sudo_command' in config_check['fix'] or
+                'manual' in config_check['fix'])
+        fix = None
+        sudo_fix = None
+        manual_fix = None
+        restart = None
+        sudo_restart = None
+        if 'command' in config_check['fix']:
+            fix = config_check['fix']['command']
+        if 'sudo_command' in config_check['fix']:
+            sudo_fix = config_check['fix']['sudo_command']
+        if 'manual' in config_check['fix']:
+            manual_fix = config_check['fix']['manual']
+        if 'restart' in config_check['fix']:
+            restart = config_check['fix']['restart']
+        if 'sudo_restart' in config_check['fix']:
+            sudo_restart = config_check['fix']['sudo_restart']
+
+        config_check_obj = ConfigCheck(
+            tests=tests,
+            description=description,
+            confidence=confidence,
+            fix=fix,
+            sudo_fix=sudo_fix,
+            manual_fix=manual_fix,
+            restart=restart,
+            sudo_restart=sudo_restart,
+            cost=config_check.get('cost', 'light'),
+            scope=config_check.get('scope'),
+            wait_until=config_check['fix'].get('wait_until'))
+        config_checks.append(config_check_obj)
+
+    #classify every command once, see `shell_free_argv`
+    commands = [command for config_check in config_checks
+                for command in [test.command for test in config_check.tests] +
+                [config_check.fix, config_check.sudo_fix, config_check.restart,
+                 config_check.sudo_restart]
+                if command is not None]
+    shell_free = sum(1 for command in commands
+                     if shell_free_argv(command) is not None)
+    user_scope = sum(1 for config_check in config_checks
+                     if config_check.scope == 'user')
+    if output is not None:
+        output.write("%d of %d commands can be executed without a shell." %
+                     (shell_free, len(commands)), debug=True)
+        output.write("%d of %d checks concern the settings of each user." %
+                     (user_scope, len(config_checks)), debug=True)
+    return config_checks
+
+#the kind of each tag checks can be selected by, see `select_checks`
+CHECK_TAGS = dict(
+    [(tag, 'confidence') for tag in ('required', 'recommended',
+                                     'experimental')] +
+    [(tag, 'scope') for tag in const.SCOPES] +
+    [(tag, 'cost') for tag in governor.COST_CLASSES])
+
+def check_tags(config_check):
+    """Returns the tags of a check: its confidence, scope and cost."""
+    return (confidence_to_str(config_check.confidence), config_check.scope,
+            config_check.cost)
+
+def select_checks(config_checks, check=None, tags=None):
+    """Returns the numbers of the checks selected by a check and tags.
+
+    A check is selected by tags if, for each kind of tag given, it has one of
+    the tags of that kind, e.g. "required", "recommended" and "user" select
+    the required and recommended checks of each user. See `CHECK_TAGS`.
+
+    Args:
+        config_checks (List[`ConfigCheck`]): The checks of the config.
+        check (Optional[str]): The number of a check, or text its description
+            contains, ignoring case. Default: any check.
+        tags (Optional[Iterable[str]]): Default: any check.
+
+    Returns:
+        Set[int]: The numbers of the selected checks, for `RunOptions.checks`.
+
+    Raises:
+        ValueError: If a tag is unknown.
+    """
+    wanted = {}
+    for tag in tags or ():
+        if tag not in CHECK_TAGS:
+            raise ValueError("Unknown tag '%s'; the tags are: %s." % (
+                tag, ', '.join(sorted(CHECK_TAGS))))
+        wanted.setdefault(CHECK_TAGS[tag], set()).add(tag)
+    selected = set()
+    for check_num, config_check in enumerate(config_checks, 1):
+        if check is not None and not (
+                str(check_num) == check if check.isdigit() else
+                check.lower() in config_check.description.lower()):
+            continue
+        if all(any(tag in kind_tags for tag in check_tags(config_check))
+               for kind_tags in wanted.itervalues()):
+            selected.add(check_num)
+    return selected
+
+class OutputMatcher(object):
+    """Matches the output of a test command incrementally as it is produced.
+
+    The output is compared with leading and trailing whitespace stripped, and
+    the fail condition takes precedence over the pass condition.
+
+    An exact match is decided as soon as the output can no longer equal either
+    condition, e.g. because it has diverged from both or has grown longer than
+    both. A regex match is evaluated on at most the first
+    `const.REGEX_MATCH_WINDOW` bytes of output, so it is decided once that many
+    bytes have been read. Only the first `const.MAX_LOGGED_OUTPUT` bytes of
+    output are kept for logging.
+    """
+
+    def __init__(self, comparison_type, case_sensitive, command_pass=None,
+                 command_fail=None, window=None, capture_limit=None):
+        """
+        Args:
+            comparison_type (str): 'exact match' or 'regex match'
+            case_sensitive (bool): Whether the comparison is case sensitive.
+            command_pass (str or None): The explicit pass condition.
+            command_fail (str or None): The explicit fail condition.
+            window (Optional[int]): The number of bytes of output a regex is
+                matched on. Default: `const.REGEX_MATCH_WINDOW`
+            capture_limit (Optional[int]): The number of bytes of output kept
+                for logging. Default: `const.MAX_LOGGED_OUTPUT`
+
+        Raises:
+            ValueError if `comparison_type` is not an expected value
+        """
+        if comparison_type not in ('exact match', 'regex match'):
+            raise ValueError
+        self.exact = comparison_type == 'exact match'
+        self.case_sensitive = case_sensitive
+        self.conditions = [(result, condition) for result, condition in
+                           ((CheckResult.explicit_fail, command_fail),
+                            (CheckResult.explicit_pass, command_pass))
+                           if condition is not None]
+        if self.exact and not case_sensitive:
+            self.conditions = [(result, condition.lower())
+                               for result, condition in self.conditions]
+        self.window = const.REGEX_MATCH_WINDOW if window is None else window
+        self.capture_limit = (const.MAX_LOGGED_OUTPUT if capture_limit is None
+                              else capture_limit)
+        #the longest output that can still match exactly
+        self.max_length = max([len(condition)
+                               for _, condition in self.conditions] + [0])
+        self.output = '' #output read so far, without leading whitespace
+        self.captured = ''
+        self.length = 0 #bytes of output read so far
+        self.decided = False
+
+    def feed(self, chunk):
+        """Processes the next chunk of output.
+
+        Returns:
+            bool: Whether the result is decided, so that the rest of the output
+                does not need to be read.
+        """
+        if self.decided:
+            return True
+        if len(self.captured) < self.capture_limit:
+            self.captured += chunk[:self.capture_limit - len(self.captured)]
+        self.length += len(chunk)
+
+        if self.output == '':
+            chunk = chunk.lstrip()
+        if self.exact and not self.case_sensitive:
+            chunk = chunk.lower()
+        self.output += chunk
+
+        if self.exact:
+            if len(self.output) > self.max_length + 1:
+                #Only whitespace can follow a match now, and how much of it
+                #there is does not matter.
+                stripped = self.output.rstrip()
+                self.output = self.output[:max(len(stripped),
+                                               self.max_length + 1)]
+            self.decided = not any(self._could_equal(condition)
+                                   for _, condition in self.conditions)
+        elif len(self.output) >= self.window:
+            self.output = self.output[:self.window]
+            self.decided = True
+        return self.decided
+
+    def _could_equal(self, condition):
+        """Whether the output could still equal `condition` when stripped."""
+        return (condition.startswith(self.output) or
+                self.output.rstrip() == condition)
+
+    def finish(self):
+        """Returns the `CheckResult` for the output read.
+
+        Call this once the output has been read to the end, or the result has
+        been decided.
+        """
+        output = self.output.rstrip()
+        for result, condition in self.conditions:
+            if self.exact:
+                if output == condition:
+                    return result
+            elif is_match(condition, output,
+                          ignore_case=not self.case_sensitive):
+                return result
+        return CheckResult.no_pass
+
+    def captured_output(self):
+        """Returns the output kept for logging, noting what was left out."""
+        notes = []
+        if self.length > len(self.captured):
+            notes.append("%d more bytes not shown" %
+                         (self.length - len(self.captured)))
+        if self.decided:
+            notes.append("result decided before the end of the output")
+        if len(notes) == 0:
+            return self.captured
+        return "%s... [%s]" % (self.captured, '; '.join(notes))
+
+def is_match(regex, string, ignore_case=False):
+    """Check if regex matches string."""
+    regex_flags = re.DOTALL
+    if ignore_case:
+        regex_flags = re.DOTALL | re.IGNORECASE
+
+    return re.match(regex, string, regex_flags) is not None
+
+def _comparer(comparison_type, case_sensitive, command_pass, command_fail):
+    """Returns a function that compares a complete output with the
+    conditions of a test, see `OutputMatcher`."""
+    def compare(output):
+        matcher = OutputMatcher(comparison_type, case_sensitive,
+                                command_pass=command_pass,
+                                command_fail=command_fail)
+        matcher.feed(output)
+        return matcher.finish()
+    return compare
+
+def compare_targets(output, compare):
+    """Compares the output of a `per_target` test for each target.
+
+    Output lines that do not name a target, such as error messages, prevent
+    the test from passing. If no line names a target, the whole output is
+    compared.
+
+    Args:
+        output (str): The complete output of the test command.
+        compare (function): Returns the `CheckResult` of an output.
+
+    Returns:
+        tuple: (`CheckResult`, List[(str, `CheckResult`)]): The result of
+            the test, and the result of each target in the order listed,
+            or None if no target was listed.
+    """
+    names = []
+    outputs = {}
+    untargeted = False
+    for line in output.splitlines():
+        target, tab, target_output = line.partition('\t')
+        if tab == '':
+            untargeted = untargeted or line.strip() != ''
+            continue
+        if target not in outputs:
+            names.append(target)
+            outputs[target] = []
+        outputs[target].append(target_output)
+    if len(names) == 0:
+        return compare(output), None
+
+    targets = [(target, compare('\n'.join(outputs[target])))
+               for target in names]
+    results = [result for _, result in targets]
+    if CheckResult.explicit_fail in results:
+        result = CheckResult.explicit_fail
+    elif untargeted or any(result != CheckResult.explicit_pass
+                           for result in results):
+        result = CheckResult.no_pass
+    else:
+        result = CheckResult.explicit_pass
+    return result, targets
+
+def evaluate_output(test, output):
+    """Returns the `CheckResult` of a test for the complete output of its
+    command, the same as if the command had been executed, e.g. for output
+    recorded on another host, see `fleet`.
+
+    Args:
+        test (`CheckTest`): The test.
+        output (str): The output of `test.command`.
+    """
+    compare = _comparer(
+        test.comparison_type, test.case_sensitive,
+        None if test.command_pass is None else str(test.command_pass),
+        None if test.command_fail is None else str(test.command_fail))
+    if test.per_target:
+        return compare_targets(output, compare)[0]
+    return compare(output)
+
+class ConsoleOutput(object):
+    """Prints messages and optionally appends them to a log file.
+
+    Messages written from several threads are not interleaved.
+    """
+
+    def __init__(self, debug_print=False, log_file=None):
+        """
+        Args:
+            debug_print (bool): Whether to print debug messages.
+            log_file (Optional[str]): The log file to append messages to.
+                Default: messages are not logged.
+        """
+        self.debug_print = debug_print
+        self.log_file = log_file
+        if log_file is not None and log_file.startswith('~'):
+            self.log_file = expanduser(log_file)
+        self._lock = threading.Lock()
+
+    def write(self, msg, debug=False):
+        """Print and logs the specified message unless prohibited by settings.
+
+        Args:
+            msg (str): The message to be written.
+            debug (bool): Whether the message is normal or debug-only info.
+                Default: False
+        """
+        with self._lock:
+            if debug:
+                if self.debug_print:
+                    print "DEBUG: %s" % msg
+                if ((self.debug_print or const.LOG_DEBUG_ALWAYS) and
+                        self.log_file is not None):
+                    self._log("DEBUG: %s" % msg)
+            else:
+                print "%s" % msg
+                if self.log_file is not None:
+                    self._log(msg)
+
+    def _log(self, string):
+        """Append string, followed by newline character, to log file.
+
+        Color codes will be stripped out of the string non-destructively before
+        writing.
+        """
+        string = re.sub(r"\033\[\d{1,2}m", "", string)
+        with open(self.log_file, 'a+') as log_file:
+            log_file.write("%s\n" % string)
+
+class Executor(object):
+    """Executes the test, fix and restart commands of checks.
+
+    Subclasses must implement `run_status`. Commands are shell commands that
+    expect the API script to have been sourced, see `const.API_FILENAME`.
+    """
+
+    def run_status(self, command):
+        """Executes a command.
+
+        Returns:
+            tuple: (int, str): The exit status and the combined stdout and
+                stderr of the command.
+        """
+        raise NotImplementedError
+
+    def run(self, command):
+        """Executes a command, returning its combined stdout and stderr."""
+        return self.run_status(command)[1]
+
+    def match(self, command, matcher):
+        """Executes a test command, feeding its output to `matcher`.
+
+        Args:
+            command (str): The command to execute.
+            matcher (`OutputMatcher`): Decides the result of the test.
+
+        Returns:
+            int: The exit status of the command.
+        """
+        status, output = self.run_status(command)
+        matcher.feed(output)
+        return status
+
+    def prompts_for_password(self, command):
+        """Whether executing `command` may prompt the user for a password."""
+        return 'sudo ' in command
+
+    def processes_spawned(self):
+        """Returns the number of processes started so far to execute
+        commands, counting a shell and the command it starts as two."""
+        return 0
+
+    def shells_avoided(self):
+        """Returns the number of commands executed so far without a shell,
+        see `shell_free_argv`."""
+        return 0
+
+    def close(self):
+        """Releases any resources held, at the end of a run."""
+        pass
+
+class ShellExecutor(Executor):
+    """Executes commands with the local shell.
+
+    Commands that need no shell features are executed directly instead, see
+    `shell_free_argv`. Commands using sudo are sent to a privileged helper
+    process if that is enabled, see `sudo_helper`.
+
+    An executor can run the commands of another user, see `multiuser`: HOME,
+    USER and LOGNAME are set to those of the user, and if this process runs as
+    root, commands run as the owner of the home directory. Commands using sudo
+    keep running as root.
+    """
+
+    def __init__(self, use_sudo_helper=False, output=None,
+                 resource_governor=None, home=None):
+        """
+        Args:
+            use_sudo_helper (bool): Whether to run commands using sudo in a
+                `sudo_helper.SudoHelper`.
+            output (Optional[`ConsoleOutput`]): Where to write messages.
+            resource_governor (Optional[`governor.ResourceGovernor`]): Limits
+                the resources of the processes started. Default: no limits.
+            home (Optional[`multiuser.Home`]): The user to run commands for.
+                Default: the current user.
+        """
+        self.sudo_helper = sudo_helper.SudoHelper() if use_sudo_helper else None
+        self.output = ConsoleOutput() if output is None else output
+        self.preexec_fn = None
+        if resource_governor is not None:
+            self.preexec_fn = resource_governor.preexec_fn()
+        self.env = None #the environment of commands, if not this process's
+        self._run_as = None #the `multiuser.Home` to switch to, if any
+        if home is not None:
+            self.env = dict(os.environ, HOME=home.path, USER=home.name,
+                            LOGNAME=home.name)
+            if os.geteuid() == 0 and home.uid != 0:
+                self._run_as = home
+        self.spawned = 0 #processes started, including those of the helper
+        self.avoided = 0 #commands executed without a shell
+        self._helper_lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+
+    def uses_sudo_helper(self, command):
+        """Whether `command` will be executed by the privileged helper."""
+        return self.sudo_helper is not None and 'sudo ' in command
+
+    def prompts_for_password(self, command):
+        return 'sudo ' in command and not self.uses_sudo_helper(command)
+
+    def processes_spawned(self):
+        with self._spawn_lock:
+            return self.spawned
+
+    def shells_avoided(self):
+        with self._spawn_lock:
+            return self.avoided
+
+    def _count_spawn(self, count=1, shell_free=False):
+        with self._spawn_lock:
+            self.spawned += count
+            if shell_free:
+                self.avoided += 1
+
+    def run_status(self, command):
+        """Executes a shell command.
+
+        If the privileged helper cannot be started or stops responding, it is
+        disabled from then on and commands using sudo invoke sudo themselves
+        again.
+        """
+        if self.uses_sudo_helper(command):
+            result = self._run_in_helper(command)
+            if result is not None:
+                return result
+
+        #http://stackoverflow.com/questions/7129107/python-how-to-suppress-the-output-of-os-system
+        process = self._start(command)
+        stdout, _ = process.communicate()
+        return process.returncode, stdout
+
+    def _start(self, command):
+        """Starts a command, without a shell if it does not need one."""
+        argv = shell_free_argv(command)
+        preexec_fn = self._preexec_fn(command)
+        if argv is not None:
+            try:
+                process = Popen(list(argv), stdout=PIPE, stderr=STDOUT,
+                                preexec_fn=preexec_fn, env=self.env)
+                self._count_spawn(shell_free=True)
+                return process
+            except OSError:
+                pass #not found; let the shell report that as usual
+        #the shell, and the command it starts
+        self._count_spawn(2)
+        return Popen(command, stdout=PIPE, stderr=STDOUT, shell=True,
+                     preexec_fn=preexec_fn, env=self.env)
+
+    def _preexec_fn(self, command):
+        """Returns the function that prepares a new process to execute
+        `command`, if any: it applies the resource limits, then switches to
+        the user the command runs for."""
+        run_as = self._run_as
+        if run_as is None or 'sudo ' in command:
+            return self.preexec_fn
+        limit_process = self.preexec_fn
+        def switch_user():
+            if limit_process is not None:
+                limit_process()
+            try:
+                os.initgroups(run_as.name, run_as.gid)
+            except (KeyError, OSError):
+                os.setgroups([run_as.gid]) #not a user in the user database
+            os.setgid(run_as.gid)
+            os.setuid(run_as.uid)
+        return switch_user
+
+    def _run_in_helper(self, command):
+        """Returns the exit status and output of `command` run by the
+        privileged helper, or None if the helper failed."""
+        with self._helper_lock:
+            helper = self.sudo_helper
+            if helper is None:
+                return None
+            if not helper.started:
+                self.output.write((
+                    "Starting a helper process with elevated privileges to run "
+                    "every check and fix that requires them; %syou may be "
+                    "prompted for your current OS X user's password below%s, "
+                    "once for this run.") %
+                                  (const.COLORS['BOLD'], const.COLORS['ENDC']))
+            try:
+                #the helper itself, then one process per command
+                self._count_spawn(1 if helper.started else 2)
+                status, output = helper.run(command)
+                self.output.write("Privileged helper exit status: %d" % status,
+                                  debug=True)
+                return status, output
+            except sudo_helper.HelperError as err:
+                self.output.write(
+                    "%s%s Falling back to invoking sudo for each command.%s" %
+                    (const.COLORS['WARNING'], err, const.COLORS['ENDC']))
+                self.sudo_helper = None
+                return None
+
+    def match(self, command, matcher):
+        """Executes a test command, feeding its output to `matcher`.
+
+        Once the matcher has decided the result, the command is terminated. Any
+        commands in a pipeline it started are terminated by SIGPIPE the next
+        time they write output.
+        """
+        if self.uses_sudo_helper(command):
+            return Executor.match(self, command, matcher)
+
+        process = self._start(command)
+        try:
+            while True:
+                chunk = os.read(process.stdout.fileno(), const.READ_SIZE)
+                if chunk == '':
+                    break
+                if matcher.feed(chunk):
+                    self.output.write(
+                        "Result decided after %d bytes of output; terminating "
+                        "command." % matcher.length, debug=True)
+                    try:
+                        process.terminate()
+                    except OSError:
+                        pass #already exited
+                    break
+        finally:
+            process.stdout.close()
+            process.wait()
+        return process.returncode
+
+    def close(self):
+        with self._helper_lock:
+            if self.sudo_helper is not None:
+                self.sudo_helper.close()
+
+class RecordingExecutor(Executor):
+    """Executes commands with another executor, recording their results in a
+    cassette, see `cassette`.
+
+    Test commands are executed to completion, rather than terminated once
+    their result is decided, so that the cassette holds their complete output
+    and exit status: a replay with a different config may need all of it.
+
+    The cassette is written when the executor is closed at the end of a run.
+    """
+
+    def __init__(self, executor, cassette_filename):
+        """
+        Args:
+            executor (`Executor`): Executes the commands.
+            cassette_filename (str): The cassette to write.
+        """
+        self.executor = executor
+        self.cassette_filename = cassette_filename
+        self.cassette = cassette.Cassette()
+
+    def run_status(self, command):
+        started = time.time()
+        status, output = self.executor.run_status(command)
+        self.cassette.add(command, status, time.time() - started, output)
+        return status, output
+
+    def prompts_for_password(self, command):
+        return self.executor.prompts_for_password(command)
+
+    def processes_spawned(self):
+        return self.executor.processes_spawned()
+
+    def shells_avoided(self):
+        return self.executor.shells_avoided()
+
+    def close(self):
+        self.executor.close()
+        cassette.write_cassette(self.cassette_filename, self.cassette,
+                                const.VERSION)
+        self.cassette = cassette.Cassette()
+
+class ReplayExecutor(Executor):
+    """Serves the results of commands from a cassette without executing
+    anything, see `cassette`.
+
+    Commands that were not recorded produce no output and exit status 127,
+    as if they did not exist.
+    """
+
+    def __init__(self, recording, output=None):
+        """
+        Args:
+            recording (`cassette.Cassette`): The recorded results.
+            output (Optional[`ConsoleOutput`]): Where to write messages.
+        """
+        self.recording = recording
+        self.output = ConsoleOutput() if output is None else output
+        self.occurrences = {} #command -> number of times executed
+        self.misses = 0 #number of executions that were not recorded
+        self._lock = threading.Lock()
+
+    def run_status(self, command):
+        with self._lock:
+            occurrence = self.occurrences.get(command, 0)
+            self.occurrences[command] = occurrence + 1
+        result = self.recording.lookup(command, occurrence)
+        if result is None:
+            with self._lock:
+                self.misses += 1
+            self.output.write("%sCommand not recorded in cassette: '%s'%s" %
+                              (const.COLORS['WARNING'], command,
+                               const.COLORS['ENDC']))
+            return 127, ''
+        status, _, output = result
+        return status, output
+
+    def prompts_for_password(self, command):
+        return False #nothing is executed
+
+    def close(self):
+        with self._lock:
+            self.occurrences = {}
+
+class RunOptions(object):
+    """The settings of a run; see `Runner`."""
+
+    def __init__(self, debug_print=False, log_file=None, prompt_for_fixes=True,
+                 attempt_fixes=True, skip_sudo_tests=False, sudo_helper=False,
+                 history_db=None, two_phase=False, jobs=None, plan_file=None,
+                 apply_plan=None, record=None, replay=None, probe_cache=None,
+                 durations_file=None, time_budget=None, metrics_file=None,
+                 journal_file=None, resume=False, resource_limits=None,
+                 checks=None):
+        """
+        Args:
+            debug_print (bool): Whether to print debug messages.
+            log_file (Optional[str]): The log file to append messages to.
+            prompt_for_fixes (bool): Whether to ask before applying fixes.
+            attempt_fixes (bool): Whether to fix failing checks at all, rather
+                than only reporting them.
+            skip_sudo_tests (bool): Whether to skip tests that require sudo.
+            sudo_helper (bool): Whether to run all commands that require sudo
+                in one privileged helper process.
+            history_db (Optional[str]): The run history database to record the
+                run in, see `history`. Default: the run is not recorded.
+            two_phase (bool): Whether to evaluate every check before fixing
+                any, see `Runner.run_two_phase`.
+            jobs (Optional[int]): The maximum number of checks to evaluate
+                concurrently in two-phase mode, of homes whose checks are
+                performed concurrently by `multiuser.AllUsersRunner`, and of
+                warm shells of a `daemon.CheckDaemon`. Default:
+                `const.DEFAULT_JOBS`
+            plan_file (Optional[str]): Where to write the remediation plan in
+                two-phase mode. Default: no plan is written.
+            apply_plan (Optional[str]): A remediation plan to apply instead of
+                performing every check, see `Runner.apply_plan`.
+            record (Optional[str]): A cassette to record the results of all
+                commands executed in, see `cassette`.
+            replay (Optional[str]): A cassette to take the results of all
+                commands from instead of executing them.
+            probe_cache (Optional[str]): The file in which the results of
+                tests that may be cached are kept between runs, see
+                `probe_cache`. Default: no results are cached.
+            durations_file (Optional[str]): The file in which the expected
+                duration of each check is kept, see `durations`. Default:
+                checks are not timed across runs.
+            time_budget (Optional[float]): The number of seconds the checks
+                may take. Checks are then performed by priority, see
+                `Runner.ordered_checks`, and those that do not fit in the
+                budget are not evaluated. Default: no limit.
+            metrics_file (Optional[str]): Where to write the result of each
+                run as Prometheus metrics, see `metrics`. Default: nowhere.
+            journal_file (Optional[str]): The journal in which the outcome of
+                each completed check is checkpointed, see `journal`. It is
+                not used when applying a remediation plan. Default: no
+                checkpoints are kept.
+            resume (bool): Whether to take the outcomes of the checks
+                completed by an interrupted run from its journal instead of
+                performing them again.
+            resource_limits (Optional[`governor.ResourceLimits`]): The limits
+                of the processes that execute commands, and of how many
+                commands of heavy checks run at once. Default: no limits.
+            checks (Optional[Set[int]]): The numbers of the checks to perform,
+                e.g. those of one scope, see `multiuser`. Default: every
+                check.
+        """
+        self.debug_print = debug_print
+        self.log_file = log_file
+        self.prompt_for_fixes = prompt_for_fixes
+        self.attempt_fixes = attempt_fixes
+        self.skip_sudo_tests = skip_sudo_tests
+        self.sudo_helper = sudo_helper
+        self.history_db = history_db
+        self.two_phase = two_phase
+        self.jobs = const.DEFAULT_JOBS if jobs is None else jobs
+        self.plan_file = plan_file
+        self.apply_plan = apply_plan
+        self.record = record
+        self.replay = replay
+        self.probe_cache = probe_cache
+        self.durations_file = durations_file
+        self.time_budget = time_budget
+        self.metrics_file = metrics_file
+        self.journal_file = journal_file
+        self.resume = resume
+        self.resource_limits = resource_limits
+        self.checks = checks
+
+    def to_dict(self):
+        """Returns the options as a `dict`, e.g. for the run history."""
+        return dict(vars(self))
+
+class CheckOutcome(namedtuple('CheckOutcome', ['check_num', 'description',
+                                               'confidence', 'outcome',
+                                               'started', 'duration',
+                                               'failing_targets'])):
+    """The final outcome of one check in a run.
+
+    `outcome` is one of the outcome constants in `history`, and `confidence`
+    is a `Confidence`. `started` and `duration` are in seconds, and include
+    fixes and waiting for the user to answer prompts. `failing_targets` lists
+    the targets of a `per_target` test that did not pass, e.g. the browser
+    profiles that are configured incorrectly.
+    """
+    __slots__ = ()
+
+class RunResult(object):
+    """The results of a run, returned by `Runner.run`."""
+
+    def __init__(self):
+        self.checks = [] #`CheckOutcome` of each check considered, in order
+        self.manual_fixes = [] #numbers of checks to fix manually, in order
+        self.total_checks = 0 #the number of checks considered
+        self.duration = 0.0 #seconds the run took
+        self.processes_spawned = 0 #processes started to execute commands
+
+    def count(self, *outcomes):
+        """Returns the number of checks with any of the given outcomes."""
+        return sum(1 for check in self.checks if check.outcome in outcomes)
+
+    @property
+    def passed(self):
+        """The number of checks that passed, with or without a fix."""
+        return self.count(*history.PASSING_OUTCOMES)
+
+    @property
+    def failed(self):
+        """The number of checks that failed or were skipped, not counting
+        checks that have no automatic fix."""
+        return self.count(history.FAIL_FIX_FAIL, history.FAIL_FIX_SKIPPED,
+                          history.FAIL_FIX_DECLINED, history.SKIPPED)
+
+    @property
+    def not_evaluated(self):
+        """The numbers of the checks left out because the time budget was
+        spent, in order."""
+        return [check.check_num for check in self.checks
+                if check.outcome == history.NOT_EVALUATED]
+
+def query_user(question, default):
+    """Asks the user a yes or no question on the terminal.
+
+    Args:
+        question (str): The question to ask.
+        default (bool): The answer if the user just presses enter.
+
+    Returns:
+        bool: The user's answer.
+    """
+    return prompt.query_yes_no(question=question,
+                               default=_bool_to_yes_no(default))
+
+def _bool_to_yes_no(boolean):
+    return 'yes' if boolean else 'no'
+
+class Runner(object):
+    """Performs the checks of a config and fixes them, one run at a time.
+
+    Each call of `run` performs a complete run and returns its `RunResult`.
+    Concurrent calls of `run` on the same runner are serialized, while
+    different runners do not share any state and can run concurrently.
+    """
+
+    def __init__(self, config, options=None, executor=None, output=None,
+                 ask=None, resource_governor=None, cache=None):
+        """
+        Args:
+            config (str or List[`ConfigCheck`]): The config file to read, or
+                the checks to perform.
+            options (Optional[`RunOptions`]): Default: `RunOptions()`
+            executor (Optional[`Executor`]): Executes the commands of checks.
+                Default: a `ShellExecutor` applying the resource limits of the
+                options, or a `ReplayExecutor` if a cassette is replayed.
+                Commands are recorded if a cassette is recorded.
+            output (Optional[`ConsoleOutput`]): Where to write messages.
+                Default: a `ConsoleOutput` for the options.
+            ask (Optional[function]): Called with a question and the default
+                answer to ask the user whether to apply fixes, returning a
+                bool. Default: `query_user`
+            resource_governor (Optional[`governor.ResourceGovernor`]): Limits
+                how many commands of heavy checks run at once, e.g. shared by
+                runners that run concurrently. Default: one applying the
+                resource limits of the options.
+            cache (Optional[`probe_cache.ProbeCache`]): The probe cache of
+                every run, e.g. kept in memory between runs by the daemon; it
+                is saved after each run. Default: the probe cache file of the
+                options is read at the start of each run.
+
+        Raises:
+            cassette.CassetteError: If the cassette to replay could not be
+                read.
+        """
+        self.options = RunOptions() if options is None else options
+        if output is None:
+            output = ConsoleOutput(debug_print=self.options.debug_print,
+                                   log_file=self.options.log_file)
+        self.output = output
+        self.governor = resource_governor
+        if resource_governor is None:
+            self.governor = governor.ResourceGovernor(
+                self.options.resource_limits)
+        if executor is None:
+            if self.options.replay is not None:
+                executor = ReplayExecutor(
+                    cassette.read_cassette(self.options.replay), output)
+            else:
+                executor = ShellExecutor(
+                    use_sudo_helper=(self.options.sudo_helper and
+                                     not self.options.skip_sudo_tests),
+                    output=output, resource_governor=self.governor)
+        if self.options.record is not None:
+            executor = RecordingExecutor(executor, self.options.record)
+        self.executor = executor
+        self.ask = query_user if ask is None else ask
+        self.cache = cache
+        if isinstance(config, basestring):
+            config = read_config(config, output)
+        self.config_checks = config
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Clears the state of the previous run."""
+        self.check_num = 1 #the number of the current check
+        self.history = None #`history.RunHistory` recording the run, if any
+        self.probe_cache = None #`probe_cache.ProbeCache` of the run, if any
+        self.durations = None #`durations.DurationHistory`, if any
+        self.deadline = None #when the time budget is spent, if there is one
+        self.journal = None #`journal.Journal` checkpointing the run, if any
+        #the targets of each check that did not pass, if its tests list any
+        self.failing_targets = {}
+        self.result = RunResult()
+
+    def write_str(self, msg, debug=False):
+        """Writes a message to the output of this runner."""
+        self.output.write(msg, debug=debug)
+
+    def run(self):
+        """Performs the checks, fixing them according to the options.
+
+        Returns:
+            `RunResult`: The outcome of each check considered.
+
+        Raises:
+            remediation.PlanError: If a remediation plan was to be applied, but
+                it could not be read.
+        """
+        with self._lock:
+            self._reset()
+            started = time.time()
+            spawned_before = self.executor.processes_spawned()
+            avoided_before = self.executor.shells_avoided()
+            if self.options.history_db is not None:
+                self.history = history.RunHistory(self.options.history_db)
+                self.history.start_run(const.VERSION, self.options.to_dict())
+            if self.cache is not None:
+                self.probe_cache = self.cache
+            elif self.options.probe_cache is not None:
+                self.probe_cache = probe_cache.ProbeCache(
+                    self.options.probe_cache)
+            if self.options.durations_file is not None:
+                self.durations = durations.DurationHistory(
+                    self.options.durations_file)
+            if self.options.time_budget is not None:
+                self.deadline = time.time() + self.options.time_budget
+            if (self.options.journal_file is not None and
+                    self.options.apply_plan is None):
+                self._open_journal(started)
+            finished = False
+            try:
+                if self.options.apply_plan is not None:
+                    self.result.total_checks = self.apply_plan(
+                        self.options.apply_plan)
+                else:
+                    if self.options.two_phase:
+                        self.run_two_phase()
+                    else:
+                        self._run_one_by_one()
+                    self.result.total_checks = len(self._numbered_checks())
+                finished = True
+            finally:
+                self.result.processes_spawned = (
+                    self.executor.processes_spawned() - spawned_before)
+                self.executor.close()
+                self._save_state()
+                if self.journal is not None:
+                    self.journal.close(finished)
+                if self.history is not None:
+                    self.history.finish_run()
+                    self.history.compact(const.HISTORY_MAX_RUNS,
+                                         const.HISTORY_MAX_AGE_DAYS)
+                    self.history.close()
+            result = self.result
+            result.checks.sort(key=lambda check: check.check_num)
+            result.manual_fixes.sort()
+            result.duration = time.time() - started
+            self.write_str("Processes spawned: %d (%d commands executed "
+                           "without a shell)" % (
+                               result.processes_spawned,
+                               self.executor.shells_avoided() - avoided_before),
+                           debug=True)
+            if self.options.metrics_file is not None:
+                self._write_metrics(result)
+            return result
+
+    def _save_state(self):
+        """Saves the probe cache and check durations for later runs."""
+        try:
+            if self.probe_cache is not None:
+                self.probe_cache.save()
+            if self.durations is not None:
+                self.durations.save(keep=set(
+                    history.check_key(config_check.description)
+                    for config_check in self.config_checks))
+        except (IOError, OSError) as err:
+            self.write_str("%sCould not save the state of this run for later "
+                           "runs: %s%s" % (const.COLORS['WARNING'], err,
+                                           const.COLORS['ENDC']))
+
+    def _open_journal(self, started):
+        """Starts checkpointing the run, resuming an interrupted run if
+        requested."""
+        try:
+            self.journal = journal.Journal(self.options.journal_file, started,
+                                           resume=self.options.resume)
+        except (IOError, OSError) as err:
+            self.write_str("%sCould not checkpoint this run in '%s': %s%s" %
+                           (const.COLORS['WARNING'], self.options.journal_file,
+                            err, const.COLORS['ENDC']))
+
+    def _inputs_key(self, config_check):
+        return journal.inputs_key(config_check, self.options.attempt_fixes,
+                                  self.options.skip_sudo_tests)
+
+    def _resume(self, numbered_checks):
+        """Records the checks completed by the interrupted run that is resumed.
+
+        Args:
+            numbered_checks (List[(int, `ConfigCheck`)]): The checks to
+                perform, see `ordered_checks`.
+
+        Returns:
+            List[(int, `ConfigCheck`)]: The checks that remain to be
+                performed, in the same order.
+        """
+        if self.journal is None or not self.options.resume:
+            return numbered_checks
+        remaining = []
+        for check_num, config_check in numbered_checks:
+            entry = self.journal.completed(
+                history.check_key(config_check.description),
+                self._inputs_key(config_check))
+            if entry is None:
+                remaining.append((check_num, config_check))
+                continue
+            self.check_num = check_num
+            self.failing_targets[config_check] = list(entry['failing_targets'])
+            if entry['manual_fix']:
+                self.result.manual_fixes.append(check_num)
+            self._print_resumed(config_check, entry['outcome'])
+            self._record_check(config_check, entry['outcome'],
+                               entry['started'], entry['duration'],
+                               resumed=True)
+        return remaining
+
+    def _print_resumed(self, config_check, outcome):
+        """Prints the outcome of a check taken from the journal."""
+        if outcome in history.PASSING_OUTCOMES:
+            outcome_str = const.PASSED_STR
+        elif outcome == history.SKIPPED:
+            outcome_str = const.SKIPPED_STR
+        else:
+            outcome_str = const.FAILED_STR
+        self.write_str("\nCHECK #%d: %s... %s (before the run was resumed)" %
+                       (self.check_num, config_check.description,
+                        outcome_str))
+        if outcome not in history.PASSING_OUTCOMES:
+            for target in self.failing_targets.get(config_check, ()):
+                self.write_str("\t%s %s" % (const.FAILED_STR, target))
+
+    def _write_metrics(self, result):
+        """Writes the result of the run as Prometheus metrics."""
+        try:
+            metrics.write_metrics(
+                self.options.metrics_file,
+                metrics.format_metrics(result, confidence_to_str))
+        except (IOError, OSError) as err:
+            self.write_str("%sCould not write metrics to '%s': %s%s" %
+                           (const.COLORS['WARNING'], self.options.metrics_file,
+                            err, const.COLORS['ENDC']))
+
+    def expected_duration(self, config_check):
+        """Returns how long the tests of a check are expected to take, in
+        seconds, or None if that is not known."""
+        if self.durations is None:
+            return None
+        return self.durations.expected(
+            history.check_key(config_check.description))
+
+    def ordered_checks(self):
+        """Returns the checks in the order they should be performed.
+
+        With a time budget, checks are performed by priority: required checks
+        first, then recommended and then experimental ones, and the cheapest
+        checks first within each of these. A check is left out if it is not
+        expected to finish before the budget is spent, but cheaper checks
+        after it are still performed. Checks that have not been timed yet are
+        assumed to take `const.DEFAULT_EXPECTED_DURATION`. Otherwise,
+        checks are performed in the order of the config.
+
+        Returns:
+            List[(int, `ConfigCheck`)]: The number of each check and the check.
+        """
+        numbered_checks = self._numbered_checks()
+        if self.deadline is None:
+            return numbered_checks
+        return sorted(numbered_checks, key=lambda (check_num, config_check): (
+            config_check.confidence, self._expected_or_default(config_check),
+            check_num))
+
+    def _numbered_checks(self):
+        """The checks selected by the options, with their numbers."""
+        return [(check_num, config_check) for check_num, config_check
+                in enumerate(self.config_checks, 1)
+                if self.options.checks is None or
+                check_num in self.options.checks]
+
+    def _expected_or_default(self, config_check):
+        expected = self.expected_duration(config_check)
+        return const.DEFAULT_EXPECTED_DURATION if expected is None else expected
+
+    def _fits_budget(self, config_check):
+        """Whether there is enough time left to perform a check."""
+        if self.deadline is None:
+            return True
+        return (time.time() + self._expected_or_default(config_check) <=
+                self.deadline)
+
+    def _record_not_evaluated(self, check_num, config_check):
+        """Records a check left out because the time budget was spent."""
+        self.check_num = check_num
+        self._record_check(config_check, history.NOT_EVALUATED, time.time(),
+                           0.0)
+
+    def _run_one_by_one(self):
+        """Performs each check, offering to fix it right away if it fails."""
+        for check_num, config_check in self._resume(self.ordered_checks()):
+            if not self._fits_budget(config_check):
+                self._record_not_evaluated(check_num, config_check)
+                continue
+            self.check_num = check_num
+            check_started = time.time()
+            if self.history is not None:
+                self.history.start_check(config_check.description)
+            outcome = self._run_and_fix(config_check)
+            self._record_check(config_check, outcome, check_started,
+                               time.time() - check_started)
+
+    def run_check(self, config_check, last_attempt=False, quiet_fail=False):
+        """Perform the specified configuration check against the OS.
+
+        Each config check may specify multiple test cases with early-succeed
+        and/or early-fail parameters.
+
+        These are the possible conditions resulting from run_check:
+        1. One of the tests explicitly passed.
+        2. One of the tests explicitly failed.
+        3. All of the tests were run and none of them passed or failed. (This
+            should be considered a fail.)
+        4. All of the tests were skipped because we're skipping sudo checks and
+            the only tests available require sudo privs.
+
+        Args:
+            config_check (`ConfigCheck`): The check to perform. May contain
+                multiple commands to test.
+            last_attempt (bool): Is this the last time the script checks this
+                configuration, or will we check again during this run?
+            quiet_fail (bool): Suppress print failed results to stdout?
+                Default: False.
+
+        Returns: `CheckResult`: The check explicitly passed, explicitly
+            failed, never passed, or all checks were skipped.
+
+        Raises: ValueError if result of _execute_check is not valid.
+        """
+        assert isinstance(config_check, ConfigCheck)
+
+        result, test_runs = self.evaluate_tests(config_check)
+        self._record_tests(config_check, test_runs)
+        self._print_result(config_check, result, last_attempt=last_attempt,
+                           quiet_fail=quiet_fail)
+        return result
+
+    def evaluate_tests(self, config_check):
+        """Performs the tests of a configuration check without printing its
+        result.
+
+        This does not change the state of the run, so checks that do not use
+        sudo can be evaluated concurrently in worker threads.
+
+        Args:
+            config_check (`ConfigCheck`): The check to perform.
+
+        Returns:
+            tuple: (`CheckResult`, List[(str, `CheckResult`, float, float,
+                list)]): The result of the check, and the command, result,
+                start time, duration and per-target results of each test
+                executed. The per-target results are a list of (target,
+                `CheckResult`) tuples for `per_target` tests, and None
+                otherwise.
+
+        Raises: ValueError if result of _execute_check is not valid.
+        """
+        skip_sudo_tests = self.options.skip_sudo_tests
+        #Assume all tests have been skipped until demonstrated otherwise.
+        result = CheckResult.all_skipped
+        test_runs = []
+        for test in config_check.tests:
+            #alert user if he might get prompted for admin privs due to sudo use
+            if 'sudo ' in test.command:
+                if skip_sudo_tests:
+                    self.write_str("Skipping test because app skipping sudo "
+                                   "tests.", debug=True)
+                elif not self.executor.prompts_for_password(test.command):
+                    self.write_str("Running test without prompting for a "
+                                   "password: '%s'" % test.command, debug=True)
+                else:
+                    fancy_sudo_command = re.sub(
+                        "sudo", const.SUDO_STR, test.command)
+                    self.write_str((
+                        "The next configuration check requires elevated "
+                        "privileges; %syou may be prompted for your current "
+                        "OS X user's password  below%s. The command to be "
+                        "executed is: '%s'") %
+                                   (const.COLORS['BOLD'], const.COLORS['ENDC'],
+                                    fancy_sudo_command))
+
+            if 'sudo ' not in test.command or not skip_sudo_tests:
+                command_pass = None
+                if test.command_pass is not None:
+                    command_pass = str(test.command_pass)
+                command_fail = None
+                if test.command_fail is not None:
+                    command_fail = str(test.command_fail)
+                started = time.time()
+                targets = None
+                result = self._cached_result(test)
+                if result is None:
+                    with self.governor.slot(config_check.cost):
+                        if test.per_target:
+                            result, targets = self._execute_per_target(
+                                command=test.command,
+                                comparison_type=test.comparison_type,
+                                case_sensitive=test.case_sensitive,
+                                command_pass=command_pass,
+                                command_fail=command_fail)
+                        else:
+                            result = self._execute_check(
+                                command=test.command,
+                                comparison_type=test.comparison_type,
+                                case_sensitive=test.case_sensitive,
+                                command_pass=command_pass,
+                                command_fail=command_fail)
+                    if self.probe_cache is not None and test.cache is not None:
+                        self.probe_cache.store(test, result)
+                test_runs.append((test.command, result, started,
+                                  time.time() - started, targets))
+                if result == CheckResult.explicit_pass:
+                    self.write_str("Test passed exlicitly for '%s'" %
+                                   test.command, debug=True)
+                    break
+                elif result == CheckResult.explicit_fail:
+                    self.write_str("Test failed exlicitly for '%s'" %
+                                   test.command, debug=True)
+                    break
+                elif result == CheckResult.no_pass:
+                    self.write_str("Test did not pass for '%s'" % test.command,
+                                   debug=True)
+                    continue
+                else:
+                    raise ValueError("Invalid return value from "
+                                     "_execute_check.")
+
+        return result, test_runs
+
+    def _cached_result(self, test):
+        """Returns the result of a test cached by an earlier run, if any."""
+        if self.probe_cache is None or test.cache is None:
+            return None
+        result = self.probe_cache.lookup(test)
+        if result is not None:
+            self.write_str("Using cached result of '%s'" % test.command,
+                           debug=True)
+        return result
+
+    def _record_tests(self, config_check, test_runs):
+        """Records tests returned by `evaluate_tests` in the run history, the
+        expected durations of checks and the failing targets of the check."""
+        if self.history is not None:
+            for command, result, started, duration, _ in test_runs:
+                self.history.record_test(command, result, started, duration)
+        if self.durations is not None and len(test_runs) > 0:
+            self.durations.update(
+                history.check_key(config_check.description),
+                sum(duration for _, _, _, duration, _ in test_runs))
+        #the last test executed decided the result
+        targets = test_runs[-1][4] if len(test_runs) > 0 else None
+        if targets is None:
+            self.failing_targets.pop(config_check, None)
+        else:
+            self.failing_targets[config_check] = [
+                target for target, result in targets
+                if result != CheckResult.explicit_pass]
+
+    def _print_result(self, config_check, result, last_attempt=False,
+                      quiet_fail=False):
+        """Prints the result of the current check; see `run_check`."""
+        if result == CheckResult.explicit_pass or not quiet_fail:
+            self.write_str("\nCHECK #%d: %s... %s" %
+                           (self.check_num, config_check.description,
+                            check_result_to_str(result)))
+            if result != CheckResult.explicit_pass:
+                for target in self.failing_targets.get(config_check, ()):
+                    self.write_str("\t%s %s" % (const.FAILED_STR, target))
+
+        if (result not in (CheckResult.explicit_pass,
+                           CheckResult.all_skipped) and
+                last_attempt and do_warn(config_check)):
+            warn("Attempted fix %s" % const.FAILED_STR)
+
+    def _execute_check(self, command, comparison_type, case_sensitive,
+                       command_pass=None, command_fail=None):
+        """Helper function for `run_check` -- executes command and checks
+        result.
+
+        This check can result in three conditions:
+        1. The check explicitly passed, and no subsequent tests need to be
+            performed for this check. Returns True.
+        2. The check explicitly failed, and no subsequent tests need to be
+            performed for this check. Raises ConfigCheckFailedExplicitly.
+        3. The check produced another result, and if there is another test
+            available, it
+
+        The output of the command is matched as it is produced, see
+        `OutputMatcher`. Once the result is decided, the command is terminated
+        without reading the rest of its output.
+
+        Args:
+            command (str): The command to execute to perform the check.
+            comparison_type (str): 'exact match' or 'regex match'
+            case_sensitive (bool): Whether the comparison to output is case
+                sensitive.
+            command_pass (str or None): The output of the command which
+                constitutes an explicit pass for the test, either as an exact
+                string or regex depending on `comparison_type`.
+            command_fail (str or None): The output of the command which
+                constitutes an explicit fail for the test, either as an exact
+                string or regex depending on `comparison_type`.
+
+        Returns:
+           `CheckResult`: explicit pass, explicit failure, or lacking of
+                passing for this test only.
+
+        Raises:
+            ValueError if `comparison_type` is not an expected value
+        """
+        matcher = OutputMatcher(comparison_type, case_sensitive,
+                                command_pass=command_pass,
+                                command_fail=command_fail)
+        command = const.API_PREFIX + command
+        self.executor.match(command, matcher)
+
+        self.write_str("Command executed to check config: '%s'" % str(command),
+                       debug=True)
+        self.write_str("Result of command: '%s'" % matcher.captured_output(),
+                       debug=True)
+        self.write_str("Explicit pass condition for command: '%s'" %
+                       str(command_pass), debug=True)
+        self.write_str("Explicit fail condition for command: '%s'" %
+                       str(command_fail), debug=True)
+
+        return matcher.finish()
+
+    def _execute_per_target(self, command, comparison_type, case_sensitive,
+                            command_pass=None, command_fail=None):
+        """Executes a `per_target` test and compares the output of each target
+        separately; see `CheckTest`.
+
+        The arguments are the same as for `_execute_check`, and the result is
+        that of `compare_targets`.
+        """
+        command = const.API_PREFIX + command
+        output = self.executor.run(command)
+        self.write_str("Command executed to check config: '%s'" % str(command),
+                       debug=True)
+        self.write_str("Result of command: '%s'" %
+                       output[:const.MAX_LOGGED_OUTPUT], debug=True)
+
+        result, targets = compare_targets(
+            output, _comparer(comparison_type, case_sensitive, command_pass,
+                              command_fail))
+        if targets is not None:
+            self.write_str("Results of targets: %s" % str(targets), debug=True)
+        return result, targets
+
+    def fix_commands(self, config_check, command):
+        """Returns the commands to run for a fix command of a check.
+
+        A command containing `const.TARGET_PLACEHOLDER` is run once for each
+        failing target of the check, see `CheckTest`. If no failing targets
+        are known, it is not run at all.
+
+        Args:
+            config_check (`ConfigCheck`): The check to fix.
+            command (str): Its fix or sudo fix command.
+
+        Returns:
+            List[str]: The commands to run, in order.
+        """
+        if const.TARGET_PLACEHOLDER not in command:
+            return [command]
+        return [command.replace(const.TARGET_PLACEHOLDER, pipes.quote(target))
+                for target in self.failing_targets.get(config_check, ())]
+
+    def _try_fix(self, config_check, use_sudo=False, restart=True):
+        """Attempt to fix a misconfiguration.
+
+        Args:
+            config_check (`ConfigCheck`): The check to perform.
+            use_sudo (bool): Whether to use the sudo version of this command.
+                If no sudo version of this command has been specified in the
+                config file, this will simply return without executing
+                anything.
+            restart (bool): Whether to run the restart command of the fix, if
+                any, and wait for the fix to take effect right after the fix.
+                Fixes applied in a batch are restarted together afterwards
+                instead. Neither is done if no fix command exited with status
+                0.
+
+        Returns:
+            tuple: (bool, Optional[str]): Whether a fix command exited with
+                status 0, and, if one did but `restart` is False and the check
+                waits for its fixes to take effect, the result of
+                `readiness.snapshot` to pass to `_wait_for_fix` after the
+                restart, or None.
+        """
+        command = config_check.sudo_fix if use_sudo else config_check.fix
+        restart_command = (config_check.sudo_restart if use_sudo
+                           else config_check.restart)
+        if (use_sudo and command is not None and
+                self.executor.prompts_for_password(command)):
+            self.write_str((
+                "\tAttempting configuration fix with elevated privileges; %s"
+                "you may be prompted for your OS X login password%s...") %
+                           (const.COLORS['BOLD'], const.COLORS['ENDC']))
+        commands = []
+        if command is not None:
+            commands = self.fix_commands(config_check, command)
+            if len(commands) == 0:
+                self.write_str("No failing targets to run the fix for.",
+                               debug=True)
+        before = None
+        if len(commands) > 0 and config_check.wait_until is not None:
+            before = readiness.snapshot(config_check.wait_until, self.executor)
+        succeeded = False
+        for command in commands:
+            started = time.time()
+            full_command = const.API_PREFIX + command
+            with self.governor.slot(config_check.cost):
+                status, stdoutdata = self.executor.run_status(full_command)
+            succeeded = succeeded or status == 0
+            if self.history is not None:
+                self.history.record_fix(command, use_sudo, started,
+                                        time.time() - started)
+            if self.probe_cache is not None:
+                purged = self.probe_cache.purge_for_fix(config_check.tests,
+                                                        command)
+                self.write_str("Purged %d cached results." % purged,
+                               debug=True)
+
+            self.write_str("Command executed: '%s'" % full_command,
+                           debug=True)
+            self.write_str("Command exit status: %d" % status, debug=True)
+            self.write_str("Command STDOUT and STDERR: '%s'" % str(stdoutdata),
+                           debug=True)
+
+        if not succeeded:
+            return False, None
+        if restart_command is not None and restart:
+            self._restart(restart_command)
+        if before is not None and restart:
+            self._wait_for_fix(config_check, before)
+            return True, None
+        return True, before
+
+    def _wait_for_fix(self, config_check, before):
+        """Waits until the fix of a check has taken effect, see `readiness`.
+
+        Args:
+            config_check (`ConfigCheck`): The check that was fixed.
+            before (str): The result of `readiness.snapshot` before the fix.
+        """
+        started = time.time()
+        ready, evaluations = readiness.wait_until(config_check.wait_until,
+                                                  self.executor, before)
+        self.write_str("Waited %.2f seconds for the fix to take effect, "
+                       "evaluating '%s' %d times." % (
+                           time.time() - started,
+                           config_check.wait_until.command(), evaluations),
+                       debug=True)
+        if not ready:
+            self.write_str("%s\tThe fix did not take effect within %g "
+                           "seconds.%s" % (const.COLORS['WARNING'],
+                                           config_check.wait_until.timeout,
+                                           const.COLORS['ENDC']))
+
+    def _restart(self, command):
+        """Runs the restart command of one or more fixes that were applied."""
+        full_command = const.API_PREFIX + command
+        stdoutdata = self.executor.run(full_command)
+        self.write_str("Restart command executed: '%s'" % full_command,
+                       debug=True)
+        self.write_str("Command STDOUT and STDERR: '%s'" % str(stdoutdata),
+                       debug=True)
+
+    def do_fix_and_test(self, config_check):
+        """Attempt to fix misconfiguration, returning the result.
+
+        If a non-sudo fix is specified, this will be attempted first.
+        If a non-sudo fix fails or there is none specified and a sudo fix is
+        specified, this will be attempted next.
+        If all previous attempts have failed or none have been specified and
+        instructions for manually fixing the configuration have been specified,
+        these will be listed in the `RunResult`.
+
+        Args:
+            config_check (`ConfigCheck`): The check to perform.
+
+        Returns:
+            bool: Whether an attempted fix was successful.
+        """
+        self.write_str("Entered do_fix_and_test()", debug=True)
+
+        if config_check.fix is not None:
+            self._try_fix(config_check, use_sudo=False)
+            check_result = self.run_check(
+                config_check, last_attempt=False, quiet_fail=True)
+            if check_result == CheckResult.explicit_pass:
+                return True
+
+        if config_check.sudo_fix is not None:
+            self._try_fix(config_check, use_sudo=True)
+            check_result = self.run_check(
+                config_check, last_attempt=True, quiet_fail=False)
+            return bool(check_result == CheckResult.explicit_pass)
+        else:
+            return False
+
+    def do_fixes_and_test(self, numbered_checks):
+        """Attempt to fix several misconfigurations at once, returning the
+        results.
+
+        This works like `do_fix_and_test`, except that each step is performed
+        for all of the checks before the next one: first every non-sudo fix is
+        applied, then each distinct restart command of the fixes that exited
+        with status 0 is run once, then the fixes are waited for (see
+        `readiness`), and then all of the checks are verified. The checks that
+        still fail are then retried the same way with their sudo fixes.
+
+        Args:
+            numbered_checks (List[(int, `ConfigCheck`)]): The numbers of the
+                checks to fix and the checks themselves.
+
+        Returns:
+            dict: The check number of each check mapped to whether it was fixed.
+        """
+        self.write_str("Entered do_fixes_and_test()", debug=True)
+
+        fixed = dict((check_num, False) for check_num, _ in numbered_checks)
+        for use_sudo in (False, True):
+            attempts = [(check_num, config_check)
+                        for check_num, config_check in numbered_checks
+                        if not fixed[check_num] and
+                        (config_check.sudo_fix if use_sudo
+                         else config_check.fix) is not None]
+            restarts = []
+            waits = [] #the checks whose fixes to wait for after the restarts
+            for check_num, config_check in attempts:
+                self.check_num = check_num
+                if self.history is not None:
+                    self.history.start_check(config_check.description)
+                succeeded, before = self._try_fix(
+                    config_check, use_sudo=use_sudo, restart=False)
+                if before is not None:
+                    waits.append((check_num, config_check, before))
+                restart = (config_check.sudo_restart if use_sudo
+                           else config_check.restart)
+                if (succeeded and restart is not None and
+                        restart not in restarts):
+                    restarts.append(restart)
+
+            for restart in restarts:
+                self._restart(restart)
+
+            for check_num, config_check, before in waits:
+                self.check_num = check_num
+                self._wait_for_fix(config_check, before)
+
+            for check_num, config_check in attempts:
+                self.check_num = check_num
+                if self.history is not None:
+                    self.history.start_check(config_check.description)
+                last_attempt = use_sudo or config_check.sudo_fix is None
+                check_result = self.run_check(
+                    config_check, last_attempt=last_attempt,
+                    quiet_fail=not last_attempt)
+                fixed[check_num] = check_result == CheckResult.explicit_pass
+        return fixed
+
+    def _run_and_fix(self, config_check):
+        """Runs a check and attempts to fix it if appropriate.
+
+        Args:
+            config_check (`ConfigCheck`): The check to perform.
+
+        Returns:
+            str: The outcome of the check, as one of the constants in `history`.
+        """
+        check_result = self.run_check(config_check)
+        outcome = self._outcome_without_fix(config_check, check_result)
+        if outcome is not None:
+            return outcome
+
+        #attempt fix, but prompt user first if appropriate
+        if self.options.prompt_for_fixes:
+            prompt_default, descriptor = _fix_prompt_default(config_check)
+
+            next_fix_command = config_check.fix
+            if next_fix_command is None:
+                next_fix_command = config_check.sudo_fix
+            next_fix_command = "' and '".join(
+                self.fix_commands(config_check, next_fix_command))
+
+            question = (("\tApply the following %s fix? This will "
+                         "execute  this command:\n\t\t'%s'") %
+                        (descriptor, next_fix_command))
+            if not self.ask(question, prompt_default):
+                #user declined fix
+                return history.FAIL_FIX_DECLINED
+
+        return self._fix_outcome(config_check,
+                                 self.do_fix_and_test(config_check))
+
+    def _outcome_without_fix(self, config_check, check_result):
+        """Determines the outcome of a check that will not be fixed
+        automatically.
+
+        Checks that cannot be fixed automatically but have manual fix
+        instructions are added to the `RunResult`.
+
+        Args:
+            config_check (`ConfigCheck`): The check performed.
+            check_result (`CheckResult`): The result of the check.
+
+        Returns:
+            str or None: The outcome of the check, as one of the constants in
+                `history`, or None if a fix should be offered.
+        """
+        if check_result == CheckResult.explicit_pass:
+            return history.PASS_NO_FIX
+        elif check_result == CheckResult.all_skipped:
+            return history.SKIPPED
+
+        if not self.options.attempt_fixes:
+            #report-only mode
+            return history.FAIL_FIX_SKIPPED
+
+        if config_check.fix is None and config_check.sudo_fix is None:
+            #no automatic fix available
+            self._add_manual_fix(config_check)
+            return history.FAIL_NO_FIX
+
+        return None
+
+    def _fix_outcome(self, config_check, fixed):
+        """Determines the outcome of a check after attempting to fix it.
+
+        Args:
+            config_check (`ConfigCheck`): The check fixed.
+            fixed (bool): Whether the check passed after the fix.
+
+        Returns:
+            str: The outcome of the check, as one of the constants in `history`.
+        """
+        self.write_str("Value of fixed is: %s" % str(fixed), debug=True)
+        if fixed:
+            return history.PASS_AFTER_FIX
+
+        self._add_manual_fix(config_check)
+        return history.FAIL_FIX_FAIL
+
+    def _add_manual_fix(self, config_check):
+        """Lists the current check for manual remediation, if possible."""
+        if config_check.manual_fix is not None:
+            self.result.manual_fixes.append(self.check_num)
+        else:
+            self.write_str(("Could not satisfy test #%d but no manual fix "
+                            "specified.") % self.check_num, debug=True)
+
+    def _record_check(self, config_check, outcome, started, duration,
+                      resumed=False):
+        """Records the outcome of the current check in the result, the run
+        history and the journal, unless it was `resumed` from the journal."""
+        failing_targets = ()
+        if outcome not in history.PASSING_OUTCOMES:
+            failing_targets = tuple(self.failing_targets.get(config_check, ()))
+        self.result.checks.append(CheckOutcome(
+            self.check_num, config_check.description, config_check.confidence,
+            outcome, started, duration, failing_targets))
+        if self.history is not None:
+            self.history.record_check(
+                self.check_num, config_check.description,
+                config_check.confidence, outcome, started, duration)
+        if (self.journal is not None and not resumed and
+                outcome != history.NOT_EVALUATED):
+            try:
+                self.journal.record(
+                    history.check_key(config_check.description),
+                    self._inputs_key(config_check), outcome, started,
+                    duration, failing_targets,
+                    self.check_num in self.result.manual_fixes)
+            except (IOError, OSError) as err:
+                self.write_str("%sCould not checkpoint this run: %s%s" %
+                               (const.COLORS['WARNING'], err,
+                                const.COLORS['ENDC']))
+                self.journal = None
+
+    def _evaluate_timed(self, numbered_check):
+        """Evaluates a check if it fits in the time budget.
+
+        Returns:
+            tuple: (`CheckResult`, list, float, float): See `evaluate_tests`,
+                followed by the start time and duration, or None if the check
+                was not evaluated.
+        """
+        config_check = numbered_check[1]
+        if not self._fits_budget(config_check):
+            return None
+        started = time.time()
+        result, test_runs = self.evaluate_tests(config_check)
+        return result, test_runs, started, time.time() - started
+
+    def _can_evaluate_in_parallel(self, numbered_check):
+        """Whether a check can be evaluated without prompting for a
+        password."""
+        config_check = numbered_check[1]
+        return (self.options.skip_sudo_tests or
+                all('sudo ' not in test.command for test in config_check.tests))
+
+    def run_two_phase(self):
+        """Evaluates every check, then applies the fixes approved in bulk.
+
+        In the first phase, checks are evaluated without interruption, up to
+        `jobs` of them at a time, starting with the checks expected to take
+        the longest unless there is a time budget. Checks that may prompt for
+        a password are evaluated one at a time. The failing checks that have
+        an automatic fix are written to a remediation plan (see `remediation`)
+        if a plan file is set. In the second phase, the user approves the
+        fixes for each level of confidence at once, and the approved fixes are
+        applied and verified in one batch, see `do_fixes_and_test`.
+        """
+        plan_filename = self.options.plan_file
+
+        #phase one: evaluate every check
+        plan = []
+        pending = []
+        numbered_checks = self._resume(self.ordered_checks())
+        priority = None
+        if self.deadline is None:
+            priority = lambda (_, config_check): self._expected_or_default(
+                config_check)
+        evaluations = remediation.map_in_order(
+            self._evaluate_timed, numbered_checks, self.options.jobs,
+            in_parallel=self._can_evaluate_in_parallel, priority=priority)
+        for (check_num, config_check), evaluation in zip(numbered_checks,
+                                                         evaluations):
+            if evaluation is None:
+                self._record_not_evaluated(check_num, config_check)
+                continue
+            result, test_runs, started, duration = evaluation
+            self.check_num = check_num
+            if self.history is not None:
+                self.history.start_check(config_check.description)
+            self._record_tests(config_check, test_runs)
+            self._print_result(config_check, result)
+
+            if (result not in (CheckResult.explicit_pass,
+                               CheckResult.all_skipped) and
+                    (config_check.fix is not None or
+                     config_check.sudo_fix is not None)):
+                plan.append(remediation.PlanEntry(
+                    check_num=check_num,
+                    check_key=history.check_key(config_check.description),
+                    description=config_check.description,
+                    confidence=confidence_to_str(config_check.confidence),
+                    fix=config_check.fix,
+                    sudo_fix=config_check.sudo_fix,
+                    manual_fix=config_check.manual_fix,
+                    approved=_fix_prompt_default(config_check)[0]))
+
+            outcome = self._outcome_without_fix(config_check, result)
+            if outcome is None:
+                pending.append((check_num, config_check, started))
+            else:
+                self._record_check(config_check, outcome, started, duration)
+        plan.sort(key=lambda entry: entry.check_num)
+        pending.sort(key=lambda (check_num, _, __): check_num)
+
+        if len(plan) == 0:
+            self.write_str("\nNo failing checks can be fixed automatically.")
+            return
+        if plan_filename is not None:
+            remediation.write_plan(plan_filename, plan, const.VERSION)
+            self.write_str((
+                "\nWrote a remediation plan for %d failing checks to '%s'. To "
+                "apply it later, set \"approved\" for each fix to apply and "
+                "run this tool with --apply-plan.") % (len(plan),
+                                                       plan_filename))
+        if len(pending) == 0:
+            return
+
+        #phase two: approve fixes in bulk, then apply them
+        approved = self._approve_in_bulk([config_check
+                                          for _, config_check, _ in pending])
+        self._apply_fixes(pending, approved)
+
+    def _approve_in_bulk(self, config_checks):
+        """Asks the user once per level of confidence which fixes to apply.
+
+        Returns:
+            List[`ConfigCheck`]: The checks whose fixes were approved.
+        """
+        self.write_str("\n==========================")
+        self.write_str("%sThe following checks failed and can be fixed "
+                       "automatically:%s" %
+                       (const.COLORS['BOLD'], const.COLORS['ENDC']))
+        for config_check in config_checks:
+            self.write_str("%s%s" % (_fix_prompt_default(config_check)[1],
+                                     config_check.description))
+            for command, restart in ((config_check.fix, config_check.restart),
+                                     (config_check.sudo_fix,
+                                      config_check.sudo_restart)):
+                if command is not None:
+                    for target_command in self.fix_commands(config_check,
+                                                            command):
+                        self.write_str("\t\t'%s'" % target_command)
+                    if restart is not None:
+                        self.write_str("\t\tthen, once for all fixes: '%s'" %
+                                       restart)
+        self.write_str("==========================")
+
+        approved = []
+        for confidence in (Confidence.required, Confidence.recommended,
+                           Confidence.experimental):
+            checks = [config_check for config_check in config_checks
+                      if config_check.confidence == confidence]
+            if len(checks) == 0:
+                continue
+            if self.options.prompt_for_fixes:
+                prompt_default, descriptor = _fix_prompt_default(checks[0])
+                question = ("\tApply all %d %sfixes listed above?" %
+                            (len(checks), descriptor or 'required '))
+                if not self.ask(question, prompt_default):
+                    continue
+            approved.extend(checks)
+        return approved
+
+    def _apply_fixes(self, pending, approved):
+        """Applies the approved fixes in one batch, recording the outcomes.
+
+        Args:
+            pending (List[(int, `ConfigCheck`, float)]): The number of each
+                failing check that can be fixed automatically, the check
+                itself, and when it started.
+            approved (List[`ConfigCheck`]): The checks whose fixes to apply.
+                The fixes of the other pending checks count as declined.
+        """
+        fixed = self.do_fixes_and_test([(check_num, config_check)
+                                        for check_num, config_check, _
+                                        in pending
+                                        if config_check in approved])
+        for check_num, config_check, started in pending:
+            self.check_num = check_num
+            if check_num in fixed:
+                outcome = self._fix_outcome(config_check, fixed[check_num])
+            else:
+                outcome = history.FAIL_FIX_DECLINED
+            self._record_check(config_check, outcome, started,
+                               time.time() - started)
+
+    def apply_plan(self, plan_filename):
+        """Applies the approved fixes of a remediation plan written earlier.
+
+        Each check listed in the plan is evaluated again first and only fixed
+        if it still fails, so a plan can be applied more than once. The fixes
+        are then applied in one batch, see `do_fixes_and_test`. Checks are
+        matched to the config by their description. The fix commands in the
+        config file are used, and checks whose fix changed since the plan was
+        written are skipped.
+
+        Args:
+            plan_filename (str): The remediation plan to apply.
+
+        Returns:
+            int: The number of checks from the plan that were considered.
+
+        Raises:
+            remediation.PlanError: If the plan could not be read.
+        """
+        config_checks = self.config_checks
+        entries = remediation.read_plan(plan_filename)
+
+        check_nums = dict((history.check_key(config_check.description),
+                           check_num)
+                          for check_num, config_check
+                          in enumerate(config_checks, 1))
+        total_checks = 0
+        pending = []
+        approved = []
+        for entry in entries:
+            check_num = check_nums.get(entry.check_key)
+            if check_num is None:
+                self.write_str("%sSkipping '%s': it is no longer in the "
+                               "config.%s" %
+                               (const.COLORS['WARNING'], entry.description,
+                                const.COLORS['ENDC']))
+                continue
+            config_check = config_checks[check_num - 1]
+            if (entry.fix, entry.sudo_fix) != (config_check.fix,
+                                                config_check.sudo_fix):
+                self.write_str(("%sSkipping '%s': its fix has changed since "
+                                "the plan was written.%s") %
+                               (const.COLORS['WARNING'], entry.description,
+                                const.COLORS['ENDC']))
+                continue
+
+            total_checks += 1
+            self.check_num = check_num
+            started = time.time()
+            if self.history is not None:
+                self.history.start_check(config_check.description)
+            if not entry.approved:
+                self.write_str("\nCHECK #%d: %s... fix not approved in plan." %
+                               (check_num, config_check.description))
+                pending.append((check_num, config_check, started))
+                continue
+            outcome = self._outcome_without_fix(config_check,
+                                                self.run_check(config_check))
+            if outcome is None:
+                pending.append((check_num, config_check, started))
+                approved.append(config_check)
+            else:
+                self._record_check(config_check, outcome, started,
+                                   time.time() - started)
+
+        self._apply_fixes(pending, approved)
+        return total_checks
+
+def do_warn(config_check):
+    """Determines whether the config failure merits warning."""
+    if config_check.confidence == Confidence.required:
+        return True
+    if (config_check.confidence == Confidence.recommended and
+            const.WARN_FOR_RECOMMENDED):
+        return True
+    if (config_check.confidence == Confidence.experimental and
+            const.WARN_FOR_EXPERIMENTAL):
+        return True
+    return False
+
+def _fix_prompt_default(config_check):
+    """Whether to fix a check unless the user says otherwise.
+
+    Returns:
+        tuple: (bool, str): The default answer, and a descriptor of the
+            check's confidence for use in prompts.
+    """
+    if config_check.confidence == Confidence.recommended:
+        return (const.FIX_RECOMMENDED_BY_DEFAULT,
+                const.RECOMMENDED_STR + ' ')
+    elif config_check.confidence == Confidence.experimental:
+        return (const.FIX_EXPERIMENTAL_BY_DEFAULT,
+                const.EXPERIMENTAL_STR + ' ')
+    return True, ''
@@ -79,6 +79,102 @@ Examples:
 
     $ python chrome_defaults.py write-array "/Users/myusername/Library/Application Support/Google/Chrome/Default/Preferences" plugins.plugins_list enabled -bool false where name -string "Shockwave Flash"
 
+####################
+# Path Expressions #
+####################
+
+Wherever an attribute name is accepted by the "read", "write" and "delete"
+sub-commands, a path expression can be used instead to address many attributes
+at once. Path expressions extend dot notation with:
+
+    *               any attribute of an object or element of an array
+    **              zero or more levels of nesting (recursive descent)
+    name[3]         the element of array "name" at index 3
+    name[*]         every element of array "name"
+    name[key=value] the elements of "name" whose "key" attribute equals value;
+                    the value is decoded as JSON if possible, e.g. "text", 3,
+                    true, and otherwise taken as a string
+
+For example:
+
+    $ python chrome_defaults.py read "/Users/myusername/Library/Application Support/Google/Chrome/Default/Preferences" 'profile.content_settings.exceptions.*.*.setting'
+
+    $ python chrome_defaults.py write "/Users/myusername/Library/Application Support/Google/Chrome/Default/Preferences" 'plugins.plugins_list[name="Adobe Flash Player"].enabled' -bool false
+
+"read" prints the value of each match on its own line. "write" sets the final
+attribute in every object matched by the rest of the expression, creating it if
+it is missing, while "delete" removes every match. Expressions are compiled once
+per process and evaluated in a single traversal of the preferences file.
+
+#####################
+# Multiple Profiles #
+#####################
+
+Instead of a single preferences file, the file argument can name a Chrome
+profile root directory or a glob pattern. For a directory, every file named
+"Preferences" in it or in one of its immediate sub-directories is processed,
+like `find DIR -name "Preferences" -maxdepth 2`. For a glob pattern, every
+matching file is processed, and matching directories are searched in the same
+way. Discovered files are processed in sorted order by a single process, and
+"read" prints one result per file, in that order, just as running the command
+once per file would. An error in one file is reported and the remaining files
+are still processed; the exit status is then non-zero.
+
+The "--jobs N" option, given before the sub-command, processes up to N files
+at once in a pool of worker processes. This is worthwhile only for large numbers
+of profiles. For example:
+
+    $ python chrome_defaults.py read ~/Library/Application\ Support/Google/Chrome search.suggest_enabled
+
+    $ python chrome_defaults.py --jobs 4 write "/Users/*/Library/Application Support/Google/Chrome" search.suggest_enabled -bool false
+
+The "--with-filename" option, also given before the sub-command, prefixes each
+line printed for a file, including error messages, with the name of the file
+and a tab. This lets the caller tell which profiles a result belongs to, e.g.
+to fix only the profiles whose value is wrong:
+
+    $ python chrome_defaults.py --with-filename read ~/Library/Application\ Support/Google/Chrome search.suggest_enabled
+    /Users/myusername/Library/Application Support/Google/Chrome/Default/Preferences	False
+    /Users/myusername/Library/Application Support/Google/Chrome/Profile 1/Preferences	True
+
+######################
+# Concurrent Writers #
+######################
+
+"write", "delete" and "write-array" take an advisory lock on the preferences
+file, using the sidecar file "Preferences.lock", so that concurrent writers
+cannot undo each other's changes. A writer first appends its change to the queue
+in "Preferences.queue" and then waits for the lock. Whoever gets the lock
+applies every change queued so far in a single read-modify-write, with a single
+backup, and leaves the outcome of each change in the queue. A writer whose
+change was applied by someone else only picks up its outcome. A change that
+fails, e.g. because its attribute does not exist, is left out and reported to
+its own writer without affecting the others. The sidecar files belong to the
+owner of the preferences file, even if a writer runs as root, and the queue is
+removed once it is empty.
+
+The new preferences are written to a temporary file that then replaces the
+preferences file, so reads, which take no lock, see either the old or the new
+preferences and never a partially written file.
+
+##################
+# Reading Values #
+##################
+
+Reading a single attribute does not parse the whole preferences file. The file
+is memory-mapped and scanned forward along the requested dotted path: sibling
+values are skipped over without being decoded, and scanning stops as soon as
+the requested value has been found. Only the requested value itself is decoded.
+Looking up an attribute near the top of a large preferences file therefore costs
+about the same as looking it up in a small one. Note that the part of the file
+after the requested value is not validated, and if an object contains the same
+key twice, the first occurrence is returned.
+
+Printed values and full dumps are written to stdout token by token as the file
+is scanned, so memory use does not grow with the size of the preferences file
+or the depth of its nesting. If the file turns out to be malformed part-way
+through a full dump, the output printed so far is followed by an error.
+
 Todos:
     * Unit tests
     * Add support for writing list values e.g. write [1, 2, 3]
@@ -86,83 +182,506 @@ Todos:
 """
 
 import sys
+import os
 import json
+import mmap
+import glob
+import multiprocessing
+from StringIO import StringIO
+from contextlib import contextmanager
 from datetime import datetime
 import shutil
 from copy import deepcopy
 import re
+import time
+import errno
+import fcntl
+import binascii
+import tempfile
 
 UNDERLINE = '\033[4m'
 ENDC = '\033[0m'
 
 DEBUG_PRINT = False
 
+PREFERENCES_FILENAME = 'Preferences'
+
+#sidecar files of a preferences file that serialize and coalesce writers
+LOCK_SUFFIX = '.lock'
+QUEUE_SUFFIX = '.queue'
+#the arguments of a write, delete or write-array that describe the change
+MUTATION_KEYS = ('action', 'chrome_property', 'value', 'child_attrib',
+                 'where_property', 'where_value')
+#how long outcomes are kept in a queue for writers that are gone, in seconds
+OUTCOME_TTL = 3600
+
+#Unrolled regex for a JSON string literal, including the surrounding quotes
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+#numbers, true, false and null
+_SCALAR_RE = re.compile(r'[^,:\]}\s]+')
+#(kind, argument) steps of a compiled path expression; see `compile_path`
+_STEP_KEY, _STEP_INDEX, _STEP_ANY, _STEP_DESCEND, _STEP_FILTER = range(5)
+_PATH_TOKEN_RE = re.compile(
+    r'(?P<name>[^.\[]+)|(?P<dot>\.)|\[(?P<index>-?\d+|\*)\]|'
+    r'\[\s*(?P<attr>[^=\]]+?)\s*=\s*'
+    r'(?P<value>"[^"\\]*(?:\\.[^"\\]*)*"|[^\]]*?)\s*\]')
+_SPLIT_PATHS = dict()
+_PREFERENCES_FILES = dict()
+_COMPILED_PATHS = dict()
+
+#one punctuation character or literal, after optional whitespace
+_TOKEN_RE = re.compile(r'[ \t\n\r]*(?:([{}\[\],:])|'
+                       r'("[^"\\]*(?:\\.[^"\\]*)*"|[^,:\[\]{}"\s]+))')
+#what iter_json_tokens accepts next
+_EXPECT_VALUE, _EXPECT_VALUE_OR_END, _EXPECT_KEY, _EXPECT_KEY_OR_END, \
+    _EXPECT_COLON, _EXPECT_SEPARATOR = range(6)
+#everything up to the next bracket that is not inside a string literal
+_SKIP_RE = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+
 def _main():
     args = get_args()
     dprint(args)
-    preferences_json = _get_json(args['preferences_filename'])
+    filenames = find_preferences_files(args['preferences_filename'])
+    if (filenames == [args['preferences_filename']] and
+            not args['with_filename']):
+        _run_action(args)
+    else:
+        sys.exit(_run_for_each_file(args, filenames))
+
+def _run_action(args):
+    """Performs the sub-command in `args` on a single preferences file, exiting
+    with an error message if the file cannot be read or written."""
+    try:
+        _perform_action(args)
+    except (IOError, OSError) as err:
+        _exit_unreadable(args['preferences_filename'], err)
+
+def _perform_action(args):
+    if (args['chrome_property'] is not None and
+            is_path_pattern(args['chrome_property'])):
+        _main_path_pattern(args)
+        sys.exit()
+
     if args['action'] == 'read':
-        if args['chrome_property'] is None:
-            print "%s" % json.dumps(preferences_json, indent=4)
-            sys.exit()
-        else:
+        try:
+            if args['chrome_property'] is None:
+                print_json(args['preferences_filename'])
+            else:
+                print_json_field(args['preferences_filename'],
+                                 args['chrome_property'])
+        except KeyError:
+            print("The attribute '%s' does not exist in '%s'." %
+                  (args['chrome_property'], args['preferences_filename']))
+        except ValueError:
+            _exit_invalid_json(args['preferences_filename'])
+        sys.exit()
+
+    if args['action'] in ('write', 'delete', 'write-array'):
+        _update_and_exit(args)
+    else:
+        raise ValueError("Invalid sub-command.")
+
+def find_preferences_files(target):
+    """Lists the preferences files named by a file, profile root or glob.
+
+    The result is cached, so each target is only searched once per process.
+
+    Args:
+        target (str): A preferences file, a directory containing Chrome
+            profiles, or a glob pattern matching either.
+    Returns:
+        List[str]: The preferences files in sorted order. If `target` is
+            neither a directory nor a glob pattern, this is just `[target]`.
+    """
+    try:
+        return _PREFERENCES_FILES[target]
+    except KeyError:
+        pass
+
+    if os.path.isdir(target):
+        filenames = _find_in_profile_root(target)
+    elif glob.has_magic(target) and not os.path.exists(target):
+        filenames = []
+        for match in glob.glob(os.path.expanduser(target)):
+            if os.path.isdir(match):
+                filenames.extend(_find_in_profile_root(match))
+            else:
+                filenames.append(match)
+        filenames = sorted(set(filenames))
+    else:
+        filenames = [target]
+    dprint("find_preferences_files: %s -> %s" % (target, filenames))
+    _PREFERENCES_FILES[target] = filenames
+    return filenames
+
+def _find_in_profile_root(directory):
+    candidates = ([os.path.join(directory, PREFERENCES_FILENAME)] +
+                  glob.glob(os.path.join(directory, '*', PREFERENCES_FILENAME)))
+    return sorted(filename for filename in candidates
+                  if os.path.isfile(filename))
+
+def _run_for_each_file(args, filenames):
+    """Performs the sub-command in `args` on each of `filenames`.
+
+    Returns:
+        int: The exit status; 1 if the sub-command failed for any file.
+    """
+    jobs = min(args['jobs'], len(filenames))
+    if jobs > 1 or args['with_filename']:
+        file_args = [dict(args, preferences_filename=filename)
+                     for filename in filenames]
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
             try:
-                args['value'] = get_json_field(
-                    preferences_json, args['chrome_property'],
-                    args['preferences_filename'])
-                print "%s" % normalize(args['value'])
-            except KeyError:
-                print("The attribute '%s' does not exist in '%s'." %
-                      (args['chrome_property'], args['preferences_filename']))
-    elif args['action'] == 'write':
-        _make_backup(args['preferences_filename'])
-        new_json = write_json_field(
-            preferences_json, args['chrome_property'], args['value'])
+                results = pool.map(_run_action_captured, file_args)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_run_action_captured(file_arg) for file_arg in file_args]
+        for filename, (output, errors, _) in zip(filenames, results):
+            if args['with_filename']:
+                output = _prefix_lines(output, filename)
+                errors = _prefix_lines(errors, filename)
+            sys.stdout.write(output)
+            sys.stderr.write(errors)
+        return int(any(failed for _, _, failed in results))
 
-        with open(args['preferences_filename'], 'w') as preferences_file:
-            preferences_file.write(json.dumps(new_json))
-    elif args['action'] == 'delete':
-        _make_backup(args['preferences_filename'])
-        new_json = delete_json_field(preferences_json, args['chrome_property'])
+    status = 0
+    for filename in filenames:
+        try:
+            _run_action(dict(args, preferences_filename=filename))
+        except SystemExit as err:
+            if _report_exit(err, sys.stderr):
+                status = 1
+    return status
 
-        with open(args['preferences_filename'], 'w') as preferences_file:
-            preferences_file.write(json.dumps(new_json))
-    elif args['action'] == 'write-array':
-        _make_backup(args['preferences_filename'])
+def _run_action_captured(args):
+    """Runs `_run_action` in a worker process or for `--with-filename`,
+    capturing its output.
 
-        where_clause = None
-        if 'where_property' in args and 'where_value' in args:
-            where_clause = (args['where_property'], args['where_value'])
+    Returns:
+        tuple: (stdout text, stderr text, whether the sub-command failed)
+    """
+    output, errors = StringIO(), StringIO()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = output, errors
+    failed = False
+    try:
+        _run_action(args)
+    except SystemExit as err:
+        failed = _report_exit(err, errors)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return output.getvalue(), errors.getvalue(), failed
 
-        new_json = write_json_array(preferences_json, args['chrome_property'],
-                                    args['value'], args['child_attrib'],
-                                    where_clause=where_clause)
-        with open(args['preferences_filename'], 'w') as preferences_file:
-            preferences_file.write(json.dumps(new_json))
+def _prefix_lines(text, filename):
+    """Prefixes each line of `text` with `filename` and a tab."""
+    return ''.join("%s\t%s\n" % (filename, line)
+                   for line in text.splitlines())
+
+def _report_exit(err, out):
+    """Writes the message of a `SystemExit` the way the interpreter would.
+
+    Returns:
+        bool: Whether the exit indicates a failure.
+    """
+    if err.code is None or err.code == 0:
+        return False
+    if not isinstance(err.code, int):
+        out.write("%s\n" % err.code)
+    return True
+
+def _main_path_pattern(args):
+    """Performs a read, write or delete on all matches of a path expression."""
+    preferences_json = _get_json(args['preferences_filename'])
+    if args['action'] == 'read':
+        values = [value for _, _, value in
+                  iter_path_matches(preferences_json, args['chrome_property'])]
+        if len(values) == 0:
+            print("The attribute '%s' does not exist in '%s'." %
+                  (args['chrome_property'], args['preferences_filename']))
+        for value in values:
+            print "%s" % normalize(value)
+        return
+    elif args['action'] in ('write', 'delete'):
+        _update_and_exit(args)
+    else:
+        sys.exit("Error: Path expressions are not supported by '%s'." %
+                 args['action'])
+
+def _update_and_exit(args):
+    """Applies the write, delete or write-array in `args`, exiting with an
+    error message if it fails."""
+    mutation = dict((key, args[key]) for key in MUTATION_KEYS if key in args)
+    error = update_preferences(args['preferences_filename'], mutation)
+    if error is not None:
+        sys.exit(error)
+
+def update_preferences(filename, mutation):
+    """Applies a change to a preferences file, coalescing concurrent writers.
+
+    The change is appended to the queue of the file, and then the lock of the
+    file is taken. If another writer applied the change in the meantime, its
+    outcome is taken from the queue. Otherwise, every change in the queue is
+    applied in a single read-modify-write, and the outcome of each one is left
+    in the queue for its writer to pick up.
+
+    Args:
+        filename (str): The preferences file.
+        mutation (dict): The change, with the keys in `MUTATION_KEYS` that
+            `get_args` sets for a "write", "delete" or "write-array".
+
+    Returns:
+        Optional[str]: An error message if the change could not be made, or
+            None if it was made.
+    """
+    if not os.path.isfile(filename):
+        return "No Google Chrome preferences file found at '%s'" % filename
+    entry_id = "%d.%s" % (os.getpid(), binascii.hexlify(os.urandom(6)))
+    _update_queue(filename, lambda entries: entries + [
+        {'id': entry_id, 'mutation': mutation}])
+
+    with _locked(filename + LOCK_SUFFIX, owner=filename):
+        taken = []
+        def take(entries):
+            """Takes either this writer's outcome or every queued change."""
+            outcomes = [entry for entry in entries
+                        if entry['id'] == entry_id and 'mutation' not in entry]
+            if len(outcomes) > 0:
+                taken.extend(outcomes)
+                return [entry for entry in entries if entry['id'] != entry_id]
+            taken.extend(entry for entry in entries if 'mutation' in entry)
+            return [entry for entry in entries if 'mutation' not in entry and
+                    entry.get('time', 0) > time.time() - OUTCOME_TTL]
+        _update_queue(filename, take)
+        if len(taken) > 0 and 'mutation' not in taken[0]:
+            return taken[0]['error']
+        if entry_id not in [entry['id'] for entry in taken]:
+            return "Error: The change to '%s' was lost." % filename
+
+        errors = _apply_mutations(filename, taken)
+        now = time.time()
+        _update_queue(filename, lambda entries: entries + [
+            {'id': entry['id'], 'error': errors.get(entry['id']), 'time': now}
+            for entry in taken if entry['id'] != entry_id])
+    return errors.get(entry_id)
+
+def _apply_mutations(filename, entries):
+    """Applies queued changes to a preferences file in one read-modify-write.
+
+    The file is backed up and then replaced atomically, so that lock-free
+    readers see either the old or the new preferences. A change that fails is
+    left out without affecting the others.
+
+    Returns:
+        dict: The error message of each change that failed, by queue id.
+    """
+    errors = dict()
+    try:
+        with open(filename, 'r') as preferences_file:
+            text = preferences_file.read()
+        try:
+            json.loads(text)
+        except ValueError:
+            _exit_invalid_json(filename)
+    except IOError:
+        return dict((entry['id'], "No Google Chrome preferences file found "
+                     "at '%s'" % filename) for entry in entries)
+    except SystemExit as err:
+        return dict((entry['id'], err.code) for entry in entries)
+
+    preferences_json = json.loads(text)
+    applied = []
+    for entry in entries:
+        try:
+            apply_mutation(preferences_json, normalize(entry['mutation']))
+            applied.append(entry)
+        except (SystemExit, ValueError) as err:
+            errors[entry['id']] = (err.code if isinstance(err, SystemExit)
+                                   else "Error: %s" % err)
+            #a failed change may have been applied in part, so start over
+            preferences_json = json.loads(text)
+            for applied_entry in applied:
+                apply_mutation(preferences_json,
+                               normalize(applied_entry['mutation']))
+    if len(applied) == 0:
+        return errors
+
+    _make_backup(filename)
+    handle, temp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as temp_file:
+            temp_file.write(json.dumps(preferences_json))
+        shutil.copymode(filename, temp_filename)
+        stat = os.stat(filename)
+        try:
+            os.chown(temp_filename, stat.st_uid, stat.st_gid)
+        except OSError:
+            pass #only root can give the file to another user
+        os.rename(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
+    return errors
+
+def apply_mutation(json_obj, mutation):
+    """Applies a queued change to a JSON object in place.
+
+    Args:
+        json_obj (dict): The JSON data being modified.
+        mutation (dict): The change, as for `update_preferences`.
+
+    Raises:
+        SystemExit: If the change cannot be made, with the error message.
+        ValueError: If the value or path expression of the change is invalid.
+    """
+    action = mutation['action']
+    chrome_property = mutation['chrome_property']
+    if is_path_pattern(chrome_property):
+        if action == 'write':
+            _, count = write_json_matches(json_obj, chrome_property,
+                                          mutation['value'], in_place=True)
+        elif action == 'delete':
+            _, count = delete_json_matches(json_obj, chrome_property,
+                                           in_place=True)
+        else:
+            sys.exit("Error: Path expressions are not supported by '%s'." %
+                     action)
+        if count == 0:
+            sys.exit("Error: No attributes match '%s'." % chrome_property)
+    elif action == 'write':
+        write_json_field(json_obj, chrome_property, mutation['value'],
+                         in_place=True)
+    elif action == 'delete':
+        delete_json_field(json_obj, chrome_property, in_place=True)
+    elif action == 'write-array':
+        where_clause = None
+        if 'where_property' in mutation and 'where_value' in mutation:
+            where_clause = (mutation['where_property'],
+                            mutation['where_value'])
+        write_json_array(json_obj, chrome_property, mutation['value'],
+                         mutation['child_attrib'], where_clause=where_clause,
+                         in_place=True)
     else:
         raise ValueError("Invalid sub-command.")
 
+@contextmanager
+def _locked(filename, owner=None):
+    """Holds an exclusive advisory lock on a file, creating it if needed.
+
+    If the file is removed while waiting for the lock, the lock is taken on the
+    file at `filename` again, so that a holder of the lock may remove the file.
+
+    Args:
+        filename (str): The file to lock.
+        owner (Optional[str]): A file whose owner the locked file is given to,
+            e.g. so that a run as root does not leave behind a file that its
+            user cannot open.
+    """
+    while True:
+        with open(filename, 'a+') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                if _is_same_file(lock_file, filename):
+                    if owner is not None:
+                        _give_to_owner(filename, owner)
+                    yield lock_file
+                    return
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _is_same_file(open_file, filename):
+    """Whether `open_file` is still the file at `filename`."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+    open_stat = os.fstat(open_file.fileno())
+    return (stat.st_dev, stat.st_ino) == (open_stat.st_dev, open_stat.st_ino)
+
+def _give_to_owner(filename, owner):
+    """Gives `filename` to the user and group that own the file `owner`."""
+    try:
+        stat, owner_stat = os.stat(filename), os.stat(owner)
+        if ((stat.st_uid, stat.st_gid) !=
+                (owner_stat.st_uid, owner_stat.st_gid)):
+            os.chown(filename, owner_stat.st_uid, owner_stat.st_gid)
+    except OSError:
+        pass #only root can give the file to another user
+
+def _update_queue(filename, update):
+    """Replaces the entries of the queue of a preferences file.
+
+    Args:
+        filename (str): The preferences file.
+        update (function): Takes the list of entries in the queue and returns
+            the entries to keep. Damaged entries are dropped. The queue file
+            is removed if no entries are kept.
+    """
+    with _locked(filename + QUEUE_SUFFIX, owner=filename) as queue_file:
+        queue_file.seek(0)
+        entries = []
+        for line in queue_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and 'id' in entry:
+                entries.append(entry)
+        entries = update(entries)
+        if len(entries) == 0:
+            #waiters for the lock take it on a new file, see `_locked`
+            os.remove(filename + QUEUE_SUFFIX)
+            return
+        queue_file.seek(0)
+        queue_file.truncate()
+        for entry in entries:
+            queue_file.write(json.dumps(entry) + '\n')
+        queue_file.flush()
+
 def normalize(obj):
-    """Recursively normalizes `unicode` data into utf-8 encoded `str`.
+    """Normalizes `unicode` data nested anywhere in `obj` into utf-8 `str`.
 
     This will have the effect of converting a Chrome preferences JSON file into
     UTF-8 encoding, which may break some non-English or otherwise funky files.
 
+    Nested objects are walked with an explicit stack instead of recursion, so
+    deeply nested values cannot exceed the interpreter's recursion limit. `obj`
+    itself is not modified.
+
     http://stackoverflow.com/questions/18272066/easy-way-to-convert-a-unicode-list-to-a-list-containing-python-strings
     """
     dprint("normalize: object is of type %s" % str(type(obj)))
+    root = [obj]
+    #(container, key) pairs whose element still has to be normalized
+    pending = [(root, 0)]
+    while pending:
+        container, key = pending.pop()
+        item = container[key]
+        if isinstance(item, dict):
+            copied = dict()
+            for child_key, child in item.iteritems():
+                child_key = _normalize_scalar(child_key)
+                copied[child_key] = child
+                pending.append((copied, child_key))
+            container[key] = copied
+        elif isinstance(item, list):
+            copied = list(item)
+            pending.extend((copied, index) for index in xrange(len(copied)))
+            container[key] = copied
+        else:
+            container[key] = _normalize_scalar(item)
+    return root[0]
+
+def _normalize_scalar(obj):
     if isinstance(obj, unicode):
-        encoded = obj.encode('utf-8', errors='replace')
-        dprint('Encoded %s' % encoded)
-        return encoded
-    elif isinstance(obj, dict):
-        return dict((normalize(key), normalize(obj[key])) for key in obj)
-    elif isinstance(obj, list):
-        return list(normalize(item) for item in obj)
-    else:
-        return obj
+        return obj.encode('utf-8', errors='replace')
+    return obj
 
-def write_json_field(json_obj, attribute_name, value):
+def write_json_field(json_obj, attribute_name, value, in_place=False):
     """Writes a string value to a JSON object (dict).
 
     Args:
@@ -175,6 +694,8 @@ def write_json_field(json_obj, attribute_name, value):
             an instance of one of the following Python data types: int, float,
             str, bool, list, dict, None. The "None" value is used to represent
             a "null" value in JSON.
+        in_place (bool): Whether to modify `json_obj` itself instead of a
+            copy of it. Default: False.
 
     Returns:
         dict: The new JSON object with the modified or added attribute.
@@ -189,13 +710,14 @@ def write_json_field(json_obj, attribute_name, value):
                          (type(value), value))
 
     try:
-        new_json = _recursive_write(deepcopy(json_obj), attribute_name, value)
+        new_json = _recursive_write(_copy_unless(in_place, json_obj),
+                                    attribute_name, value)
         return new_json
     except KeyError as err:
         sys.exit("Error: " + re.sub('"', '', str(err)))
 
 def write_json_array(json_obj, attribute_name, value, child_name,
-                     where_clause=None):
+                     where_clause=None, in_place=False):
     """
     Args:
         json_obj (dict): The JSON data being modified.
@@ -215,6 +737,8 @@ def write_json_array(json_obj, attribute_name, value, child_name,
             attribute to match, and the value it must equal in order to meet
             the criteria. This is akin to a "WHERE {atrib} = {value}" clause
             in SQL.
+        in_place (bool): Whether to modify `json_obj` itself instead of a
+            copy of it. Default: False.
     """
     if (type(value) not in (int, float, str, bool, list, dict) and
             value is not None):
@@ -222,7 +746,7 @@ def write_json_array(json_obj, attribute_name, value, child_name,
                          (type(value), value))
 
     try:
-        new_json = _recursive_write(json_obj=deepcopy(json_obj),
+        new_json = _recursive_write(json_obj=_copy_unless(in_place, json_obj),
                                     attribute_name=attribute_name,
                                     value=value,
                                     delete_attrib=False,
@@ -273,80 +797,70 @@ def _recursive_write(json_obj, attribute_name, value=None, delete_attrib=False,
     if child_name is None:
         assert where_clause is None
 
-    attrib_as_list = attribute_name.split('.')
-    current_attrib = attrib_as_list.pop(0)
-
-    dprint(("_recursive_write: attribute_name='%s' current_attrib='%s' "
-            "value='%s' type(value)='%s' delete_attrib='%s' child_name='%s' "
-            "where_clause='%s'") %
-           (attribute_name, current_attrib, str(value), str(type(value)),
-            str(delete_attrib), str(child_name), str(where_clause)))
-
-    if len(attrib_as_list) == 0:
-        #Recursed down to target attribute
-        if delete_attrib:
-            try:
-                del json_obj[current_attrib]
-            except TypeError:
-                raise KeyError(("Error: Attribute '%s' cannot be deleted "
-                                "because the presumed parent attribute is not "
-                                "an object.") % current_attrib)
-        elif child_name is None:
-            #normal write operation
-            try:
-                json_obj[current_attrib] = value
-            except TypeError:
-                raise KeyError(("Error: Attribute '%s' cannot be set because "
-                                "the parent attribute is already set to a "
-                                "non-object value.") % current_attrib)
-        else:
-            #write-array operation
-            try:
-                iter(json_obj[current_attrib])
-            except TypeError:
-                sys.exit(("Error: Cannot write to array because '%s' is not an "
-                          "array.") % current_attrib)
+    dprint(("_recursive_write: attribute_name='%s' value='%s' type(value)='%s' "
+            "delete_attrib='%s' child_name='%s' where_clause='%s'") %
+           (attribute_name, str(value), str(type(value)), str(delete_attrib),
+            str(child_name), str(where_clause)))
 
-            for array_item in json_obj[current_attrib]:
-                if where_clause is None:
-                    try:
-                        array_item[child_name] = value
-                    except TypeError:
-                        sys.exit(("Error: Attribute '%s' cannot be set because "
-                                  "one of the elements of the target array is "
-                                  "already set to a non-object value.") %
-                                 current_attrib)
-                else:
-                    where_attrib = str(where_clause[0])
-                    where_val = where_clause[1]
-                    if array_item[where_attrib] == where_val:
-                        try:
-                            array_item[child_name] = value
-                        except TypeError:
-                            sys.exit(("Error: Attribute '%s' cannot be set "
-                                      "because one of the elements of the "
-                                      "target array is already set to a "
-                                      "non-object value.") % current_attrib)
-        dprint("_recursive_write: base case: returning '%s'" % str(json_obj))
-        return json_obj
-    else:
-        if not isinstance(json_obj, dict):
+    path = _split_path(attribute_name)
+    parent = json_obj
+    for current_attrib in path[:-1]:
+        if not isinstance(parent, dict):
             raise KeyError(("The specified parent of the supposed sub-"
                             "attribute '%s' is not an object, and therefore "
                             "cannot have a sub-attribute.") % current_attrib)
-        if current_attrib not in json_obj:
-            json_obj[current_attrib] = dict()
-        attribute_name = '.'.join(attrib_as_list) #no period included for len 1
+        if current_attrib not in parent:
+            parent[current_attrib] = dict()
+        parent = parent[current_attrib]
+    current_attrib = path[-1]
 
-        json_obj[current_attrib] = _recursive_write(
-            json_obj=json_obj[current_attrib], attribute_name=attribute_name,
-            value=value, delete_attrib=delete_attrib, child_name=child_name,
-            where_clause=where_clause)
+    if delete_attrib:
+        try:
+            del parent[current_attrib]
+        except TypeError:
+            raise KeyError(("Error: Attribute '%s' cannot be deleted "
+                            "because the presumed parent attribute is not "
+                            "an object.") % current_attrib)
+    elif child_name is None:
+        #normal write operation
+        try:
+            parent[current_attrib] = value
+        except TypeError:
+            raise KeyError(("Error: Attribute '%s' cannot be set because "
+                            "the parent attribute is already set to a "
+                            "non-object value.") % current_attrib)
+    else:
+        #write-array operation
+        try:
+            iter(parent[current_attrib])
+        except TypeError:
+            sys.exit(("Error: Cannot write to array because '%s' is not an "
+                      "array.") % current_attrib)
 
-        dprint("_recursive_write: returning '%s'" % str(json_obj))
-        return json_obj
+        for array_item in parent[current_attrib]:
+            if where_clause is None:
+                try:
+                    array_item[child_name] = value
+                except TypeError:
+                    sys.exit(("Error: Attribute '%s' cannot be set because "
+                              "one of the elements of the target array is "
+                              "already set to a non-object value.") %
+                             current_attrib)
+            else:
+                where_attrib = str(where_clause[0])
+                where_val = where_clause[1]
+                if array_item[where_attrib] == where_val:
+                    try:
+                        array_item[child_name] = value
+                    except TypeError:
+                        sys.exit(("Error: Attribute '%s' cannot be set "
+                                  "because one of the elements of the "
+                                  "target array is already set to a "
+                                  "non-object value.") % current_attrib)
+    dprint("_recursive_write: returning '%s'" % str(json_obj))
+    return json_obj
 
-def delete_json_field(json_obj, attribute_name):
+def delete_json_field(json_obj, attribute_name, in_place=False):
     """Deletes a value from a JSON object (dict).
     Args:
         json_obj (dict): The JSON file that contains the attribute to delete.
@@ -354,10 +868,13 @@ def delete_json_field(json_obj, attribute_name):
             structures expressed within the attribute_name, they should be
             separated by periods. Consequently, attribute names and nested
             names cannot contain periods.
+        in_place (bool): Whether to modify `json_obj` itself instead of a
+            copy of it. Default: False.
     """
     try:
-        new_json = _recursive_write(deepcopy(json_obj), attribute_name,
-                                    value=None, delete_attrib=True)
+        new_json = _recursive_write(_copy_unless(in_place, json_obj),
+                                    attribute_name, value=None,
+                                    delete_attrib=True)
         return new_json
     except KeyError:
         sys.exit("Error: '%s' attribute not found." % attribute_name)
@@ -380,9 +897,8 @@ def get_json_field(json_obj, attribute_name, json_filename=None,
     Raises:
         KeyError: If the specified `attribute_name` does not exist in the JSON.
     """
-    while '.' in attribute_name:
-        attrib_as_list = attribute_name.split('.')
-        attrib_name_single = attrib_as_list.pop(0)
+    path = _split_path(attribute_name)
+    for attrib_name_single in path[:-1]:
         try:
             json_obj = json_obj[attrib_name_single]
         except KeyError:
@@ -393,8 +909,539 @@ def get_json_field(json_obj, attribute_name, json_filename=None,
                 print("Attribute '%s' not found in preferences file%s" %
                       (attrib_name_single, error_suffix))
             raise
-        attribute_name = '.'.join(attrib_as_list) #no period included for len 1
-    return json_obj[attribute_name]
+    return json_obj[path[-1]]
+
+def _split_path(attribute_name):
+    """Splits a dot-notation attribute name, caching the result."""
+    try:
+        return _SPLIT_PATHS[attribute_name]
+    except KeyError:
+        path = tuple(attribute_name.split('.'))
+        _SPLIT_PATHS[attribute_name] = path
+        return path
+
+def compile_path(expression):
+    """Compiles a path expression into a tuple of steps, caching the result.
+
+    See "Path Expressions" in the module documentation for the syntax. Each step
+    is a 2-tuple of one of the `_STEP_*` constants and its argument: the
+    attribute name for `_STEP_KEY`, the index for `_STEP_INDEX`, the
+    (attribute name, value) pair for `_STEP_FILTER` and None otherwise.
+
+    Raises:
+        ValueError: If `expression` is not a valid path expression.
+    """
+    try:
+        return _COMPILED_PATHS[expression]
+    except KeyError:
+        pass
+
+    steps = []
+    pos = 0
+    expect_name = True
+    while pos < len(expression):
+        match = _PATH_TOKEN_RE.match(expression, pos)
+        if match is None or (match.group('name') is not None) != expect_name:
+            raise ValueError("Invalid path expression '%s' at offset %d." %
+                             (expression, pos))
+        pos = match.end()
+        if match.group('name') is not None:
+            name = match.group('name')
+            if name == '*':
+                steps.append((_STEP_ANY, None))
+            elif name == '**':
+                steps.append((_STEP_DESCEND, None))
+            else:
+                steps.append((_STEP_KEY, name))
+            expect_name = False
+        elif match.group('dot') is not None:
+            expect_name = True
+        elif match.group('index') == '*':
+            steps.append((_STEP_ANY, None))
+        elif match.group('index') is not None:
+            steps.append((_STEP_INDEX, int(match.group('index'))))
+        else:
+            try:
+                filter_value = json.loads(match.group('value'))
+            except ValueError:
+                filter_value = match.group('value')
+            steps.append((_STEP_FILTER, (match.group('attr'), filter_value)))
+    if expect_name:
+        raise ValueError("Path expression '%s' ends with a period." %
+                         expression)
+
+    steps = tuple(steps)
+    _COMPILED_PATHS[expression] = steps
+    return steps
+
+def is_path_pattern(expression):
+    """Whether `expression` uses path expression syntax beyond dot notation.
+
+    An expression that is not valid path expression syntax is treated as plain
+    dot notation.
+    """
+    try:
+        return any(kind != _STEP_KEY for kind, _ in compile_path(expression))
+    except ValueError:
+        return False
+
+def iter_path_matches(json_obj, expression):
+    """Yields every value in `json_obj` matched by a path expression.
+
+    The JSON is traversed once, iteratively, visiting only the parts that can
+    match `expression`.
+
+    Args:
+        json_obj: The decoded JSON to search.
+        expression (str or tuple): A path expression or the result of
+            `compile_path`.
+    Yields:
+        tuple: (parent, key, value) for each match, where `parent[key]` is
+            `value`. For the document itself, `parent` and `key` are None.
+    Raises:
+        ValueError: If `expression` is not a valid path expression.
+    """
+    steps = expression
+    if not isinstance(steps, tuple):
+        steps = compile_path(expression)
+    pending = [(0, None, None, json_obj)]
+    while pending:
+        step_num, parent, key, node = pending.pop()
+        if step_num == len(steps):
+            yield parent, key, node
+            continue
+
+        kind, arg = steps[step_num]
+        children = []
+        if kind == _STEP_KEY:
+            if isinstance(node, dict) and arg in node:
+                children.append((arg, node[arg]))
+        elif kind == _STEP_INDEX:
+            if isinstance(node, list) and -len(node) <= arg < len(node):
+                children.append((arg, node[arg]))
+        else:
+            children = _iter_children(node)
+            if kind == _STEP_FILTER:
+                attr, filter_value = arg
+                children = [(child_key, child) for child_key, child in children
+                            if isinstance(child, dict) and attr in child and
+                            child[attr] == filter_value]
+            elif kind == _STEP_DESCEND:
+                #either stop descending here, or descend into each child
+                children = list(children)
+                pending.extend((step_num, node, child_key, child)
+                               for child_key, child in reversed(children))
+                pending.append((step_num + 1, parent, key, node))
+                continue
+        pending.extend((step_num + 1, node, child_key, child)
+                       for child_key, child in reversed(list(children)))
+
+def _iter_children(node):
+    if isinstance(node, dict):
+        return node.iteritems()
+    elif isinstance(node, list):
+        return enumerate(node)
+    return []
+
+def write_json_matches(json_obj, expression, value, in_place=False):
+    """Writes a value to every attribute matched by a path expression.
+
+    If the expression ends in an attribute name, that attribute is set in every
+    object matched by the rest of the expression, whether or not it already
+    exists. Otherwise, every existing match is replaced by `value`.
+
+    Args:
+        json_obj (dict): The JSON data being modified.
+        expression (str): The path expression to write to.
+        value: The value to write, as for `write_json_field`.
+        in_place (bool): Whether to modify `json_obj` itself instead of a
+            copy of it. Default: False.
+    Returns:
+        tuple: The new JSON object and the number of attributes written.
+    Raises:
+        ValueError: If the `value` parameter is not of one of the accepted
+            types, or if `expression` is not a valid path expression.
+    """
+    if (type(value) not in (int, float, str, bool, list, dict) and
+            value is not None):
+        raise ValueError("Type '%s' of value '%s' is not valid." %
+                         (type(value), value))
+
+    new_json = _copy_unless(in_place, json_obj)
+    steps = compile_path(expression)
+    count = 0
+    if steps[-1][0] == _STEP_KEY:
+        for _, _, parent in iter_path_matches(new_json, steps[:-1]):
+            if isinstance(parent, dict):
+                parent[steps[-1][1]] = deepcopy(value)
+                count += 1
+    else:
+        for parent, key, _ in list(iter_path_matches(new_json, steps)):
+            if parent is not None:
+                parent[key] = deepcopy(value)
+                count += 1
+    return new_json, count
+
+def delete_json_matches(json_obj, expression, in_place=False):
+    """Deletes every attribute or array element matched by a path expression.
+
+    `json_obj` itself is modified if `in_place` is True, and a copy of it
+    otherwise.
+
+    Returns:
+        tuple: The new JSON object and the number of values deleted.
+    Raises:
+        ValueError: If `expression` is not a valid path expression.
+    """
+    new_json = _copy_unless(in_place, json_obj)
+    #"**" can reach the same value more than once
+    matches = dict(((id(parent), key), (parent, key)) for parent, key, _ in
+                   iter_path_matches(new_json, expression)
+                   if parent is not None)
+    #delete later array elements first so earlier indexes stay valid
+    for parent, key in sorted(matches.values(), key=lambda match: match[1],
+                              reverse=True):
+        del parent[key]
+    return new_json, len(matches)
+
+def _copy_unless(in_place, json_obj):
+    return json_obj if in_place else deepcopy(json_obj)
+
+def stream_json_field(json_filename, attribute_name, suppress_err_msg=False):
+    """Retrieves a value from a JSON file without parsing the whole file.
+
+    The file is scanned forward along the path in `attribute_name`. Values that
+    are not on the path are skipped without being decoded, and scanning stops
+    as soon as the requested value has been decoded.
+
+    Args:
+        json_filename (str): The name of the JSON file to read from.
+        attribute_name (str): The attribute to look up. If there are nested
+            structures expressed within the attribute_name, they should be
+            separated by periods. Consequently, attribute names and nested
+            names cannot contain periods.
+        suppress_err_msg (Optional[bool]): Specifies whether an error message
+            will be printed to stdout if an error condition is met. By default,
+            error messages will be printed.
+    Raises:
+        KeyError: If the specified `attribute_name` does not exist in the JSON.
+        ValueError: If the file is not valid JSON up to the requested value.
+    """
+    with _open_json_stream(json_filename) as stream:
+        _seek_path(stream, attribute_name, json_filename, suppress_err_msg)
+        return stream.read_value()
+
+def print_json_field(json_filename, attribute_name, out=None):
+    """Writes a value from a JSON file to `out` without building it in memory.
+
+    Strings are written utf-8 encoded and objects and arrays in the notation
+    Python prints them in, as if the value had been decoded and printed.
+
+    Args:
+        json_filename (str): The name of the JSON file to read from.
+        attribute_name (str): The attribute to print, in dot notation.
+        out (Optional[file]): Where to write the value. Default is stdout.
+    Raises:
+        KeyError: If the specified `attribute_name` does not exist in the JSON.
+        ValueError: If the file is not valid JSON up to the end of the value.
+    """
+    out = sys.stdout if out is None else out
+    with _open_json_stream(json_filename) as stream:
+        _seek_path(stream, attribute_name, json_filename)
+        _write_python_tokens(iter_json_tokens(stream), out)
+        out.write('\n')
+
+def print_json(json_filename, out=None):
+    """Writes a whole JSON file to `out`, indented by four spaces.
+
+    Args:
+        json_filename (str): The name of the JSON file to read from.
+        out (Optional[file]): Where to write the JSON. Default is stdout.
+    Raises:
+        ValueError: If the file is not valid JSON.
+    """
+    out = sys.stdout if out is None else out
+    with _open_json_stream(json_filename) as stream:
+        _write_json_tokens(iter_json_tokens(stream), out)
+        out.write('\n')
+
+def iter_json_tokens(stream):
+    """Yields the tokens of the next value in a `_JsonStream`.
+
+    The value is tokenized iteratively rather than decoded, so neither its size
+    nor its depth is limited by memory or the recursion limit.
+
+    Yields:
+        (str, str): Pairs of a token kind and its raw JSON text. The kinds are
+            '{', '}', '[' and ']' (raw text None), 'key' for object keys
+            and 'value' for strings, numbers, booleans and null.
+    """
+    data = stream.data
+    data_len = len(data)
+    match_token = _TOKEN_RE.match
+    closers = []
+    expected = _EXPECT_VALUE
+    pos = stream.pos
+    while True:
+        match = match_token(data, pos)
+        if match is None:
+            raise ValueError("Invalid JSON at offset %d." % pos)
+        pos = match.end()
+        punct, literal = match.groups()
+
+        if expected in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+            if literal is not None:
+                if pos >= data_len and literal[0] != '"':
+                    #may have been truncated
+                    raise ValueError("Unexpected end of JSON data.")
+                yield 'value', literal
+                expected = _EXPECT_SEPARATOR
+            elif punct in '{[':
+                yield punct, None
+                closers.append('}' if punct == '{' else ']')
+                expected = (_EXPECT_KEY_OR_END if punct == '{' else
+                            _EXPECT_VALUE_OR_END)
+                continue
+            elif punct == ']' and expected == _EXPECT_VALUE_OR_END:
+                yield closers.pop(), None
+                expected = _EXPECT_SEPARATOR
+            else:
+                raise ValueError("Unexpected '%s' at offset %d." % (punct, pos))
+        elif expected in (_EXPECT_KEY, _EXPECT_KEY_OR_END):
+            if literal is not None and literal[0] == '"':
+                yield 'key', literal
+                expected = _EXPECT_COLON
+                continue
+            elif punct == '}' and expected == _EXPECT_KEY_OR_END:
+                yield closers.pop(), None
+                expected = _EXPECT_SEPARATOR
+            else:
+                raise ValueError("Expected a key at offset %d." % pos)
+        elif expected == _EXPECT_COLON:
+            if punct != ':':
+                raise ValueError("Expected ':' at offset %d." % pos)
+            expected = _EXPECT_VALUE
+            continue
+        else:
+            if punct == ',' and closers:
+                expected = _EXPECT_KEY if closers[-1] == '}' else _EXPECT_VALUE
+                continue
+            elif closers and punct == closers[-1]:
+                yield closers.pop(), None
+            else:
+                raise ValueError("Unexpected token at offset %d." % pos)
+
+        #a value just ended; the outermost one ends the token stream
+        if not closers:
+            stream.pos = pos
+            return
+
+def _write_json_tokens(tokens, out):
+    """Writes tokens from `iter_json_tokens` as JSON indented by four spaces."""
+    depth = 0
+    first_item = True
+    after_key = False
+    for kind, raw in tokens:
+        if kind in ('}', ']'):
+            depth -= 1
+            if not first_item:
+                out.write('\n' + '    ' * depth)
+            out.write(kind)
+            first_item = False
+            continue
+
+        if after_key:
+            after_key = False
+        elif depth > 0:
+            out.write(('\n' if first_item else ',\n') + '    ' * depth)
+        first_item = False
+
+        if kind == 'key':
+            out.write(raw + ': ')
+            after_key = True
+        elif kind == 'value':
+            out.write(raw)
+        else:
+            out.write(kind)
+            depth += 1
+            first_item = True
+
+def _write_python_tokens(tokens, out):
+    """Writes tokens from `iter_json_tokens` the way `print` shows the value.
+
+    This matches printing the `normalize`d value: a top-level scalar is written
+    as `str` would show it, while nested keys and scalars are written as `repr`
+    would show them inside a printed `dict` or `list`.
+    """
+    depth = 0
+    first_item = True
+    after_key = False
+    for kind, raw in tokens:
+        if kind in ('}', ']'):
+            depth -= 1
+            out.write(kind)
+            first_item = False
+            continue
+
+        if after_key:
+            after_key = False
+        elif not first_item:
+            out.write(', ')
+        first_item = False
+
+        if kind == 'key':
+            out.write(repr(_normalize_scalar(json.loads(raw))) + ': ')
+            after_key = True
+        elif kind == 'value':
+            value = _normalize_scalar(json.loads(raw))
+            out.write(repr(value) if depth > 0 else str(value))
+        else:
+            out.write(kind)
+            depth += 1
+            first_item = True
+
+@contextmanager
+def _open_json_stream(json_filename):
+    """Yields a `_JsonStream` over the memory-mapped contents of a file."""
+    with open(json_filename, 'rb') as json_file:
+        data = _map_file(json_file)
+        try:
+            yield _JsonStream(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+def _seek_path(stream, attribute_name, json_filename, suppress_err_msg=False):
+    """Advances `stream` to the value of a dot-notation attribute.
+
+    Raises:
+        KeyError: If the specified `attribute_name` does not exist in the JSON.
+    """
+    path = attribute_name.split('.')
+    for index, attrib_name_single in enumerate(path):
+        if not _seek_key(stream, _to_unicode(attrib_name_single)):
+            if index < len(path) - 1 and not suppress_err_msg:
+                print("Attribute '%s' not found in preferences file '%s'." %
+                      (attrib_name_single, json_filename))
+            raise KeyError(attrib_name_single)
+
+def _map_file(json_file):
+    """Memory-maps an open file, falling back to reading it for special files.
+
+    Empty files cannot be mapped; reading them returns an empty string, which is
+    then rejected as invalid JSON like any other malformed file.
+    """
+    try:
+        return mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, mmap.error):
+        return json_file.read()
+
+def _to_unicode(string):
+    if isinstance(string, unicode):
+        return string
+    return string.decode('utf-8')
+
+def _seek_key(stream, key):
+    """Advances `stream` to the value of `key` in the object at its position.
+
+    Returns:
+        bool: True if the stream is now positioned at the value of `key`. False
+            if the object has no such key or the value at the current position
+            is not an object.
+    """
+    if stream.peek() != '{':
+        return False
+    stream.pos += 1
+    if stream.peek() == '}':
+        return False
+    while True:
+        current_key = stream.read_string()
+        stream.expect(':')
+        if current_key == key:
+            return True
+        stream.skip_value()
+        if stream.peek() == '}':
+            return False
+        stream.expect(',')
+
+class _JsonStream(object):
+    """Forward-only cursor over the raw text of a JSON document.
+
+    `data` may be a `str` or an `mmap.mmap`; only the slices that are actually
+    decoded are copied out of it.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it."""
+        self.pos = _WHITESPACE_RE.match(self.data, self.pos).end()
+        if self.pos >= len(self.data):
+            raise ValueError("Unexpected end of JSON data.")
+        return self.data[self.pos]
+
+    def expect(self, char):
+        """Consumes `char`, which must be the next non-whitespace character."""
+        if self.peek() != char:
+            raise ValueError("Expected '%s' at offset %d." % (char, self.pos))
+        self.pos += 1
+
+    def read_string(self):
+        """Consumes a string literal and returns it decoded."""
+        raw = self.read_raw_string()
+        if '\\' in raw:
+            return json.loads(raw)
+        return raw[1:-1].decode('utf-8')
+
+    def read_raw_string(self):
+        """Consumes a string literal and returns its raw JSON text."""
+        self.peek()
+        start = self.pos
+        self._skip_string()
+        return self.data[start:self.pos]
+
+    def read_raw_scalar(self):
+        """Consumes a non-container value and returns its raw JSON text."""
+        self.peek()
+        start = self.pos
+        self.skip_value()
+        return self.data[start:self.pos]
+
+    def read_value(self):
+        """Consumes the next value and returns it decoded."""
+        self.peek()
+        start = self.pos
+        self.skip_value()
+        return json.loads(self.data[start:self.pos])
+
+    def skip_value(self):
+        """Consumes the next value without decoding it."""
+        char = self.peek()
+        if char == '"':
+            self._skip_string()
+        elif char in '[{':
+            depth = 0
+            while True:
+                self.pos = _SKIP_RE.match(self.data, self.pos).end()
+                if self.pos >= len(self.data) or self.data[self.pos] == '"':
+                    raise ValueError("Unterminated object or array.")
+                depth += 1 if self.data[self.pos] in '[{' else -1
+                self.pos += 1
+                if depth == 0:
+                    return
+        else:
+            #a scalar running into the end of the data may have been truncated
+            match = _SCALAR_RE.match(self.data, self.pos)
+            if match is None or match.end() >= len(self.data):
+                raise ValueError("Invalid value at offset %d." % self.pos)
+            self.pos = match.end()
+
+    def _skip_string(self):
+        match = _STRING_RE.match(self.data, self.pos)
+        if match is None:
+            raise ValueError("Invalid string at offset %d." % self.pos)
+        self.pos = match.end()
 
 def _get_json(filename):
     try:
@@ -403,9 +1450,18 @@ def _get_json(filename):
     except TypeError:
         sys.exit("No Google Chrome preferences file found at '%s'" % filename)
     except ValueError:
-        sys.exit(("File '%s' does not appear to be a valid JSON file. Check "
-                  "this directory for backup copies to restore to, in case "
-                  "this file has become corrupted.") % filename)
+        _exit_invalid_json(filename)
+
+def _exit_unreadable(filename, err):
+    if err.errno == errno.ENOENT:
+        sys.exit("No Google Chrome preferences file found at '%s'" % filename)
+    sys.exit("Error: Could not access '%s': %s" %
+             (filename, err.strerror or err))
+
+def _exit_invalid_json(filename):
+    sys.exit(("File '%s' does not appear to be a valid JSON file. Check "
+              "this directory for backup copies to restore to, in case "
+              "this file has become corrupted.") % filename)
 
 def get_args():
     """Reads command line arguments.
@@ -419,57 +1475,77 @@ def get_args():
             * 'where_property' (optional): Condition to write 'value' to array
                 of objects
             * 'where_value' (optional)
+            * 'jobs': The number of worker processes to use when the
+                preferences file argument names multiple files. Default: 1.
+            * 'with_filename': Whether to prefix each line printed for a file
+                with its name. Default: False.
     """
     args = dict()
     args['action'] = None
     args['preferences_filename'] = None
     args['chrome_property'] = None
+    args['jobs'] = 1
+    args['with_filename'] = False
+
+    argv = list(sys.argv)
+    while len(argv) > 1 and argv[1].startswith('-'):
+        if len(argv) > 2 and argv[1] in ('-j', '--jobs'):
+            try:
+                args['jobs'] = int(argv[2])
+            except ValueError:
+                print_usage()
+            del argv[1:3]
+        elif argv[1] in ('-H', '--with-filename'):
+            args['with_filename'] = True
+            del argv[1]
+        else:
+            print_usage()
 
-    if len(sys.argv) > 2:
-        args['action'] = sys.argv[1]
+    if len(argv) > 2:
+        args['action'] = argv[1]
     else:
         print_usage()
 
     if args['action'] == 'read':
-        if len(sys.argv) == 3:
-            args['preferences_filename'] = sys.argv[2]
-        elif len(sys.argv) == 4:
-            args['preferences_filename'] = sys.argv[2]
-            args['chrome_property'] = sys.argv[3]
+        if len(argv) == 3:
+            args['preferences_filename'] = argv[2]
+        elif len(argv) == 4:
+            args['preferences_filename'] = argv[2]
+            args['chrome_property'] = argv[3]
         else:
             print_usage()
     elif args['action'] == 'delete':
-        if len(sys.argv) == 4:
-            args['preferences_filename'] = sys.argv[2]
-            args['chrome_property'] = sys.argv[3]
+        if len(argv) == 4:
+            args['preferences_filename'] = argv[2]
+            args['chrome_property'] = argv[3]
         else:
             print_usage()
     elif args['action'] == 'write':
-        if len(sys.argv) == 6:
-            args['preferences_filename'] = sys.argv[2]
-            args['chrome_property'] = sys.argv[3]
-            write_type = sys.argv[4]
-            write_value = sys.argv[5]
+        if len(argv) == 6:
+            args['preferences_filename'] = argv[2]
+            args['chrome_property'] = argv[3]
+            write_type = argv[4]
+            write_value = argv[5]
 
             args['value'] = _get_value_and_handle_errors(value=write_value,
                                                          type_arg=write_type)
         else:
             print_usage()
     elif args['action'] == 'write-array':
-        if len(sys.argv) in (7, 11):
-            args['preferences_filename'] = sys.argv[2]
-            args['chrome_property'] = sys.argv[3]
-            args['child_attrib'] = sys.argv[4]
-            write_type = sys.argv[5]
-            write_value = sys.argv[6]
+        if len(argv) in (7, 11):
+            args['preferences_filename'] = argv[2]
+            args['chrome_property'] = argv[3]
+            args['child_attrib'] = argv[4]
+            write_type = argv[5]
+            write_value = argv[6]
 
             args['value'] = _get_value_and_handle_errors(value=write_value,
                                                          type_arg=write_type)
-            if len(sys.argv) == 11:
-                if sys.argv[7] == 'where':
-                    args['where_property'] = sys.argv[8]
-                    where_type = sys.argv[9]
-                    where_val = sys.argv[10]
+            if len(argv) == 11:
+                if argv[7] == 'where':
+                    args['where_property'] = argv[8]
+                    where_type = argv[9]
+                    where_val = argv[10]
                     args['where_value'] = _get_value_and_handle_errors(
                         value=where_val, type_arg=where_type)
                 else:
@@ -532,7 +1608,8 @@ def _get_value(value, type_arg):
 def print_usage():
     """Prints syntax for usage and exits the program."""
     print(("Usage:\n"
-           "\tpython chrome_defaults.py read %sfile%s "
+           "\tpython chrome_defaults.py [--jobs %sN%s] [--with-filename] "
+           "read %sfile%s "
            "[%sattribute-name%s]\n"
            "\tOR\n"
            "\tpython chrome_defaults.py write %sfile%s %sattribute-name%s "
@@ -542,11 +1619,14 @@ def print_usage():
            "\tOR\n"
            "\tpython chrome_defaults.py write-array %sfile%s "
            "%sarray-name%s %sattribute-name%s -bool|-string|-int %svalue%s "
-           "[where %sattribute-name%s -bool|-string|-int %svalue%s]") %
+           "[where %sattribute-name%s -bool|-string|-int %svalue%s]\n"
+           "\n"
+           "\t%sfile%s may also be a Chrome profile directory or a glob "
+           "pattern, to process every Preferences file found there.") %
           (UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC,
            UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC,
            UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC,
-           UNDERLINE, ENDC))
+           UNDERLINE, ENDC, UNDERLINE, ENDC, UNDERLINE, ENDC))
     sys.exit()
 
 def _make_backup(filename):
@@ -12,6 +12,13 @@ Todos:
 
 import unittest
 import json
+import os
+import sys
+import shutil
+import tempfile
+import time
+import multiprocessing
+from StringIO import StringIO
 from .. import chrome_defaults #chrome_defaults.py
 
 class SupportFunctionTest(unittest.TestCase):
@@ -41,6 +48,18 @@ class SupportFunctionTest(unittest.TestCase):
         sample_json = {'str1': u"\u0394", 'str2': u"\U00000394"}
         chrome_defaults.normalize(sample_json)
 
+    def test_normalize_deeply_nested(self):
+        """`normalize` should not be limited by the recursion limit."""
+        sample_json = u'leaf'
+        for _ in range(5000):
+            sample_json = {u'key': [sample_json]}
+        result = chrome_defaults.normalize(sample_json)
+        for _ in range(5000):
+            self.assertIsInstance(result.keys()[0], str)
+            result = result['key'][0]
+        self.assertEqual(result, 'leaf')
+        self.assertIsInstance(result, str)
+
 #   TODO: I need to study more how unicode works here.
 #   def test_normalize_replace_non_utf8(self):
 #       """The `normalize` function should replace non-UTF-8 characters.
@@ -96,6 +115,480 @@ class ReadCommandTest(unittest.TestCase):
         with self.assertRaises(KeyError):
             chrome_defaults.get_json_field(sample_json, "missing_attrib")
 
+class StreamingReadTest(unittest.TestCase):
+    """Tests for reading a single attribute straight from a file.
+
+    Relevant functions in chrome_defaults:
+        * stream_json_field(json_filename, attribute_name,
+                            suppress_err_msg=False)
+    """
+
+    def setUp(self):
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def _write_file(self, contents):
+        handle, filename = tempfile.mkstemp()
+        os.write(handle, contents)
+        os.close(handle)
+        self.filenames.append(filename)
+        return filename
+
+    def test_read_nested_val(self):
+        """Read a nested value, skipping over complex siblings."""
+        sample_json = {
+            'a': {'list': [{'x': '}]"{['}, 1.5e3, None], 'str': 'a"\\b'},
+            'level1': {'skip': {'deep': [1, 2]}, 'level2': {'int': 42}}
+        }
+        filename = self._write_file(json.dumps(sample_json, indent=4))
+        self.assertEqual(
+            chrome_defaults.stream_json_field(filename, 'level1.level2.int'),
+            42)
+        self.assertEqual(chrome_defaults.stream_json_field(filename, 'a'),
+                         sample_json['a'])
+
+    def test_read_escaped_key(self):
+        """Keys containing escapes and non-ASCII characters should match."""
+        filename = self._write_file('{"b\\u00e9": {"\\u0394": true}}')
+        self.assertEqual(
+            chrome_defaults.stream_json_field(filename, u'b\xe9.\u0394'),
+            True)
+
+    def test_stops_after_value(self):
+        """Content after the requested value should not be examined."""
+        filename = self._write_file('{"first": [1, {"x": 2}], "second": !!!')
+        self.assertEqual(chrome_defaults.stream_json_field(filename, 'first'),
+                         [1, {'x': 2}])
+
+    def test_missing_attribute(self):
+        """Test error handling when requested attribute is missing."""
+        filename = self._write_file('{"level1": {"int": 42}, "str": "val"}')
+        with self.assertRaises(KeyError):
+            chrome_defaults.stream_json_field(filename, 'missing_attrib')
+        with self.assertRaises(KeyError):
+            chrome_defaults.stream_json_field(
+                filename, 'level1.missing.int', suppress_err_msg=True)
+        with self.assertRaises(KeyError):
+            chrome_defaults.stream_json_field(filename, 'str.int')
+
+    def test_print_field_matches_print(self):
+        """Printed values should look like the printed decoded value."""
+        sample_json = {
+            'level1': {'list': [1, 2.5, u'd\xe9', None, {'t': True}, []]},
+            'scalar': u'x"y\u0394',
+            'empty': {}
+        }
+        filename = self._write_file(json.dumps(sample_json))
+        for attribute_name in ('level1.list', 'scalar', 'empty'):
+            out = StringIO()
+            chrome_defaults.print_json_field(filename, attribute_name, out)
+            expected = chrome_defaults.normalize(
+                chrome_defaults.get_json_field(sample_json, attribute_name))
+            self.assertEqual(out.getvalue(), "%s\n" % expected)
+
+    def test_print_whole_file(self):
+        """A full dump should be indented JSON of the whole file."""
+        sample_json = {
+            'level1': {'list': [1, 2.5, u'd\xe9', None, {'t': True}, []]},
+            'scalar': u'x"y',
+            'empty': {}
+        }
+        filename = self._write_file(json.dumps(sample_json))
+        out = StringIO()
+        chrome_defaults.print_json(filename, out)
+        self.assertEqual(json.loads(out.getvalue()), sample_json)
+        self.assertIn('\n    "scalar": "x\\"y"', out.getvalue())
+
+    def test_print_deeply_nested(self):
+        """Printing should not be limited by the recursion limit."""
+        filename = self._write_file(
+            '{"a": %s1%s}' % ('[{"b": ' * 5000, '}]' * 5000))
+        out = StringIO()
+        chrome_defaults.print_json_field(filename, 'a', out)
+        self.assertEqual(out.getvalue().count("'b'"), 5000)
+        out = StringIO()
+        chrome_defaults.print_json(filename, out)
+        self.assertEqual(out.getvalue().count('"b"'), 5000)
+
+    def test_invalid_json(self):
+        """Malformed or empty files should raise `ValueError`."""
+        for contents in ('', '{"level1": {"int": 42', '["not", "an object"'):
+            filename = self._write_file(contents)
+            with self.assertRaises((ValueError, KeyError)):
+                chrome_defaults.stream_json_field(
+                    filename, 'level1.int', suppress_err_msg=True)
+
+class PathExpressionTest(unittest.TestCase):
+    """Tests for path expressions.
+
+    Relevant functions in chrome_defaults:
+        * compile_path(expression)
+        * iter_path_matches(json_obj, expression)
+        * write_json_matches(json_obj, expression, value)
+        * delete_json_matches(json_obj, expression)
+    """
+
+    def setUp(self):
+        self.sample_json = {
+            'plugins': {
+                'plugins_list': [
+                    {'enabled': True, 'name': 'Widevine'},
+                    {'enabled': True, 'name': 'Adobe Flash Player 1.2'},
+                    {'enabled': True, 'name': 'Adobe Flash Player 1.2'}
+                ]
+            },
+            'exceptions': {
+                'cookies': {'a.com': {'setting': 1}, 'b.com': {'setting': 2}},
+                'images': {'c.com': {'setting': 3}, 'd.com': {}}
+            }
+        }
+
+    def _values(self, expression):
+        return sorted(value for _, _, value in
+                      chrome_defaults.iter_path_matches(self.sample_json,
+                                                        expression))
+
+    def test_compile_is_cached(self):
+        """Compiling the same expression twice should reuse the result."""
+        first = chrome_defaults.compile_path('a.*[x="1.5"].b')
+        self.assertIs(chrome_defaults.compile_path('a.*[x="1.5"].b'), first)
+        self.assertEqual(len(first), 4)
+
+    def test_invalid_expressions(self):
+        """Malformed expressions should raise `ValueError`."""
+        for expression in ('a..b', 'a.', '.a', 'a[b'):
+            with self.assertRaises(ValueError):
+                chrome_defaults.compile_path(expression)
+        self.assertFalse(chrome_defaults.is_path_pattern('a.b'))
+        self.assertFalse(chrome_defaults.is_path_pattern('a[b'))
+        self.assertTrue(chrome_defaults.is_path_pattern('a.*'))
+
+    def test_wildcards(self):
+        """`*` should match every attribute or array element."""
+        self.assertEqual(self._values('exceptions.*.*.setting'), [1, 2, 3])
+        self.assertEqual(self._values('plugins.plugins_list[*].enabled'),
+                         [True] * 3)
+
+    def test_recursive_descent(self):
+        """`**` should match at any depth, including none."""
+        self.assertEqual(self._values('**.setting'), [1, 2, 3])
+        self.assertEqual(self._values('exceptions.**.c.com.setting'), [])
+        self.assertEqual(len(self._values('**.enabled')), 3)
+
+    def test_filter_and_index(self):
+        """Filters and indexes should select specific array elements."""
+        self.assertEqual(
+            self._values('plugins.plugins_list[name="Widevine"].name'),
+            ['Widevine'])
+        self.assertEqual(
+            self._values('plugins.plugins_list[name=Widevine].name'),
+            ['Widevine'])
+        self.assertEqual(self._values('plugins.plugins_list[-3].name'),
+                         ['Widevine'])
+        self.assertEqual(self._values('plugins.plugins_list[enabled=false]'),
+                         [])
+
+    def test_write_matches(self):
+        """Writes should set every match and create missing final keys."""
+        result, count = chrome_defaults.write_json_matches(
+            self.sample_json,
+            'plugins.plugins_list[name="Adobe Flash Player 1.2"].enabled',
+            False)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            [item['enabled'] for item in result['plugins']['plugins_list']],
+            [True, False, False])
+        self.assertTrue(
+            self.sample_json['plugins']['plugins_list'][1]['enabled'])
+
+        result, count = chrome_defaults.write_json_matches(
+            self.sample_json, 'exceptions.images.*.setting', 2)
+        self.assertEqual(count, 2)
+        self.assertEqual(result['exceptions']['images']['d.com']['setting'], 2)
+
+    def test_delete_matches(self):
+        """Deletes should remove every match, including array elements."""
+        result, count = chrome_defaults.delete_json_matches(
+            self.sample_json,
+            'plugins.plugins_list[name="Adobe Flash Player 1.2"]')
+        self.assertEqual(count, 2)
+        self.assertEqual(result['plugins']['plugins_list'],
+                         [{'enabled': True, 'name': 'Widevine'}])
+
+        result, count = chrome_defaults.delete_json_matches(
+            self.sample_json, '**.setting')
+        self.assertEqual(count, 3)
+        self.assertEqual(result['exceptions']['cookies']['a.com'], {})
+
+class MultipleProfilesTest(unittest.TestCase):
+    """Tests for processing several preferences files in one process.
+
+    Relevant functions in chrome_defaults:
+        * find_preferences_files(target)
+        * _run_for_each_file(args, filenames)
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filenames = []
+        for profile, value in (('Default', False), ('Profile 1', True),
+                               ('Profile 2', False)):
+            os.mkdir(os.path.join(self.root, profile))
+            filename = os.path.join(self.root, profile, 'Preferences')
+            with open(filename, 'w') as preferences_file:
+                preferences_file.write(json.dumps({'search': {'on': value}}))
+            self.filenames.append(filename)
+        #not a profile: too deep, or not named "Preferences"
+        os.makedirs(os.path.join(self.root, 'Default', 'Sub'))
+        open(os.path.join(self.root, 'Default', 'Sub', 'Preferences'),
+             'w').close()
+        open(os.path.join(self.root, 'Local State'), 'w').close()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.root)
+
+    def _args(self, action, chrome_property, jobs=1, with_filename=False,
+              **kwargs):
+        return dict(action=action, preferences_filename=self.root,
+                    chrome_property=chrome_property, jobs=jobs,
+                    with_filename=with_filename, **kwargs)
+
+    def test_find_profiles(self):
+        """Profile roots and globs should find each Preferences file once."""
+        self.assertEqual(chrome_defaults.find_preferences_files(self.root),
+                         self.filenames)
+        self.assertEqual(
+            chrome_defaults.find_preferences_files(
+                os.path.join(self.root, 'Profile*')),
+            self.filenames[1:])
+        self.assertEqual(
+            chrome_defaults.find_preferences_files(self.filenames[0]),
+            [self.filenames[0]])
+
+    def test_read_all_profiles(self):
+        """Reads should print one line per profile, in order."""
+        for jobs in (1, 2):
+            sys.stdout = StringIO()
+            status = chrome_defaults._run_for_each_file(
+                self._args('read', 'search.on', jobs), self.filenames)
+            self.assertEqual(status, 0)
+            self.assertEqual(sys.stdout.getvalue(), "False\nTrue\nFalse\n")
+
+    def test_read_with_filename(self):
+        """Each line should name the profile it was read from."""
+        for jobs in (1, 2):
+            sys.stdout = StringIO()
+            status = chrome_defaults._run_for_each_file(
+                self._args('read', 'search.on', jobs, with_filename=True),
+                self.filenames)
+            self.assertEqual(status, 0)
+            self.assertEqual(sys.stdout.getvalue(), ''.join(
+                "%s\t%s\n" % (filename, value) for filename, value
+                in zip(self.filenames, ('False', 'True', 'False'))))
+
+    def test_write_all_profiles(self):
+        """Writes should apply to every profile."""
+        status = chrome_defaults._run_for_each_file(
+            self._args('write', 'search.on', 2, value=False), self.filenames)
+        self.assertEqual(status, 0)
+        for filename in self.filenames:
+            self.assertEqual(chrome_defaults.stream_json_field(
+                filename, 'search.on'), False)
+
+    def test_error_in_one_profile(self):
+        """A failure in one file should not stop the others."""
+        with open(self.filenames[0], 'w') as preferences_file:
+            preferences_file.write('{"search": 1}')
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            status = chrome_defaults._run_for_each_file(
+                self._args('write', 'search.on', value=False), self.filenames)
+            self.assertIn('Error', sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(status, 1)
+        self.assertEqual(chrome_defaults.stream_json_field(
+            self.filenames[2], 'search.on'), False)
+
+    def test_missing_root(self):
+        """A missing profile root should exit with an error message."""
+        missing = os.path.join(self.root, 'Missing')
+        with self.assertRaises(SystemExit) as context:
+            chrome_defaults._run_action(dict(
+                self._args('read', 'search.on'), preferences_filename=missing))
+        self.assertEqual(context.exception.code, "No Google Chrome preferences "
+                         "file found at '%s'" % missing)
+        output, errors, failed = chrome_defaults._run_action_captured(dict(
+            self._args('read', 'search.on'), preferences_filename=missing))
+        self.assertEqual((output, failed), ('', True))
+        self.assertIn(missing, errors)
+
+    def test_unreadable_profile(self):
+        """A preferences file that cannot be read should be reported without
+        stopping the others."""
+        os.remove(self.filenames[1])
+        os.mkdir(self.filenames[1])
+        stderr = sys.stderr
+        try:
+            for jobs, with_filename in ((1, False), (1, True), (2, False)):
+                sys.stdout, sys.stderr = StringIO(), StringIO()
+                status = chrome_defaults._run_for_each_file(
+                    self._args('read', 'search.on', jobs,
+                               with_filename=with_filename), self.filenames)
+                self.assertEqual(status, 1)
+                self.assertIn("Error: Could not access '%s'" %
+                              self.filenames[1], sys.stderr.getvalue())
+                self.assertEqual(sys.stdout.getvalue().count('False'), 2)
+        finally:
+            sys.stderr = stderr
+
+def _write_key(args):
+    """Writes one key from a worker process of `ConcurrentWriteTest`."""
+    filename, key = args
+    return chrome_defaults.update_preferences(
+        filename, {'action': 'write', 'chrome_property': 'keys.' + key,
+                   'value': True})
+
+class ConcurrentWriteTest(unittest.TestCase):
+    """Tests for locking preferences files and coalescing queued writes.
+
+    Relevant functions in chrome_defaults:
+        * update_preferences(filename, mutation)
+        * _update_queue(filename, update)
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'Preferences')
+        with open(self.filename, 'w') as preferences_file:
+            preferences_file.write(json.dumps({'search': {'on': True}}))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _queue(self, *entries):
+        chrome_defaults._update_queue(
+            self.filename, lambda queued: queued + list(entries))
+
+    def _queued(self):
+        result = []
+        def keep(entries):
+            result.extend(entries)
+            return entries
+        chrome_defaults._update_queue(self.filename, keep)
+        return dict((entry['id'], entry) for entry in result)
+
+    def _backups(self):
+        return [name for name in os.listdir(self.root) if name.endswith('.bak')]
+
+    def test_queued_changes_coalesced(self):
+        """Changes queued by other writers should be applied together with a
+        single backup, leaving their outcomes in the queue."""
+        self._queue({'id': 'a', 'mutation': {
+            'action': 'write', 'chrome_property': 'search.on', 'value': False}},
+                    {'id': 'b', 'mutation': {
+                        'action': 'write',
+                        'chrome_property': 'profile.name', 'value': 'x'}})
+        self.assertIsNone(chrome_defaults.update_preferences(
+            self.filename, {'action': 'write', 'chrome_property': 'extra',
+                            'value': 3}))
+        with open(self.filename, 'r') as preferences_file:
+            self.assertEqual(json.load(preferences_file),
+                             {'search': {'on': False},
+                              'profile': {'name': 'x'}, 'extra': 3})
+        self.assertEqual(len(self._backups()), 1)
+        queued = self._queued()
+        self.assertEqual(sorted(queued), ['a', 'b'])
+        self.assertIsNone(queued['a']['error'])
+        self.assertNotIn('mutation', queued['b'])
+
+    def test_outcome_from_queue(self):
+        """A change already applied by another writer should not be applied
+        again."""
+        urandom = chrome_defaults.os.urandom
+        chrome_defaults.os.urandom = lambda length: 'x' * length
+        try:
+            self._queue({'id': '%d.%s' % (os.getpid(), '78' * 6),
+                         'error': 'Error: Failed elsewhere.', 'time': 0})
+            error = chrome_defaults.update_preferences(
+                self.filename, {'action': 'delete',
+                                'chrome_property': 'search'})
+        finally:
+            chrome_defaults.os.urandom = urandom
+        self.assertEqual(error, 'Error: Failed elsewhere.')
+        self.assertEqual(chrome_defaults.stream_json_field(
+            self.filename, 'search.on'), True)
+        self.assertEqual(self._backups(), [])
+        self.assertEqual(self._queued(), {})
+
+    def test_failed_change_left_out(self):
+        """A change that fails should be reported to its writer only."""
+        self._queue({'id': 'a', 'mutation': {
+            'action': 'write', 'chrome_property': 'search.on.deeper',
+            'value': 1}})
+        self.assertIsNone(chrome_defaults.update_preferences(
+            self.filename, {'action': 'delete', 'chrome_property': 'search'}))
+        self.assertIn('Error', self._queued()['a']['error'])
+        with open(self.filename, 'r') as preferences_file:
+            self.assertEqual(json.load(preferences_file), {})
+
+        error = chrome_defaults.update_preferences(
+            self.filename, {'action': 'delete', 'chrome_property': 'search'})
+        self.assertIn('not found', error)
+        self.assertEqual(len(self._backups()), 1)
+
+    def test_concurrent_writers(self):
+        """No change should be lost when many processes write at once."""
+        keys = ['k%d' % index for index in range(24)]
+        pool = multiprocessing.Pool(8)
+        try:
+            errors = pool.map(_write_key, [(self.filename, key)
+                                           for key in keys])
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(errors, [None] * len(keys))
+        with open(self.filename, 'r') as preferences_file:
+            preferences = json.load(preferences_file)
+        self.assertEqual(sorted(preferences['keys']), sorted(keys))
+        self.assertEqual(preferences['search'], {'on': True})
+        self.assertEqual(self._queued(), {})
+
+    def test_queue_removed(self):
+        """No queue file should be left once every outcome was taken."""
+        self.assertIsNone(chrome_defaults.update_preferences(
+            self.filename, {'action': 'write', 'chrome_property': 'search.on',
+                            'value': False}))
+        self.assertFalse(os.path.exists(
+            self.filename + chrome_defaults.QUEUE_SUFFIX))
+        self._queue({'id': 'a', 'error': None, 'time': time.time()})
+        self.assertTrue(os.path.exists(
+            self.filename + chrome_defaults.QUEUE_SUFFIX))
+        chrome_defaults._update_queue(self.filename, lambda queued: [])
+        self.assertFalse(os.path.exists(
+            self.filename + chrome_defaults.QUEUE_SUFFIX))
+
+    @unittest.skipUnless(os.getuid() == 0, "Only root can give files away.")
+    def test_sidecar_owner(self):
+        """The lock and queue files should belong to the owner of the
+        preferences file, not to the writer."""
+        os.chown(self.filename, 12345, 12345)
+        self._queue({'id': 'a', 'error': None, 'time': time.time()})
+        self.assertIsNone(chrome_defaults.update_preferences(
+            self.filename, {'action': 'write', 'chrome_property': 'search.on',
+                            'value': False}))
+        for suffix in (chrome_defaults.LOCK_SUFFIX,
+                       chrome_defaults.QUEUE_SUFFIX):
+            stat = os.stat(self.filename + suffix)
+            self.assertEqual((stat.st_uid, stat.st_gid), (12345, 12345))
+
 class WriteCommandTest(unittest.TestCase):
     """Tests for the 'write' sub-command.
 
@@ -339,3 +832,7 @@ suite2 = unittest.TestLoader().loadTestsFromTestCase(ReadCommandTest)
 suite3 = unittest.TestLoader().loadTestsFromTestCase(WriteCommandTest)
 suite4 = unittest.TestLoader().loadTestsFromTestCase(DeleteCommandTest)
 suite5 = unittest.TestLoader().loadTestsFromTestCase(WriteArrayComandTest)
+suite6 = unittest.TestLoader().loadTestsFromTestCase(StreamingReadTest)
+suite7 = unittest.TestLoader().loadTestsFromTestCase(PathExpressionTest)
+suite8 = unittest.TestLoader().loadTestsFromTestCase(MultipleProfilesTest)
+suite9 = unittest.TestLoader().loadTestsFromTestCase(ConcurrentWriteTest)
@@ -0,0 +1,229 @@
+"""Executes commands in warm shells that have sourced the API script.
+
+Every command of a check is normally executed by a new shell, which sources
+scripts/api.sh before running it. A `ShellPool` instead keeps a few bash
+processes ("workers") running that have sourced the API script once, and
+sends each of them one command at a time. A worker runs each command in a
+subshell, so a command cannot change the worker's directory, variables or
+functions for the commands after it, and a command that exits only ends its
+subshell. Forking the subshell costs far less than starting a new shell and
+sourcing the API script again.
+
+Protocol: a command is sent to a worker as a here-document, so that it may
+contain any text. The worker runs it with its input from /dev/null and its
+stderr merged into its stdout, then prints a line with a marker that is
+unique to the command and the command's exit status. Everything before the
+marker is the output of the command. A command must not leave background
+processes writing to its output.
+
+The pool is used by the resident daemon, see `daemon`. Commands using sudo are
+executed by a fallback executor instead, as are commands whose worker stopped
+responding.
+"""
+
+import os
+import re
+import sys
+import binascii
+import threading
+from subprocess import Popen, PIPE, STDOUT
+import const #const.py
+import runner #runner.py
+
+#On macOS /bin/sh is bash, the shell of every other command. Elsewhere it may
+#be a shell that cannot run the protocol below, e.g. dash.
+const.WORKER_SHELL = '/bin/sh' if sys.platform == 'darwin' else 'bash'
+
+class WorkerError(Exception):
+    """A worker exited or its output could not be read."""
+    pass
+
+class ShellWorker(object):
+    """A shell process that has sourced the API script."""
+
+    def __init__(self, preexec_fn=None):
+        """Starts the worker.
+
+        Args:
+            preexec_fn (Optional[function]): Called in the worker process
+                before the shell is executed, e.g. to apply resource limits.
+
+        Raises:
+            WorkerError: If the shell could not be started.
+        """
+        try:
+            self.process = Popen([const.WORKER_SHELL], stdin=PIPE,
+                                 stdout=PIPE, stderr=STDOUT,
+                                 preexec_fn=preexec_fn)
+        except OSError as err:
+            raise WorkerError("Could not start a shell worker: %s" % err)
+        try:
+            self._send("source %s </dev/null >/dev/null 2>&1\n" %
+                       const.API_FILENAME)
+        except WorkerError:
+            self.kill()
+            raise
+
+    def run(self, command):
+        """Runs a command in a subshell of the worker.
+
+        Args:
+            command (str): The command, without `const.API_PREFIX`.
+
+        Returns:
+            tuple: (int, str): The exit status and the combined stdout and
+                stderr of the command.
+
+        Raises:
+            WorkerError: If the worker exited.
+        """
+        end = '__osx_config_check_%s' % binascii.hexlify(os.urandom(8))
+        self._send(
+            "IFS= read -r -d '' __osx_config_check_command <<'%(end)s'\n"
+            "%(command)s\n"
+            "%(end)s\n"
+            "( eval \"$__osx_config_check_command\" ) </dev/null 2>&1\n"
+            "printf '\\n%(end)s %%d\\n' $?\n" % {'end': end,
+                                                 'command': command})
+        status_line = re.compile(r'\n%s (\d+)\n$' % end)
+        chunks = []
+        tail = ''
+        while True:
+            try:
+                chunk = os.read(self.process.stdout.fileno(), const.READ_SIZE)
+            except OSError as err:
+                raise WorkerError("Could not read from a shell worker: %s" %
+                                  err)
+            if chunk == '':
+                raise WorkerError("A shell worker exited.")
+            chunks.append(chunk)
+            tail = (tail + chunk)[-(len(end) + 16):]
+            match = status_line.search(tail)
+            if match is not None:
+                output = ''.join(chunks)
+                return (int(match.group(1)),
+                        output[:len(output) - len(match.group(0))])
+
+    def close(self):
+        """Stops the worker."""
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.wait()
+
+    def kill(self):
+        """Stops a worker that may not respond, e.g. after a `WorkerError`."""
+        try:
+            self.process.kill()
+        except OSError:
+            pass #already exited
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except IOError:
+                pass
+        self.process.wait()
+
+    def _send(self, script):
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except IOError as err:
+            raise WorkerError("Could not write to a shell worker: %s" % err)
+
+class ShellPool(runner.Executor):
+    """Executes commands in up to `size` warm `ShellWorker` processes."""
+
+    def __init__(self, size, fallback, resource_governor=None):
+        """
+        Args:
+            size (int): The maximum number of workers, i.e. of commands
+                executed at once.
+            fallback (`runner.Executor`): Executes the commands that use sudo,
+                and those whose worker stopped responding.
+            resource_governor (Optional[`governor.ResourceGovernor`]): Limits
+                the resources of the workers, and so of every command they
+                run. Default: no limits.
+        """
+        self.size = size
+        self.fallback = fallback
+        self.preexec_fn = None
+        if resource_governor is not None:
+            self.preexec_fn = resource_governor.preexec_fn()
+        self.spawned = 0 #workers, and subshells of the commands they ran
+        self._idle = [] #workers not running a command
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._api_stamp = _api_stamp()
+
+    def run_status(self, command):
+        if 'sudo ' in command:
+            return self.fallback.run_status(command)
+        if command.startswith(const.API_PREFIX):
+            command = command[len(const.API_PREFIX):]
+        with self._slots:
+            worker = None
+            try:
+                worker = self._take_worker()
+                status, output = worker.run(command)
+            except WorkerError:
+                #the worker is gone; the command did not finish there
+                if worker is not None:
+                    worker.kill()
+                return self.fallback.run_status(const.API_PREFIX + command)
+            with self._lock:
+                self.spawned += 1
+                self._idle.append(worker)
+            return status, output
+
+    def _take_worker(self):
+        """Returns an idle worker, starting one if there is none."""
+        with self._lock:
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            self.spawned += 1
+        return ShellWorker(self.preexec_fn)
+
+    def prompts_for_password(self, command):
+        return self.fallback.prompts_for_password(command)
+
+    def processes_spawned(self):
+        with self._lock:
+            return self.spawned + self.fallback.processes_spawned()
+
+    def shells_avoided(self):
+        return self.fallback.shells_avoided()
+
+    def refresh(self):
+        """Stops the idle workers if the API script changed since they
+        sourced it, so that new workers source it again.
+
+        Returns:
+            bool: Whether the workers were stopped.
+        """
+        stamp = _api_stamp()
+        if stamp == self._api_stamp:
+            return False
+        self._api_stamp = stamp
+        self.shutdown()
+        return True
+
+    def close(self):
+        """Ends a run; the workers keep running for the next one."""
+        self.fallback.close()
+
+    def shutdown(self):
+        """Stops the idle workers."""
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.close()
+
+def _api_stamp():
+    """Identifies the version of the API script on disk."""
+    try:
+        stat = os.stat(const.API_FILENAME)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
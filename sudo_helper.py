@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""Runs the privileged commands of a run of app.py in one long-lived process.
+
+Instead of invoking `sudo` separately for every test and fix that needs it,
+app.py can start this script once through `sudo`. The user then authenticates
+at most once, and all privileged commands of the run share a single process
+tree. app.py sends each command over a pipe, and the helper sends back the
+command's exit status and its combined stdout and stderr.
+
+Because the helper already runs as root, `sudo` within the commands it runs does
+not prompt again. The whole command runs as root, not just the part after
+`sudo`. The invoking user's HOME, USER and LOGNAME are passed on to the helper,
+so `~` and `$USER` in commands still refer to that user. The user's PATH is
+not: commands find programs in the PATH sudo gives root, not in directories
+the user can write to.
+
+Protocol: every message is a header line of the form "<tag> <length>",
+followed by exactly <length> bytes of payload. The first request is tagged
+"env" and carries a JSON object of environment variables for the commands.
+The helper acknowledges it once it is running. Each later request is tagged
+"run" and carries a shell command. Each response is tagged with the command's
+exit status and carries its output. The helper exits when its input is
+closed.
+"""
+
+import sys
+import os
+import json
+from subprocess import Popen, PIPE, STDOUT
+
+#environment variables passed on from the invoking user
+USER_ENV = ('HOME', 'USER', 'LOGNAME')
+
+class HelperError(Exception):
+    """The helper could not be started or stopped responding."""
+    pass
+
+class SudoHelper(object):
+    """Client side of the helper: starts it and sends it commands."""
+
+    def __init__(self, sudo_command=('sudo',)):
+        """
+        Args:
+            sudo_command (tuple): The command used to start the helper with
+                elevated privileges. The helper script and its interpreter are
+                appended to it.
+        """
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        self.argv = list(sudo_command) + [sys.executable, script]
+        self.process = None
+
+    @property
+    def started(self):
+        """Whether the helper is running, i.e. the user has authenticated."""
+        return self.process is not None
+
+    def start(self):
+        """Starts the helper, which may prompt the user for their password.
+
+        Raises:
+            HelperError: If the helper could not be started, e.g. because the
+                user failed to authenticate.
+        """
+        try:
+            self.process = Popen(self.argv, stdin=PIPE, stdout=PIPE)
+        except OSError as err:
+            raise HelperError("Could not start '%s': %s" %
+                              (' '.join(self.argv), err))
+        env = dict((name, os.environ[name]) for name in USER_ENV
+                   if name in os.environ)
+        self._request('env', json.dumps(env))
+
+    def run(self, command):
+        """Runs a shell command in the helper, starting it if needed.
+
+        Returns:
+            tuple: (int, str): The exit status and the combined stdout and
+                stderr of the command.
+        Raises:
+            HelperError: If the helper could not be started or has stopped.
+        """
+        if not self.started:
+            self.start()
+        return self._request('run', command)
+
+    def close(self):
+        """Stops the helper, if it was started."""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except IOError:
+                pass
+            self.process.wait()
+            self.process = None
+
+    def _request(self, tag, payload):
+        try:
+            write_message(self.process.stdin, tag, payload)
+            response = read_message(self.process.stdout)
+        except (IOError, ValueError):
+            response = None
+        if response is None:
+            self.process.wait()
+            self.process = None
+            raise HelperError("The privileged helper stopped responding.")
+        status, output = response
+        return int(status), output
+
+def write_message(out, tag, payload):
+    """Writes one message of the helper protocol and flushes it."""
+    out.write("%s %d\n" % (tag, len(payload)))
+    out.write(payload)
+    out.flush()
+
+def read_message(infile):
+    """Reads one message of the helper protocol.
+
+    Returns:
+        tuple: (str, str): The tag and the payload, or None at end of input.
+    Raises:
+        ValueError: If the input is not a valid message.
+    """
+    header = infile.readline()
+    if header == '':
+        return None
+    tag, length = header.split()
+    payload = infile.read(int(length))
+    if len(payload) != int(length):
+        raise ValueError("Truncated message.")
+    return tag, payload
+
+def serve(infile, outfile):
+    """Runs commands read from `infile` until it is closed."""
+    message = read_message(infile)
+    if message is None or message[0] != 'env':
+        raise ValueError("Expected the environment first.")
+    env = dict(os.environ)
+    for name, value in json.loads(message[1]).iteritems():
+        if name in USER_ENV:
+            env[name.encode('utf-8')] = value.encode('utf-8')
+    write_message(outfile, '0', '')
+
+    with open(os.devnull, 'r') as devnull:
+        while True:
+            message = read_message(infile)
+            if message is None:
+                return
+            process = Popen(message[1], stdin=devnull, stdout=PIPE,
+                            stderr=STDOUT, shell=True, env=env)
+            output, _ = process.communicate()
+            write_message(outfile, str(process.returncode), output)
+
+if __name__ == '__main__':
+    serve(sys.stdin, sys.stdout)
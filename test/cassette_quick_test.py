@@ -0,0 +1,66 @@
+"""Unit tests for cassette.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import gzip
+import socket
+import shutil
+import tempfile
+import cassette #cassette.py
+
+class CassetteTest(unittest.TestCase):
+    """Tests for writing, reading and looking up recorded commands."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'cassette.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """Commands and output should survive as the exact same bytes."""
+        recording = cassette.Cassette()
+        recording.add('read a', 0, 0.5, '0\n')
+        recording.add('read a', 0, 0.25, '1\n')
+        recording.add(u'echo \xe9', 1, 0.0, '\xff\x00binary')
+        cassette.write_cassette(self.filename, recording, 'test')
+        self.assertEqual(os.listdir(self.temp_dir), ['cassette.json.gz'])
+
+        replayed = cassette.read_cassette(self.filename)
+        self.assertEqual(len(replayed), 3)
+        self.assertEqual(replayed.commands, recording.commands)
+        self.assertEqual(replayed.hostname, socket.gethostname())
+        self.assertEqual(replayed.lookup(u'echo \xe9', 0),
+                         (1, 0.0, '\xff\x00binary'))
+
+    def test_lookup_in_order(self):
+        """Each execution should get the next result, then the last one."""
+        recording = cassette.Cassette()
+        recording.add('read a', 0, 0.1, 'before')
+        recording.add('read a', 0, 0.1, 'after')
+        self.assertEqual([recording.lookup('read a', occurrence)[2]
+                          for occurrence in range(4)],
+                         ['before', 'after', 'after', 'after'])
+        self.assertIsNone(recording.lookup('read b', 0))
+
+    def test_invalid_cassettes(self):
+        """Missing and malformed files should raise `CassetteError`."""
+        with self.assertRaises(cassette.CassetteError):
+            cassette.read_cassette(self.filename)
+        with open(self.filename, 'w') as plain_file:
+            plain_file.write('{"format": 1, "commands": {}}')
+        with self.assertRaises(cassette.CassetteError):
+            cassette.read_cassette(self.filename)
+        for document in ('not json', '[]', '{"format": 2, "commands": {}}',
+                         '{"format": 1}',
+                         '{"format": 1, "commands": {"true": [[0, 0]]}}',
+                         '{"format": 1, "commands": {"true": [["x", 0, ""]]}}'):
+            with gzip.open(self.filename, 'wb') as gzip_file:
+                gzip_file.write(document)
+            with self.assertRaises(cassette.CassetteError):
+                cassette.read_cassette(self.filename)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(CassetteTest)
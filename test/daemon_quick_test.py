@@ -0,0 +1,152 @@
+"""Unit tests for daemon.py.
+
+Each test starts a daemon on a socket in a temporary directory, with a config
+file whose checks read and write a file there.
+"""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import runner #runner.py
+import daemon #daemon.py
+from .helpers import ListOutput
+
+def _check(command, description, confidence='required', fix=None):
+    """A check that passes if `command` outputs "on"."""
+    return {'description': description, 'confidence': confidence,
+            'tests': [{'type': 'exact match', 'command': command,
+                       'command_pass': 'on', 'case_sensitive': 'true'}],
+            'fix': {'command': fix} if fix else {'manual': 'Turn it on.'}}
+
+class CheckDaemonTest(unittest.TestCase):
+    """Tests for performing runs requested by clients."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.setting = os.path.join(self.temp_dir, 'setting')
+        with open(self.setting, 'w') as setting:
+            setting.write('off\n')
+        self.config_filename = os.path.join(self.temp_dir, 'config.json')
+        self.checks = [
+            _check('echo on', "The system is on."),
+            _check('cat %s' % self.setting, "The setting is on.",
+                   confidence='recommended',
+                   fix='echo on > %s' % self.setting)]
+        self._write_config()
+        self.socket_path = os.path.join(self.temp_dir, 'daemon.sock')
+        self.daemon = daemon.CheckDaemon(
+            self.socket_path, self.config_filename, runner.RunOptions(jobs=2),
+            output=ListOutput())
+        self.daemon.listen()
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.close()
+        self.thread.join()
+        shutil.rmtree(self.temp_dir)
+
+    def _write_config(self, text=None):
+        """Writes the config, making sure its modification time changes."""
+        with open(self.config_filename, 'w') as config_file:
+            config_file.write(json.dumps(self.checks) if text is None
+                              else text)
+        mtime = os.stat(self.config_filename).st_mtime
+        os.utime(self.config_filename, (mtime + 10, mtime + 10))
+
+    def _request(self, **request):
+        output = ListOutput()
+        return daemon.request_run(self.socket_path, request, output), output
+
+    def test_report(self):
+        """A run should be performed and its messages streamed back."""
+        summary, output = self._request()
+        self.assertEqual((summary['passed'], summary['failed'],
+                          summary['total_checks']), (1, 1, 2))
+        self.assertTrue(output.messages[0].startswith('\nCHECK #1: The '
+                                                      'system is on.'))
+        summary, _ = self._request()
+        self.assertEqual(summary['passed'], 1)
+        self.assertEqual(self.daemon.runs, 2)
+        #both runs used the same warm shell
+        self.assertEqual(len(self.daemon.executor._idle), 1)
+
+    def test_fix(self):
+        """Fixes should be applied without prompting if requested."""
+        summary, _ = self._request(attempt_fixes=True)
+        self.assertEqual(summary['passed'], 2)
+        with open(self.setting) as setting:
+            self.assertEqual(setting.read(), 'on\n')
+
+    def test_selection(self):
+        """Only the checks selected by the request should be performed."""
+        summary, output = self._request(tags=['recommended'])
+        self.assertEqual(summary['total_checks'], 1)
+        self.assertTrue(output.messages[0].startswith('\nCHECK #2:'))
+        summary, _ = self._request(check='system')
+        self.assertEqual((summary['passed'], summary['total_checks']), (1, 1))
+        with self.assertRaisesRegexp(daemon.DaemonError, 'No check matches'):
+            self._request(check='nothing')
+        with self.assertRaisesRegexp(daemon.DaemonError, 'Unknown tag'):
+            self._request(tags=['fast'])
+
+    def test_hot_reload(self):
+        """Changes to the config should take effect at the next run, and a
+        config that cannot be read should not replace the previous one."""
+        self._request()
+        self.checks.append(_check('echo on', "The other setting is on."))
+        self._write_config()
+        summary, _ = self._request()
+        self.assertEqual((summary['passed'], summary['total_checks']), (2, 3))
+        self.assertEqual(self.daemon.config.reloads, 1)
+
+        self._write_config('[{"description": ')
+        summary, output = self._request()
+        self.assertEqual(summary['total_checks'], 3)
+        self.assertTrue(any('Could not read the config' in message
+                            for message in output.messages))
+
+    def test_one_daemon_per_socket(self):
+        """A second daemon should not take over the socket of a running
+        one."""
+        other = daemon.CheckDaemon(self.socket_path, self.config_filename)
+        with self.assertRaisesRegexp(daemon.DaemonError, 'already listening'):
+            other.listen()
+
+    def test_no_daemon(self):
+        """Clients should be told when no daemon is listening."""
+        with self.assertRaisesRegexp(daemon.DaemonError, 'No daemon'):
+            daemon.request_run(os.path.join(self.temp_dir, 'none.sock'), {},
+                               ListOutput())
+
+class StaleSocketTest(unittest.TestCase):
+    """Tests for replacing the socket of a daemon that stopped."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, 'daemon.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_stale_socket(self):
+        """A socket nobody listens on should be replaced, but other files
+        should be left alone."""
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        daemon._remove_stale_socket(self.socket_path)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+        open(self.socket_path, 'w').close()
+        with self.assertRaisesRegexp(daemon.DaemonError, 'not a socket'):
+            daemon._remove_stale_socket(self.socket_path)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(CheckDaemonTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(StaleSocketTest)
@@ -0,0 +1,50 @@
+"""Unit tests for durations.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import tempfile
+import durations #durations.py
+
+class DurationHistoryTest(unittest.TestCase):
+    """Tests for averaging, saving and reading check durations."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_moving_average(self):
+        """Later runs should move the expected duration towards them."""
+        history = durations.DurationHistory(self.filename)
+        self.assertIsNone(history.expected('a'))
+        history.update('a', 1.0)
+        self.assertEqual(history.expected('a'), 1.0)
+        history.update('a', 2.0)
+        self.assertAlmostEqual(history.expected('a'),
+                               1.0 + durations.SMOOTHING)
+
+    def test_round_trip(self):
+        """Saved durations should be read back, except those not kept."""
+        history = durations.DurationHistory(self.filename)
+        history.update('a', 0.5)
+        history.update('b', 3.0)
+        history.save(keep=set(['a']))
+        history = durations.DurationHistory(self.filename)
+        self.assertEqual(history.expected('a'), 0.5)
+        self.assertIsNone(history.expected('b'))
+
+    def test_damaged_file(self):
+        """A damaged file or another format should start afresh."""
+        for content in ('{"format": 1, "durations"', '[]',
+                        '{"format": 99, "durations": {"a": 1}}'):
+            with open(self.filename, 'w') as durations_file:
+                durations_file.write(content)
+            self.assertEqual(
+                durations.DurationHistory(self.filename).durations, {})
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(DurationHistoryTest)
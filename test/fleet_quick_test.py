@@ -0,0 +1,183 @@
+"""Unit tests for fleet.py.
+
+The results of the fleet evaluator are compared with those of replaying the
+cassette of each host with a `runner.Runner`, with and without NumPy if it is
+installed.
+"""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import tempfile
+import const #const.py
+import cassette #cassette.py
+import runner #runner.py
+import fleet #fleet.py
+from .helpers import ListOutput
+
+def _test(command, comparison_type='exact match', command_pass=None,
+          command_fail=None, case_sensitive='false', per_target=False):
+    test = {'type': comparison_type, 'command': command,
+            'case_sensitive': case_sensitive, 'per_target': per_target}
+    if command_pass is not None:
+        test['command_pass'] = command_pass
+    if command_fail is not None:
+        test['command_fail'] = command_fail
+    return test
+
+def _make_checks():
+    return [
+        runner.ConfigCheck(
+            tests=[_test('read a', command_pass='on', command_fail='off'),
+                   _test('read b', command_pass='yes')],
+            description="A or B is on.", confidence='required'),
+        runner.ConfigCheck(
+            tests=[_test('read c', 'regex match', command_pass=r'^v[0-9]+$',
+                         command_fail='^beta')],
+            description="C is a release.", confidence='required'),
+        runner.ConfigCheck(
+            tests=[_test('read-all p', command_pass='on', per_target=True)],
+            description="Every P is on.", confidence='recommended'),
+        runner.ConfigCheck(
+            tests=[_test('sudo read s', command_pass='1', command_fail='0'),
+                   _test('read s', command_pass='1')],
+            description="S is set.", confidence='required')]
+
+#the outputs of each command on the hosts, cycled through
+_OUTPUTS = {
+    'read a': ['on\n', 'off\n', 'ON \n', 'unknown\n', '\n'],
+    'read b': ['yes\n', 'no\n', 'YES\n'],
+    'read c': ['v12\n', 'beta 2\n', 'V3\n', 'v1.0\n'],
+    'read-all p': ['Default\ton\nProfile 1\ton\n',
+                   'Default\ton\nProfile 1\toff\n', 'error\n',
+                   'Default\ton\n'],
+    'sudo read s': ['1\n', '0\n', 'sudo: a password is required\n'],
+    'read s': ['1\n', '0\n']}
+
+def _record_host(index):
+    """Records the outputs of the commands on one host; a few hosts did not
+    record some commands."""
+    recording = cassette.Cassette(hostname='host-%02d' % index)
+    for position, (command, outputs) in enumerate(sorted(_OUTPUTS.items())):
+        if (index + position) % 7 == 0:
+            continue
+        recording.add(const.API_PREFIX + command, 0, 0.1,
+                      outputs[(index // (position + 1)) % len(outputs)])
+        recording.add(const.API_PREFIX + command, 0, 0.1, 'after a fix\n')
+    return recording
+
+class FleetEvaluatorTest(unittest.TestCase):
+    """Tests for evaluating the checks of many hosts at once."""
+
+    def setUp(self):
+        self.checks = _make_checks()
+        self.recordings = [_record_host(index) for index in range(40)]
+        self.backends = [fleet.numpy]
+        if fleet.numpy is not None:
+            self.backends.append(None)
+        self.numpy = fleet.numpy
+
+    def tearDown(self):
+        fleet.numpy = self.numpy
+
+    def _replay(self, recording, skip_sudo_tests):
+        """Returns the result of each check replayed for one host."""
+        check_runner = runner.Runner(
+            self.checks, runner.RunOptions(attempt_fixes=False,
+                                           skip_sudo_tests=skip_sudo_tests),
+            executor=runner.ReplayExecutor(recording, ListOutput()),
+            output=ListOutput())
+        return [check_runner.evaluate_tests(config_check)[0]
+                for config_check in self.checks]
+
+    def test_same_as_replay(self):
+        """Every host's results should equal those of replaying its cassette,
+        with or without NumPy."""
+        for backend in self.backends:
+            fleet.numpy = backend
+            table = fleet.ProbeTable()
+            for recording in self.recordings:
+                table.add_cassette(recording)
+            for skip_sudo_tests in (False, True):
+                result = fleet.FleetEvaluator(
+                    self.checks, skip_sudo_tests=skip_sudo_tests).evaluate(
+                        table)
+                self.assertEqual(result.hosts, ['host-%02d' % index
+                                                for index in range(40)])
+                by_host = zip(*[result.check_results(check_num) for
+                                check_num in range(1, len(self.checks) + 1)])
+                for recording, host_results in zip(self.recordings, by_host):
+                    self.assertEqual(list(host_results),
+                                     self._replay(recording, skip_sudo_tests),
+                                     recording.hostname)
+
+    def test_each_output_compared_once(self):
+        """Each distinct output should be compared once, however many hosts
+        produced it."""
+        for backend in self.backends:
+            fleet.numpy = backend
+            table = fleet.ProbeTable()
+            for index in range(1000):
+                table.add_host('host-%d' % index, {
+                    const.API_PREFIX + 'read c': 'v%d\n' % (index % 3)})
+            result = fleet.FleetEvaluator(self.checks[1:2]).evaluate(table)
+            self.assertEqual(result.comparisons, 3)
+            self.assertEqual(result.evaluations, 1000)
+            self.assertEqual(result.count(1, runner.CheckResult.explicit_pass),
+                             1000)
+
+    def test_early_exit(self):
+        """Later tests should only be evaluated for undecided hosts, and not
+        at all once every host is decided."""
+        for backend in self.backends:
+            fleet.numpy = backend
+            table = fleet.ProbeTable()
+            for index, output in enumerate(['on', 'off', 'maybe', 'on']):
+                table.add_host('host-%d' % index, {
+                    const.API_PREFIX + 'read a': output,
+                    const.API_PREFIX + 'read b': 'yes'})
+            evaluator = fleet.FleetEvaluator(self.checks[:1])
+            result = evaluator.evaluate(table)
+            self.assertEqual(result.check_results(1), [
+                runner.CheckResult.explicit_pass,
+                runner.CheckResult.explicit_fail,
+                runner.CheckResult.explicit_pass,
+                runner.CheckResult.explicit_pass])
+            self.assertEqual(result.failing_hosts(1), ['host-1'])
+            #"read b" was only evaluated for the host that output "maybe"
+            self.assertEqual(result.evaluations, 5)
+            self.assertEqual(result.comparisons, 4)
+
+            decided = fleet.ProbeTable()
+            decided.add_host('host', {const.API_PREFIX + 'read a': 'on'})
+            self.assertEqual(evaluator.evaluate(decided).comparisons, 1)
+
+class FromCassettesTest(unittest.TestCase):
+    """Tests for reading the cassettes of a fleet."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_from_cassettes(self):
+        """Each cassette should be a row named after its host."""
+        filenames = []
+        for index in range(3):
+            filename = os.path.join(self.temp_dir, 'host%d.json.gz' % index)
+            cassette.write_cassette(filename, _record_host(index), 'test')
+            filenames.append(filename)
+        table = fleet.ProbeTable.from_cassettes(filenames)
+        self.assertEqual(table.hosts, ['host-00', 'host-01', 'host-02'])
+        values, codes = table.column(const.API_PREFIX + 'read c')
+        self.assertEqual([values[code] for code in codes],
+                         ['v12\n', 'v12\n', 'v12\n'])
+        values, codes = table.column(const.API_PREFIX + 'not recorded')
+        self.assertEqual(list(codes), [0, 0, 0])
+        self.assertEqual(values, [''])
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(FleetEvaluatorTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(FromCassettesTest)
@@ -0,0 +1,77 @@
+"""Unit tests for governor.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import sys
+import time
+import threading
+import governor #governor.py
+import runner #runner.py
+
+class NullOutput(object):
+    """Discards the messages of a `runner.ShellExecutor`."""
+
+    def write(self, msg, debug=False):
+        pass
+
+class ResourceGovernorTest(unittest.TestCase):
+    """Tests for limiting the resources of commands."""
+
+    def _run(self, limits, command):
+        executor = runner.ShellExecutor(
+            output=NullOutput(),
+            resource_governor=governor.ResourceGovernor(limits))
+        status, output = executor.run_status(command)
+        self.assertEqual(status, 0)
+        return output.strip()
+
+    def test_no_limits(self):
+        """Without limits, commands should be started as usual."""
+        self.assertIsNone(governor.ResourceGovernor().preexec_fn())
+        self.assertIsNone(governor.ResourceGovernor(
+            governor.ResourceLimits(max_heavy=1)).preexec_fn())
+
+    def test_process_limits(self):
+        """The nice level and rlimits should apply to commands, with or
+        without a shell."""
+        limits = governor.ResourceLimits(nice=7, cpu_seconds=30,
+                                         memory_mb=2048)
+        self.assertEqual(self._run(limits, 'nice'), '7')
+        self.assertEqual(self._run(limits, 'ulimit -t'), '30')
+        self.assertEqual(self._run(limits, 'ulimit -v'), str(2048 * 1024))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'),
+                         "ionice is only available on Linux")
+    def test_io_priority(self):
+        """The I/O priority should apply to commands."""
+        limits = governor.ResourceLimits(io_priority='throttle')
+        self.assertEqual(self._run(limits, 'ionice'), 'idle')
+
+    def test_heavy_slots(self):
+        """Only `max_heavy` heavy commands should run at once, while light
+        commands are not limited."""
+        resource_governor = governor.ResourceGovernor(
+            governor.ResourceLimits(max_heavy=2))
+        running = {'heavy': 0, 'light': 0}
+        most = {'heavy': 0, 'light': 0}
+        lock = threading.Lock()
+
+        def command(cost):
+            with resource_governor.slot(cost):
+                with lock:
+                    running[cost] += 1
+                    most[cost] = max(most[cost], running[cost])
+                time.sleep(0.02)
+                with lock:
+                    running[cost] -= 1
+        threads = [threading.Thread(target=command, args=(cost,))
+                   for cost in ['heavy', 'light'] * 5]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(most['heavy'], 2)
+        self.assertEqual(most['light'], 5)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(ResourceGovernorTest)
@@ -0,0 +1,12 @@
+"""Helpers shared by the unit tests."""
+
+class ListOutput(object):
+    """Collects the messages written by a `runner.Runner` or an executor,
+    leaving out those for debugging."""
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, msg, debug=False):
+        if not debug:
+            self.messages.append(msg)
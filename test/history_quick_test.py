@@ -0,0 +1,105 @@
+"""Unit tests for history.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import time
+import history #history.py
+
+class RunHistoryTest(unittest.TestCase):
+    """Tests for recording and querying runs."""
+
+    def setUp(self):
+        self.run_history = history.RunHistory(':memory:')
+        self.now = time.time() - 1000
+
+    def tearDown(self):
+        self.run_history.close()
+
+    def _record_run(self, outcomes, duration=1.0):
+        """Records a run in which check i had outcome `outcomes[i]`."""
+        self.run_history.start_run('test', {})
+        self.run_history.conn.execute(
+            "UPDATE runs SET started = ? WHERE id = ?",
+            (self.now, self.run_history.run_id))
+        for check_num, outcome in enumerate(outcomes, 1):
+            description = "Check %d is configured." % check_num
+            self.run_history.start_check(description)
+            self.run_history.record_test('true', 1, self.now, duration)
+            self.run_history.record_check(check_num, description, 1, outcome,
+                                          self.now, duration)
+            self.now += 10
+        self.run_history.finish_run()
+
+    def test_regressions(self):
+        """Only checks that passed before and fail now are regressions."""
+        self._record_run([history.PASS_NO_FIX, history.FAIL_FIX_SKIPPED,
+                          history.PASS_NO_FIX])
+        self._record_run([history.FAIL_FIX_SKIPPED, history.FAIL_FIX_SKIPPED,
+                          history.FAIL_FIX_DECLINED])
+        self._record_run([history.FAIL_FIX_FAIL, history.FAIL_FIX_SKIPPED,
+                          history.PASS_AFTER_FIX])
+        regressions = self.run_history.regressions()
+        self.assertEqual(len(regressions), 1)
+        key, description, last_pass, first_fail = regressions[0]
+        self.assertEqual(key, history.check_key(description))
+        self.assertEqual(description, "Check 1 is configured.")
+        self.assertLess(last_pass, first_fail)
+
+    def test_find_and_history(self):
+        """Checks can be found by number, key or description."""
+        self._record_run([history.PASS_NO_FIX, history.SKIPPED])
+        self._record_run([history.PASS_NO_FIX, history.PASS_NO_FIX])
+        key = history.check_key("Check 2 is configured.")
+        self.assertEqual([row[0] for row in self.run_history.find_checks('2')],
+                         [key])
+        self.assertEqual([row[0] for row in self.run_history.find_checks(key)],
+                         [key])
+        self.assertEqual(len(self.run_history.find_checks('configured')), 2)
+        self.assertEqual(
+            [row[2] for row in self.run_history.check_history(key)],
+            [history.SKIPPED, history.PASS_NO_FIX])
+
+    def test_slowest(self):
+        """Checks should be ordered by average test duration."""
+        self._record_run([history.PASS_NO_FIX], duration=1.0)
+        self._record_run([history.PASS_NO_FIX, history.PASS_NO_FIX],
+                         duration=3.0)
+        slowest = self.run_history.slowest(limit=2)
+        self.assertEqual(slowest[0][1], "Check 2 is configured.")
+        self.assertEqual(slowest[0][2], 3.0)
+        self.assertEqual(slowest[1][2], 2.0)
+
+    def test_attempts(self):
+        """Tests after a fix should be recorded as a later attempt."""
+        self.run_history.start_run('test', {})
+        for description in ('Check 1', 'Check 2'):
+            self.run_history.start_check(description)
+            self.run_history.record_test('false', 2, self.now, 1.0)
+            self.run_history.record_fix('true', False, self.now, 1.0)
+        #verifying the fixes in a batch starts each check again
+        for description in ('Check 1', 'Check 2'):
+            self.run_history.start_check(description)
+            self.run_history.record_test('false', 1, self.now, 1.0)
+        self.assertEqual(self.run_history.conn.execute(
+            "SELECT attempt, outcome FROM tests ORDER BY id").fetchall(),
+                         [(0, 2), (0, 2), (1, 1), (1, 1)])
+        self.run_history.start_run('test', {})
+        self.run_history.start_check('Check 1')
+        self.run_history.record_test('false', 2, self.now, 1.0)
+        self.assertEqual(self.run_history.conn.execute(
+            "SELECT attempt FROM tests ORDER BY id DESC").fetchone(), (0,))
+
+    def test_compact(self):
+        """Compaction should delete old runs along with their rows."""
+        for _ in range(5):
+            self._record_run([history.PASS_NO_FIX])
+        self.assertEqual(self.run_history.compact(max_runs=3,
+                                                  max_age_days=10000), 2)
+        self.assertEqual(self.run_history.compact(max_runs=3,
+                                                  max_age_days=10000), 0)
+        for table in ('runs', 'checks', 'tests'):
+            self.assertEqual(self.run_history.conn.execute(
+                "SELECT COUNT(*) FROM %s" % table).fetchone()[0], 3)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(RunHistoryTest)
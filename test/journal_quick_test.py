@@ -0,0 +1,89 @@
+"""Unit tests for journal.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import tempfile
+import journal #journal.py
+import runner #runner.py
+
+def _make_check(command='read finder', fix=None):
+    return runner.ConfigCheck(
+        tests=[{'type': 'exact match', 'command': command,
+                'command_pass': 'on', 'case_sensitive': 'true'}],
+        description='finder is on.', confidence='required', fix=fix)
+
+class JournalTest(unittest.TestCase):
+    """Tests for checkpointing and resuming the checks of a run."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'journal.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _record(self, run_journal, key, inputs='inputs'):
+        run_journal.record(key, inputs, 'pass_no_fix', 1.0, 0.5, ['a'], False)
+
+    def test_resume(self):
+        """Recorded checks should be completed in a resumed run only."""
+        run_journal = journal.Journal(self.filename, 1.0)
+        self._record(run_journal, 'a')
+        run_journal.close(finished=False)
+
+        resumed = journal.Journal(self.filename, 2.0, resume=True)
+        entry = resumed.completed('a', 'inputs')
+        self.assertEqual(entry['outcome'], 'pass_no_fix')
+        self.assertEqual(entry['failing_targets'], ['a'])
+        self.assertIsNone(resumed.completed('a', 'other inputs'))
+        self.assertIsNone(resumed.completed('b', 'inputs'))
+        self._record(resumed, 'b')
+        resumed.close(finished=False)
+
+        self.assertEqual(sorted(journal.Journal(
+            self.filename, 3.0, resume=True).entries), ['a', 'b'])
+        fresh = journal.Journal(self.filename, 4.0)
+        self.assertEqual(fresh.entries, {})
+        fresh.close(finished=True)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_interrupted_line(self):
+        """A line cut short by an interruption should be ignored, and the
+        entries after it kept."""
+        run_journal = journal.Journal(self.filename, 1.0)
+        self._record(run_journal, 'a')
+        run_journal.close(finished=False)
+        with open(self.filename, 'a') as journal_file:
+            journal_file.write('{"check": "b", "inp')
+
+        resumed = journal.Journal(self.filename, 2.0, resume=True)
+        self._record(resumed, 'c')
+        resumed.close(finished=False)
+        self.assertEqual(sorted(journal.Journal(
+            self.filename, 3.0, resume=True).entries), ['a', 'c'])
+
+    def test_damaged_file(self):
+        """A damaged journal or another format should start afresh."""
+        for content in ('', '{"format": 1', '{"format": 99}\n'):
+            with open(self.filename, 'w') as journal_file:
+                journal_file.write(content)
+            self.assertEqual(
+                journal.Journal(self.filename, 1.0, resume=True).entries, {})
+
+    def test_inputs_key(self):
+        """The inputs of a check should change with its tests and fixes and
+        the options of the run."""
+        key = journal.inputs_key(_make_check(), True, False)
+        self.assertEqual(journal.inputs_key(_make_check(), True, False), key)
+        self.assertNotEqual(journal.inputs_key(
+            _make_check(command='read dock'), True, False), key)
+        self.assertNotEqual(journal.inputs_key(
+            _make_check(fix='write finder=on'), True, False), key)
+        self.assertNotEqual(journal.inputs_key(_make_check(), False, False),
+                            key)
+        self.assertNotEqual(journal.inputs_key(_make_check(), True, True), key)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(JournalTest)
@@ -0,0 +1,76 @@
+"""Unit tests for metrics.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+import history #history.py
+import metrics #metrics.py
+import runner #runner.py
+
+def _make_result():
+    result = runner.RunResult()
+    for check_num, (description, outcome) in enumerate((
+            ('Firewall is on.', history.PASS_NO_FIX),
+            ('Dock is "hidden".', history.FAIL_FIX_SKIPPED),
+            ('Bluetooth is off.', history.FAIL_NO_FIX)), 1):
+        result.checks.append(runner.CheckOutcome(
+            check_num, description, runner.Confidence.required, outcome,
+            1476890000.0, 0.25, ()))
+    result.total_checks = 3
+    result.duration = 1.5
+    result.processes_spawned = 7
+    return result
+
+class MetricsTest(unittest.TestCase):
+    """Tests for formatting and writing metrics."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_format(self):
+        """Each check and total should be exported with its labels."""
+        lines = metrics.format_metrics(_make_result(),
+                                       runner.confidence_to_str,
+                                       finished=1476890001.0).splitlines()
+        key = history.check_key('Dock is "hidden".')
+        labels = 'check="%s",confidence="required"' % key
+        for line in (
+                'osx_config_check_check_passed{%s} 0' % labels,
+                'osx_config_check_check_failed{%s} 1' % labels,
+                'osx_config_check_check_outcome{%s,outcome="%s"} 1' %
+                (labels, history.FAIL_FIX_SKIPPED),
+                'osx_config_check_check_duration_seconds{%s} 0.25' % labels,
+                'osx_config_check_checks 3',
+                'osx_config_check_checks_passed 1',
+                'osx_config_check_checks_failed 1',
+                'osx_config_check_checks_by_outcome{outcome="%s"} 1' %
+                history.FAIL_NO_FIX,
+                'osx_config_check_processes_spawned 7',
+                'osx_config_check_run_duration_seconds 1.5',
+                'osx_config_check_last_run_timestamp_seconds 1476890001.0',
+                '# TYPE osx_config_check_checks gauge'):
+            self.assertIn(line, lines)
+
+    def test_escape(self):
+        """Label values should be escaped."""
+        self.assertEqual(metrics._escape('a "b" \\ c\n'),
+                         r'a \"b\" \\ c\n')
+
+    def test_write(self):
+        """Metrics should replace the file and be readable by everyone."""
+        filename = os.path.join(self.temp_dir, 'osx_config_check.prom')
+        metrics.write_metrics(filename, 'a 1\n')
+        metrics.write_metrics(filename, 'a 2\n')
+        with open(filename) as metrics_file:
+            self.assertEqual(metrics_file.read(), 'a 2\n')
+        self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0644)
+        self.assertEqual(os.listdir(self.temp_dir), ['osx_config_check.prom'])
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(MetricsTest)
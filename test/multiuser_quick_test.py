@@ -0,0 +1,143 @@
+"""Unit tests for multiuser.py.
+
+The users are fake home directories in a temporary directory, and the checks
+under test read and write files in them with the local shell. The commands are
+wrapped in "sh -c" so that they are executed without sourcing the API script,
+which needs bash.
+"""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import pipes
+import shutil
+import tempfile
+import history #history.py
+import runner #runner.py
+import multiuser #multiuser.py
+from .helpers import ListOutput
+
+def _make_check(command, description, fix=None, scope=None):
+    """Creates a check that passes if `command` outputs "on"."""
+    return runner.ConfigCheck(
+        tests=[{'type': 'exact match', 'command': command,
+                'command_pass': 'on', 'case_sensitive': 'true'}],
+        description=description, confidence='required', fix=fix, scope=scope)
+
+class FindHomesTest(unittest.TestCase):
+    """Tests for finding the home directories of the users."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_find_homes(self):
+        """Every directory should be a home, except for hidden and shared
+        ones."""
+        for name in ('bob', 'alice', 'Shared', '.localized'):
+            os.mkdir(os.path.join(self.root, name))
+        open(os.path.join(self.root, 'notes.txt'), 'w').close()
+        homes = multiuser.find_homes(self.root)
+        self.assertEqual([home.name for home in homes], ['alice', 'bob'])
+        self.assertEqual(homes[0].path, os.path.join(self.root, 'alice'))
+        self.assertEqual(homes[0].uid, os.getuid())
+
+class AllUsersRunnerTest(unittest.TestCase):
+    """Tests for performing the checks of every user."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name, value in (('alice', 'on'), ('bob', 'off'), ('carol', 'on')):
+            os.mkdir(os.path.join(self.root, name))
+            with open(os.path.join(self.root, name, 'setting'), 'w') as fil:
+                fil.write(value + '\n')
+        self.homes = multiuser.find_homes(self.root)
+        self.checks = [
+            _make_check('echo on', "The system is on."),
+            _make_check("sh -c 'cat $HOME/setting'", "The setting is on.",
+                        fix="sh -c 'echo on > $HOME/setting'", scope='user'),
+            _make_check('echo on', "The system preference is on.")]
+        self.output = ListOutput()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _run(self, **options):
+        options.setdefault('prompt_for_fixes', False)
+        all_users_runner = multiuser.AllUsersRunner(
+            self.checks, self.homes, runner.RunOptions(**options),
+            output=self.output)
+        return all_users_runner.run()
+
+    def test_scopes(self):
+        """System-scope checks should be performed once, and user-scope checks
+        for each home."""
+        result = self._run(attempt_fixes=False)
+        self.assertEqual([check.check_num for check in result.system.checks],
+                         [1, 3])
+        self.assertEqual(result.system.total_checks, 2)
+        self.assertEqual([home.name for home, _ in result.users],
+                         ['alice', 'bob', 'carol'])
+        outcomes = [[(check.check_num, check.outcome) for check in
+                     user_result.checks] for _, user_result in result.users]
+        self.assertEqual(outcomes, [[(2, history.PASS_NO_FIX)],
+                                    [(2, history.FAIL_FIX_SKIPPED)],
+                                    [(2, history.PASS_NO_FIX)]])
+        self.assertEqual(result.users[1][1].total_checks, 1)
+        self.assertTrue(any(message.startswith('\n[bob] CHECK #2:')
+                            for message in self.output.messages))
+
+    def test_fix_each_home(self):
+        """A fix should be applied in the home of each user whose check
+        failed, and nowhere else."""
+        result = self._run(attempt_fixes=True, jobs=3)
+        self.assertEqual([user_result.checks[0].outcome for _, user_result
+                          in result.users],
+                         [history.PASS_NO_FIX, history.PASS_AFTER_FIX,
+                          history.PASS_NO_FIX])
+        for home in self.homes:
+            with open(os.path.join(home.path, 'setting')) as setting:
+                self.assertEqual(setting.read(), 'on\n')
+
+    def test_user_environment(self):
+        """Commands should run with the home and name of their user."""
+        executor = runner.ShellExecutor(output=ListOutput(),
+                                        home=self.homes[1])
+        self.assertEqual(executor.run_status('echo $HOME $USER'),
+                         (0, '%s bob\n' % self.homes[1].path))
+        self.assertEqual(executor.run_status("sh -c 'cat ~/setting'"),
+                         (0, 'off\n'))
+
+    def test_profile_of_each_user(self):
+        """The Homebrew analytics check should read the ~/.profile of each
+        user, to which its fix writes."""
+        checks = dict((check.description, check) for check in
+                      runner.read_config('osx-config.json'))
+        self.assertEqual(checks["Current user is a non-admin account."].scope,
+                         'user')
+        check = checks["Homebrew analytics are disabled."]
+        self.assertEqual(check.scope, 'user')
+        with open(os.path.join(self.homes[0].path, '.profile'), 'w') as fil:
+            fil.write('export HOMEBREW_NO_ANALYTICS=1\n')
+        environment = os.environ.pop('HOMEBREW_NO_ANALYTICS', None)
+        try:
+            outputs = [runner.ShellExecutor(output=ListOutput(), home=home)
+                       .run_status('bash -c %s' %
+                                   pipes.quote(check.tests[0].command))[1]
+                       for home in self.homes]
+        finally:
+            if environment is not None:
+                os.environ['HOMEBREW_NO_ANALYTICS'] = environment
+        self.assertEqual(outputs, ['1\n', '0\n', '0\n'])
+
+    def test_prefixed_output(self):
+        """Every line of a message should be prefixed, but not blank ones."""
+        output = ListOutput()
+        multiuser.PrefixedOutput(output, '[bob] ').write('\nCHECK #1\nline')
+        self.assertEqual(output.messages, ['\n[bob] CHECK #1\n[bob] line'])
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(FindHomesTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(AllUsersRunnerTest)
@@ -0,0 +1,88 @@
+"""Unit tests for probe_cache.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import probe_cache #probe_cache.py
+import runner #runner.py
+
+def _make_test(command, keys=(), ttl=60):
+    return runner.CheckTest('exact match', command, '1', '0', True,
+                            probe_cache.CacheSpec(ttl, tuple(keys)), False)
+
+class ProbeCacheTest(unittest.TestCase):
+    """Tests for reusing, invalidating and storing cached results."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'cache.json')
+        self.plist = os.path.join(self.temp_dir, 'Info.plist')
+        with open(self.plist, 'w') as plist_file:
+            plist_file.write('<plist/>')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """Results should be reused by later runs until they expire."""
+        cache = probe_cache.ProbeCache(self.filename)
+        test = _make_test('echo 1', ['file:' + self.plist])
+        self.assertIsNone(cache.lookup(test))
+        cache.store(test, runner.CheckResult.explicit_pass)
+        cache.store(_make_test('echo 0', ttl=0.001),
+                    runner.CheckResult.explicit_fail)
+        time.sleep(0.01)
+        cache.save()
+        self.assertEqual(os.listdir(self.temp_dir),
+                         ['Info.plist', 'cache.json'])
+
+        cache = probe_cache.ProbeCache(self.filename)
+        self.assertEqual(len(cache.entries), 1) #the other one expired
+        self.assertEqual(cache.lookup(test), runner.CheckResult.explicit_pass)
+        self.assertIsNone(cache.lookup(test._replace(command_pass='2')))
+        time.sleep(0.01)
+        self.assertIsNone(cache.lookup(test._replace(
+            cache=probe_cache.CacheSpec(0.001, test.cache.keys))))
+        self.assertEqual(cache.entries, {})
+
+    def test_invalidation_keys(self):
+        """A result should be discarded once one of its inputs changes."""
+        cache = probe_cache.ProbeCache(self.filename)
+        test = _make_test('echo 1', ['file:' + self.plist, 'binary:sh'])
+        cache.store(test, runner.CheckResult.explicit_pass)
+        self.assertEqual(cache.lookup(test), runner.CheckResult.explicit_pass)
+        stat = os.stat(self.plist)
+        os.utime(self.plist, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(cache.lookup(test))
+
+        missing = _make_test('echo 1', ['binary:no-such-binary-here'])
+        self.assertEqual(probe_cache.fingerprint(missing.cache.keys),
+                         ['binary:no-such-binary-here missing'])
+        cache.store(missing, runner.CheckResult.no_pass)
+        self.assertEqual(cache.lookup(missing), runner.CheckResult.no_pass)
+
+    def test_purge_for_fix(self):
+        """Fixes should purge their own check and tests of their inputs."""
+        cache = probe_cache.ProbeCache(self.filename)
+        own = _make_test('read finder')
+        brew = _make_test('brew --version', ['binary:brew'])
+        other = _make_test('read dock', ['file:~/Library/Dock.plist'])
+        for test in (own, brew, other):
+            cache.store(test, runner.CheckResult.explicit_pass)
+        self.assertEqual(cache.purge_for_fix([own], 'brew install x'), 2)
+        self.assertEqual(cache.entries.keys(), [probe_cache.test_key(other)])
+        self.assertEqual(
+            cache.purge_for_fix([], 'defaults write ~/Library/Dock.plist x'), 1)
+
+    def test_damaged_cache(self):
+        """An unreadable cache file should be treated as empty."""
+        for contents in ('not json', '[]', '{"format": 1}', '{"format": 9}'):
+            with open(self.filename, 'w') as cache_file:
+                cache_file.write(contents)
+            self.assertEqual(probe_cache.ProbeCache(self.filename).entries, {})
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(ProbeCacheTest)
@@ -0,0 +1,130 @@
+"""Unit tests for readiness.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import tempfile
+import const #const.py
+import runner #runner.py
+import readiness #readiness.py
+
+class ScriptedShell(runner.Executor):
+    """Returns a scripted result for each command executed, repeating the
+    last one."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.commands = []
+
+    def run_status(self, command):
+        #strip "source api.sh"
+        self.commands.append(command.split(' ; ', 1)[1])
+        if len(self.results) > 1:
+            return self.results.pop(0)
+        return self.results[0]
+
+class FakeClock(object):
+    """A clock that only advances when sleeping."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class WaitConditionTest(unittest.TestCase):
+    """Tests for the conditions of fixes in the config."""
+
+    def test_from_dict(self):
+        """A condition should have exactly one kind and a positive timeout."""
+        condition = readiness.WaitCondition.from_dict(
+            {'process_gone': 'Safari'})
+        self.assertEqual(condition, ('process_gone', 'Safari',
+                                     const.DEFAULT_WAIT_TIMEOUT))
+        self.assertEqual(readiness.WaitCondition.from_dict(
+            {'command': 'true', 'timeout': 2}).timeout, 2.0)
+        for spec in ({}, {'process_gone': 'Mail', 'command': 'true'},
+                     {'command': 'true', 'timeout': 0},
+                     {'key_readable': 'com.apple.Safari'}):
+            with self.assertRaises(AssertionError):
+                readiness.WaitCondition.from_dict(spec)
+
+    def test_commands(self):
+        """The commands of conditions should quote their arguments."""
+        for spec, command in (
+                ({'process_gone': 'System Preferences'},
+                 "killall -0 'System Preferences'"),
+                ({'file_updated': '~/Library/My Prefs.plist'},
+                 "cksum ~/'Library/My Prefs.plist'"),
+                ({'file_updated': '/Library/Prefs.plist'},
+                 "cksum /Library/Prefs.plist"),
+                ({'key_readable': 'com.apple.Safari Auto Fill'},
+                 "defaults read com.apple.Safari 'Auto Fill'"),
+                ({'command': 'pgrep -q Dock'}, 'pgrep -q Dock')):
+            self.assertEqual(readiness.WaitCondition.from_dict(spec).command(),
+                             command)
+
+class WaitUntilTest(unittest.TestCase):
+    """Tests for polling a condition with exponential backoff."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.process_gone = readiness.WaitCondition('process_gone', 'Safari',
+                                                    1.0)
+
+    def _wait(self, condition, shell, before=''):
+        return readiness.wait_until(condition, shell, before,
+                                    sleep=self.clock.sleep,
+                                    clock=self.clock.time)
+
+    def test_backoff(self):
+        """The delays should double until the condition holds."""
+        shell = ScriptedShell([(0, '')] * 4 + [(1, 'No matching processes')])
+        self.assertEqual(self._wait(self.process_gone, shell), (True, 5))
+        self.assertEqual(self.clock.sleeps, [0.05, 0.1, 0.2, 0.4])
+        self.assertEqual(shell.commands, ["killall -0 Safari"] * 5)
+
+    def test_ready_at_once(self):
+        """A condition that holds right away should not wait at all."""
+        shell = ScriptedShell([(1, '')])
+        self.assertEqual(self._wait(self.process_gone, shell), (True, 1))
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_timeout(self):
+        """Polling should stop at the timeout, with delays of at most
+        `const.WAIT_MAX_DELAY`."""
+        shell = ScriptedShell([(0, '')])
+        condition = self.process_gone._replace(timeout=3.0)
+        #the last evaluation is at the timeout
+        self.assertEqual(self._wait(condition, shell), (False, 8))
+        self.assertEqual(self.clock.sleeps[:-1], [0.05, 0.1, 0.2, 0.4, 0.8,
+                                                  1.0])
+        self.assertAlmostEqual(self.clock.sleeps[-1], 0.45)
+
+    def test_file_updated(self):
+        """A file should count as updated once its contents differ from
+        before the fix."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, 'prefs.plist')
+            with open(filename, 'w') as prefs:
+                prefs.write('old')
+            condition = readiness.WaitCondition('file_updated', filename, 1.0)
+            shell = runner.ShellExecutor()
+            before = readiness.snapshot(condition, shell)
+            self.assertFalse(self._wait(condition, shell, before)[0])
+            with open(filename, 'w') as prefs:
+                prefs.write('new')
+            self.assertEqual(self._wait(condition, shell, before), (True, 1))
+        finally:
+            shutil.rmtree(temp_dir)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(WaitConditionTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(WaitUntilTest)
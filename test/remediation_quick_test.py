@@ -0,0 +1,126 @@
+"""Unit tests for remediation.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+import remediation #remediation.py
+
+class PlanTest(unittest.TestCase):
+    """Tests for writing and reading remediation plans."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.plan_filename = os.path.join(self.temp_dir, 'plan.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """A plan that is read back should equal the plan written."""
+        entries = [
+            remediation.PlanEntry(3, 'abc', u'Check \xe9', 'required',
+                                  fix='true', approved=True),
+            remediation.PlanEntry(7, 'def', 'Another check', 'experimental',
+                                  sudo_fix='sudo true', manual_fix='Do it.')]
+        remediation.write_plan(self.plan_filename, entries, 'test')
+        self.assertEqual(os.listdir(self.temp_dir), ['plan.json'])
+        self.assertEqual(
+            [entry.to_dict() for entry in
+             remediation.read_plan(self.plan_filename)],
+            [entry.to_dict() for entry in entries])
+
+    def test_invalid_plans(self):
+        """Missing files and malformed plans should raise `PlanError`."""
+        with self.assertRaises(remediation.PlanError):
+            remediation.read_plan(self.plan_filename)
+        for plan in ('not json', '[]', '{"format": 2, "checks": []}',
+                     '{"format": 1}',
+                     '{"format": 1, "checks": [{"check_num": 1}]}',
+                     '{"format": 1, "checks": [3]}'):
+            with open(self.plan_filename, 'w') as plan_file:
+                plan_file.write(plan)
+            with self.assertRaises(remediation.PlanError):
+                remediation.read_plan(self.plan_filename)
+
+    def test_hand_edited_plan(self):
+        """Optional attributes may be left out of a plan."""
+        with open(self.plan_filename, 'w') as plan_file:
+            json.dump({'format': 1, 'checks': [
+                {'check_num': '2', 'check_key': 'abc',
+                 'description': 'Check', 'confidence': 'recommended'}]},
+                      plan_file)
+        entry, = remediation.read_plan(self.plan_filename)
+        self.assertEqual(entry.check_num, 2)
+        self.assertFalse(entry.approved)
+        self.assertIsNone(entry.fix)
+
+class MapInOrderTest(unittest.TestCase):
+    """Tests for evaluating items concurrently."""
+
+    def test_order_and_threads(self):
+        """Results should be in order, serial items in the calling thread."""
+        threads = {}
+        def evaluate(item):
+            #finish later items first to expose ordering bugs
+            time.sleep(0.01 * (10 - item))
+            threads[item] = threading.current_thread()
+            return item * item
+        items = range(10)
+        self.assertEqual(
+            list(remediation.map_in_order(evaluate, items, 4,
+                                          in_parallel=lambda item: item % 3)),
+            [item * item for item in items])
+        main_thread = threading.current_thread()
+        self.assertEqual(
+            sorted(item for item in items if threads[item] is main_thread),
+            [0, 3, 6, 9])
+
+    def test_concurrency(self):
+        """Up to `jobs` items should be processed at the same time."""
+        started = time.time()
+        results = list(remediation.map_in_order(
+            lambda item: time.sleep(0.2) or item, range(4), 4))
+        self.assertEqual(results, range(4))
+        self.assertLess(time.time() - started, 0.6)
+
+    def test_priority(self):
+        """Workers should start on the items with the highest priority."""
+        started = []
+        def evaluate(item):
+            started.append(item)
+            return item
+        items = [1, 5, 2, 5, 3]
+        self.assertEqual(
+            list(remediation.map_in_order(evaluate, items, 2,
+                                          priority=lambda item: item)),
+            items)
+        self.assertEqual(sorted(started[:2]), [5, 5])
+
+    def test_serial(self):
+        """A single job should process every item in the calling thread."""
+        main_thread = threading.current_thread()
+        self.assertEqual(
+            list(remediation.map_in_order(
+                lambda item: threading.current_thread() is main_thread,
+                range(3), 1)),
+            [True] * 3)
+
+    def test_exception(self):
+        """An exception in a worker should propagate to the caller."""
+        def evaluate(item):
+            if item == 2:
+                raise ValueError(item)
+            return item
+        results = remediation.map_in_order(evaluate, range(5), 3)
+        self.assertEqual([next(results), next(results)], [0, 1])
+        with self.assertRaises(ValueError):
+            next(results)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(PlanTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(MapInOrderTest)
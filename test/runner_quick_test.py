@@ -0,0 +1,845 @@
+"""Unit tests for runner.py.
+
+The shell commands of the checks under test are interpreted by `FakeShell`
+instead of a real shell, so these tests do not depend on OS X.
+"""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import warnings
+import time
+import os
+import json
+import tempfile
+import threading
+import const #const.py
+import history #history.py
+import cassette #cassette.py
+import runner #runner.py
+import readiness #readiness.py
+import governor #governor.py
+from .helpers import ListOutput
+
+class FakeShell(runner.Executor):
+    """Runs "read KEY", "write KEY=VALUE" and other commands against a dict.
+
+    "read-all PREFIX" lists every setting whose key starts with PREFIX as the
+    targets of a `per_target` test. "fail" exits with status 1. Every command
+    executed is appended to `commands`. Commands other than reads and writes
+    only have that effect.
+    """
+
+    def __init__(self):
+        self.settings = {}
+        self.commands = []
+
+    def run_status(self, command):
+        command = command.split(' ; ', 1)[1] #strip "source api.sh"
+        self.commands.append(command)
+        verb, _, arg = command.partition(' ')
+        if verb == 'read':
+            return 0, self.settings.get(arg, 'unset') + '\n'
+        elif verb == 'read-all':
+            return 0, ''.join("%s\t%s\n" % (key, value) for key, value
+                              in sorted(self.settings.iteritems())
+                              if key.startswith(arg))
+        elif verb == 'write':
+            key, value = arg.split('=')
+            self.settings[key] = value
+        elif verb == 'fail':
+            return 1, ''
+        return 0, ''
+
+def _make_check(key, fix=None, restart=None, sudo_fix=None,
+                sudo_restart=None):
+    """Creates a check that passes if setting `key` is "on"."""
+    return runner.ConfigCheck(
+        tests=[{'type': 'exact match', 'command': 'read %s' % key,
+                'command_pass': 'on', 'case_sensitive': 'true'}],
+        description="%s is on." % key, confidence='required', fix=fix,
+        sudo_fix=sudo_fix, restart=restart, sudo_restart=sudo_restart)
+
+class FixTest(unittest.TestCase):
+    """Tests for applying fixes and their restart commands."""
+
+    def setUp(self):
+        self.shell = FakeShell()
+        self.runner = runner.Runner([], executor=self.shell,
+                                    output=ListOutput())
+
+    def test_single_fix_restarts_immediately(self):
+        """A fix applied on its own should be restarted right away."""
+        check = _make_check('finder', fix='write finder=on',
+                            restart='killall Dock')
+        self.assertTrue(self.runner.do_fix_and_test(check))
+        self.assertEqual(self.shell.commands,
+                         ['write finder=on', 'killall Dock', 'read finder'])
+
+    def test_batch_restarts_once(self):
+        """Each distinct restart should run once, after all of the fixes."""
+        checks = [_make_check('finder', fix='write finder=on',
+                              restart='killall Dock'),
+                  _make_check('dock', fix='write dock=on',
+                              restart='killall Dock'),
+                  _make_check('bluetooth', fix='write bluetooth=on',
+                              restart='killall -HUP blued'),
+                  _make_check('firewall', fix='write firewall=off')]
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            fixed = self.runner.do_fixes_and_test(list(enumerate(checks, 1)))
+        self.assertEqual(len(caught), 1) #the firewall fix failed
+        self.assertEqual(fixed, {1: True, 2: True, 3: True, 4: False})
+        self.assertEqual(self.shell.commands,
+                         ['write finder=on', 'write dock=on',
+                          'write bluetooth=on', 'write firewall=off',
+                          'killall Dock', 'killall -HUP blued',
+                          'read finder', 'read dock', 'read bluetooth',
+                          'read firewall'])
+
+    def test_failed_fix_not_restarted(self):
+        """A restart should only run for fixes that exited with status 0."""
+        check = _make_check('finder', fix='fail finder',
+                            restart='killall Dock')
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            self.assertFalse(self.runner.do_fix_and_test(check))
+            self.assertEqual(self.shell.commands,
+                             ['fail finder', 'read finder'])
+
+            self.shell.commands = []
+            checks = [check, _make_check('bluetooth', fix='write bluetooth=on',
+                                         restart='killall -HUP blued')]
+            fixed = self.runner.do_fixes_and_test(list(enumerate(checks, 1)))
+        self.assertEqual(fixed, {1: False, 2: True})
+        self.assertEqual(self.shell.commands,
+                         ['fail finder', 'write bluetooth=on',
+                          'killall -HUP blued', 'read finder',
+                          'read bluetooth'])
+
+    def test_batch_sudo_fallback(self):
+        """Only checks still failing should be retried with sudo fixes."""
+        checks = [_make_check('finder', fix='write finder=on',
+                              restart='killall Dock',
+                              sudo_fix='sudo write finder=on',
+                              sudo_restart='sudo killall Dock'),
+                  _make_check('bluetooth', fix='write bluetooth=off',
+                              restart='killall -HUP blued',
+                              sudo_fix='write bluetooth=on',
+                              sudo_restart='sudo killall -HUP blued'),
+                  _make_check('infrared', sudo_fix='write infrared=on')]
+        fixed = self.runner.do_fixes_and_test(list(enumerate(checks, 1)))
+        self.assertEqual(fixed, {1: True, 2: True, 3: True})
+        self.assertEqual(self.shell.commands,
+                         ['write finder=on', 'write bluetooth=off',
+                          'killall Dock', 'killall -HUP blued',
+                          'read finder', 'read bluetooth',
+                          'write bluetooth=on', 'write infrared=on',
+                          'sudo killall -HUP blued',
+                          'read bluetooth', 'read infrared'])
+
+class SlowShell(FakeShell):
+    """A `FakeShell` that yields to other threads before each command."""
+
+    def run_status(self, command):
+        time.sleep(0.001)
+        return FakeShell.run_status(self, command)
+
+class InterruptedShell(FakeShell):
+    """A `FakeShell` that is interrupted when it is about to run a command."""
+
+    def __init__(self, interrupt_at):
+        FakeShell.__init__(self)
+        self.interrupt_at = interrupt_at
+
+    def run_status(self, command):
+        if command.endswith(self.interrupt_at):
+            raise KeyboardInterrupt()
+        return FakeShell.run_status(self, command)
+
+class ConcurrencyShell(FakeShell):
+    """A `FakeShell` that records how many commands of the checks made by
+    `RunnerTest.test_heavy_jobs` ran at once."""
+
+    def __init__(self):
+        FakeShell.__init__(self)
+        self.running = {'heavy': 0, 'light': 0}
+        self.most_running = {'heavy': 0, 'light': 0}
+        self.lock = threading.Lock()
+
+    def run_status(self, command):
+        cost = 'heavy' if int(command[-1]) < 6 else 'light'
+        with self.lock:
+            self.running[cost] += 1
+            self.most_running[cost] = max(self.most_running[cost],
+                                          self.running[cost])
+        time.sleep(0.05)
+        with self.lock:
+            self.running[cost] -= 1
+        return FakeShell.run_status(self, command)
+
+def _make_manual_check(key):
+    """Creates a check for setting `key` that can only be fixed manually."""
+    return runner.ConfigCheck(
+        tests=[{'type': 'exact match', 'command': 'read %s' % key,
+                'command_pass': 'on', 'case_sensitive': 'true'}],
+        description="%s is on." % key, confidence='recommended',
+        manual_fix="Turn %s on." % key)
+
+class RunnerTest(unittest.TestCase):
+    """Tests for complete runs and their results."""
+
+    def setUp(self):
+        self.checks = [_make_check('finder', fix='write finder=on'),
+                       _make_check('dock', fix='write dock=off'),
+                       _make_manual_check('firewall'),
+                       _make_check('bluetooth', fix='write bluetooth=on')]
+
+    def _run(self, shell, **options):
+        check_runner = runner.Runner(
+            self.checks, runner.RunOptions(**options), executor=shell,
+            output=ListOutput(), ask=lambda question, default: True)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            return check_runner.run()
+
+    def test_result(self):
+        """The result should list the outcome of every check in order."""
+        shell = FakeShell()
+        shell.settings['bluetooth'] = 'on'
+        result = self._run(shell)
+        self.assertEqual(result.total_checks, 4)
+        self.assertEqual([(check.check_num, check.outcome)
+                          for check in result.checks],
+                         [(1, history.PASS_AFTER_FIX),
+                          (2, history.FAIL_FIX_FAIL),
+                          (3, history.FAIL_NO_FIX),
+                          (4, history.PASS_NO_FIX)])
+        self.assertEqual(result.checks[2].description, 'firewall is on.')
+        self.assertEqual(result.manual_fixes, [3])
+        self.assertEqual((result.passed, result.failed), (2, 1))
+
+        result = self._run(FakeShell(), attempt_fixes=False)
+        self.assertEqual(result.count(history.FAIL_FIX_SKIPPED), 4)
+        self.assertEqual(result.manual_fixes, [])
+
+    def test_two_phase_result(self):
+        """Two-phase runs should produce the same result as normal runs."""
+        for jobs in (1, 4):
+            shell = FakeShell()
+            shell.settings['bluetooth'] = 'on'
+            result = self._run(shell, two_phase=True, jobs=jobs)
+            self.assertEqual([check.outcome for check in result.checks],
+                             [history.PASS_AFTER_FIX, history.FAIL_FIX_FAIL,
+                              history.FAIL_NO_FIX, history.PASS_NO_FIX])
+            self.assertEqual(result.manual_fixes, [3])
+
+    def test_runs_are_independent(self):
+        """Each run should start from scratch and record its own history."""
+        handle, db_filename = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        try:
+            check_runner = runner.Runner(
+                self.checks, runner.RunOptions(history_db=db_filename,
+                                               attempt_fixes=False),
+                executor=FakeShell(), output=ListOutput())
+            first = check_runner.run()
+            second = check_runner.run()
+            self.assertIsNot(first, second)
+            self.assertEqual(len(first.checks), 4)
+            self.assertEqual(len(second.checks), 4)
+            run_history = history.RunHistory(db_filename)
+            try:
+                self.assertEqual(len(run_history.check_history(
+                    history.check_key('dock is on.'))), 2)
+            finally:
+                run_history.close()
+        finally:
+            os.remove(db_filename)
+
+    def test_probe_cache(self):
+        """Cached tests should be skipped until a fix purges them."""
+        handle, cache_filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        cached = runner.ConfigCheck(
+            tests=[{'type': 'exact match', 'command': 'read brew',
+                    'command_pass': 'on', 'case_sensitive': 'true',
+                    'cache': {'ttl': 60, 'keys': ['binary:brew']}}],
+            description='brew is on.', confidence='required',
+            fix='write brew=on')
+        self.checks = [cached, _make_check('dock')]
+        try:
+            shell = FakeShell()
+            shell.settings['brew'] = 'on'
+            for _ in range(2):
+                result = self._run(shell, probe_cache=cache_filename)
+                self.assertEqual(result.checks[0].outcome,
+                                 history.PASS_NO_FIX)
+            self.assertEqual(shell.commands, ['read brew', 'read dock',
+                                              'read dock'])
+
+            #the fix purges the failing result before verifying itself
+            os.remove(cache_filename)
+            shell = FakeShell()
+            result = self._run(shell, probe_cache=cache_filename)
+            self.assertEqual(result.checks[0].outcome, history.PASS_AFTER_FIX)
+            self.assertEqual(shell.commands[:3], ['read brew', 'write brew=on',
+                                                  'read brew'])
+        finally:
+            os.remove(cache_filename)
+
+    def _write_durations(self, seconds_by_key):
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as durations_file:
+            json.dump({'format': 1, 'durations': dict(
+                (history.check_key("%s is on." % key), seconds)
+                for key, seconds in seconds_by_key.iteritems())},
+                      durations_file)
+        return filename
+
+    def test_time_budget(self):
+        """With a time budget, the cheapest and most important checks should
+        be performed first, and the others left out."""
+        durations_filename = self._write_durations(
+            {'finder': 0.2, 'dock': 50.0, 'firewall': 0.01,
+             'bluetooth': 0.01})
+        try:
+            for two_phase in (False, True):
+                shell = FakeShell()
+                result = self._run(shell, attempt_fixes=False,
+                                   two_phase=two_phase, time_budget=10.0,
+                                   durations_file=durations_filename)
+                self.assertEqual(shell.commands[:2],
+                                 ['read bluetooth', 'read finder'])
+                self.assertEqual(result.not_evaluated, [2])
+                self.assertEqual([check.check_num for check in result.checks],
+                                 [1, 2, 3, 4])
+                self.assertEqual(result.checks[2].outcome,
+                                 history.FAIL_FIX_SKIPPED)
+        finally:
+            os.remove(durations_filename)
+
+    def test_durations(self):
+        """The duration of each check's tests should be averaged and saved."""
+        durations_filename = self._write_durations({'dock': 100.0})
+        try:
+            self._run(FakeShell(), attempt_fixes=False,
+                      durations_file=durations_filename)
+            with open(durations_filename) as durations_file:
+                saved = json.load(durations_file)['durations']
+            self.assertEqual(len(saved), 4)
+            self.assertLess(saved[history.check_key('dock is on.')], 100.0)
+            self.assertGreater(saved[history.check_key('dock is on.')], 60.0)
+        finally:
+            os.remove(durations_filename)
+
+    def test_per_target(self):
+        """Only the failing targets should be reported and fixed."""
+        self.checks = [runner.ConfigCheck(
+            tests=[{'type': 'exact match', 'command': 'read-all profiles/',
+                    'command_pass': 'on', 'case_sensitive': 'true',
+                    'per_target': True}],
+            description='All profiles are on.', confidence='required',
+            fix='write {target}=on')]
+        for two_phase in (False, True):
+            shell = FakeShell()
+            shell.settings.update({'profiles/a': 'on', 'profiles/b': 'off',
+                                   'profiles/c': 'unset'})
+            result = self._run(shell, attempt_fixes=False, two_phase=two_phase)
+            self.assertEqual(result.checks[0].failing_targets,
+                             ('profiles/b', 'profiles/c'))
+
+            result = self._run(shell, two_phase=two_phase)
+            self.assertEqual(result.checks[0].outcome, history.PASS_AFTER_FIX)
+            self.assertEqual(result.checks[0].failing_targets, ())
+            self.assertEqual(shell.commands[1:],
+                             ['read-all profiles/', 'write profiles/b=on',
+                              'write profiles/c=on', 'read-all profiles/'])
+
+    def test_per_target_untargeted_output(self):
+        """Output that names no target should keep the test from passing."""
+        check = runner.ConfigCheck(
+            tests=[{'type': 'exact match', 'command': 'read-all profiles/',
+                    'command_pass': 'on', 'case_sensitive': 'true',
+                    'per_target': True}],
+            description='All profiles are on.', confidence='required',
+            fix='write {target}=on')
+        shell = FakeShell()
+        check_runner = runner.Runner([check], executor=shell,
+                                     output=ListOutput())
+        shell.settings['profiles/a'] = 'on'
+        self.assertEqual(check_runner.evaluate_tests(check)[0],
+                         runner.CheckResult.explicit_pass)
+        shell.settings['profiles/b'] = 'on\nError: invalid JSON'
+        self.assertEqual(check_runner.evaluate_tests(check)[0],
+                         runner.CheckResult.no_pass)
+        shell.settings.clear()
+        result, test_runs = check_runner.evaluate_tests(check)
+        self.assertEqual(result, runner.CheckResult.no_pass)
+        self.assertIsNone(test_runs[0][4])
+
+    def test_metrics_file(self):
+        """The result of each run should be written as metrics."""
+        handle, metrics_filename = tempfile.mkstemp(suffix='.prom')
+        os.close(handle)
+        try:
+            result = self._run(FakeShell(), attempt_fixes=False,
+                               metrics_file=metrics_filename)
+            with open(metrics_filename) as metrics_file:
+                text = metrics_file.read()
+            self.assertIn('osx_config_check_checks_failed %d\n' % result.failed,
+                          text)
+            self.assertIn('osx_config_check_processes_spawned 0\n', text)
+            self.assertGreater(result.duration, 0)
+        finally:
+            os.remove(metrics_filename)
+
+    def test_resume(self):
+        """A resumed run should only perform the checks that the interrupted
+        run did not complete, or whose inputs changed."""
+        handle, journal_filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            shell = InterruptedShell('read firewall')
+            self.assertRaises(KeyboardInterrupt, self._run, shell,
+                              journal_file=journal_filename)
+            with open(journal_filename) as journal_file:
+                interrupted = journal_file.read()
+            self.assertEqual(len(interrupted.splitlines()), 3)
+
+            shell = FakeShell()
+            result = self._run(shell, journal_file=journal_filename,
+                               resume=True)
+            self.assertEqual(shell.commands[0], 'read firewall')
+            self.assertNotIn('read finder', shell.commands)
+            self.assertEqual([check.outcome for check in result.checks],
+                             [history.PASS_AFTER_FIX, history.FAIL_FIX_FAIL,
+                              history.FAIL_NO_FIX, history.PASS_AFTER_FIX])
+            self.assertEqual(result.manual_fixes, [3])
+            self.assertEqual(result.passed, 2)
+            self.assertFalse(os.path.exists(journal_filename))
+
+            with open(journal_filename, 'w') as journal_file:
+                journal_file.write(interrupted)
+            self.checks[0] = _make_check('finder', fix='write finder=yes')
+            shell = FakeShell()
+            result = self._run(shell, journal_file=journal_filename,
+                               resume=True, two_phase=True)
+            self.assertIn('read finder', shell.commands)
+            self.assertNotIn('read dock', shell.commands)
+            self.assertEqual(result.checks[0].outcome, history.FAIL_FIX_FAIL)
+            self.assertEqual(result.checks[1].outcome, history.FAIL_FIX_FAIL)
+        finally:
+            if os.path.exists(journal_filename):
+                os.remove(journal_filename)
+
+    def test_selected_checks(self):
+        """Only the checks selected by the options should be performed."""
+        for two_phase in (False, True):
+            shell = FakeShell()
+            result = self._run(shell, attempt_fixes=False,
+                               two_phase=two_phase, checks=set([2, 4]))
+            #two-phase evaluates the checks concurrently
+            self.assertEqual(sorted(shell.commands),
+                             ['read bluetooth', 'read dock'])
+            self.assertEqual([check.check_num for check in result.checks],
+                             [2, 4])
+            self.assertEqual(result.total_checks, 2)
+
+    def test_wait_for_fix(self):
+        """Fixes should be waited for after their restart and before they are
+        verified, in a batch after every restart."""
+        for two_phase in (False, True):
+            self.checks = [_make_check('finder', fix='write finder=on',
+                                       restart='killall Finder'),
+                           _make_check('dock', fix='write dock=on')]
+            self.checks[0].wait_until = readiness.WaitCondition(
+                'command', 'settled finder', 1.0)
+            shell = FakeShell()
+            result = self._run(shell, prompt_for_fixes=False,
+                               two_phase=two_phase)
+            self.assertEqual(result.passed, 2)
+            commands = [command for command in shell.commands
+                        if not command.startswith('read')]
+            if two_phase:
+                self.assertEqual(commands, ['write finder=on', 'write dock=on',
+                                            'killall Finder',
+                                            'settled finder'])
+            else:
+                self.assertEqual(commands, ['write finder=on',
+                                            'killall Finder', 'settled finder',
+                                            'write dock=on'])
+
+    def test_heavy_jobs(self):
+        """Only `max_heavy` commands of heavy checks should run at once."""
+        self.checks = [runner.ConfigCheck(
+            tests=[{'type': 'exact match', 'command': 'read key%d' % index,
+                    'command_pass': 'on', 'case_sensitive': 'true'}],
+            description="key%d is on." % index, confidence='required',
+            cost='heavy' if index < 6 else 'light') for index in range(10)]
+        shell = ConcurrencyShell()
+        result = self._run(shell, attempt_fixes=False, two_phase=True, jobs=10,
+                           resource_limits=governor.ResourceLimits(
+                               max_heavy=2))
+        self.assertEqual(len(result.checks), 10)
+        self.assertEqual(shell.most_running['heavy'], 2)
+        self.assertGreater(shell.most_running['light'], 2)
+
+    def test_concurrent_runners(self):
+        """Runners in different threads should not affect each other."""
+        shells = []
+        for index in range(8):
+            shell = SlowShell()
+            if index % 2 == 0:
+                shell.settings['dock'] = 'on'
+            shells.append(shell)
+        results = [None] * len(shells)
+
+        def run(index):
+            results[index] = self._run(shells[index],
+                                       two_phase=index % 4 < 2)
+        threads = [threading.Thread(target=run, args=(index,))
+                   for index in range(len(shells))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, result in enumerate(results):
+            self.assertEqual([check.check_num for check in result.checks],
+                             [1, 2, 3, 4])
+            self.assertEqual(result.checks[1].outcome,
+                             history.PASS_NO_FIX if index % 2 == 0
+                             else history.FAIL_FIX_FAIL)
+            self.assertEqual(result.manual_fixes, [3])
+            self.assertEqual(shells[index].settings['finder'], 'on')
+
+class CassetteRunTest(unittest.TestCase):
+    """Tests for recording the commands of a run and replaying them."""
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix='.json.gz')
+        os.close(handle)
+        self.checks = [_make_check('finder', fix='write finder=on',
+                                   restart='killall Dock'),
+                       _make_check('dock', fix='write dock=off'),
+                       _make_manual_check('firewall')]
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def _run(self, executor=None, **options):
+        check_runner = runner.Runner(
+            self.checks, runner.RunOptions(**options), executor=executor,
+            output=ListOutput(), ask=lambda question, default: True)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            return check_runner, check_runner.run()
+
+    def test_replay_matches_recording(self):
+        """A replay should reach the same outcomes without any real shell."""
+        shell = FakeShell()
+        _, recorded = self._run(shell, record=self.filename)
+        self.assertEqual(len(cassette.read_cassette(self.filename)),
+                         len(shell.commands))
+
+        check_runner, replayed = self._run(replay=self.filename)
+        self.assertIsInstance(check_runner.executor, runner.ReplayExecutor)
+        self.assertEqual(check_runner.executor.misses, 0)
+        self.assertEqual([check.outcome for check in replayed.checks],
+                         [check.outcome for check in recorded.checks])
+        self.assertEqual(replayed.checks[0].outcome, history.PASS_AFTER_FIX)
+        self.assertEqual(replayed.manual_fixes, recorded.manual_fixes)
+
+    def test_replay_missing_commands(self):
+        """Commands missing from the cassette should produce no output."""
+        cassette.write_cassette(self.filename, cassette.Cassette(), 'test')
+        check_runner, result = self._run(replay=self.filename,
+                                         attempt_fixes=False)
+        self.assertEqual(check_runner.executor.misses, 3)
+        self.assertEqual(result.count(history.FAIL_FIX_SKIPPED), 3)
+
+    def test_record_complete_output(self):
+        """The complete output and exit status of a test command should be
+        recorded, even though its result was decided early."""
+        check = runner.ConfigCheck(
+            tests=[{'type': 'exact match', 'command': 'seq 1 300000',
+                    'command_pass': '1', 'case_sensitive': 'true'}],
+            description='Counts.', confidence='required')
+        executor = runner.RecordingExecutor(
+            runner.ShellExecutor(output=ListOutput()), self.filename)
+        check_runner = runner.Runner([check], executor=executor,
+                                     output=ListOutput())
+        self.assertEqual(check_runner.run_check(check),
+                         runner.CheckResult.no_pass)
+        executor.close()
+        (_, results), = cassette.read_cassette(self.filename).commands.items()
+        status, _, output = results[0]
+        self.assertEqual(status, 0)
+        self.assertEqual(output, ''.join('%d\n' % number
+                                         for number in xrange(1, 300001)))
+
+class ReadConfigTest(unittest.TestCase):
+    """Tests for the representation of checks read from a config file."""
+
+    def setUp(self):
+        handle, self.config_filename = tempfile.mkstemp(suffix='.json')
+        check = {'description': u'Check', 'confidence': u'recommended',
+                 'tests': [{'type': u'exact match', 'command': u'read key',
+                            'command_pass': 1, 'command_fail': u'0',
+                            'case_sensitive': u'false'}],
+                 'fix': {'command': u'write key=1', 'restart': u'killall X',
+                         'wait_until': {'process_gone': u'X'}}}
+        other_check = {'description': u'Check \xe9', 'confidence': u'required',
+                       'tests': check['tests'] * 2,
+                       'fix': {'manual': u'Do it \xe9.'}, 'cost': u'heavy',
+                       'scope': u'user'}
+        with os.fdopen(handle, 'w') as config_file:
+            json.dump([{'_comment': 'generated'}, check, other_check,
+                       dict(other_check)], config_file)
+        self.checks = runner.read_config(self.config_filename)
+
+    def tearDown(self):
+        os.remove(self.config_filename)
+
+    def test_records(self):
+        """Checks and tests should be compact, immutable records."""
+        self.assertEqual(len(self.checks), 3)
+        check = self.checks[0]
+        self.assertFalse(hasattr(check, '__dict__'))
+        self.assertEqual(check.confidence, runner.Confidence.recommended)
+        self.assertEqual(check.restart, 'killall X')
+        self.assertEqual(check.wait_until, ('process_gone', 'X',
+                                            const.DEFAULT_WAIT_TIMEOUT))
+        self.assertIsNone(self.checks[1].wait_until)
+        self.assertIsNone(check.sudo_fix)
+        self.assertEqual(check.cost, 'light')
+        self.assertEqual(self.checks[1].cost, 'heavy')
+        self.assertEqual(check.scope, 'system')
+        self.assertEqual(self.checks[1].scope, 'user')
+        test = check.tests[0]
+        self.assertIsInstance(test, runner.CheckTest)
+        self.assertEqual(test, ('exact match', 'read key', '1', '0', True,
+                                None, False))
+        with self.assertRaises(AttributeError):
+            test.command = 'true'
+
+    def test_infer_scope(self):
+        """Checks of the home directory or the current user's preferences
+        should be user-scope."""
+        for command, scope in (
+                ('defaults read ~/Library/Preferences/com.apple.Safari X',
+                 'user'),
+                ('ls $HOME/Library/LaunchAgents', 'user'),
+                ('defaults -currentHost read com.apple.screensaver X', 'user'),
+                ('defaults read NSGlobalDomain X', 'user'),
+                ('defaults read /Library/Preferences/com.apple.alf X',
+                 'system'),
+                ('defaults read "/Library/Preferences/com.apple.alf" X',
+                 'system'),
+                ('defaults read $PREF X', 'system'),
+                ('[[ -n $HOMEBREW_NO_ANALYTICS ]] && echo 1', 'system'),
+                ('fdesetup status', 'system')):
+            test = runner.CheckTest('exact match', command, '1', None, False,
+                                    None, False)
+            self.assertEqual(runner.infer_scope([test]), scope, command)
+
+    def test_per_target_not_cached(self):
+        """A per_target test should be rejected if it has a cache, as a cached
+        result has no failing targets to fix."""
+        test = {'type': 'exact match', 'command': 'read-all profiles/',
+                'command_pass': 'on', 'case_sensitive': 'true',
+                'per_target': True, 'cache': {'ttl': 60}}
+        with self.assertRaises(AssertionError):
+            runner.ConfigCheck(tests=[test], description='Profiles are on.',
+                               confidence='required')
+
+    def test_select_checks(self):
+        """Checks should be selected by number, description and tags."""
+        self.assertEqual(runner.select_checks(self.checks), set([1, 2, 3]))
+        self.assertEqual(runner.select_checks(self.checks, check='2'),
+                         set([2]))
+        self.assertEqual(runner.select_checks(self.checks, check=u'CHECK \xc9'),
+                         set([2, 3]))
+        self.assertEqual(runner.select_checks(self.checks, tags=['user']),
+                         set([2, 3]))
+        self.assertEqual(runner.select_checks(
+            self.checks, tags=['recommended', 'required', 'light']), set([1]))
+        self.assertEqual(runner.select_checks(
+            self.checks, check='1', tags=['heavy']), set())
+        with self.assertRaises(ValueError):
+            runner.select_checks(self.checks, tags=['fast'])
+
+    def test_interned_strings(self):
+        """Equal strings should be shared, ASCII strings stored as `str`."""
+        first, second, third = self.checks
+        self.assertIs(first.tests[0].command, second.tests[1].command)
+        self.assertIs(second.description, third.description)
+        self.assertIs(second.manual_fix, third.manual_fix)
+        self.assertIs(type(first.description), str)
+        self.assertIs(type(second.description), unicode)
+        self.assertIs(runner.intern_string(u'read key'), first.tests[0].command)
+
+def _match_buffered(output, comparison_type, case_sensitive, command_pass,
+                    command_fail):
+    """Matches complete output the way `_execute_check` used to."""
+    output = output.strip()
+    for result, condition in ((runner.CheckResult.explicit_fail, command_fail),
+                              (runner.CheckResult.explicit_pass, command_pass)):
+        if condition is None:
+            continue
+        if comparison_type == 'exact match':
+            if case_sensitive and output == condition:
+                return result
+            if not case_sensitive and output.lower() == condition.lower():
+                return result
+        elif runner.is_match(condition, output, ignore_case=not case_sensitive):
+            return result
+    return runner.CheckResult.no_pass
+
+class OutputMatcherTest(unittest.TestCase):
+    """Tests for matching output incrementally."""
+
+    def _match(self, chunks, comparison_type='exact match',
+               case_sensitive=True, command_pass=None, command_fail=None,
+               **kwargs):
+        matcher = runner.OutputMatcher(comparison_type, case_sensitive,
+                                    command_pass=command_pass,
+                                    command_fail=command_fail, **kwargs)
+        for chunk in chunks:
+            if matcher.feed(chunk):
+                break
+        return matcher
+
+    def test_same_as_buffered(self):
+        """Results should not depend on how the output is split into chunks."""
+        outputs = ['', '1', '0', ' 1\n', '\n\n1  \n', '10', '01', '1 0',
+                   'On', 'ON\n', 'on \t', ' o n', 'enabled\n', 'Enabled',
+                   'disabled', 'enabled and more', '  \n  ']
+        conditions = [('1', '0'), ('on', None), (None, 'on'),
+                      ('1 0', '0'), ('enabled', 'disabled'), ('0', '01')]
+        for output in outputs:
+            for command_pass, command_fail in conditions:
+                for case_sensitive in (True, False):
+                    expected = _match_buffered(
+                        output, 'exact match', case_sensitive, command_pass,
+                        command_fail)
+                    for size in range(1, 4):
+                        chunks = [output[i:i + size]
+                                  for i in range(0, len(output), size)]
+                        self.assertEqual(
+                            self._match(chunks, case_sensitive=case_sensitive,
+                                        command_pass=command_pass,
+                                        command_fail=command_fail).finish(),
+                            expected, repr((output, command_pass, command_fail,
+                                            case_sensitive, size)))
+
+        for pattern in (r'.*abled', r'^[0-9]+$', r'On', r'(on|off)\s+x'):
+            for output in outputs + ['on\t x', '123', '12 3']:
+                for case_sensitive in (True, False):
+                    self.assertEqual(
+                        self._match([output[i:i + 2] for i in
+                                     range(0, len(output), 2)],
+                                    comparison_type='regex match',
+                                    case_sensitive=case_sensitive,
+                                    command_pass=pattern).finish(),
+                        _match_buffered(output, 'regex match', case_sensitive,
+                                        pattern, None))
+
+    def test_exact_early_exit(self):
+        """Exact matches should be decided once the output diverges."""
+        matcher = self._match(['enab', 'x', 'never read'],
+                              command_pass='enabled', command_fail='disabled')
+        self.assertTrue(matcher.decided)
+        self.assertEqual(matcher.length, 5)
+        self.assertEqual(matcher.finish(), runner.CheckResult.no_pass)
+
+        matcher = self._match(['1\n2\n', 'never read'], command_pass='1',
+                              command_fail='0')
+        self.assertEqual(matcher.length, 4)
+        self.assertEqual(matcher.finish(), runner.CheckResult.no_pass)
+
+    def test_exact_trailing_whitespace(self):
+        """Any amount of trailing whitespace should be ignored."""
+        matcher = self._match(['1'] + [' \n'] * 10000, command_pass='1')
+        self.assertFalse(matcher.decided)
+        self.assertLessEqual(len(matcher.output), 2)
+        self.assertEqual(matcher.finish(), runner.CheckResult.explicit_pass)
+        matcher = self._match(['1', ' ' * 100, '1'], command_pass='1 1')
+        self.assertTrue(matcher.decided)
+        self.assertEqual(matcher.finish(), runner.CheckResult.no_pass)
+
+    def test_regex_window(self):
+        """Regexes should only be matched on a bounded window of output."""
+        matcher = self._match(['x' * 60, 'needle' + 'x' * 60, 'never read'],
+                              comparison_type='regex match',
+                              command_pass='.*needle', window=100)
+        self.assertTrue(matcher.decided)
+        self.assertEqual(matcher.finish(), runner.CheckResult.explicit_pass)
+        matcher = self._match(['x' * 60, 'x' * 60, 'needle'],
+                              comparison_type='regex match',
+                              command_pass='.*needle', window=100)
+        self.assertEqual(matcher.finish(), runner.CheckResult.no_pass)
+
+    def test_capture_limit(self):
+        """Only a bounded prefix of the output should be kept for logs."""
+        matcher = self._match(['abc', 'def', 'ghi'],
+                              comparison_type='regex match',
+                              command_pass='x', capture_limit=5)
+        self.assertEqual(matcher.captured_output(),
+                         'abcde... [4 more bytes not shown]')
+        matcher = self._match(['abc'], command_pass='abc')
+        self.assertEqual(matcher.captured_output(), 'abc')
+
+    def test_invalid_comparison_type(self):
+        """Unknown comparison types should be rejected."""
+        with self.assertRaises(ValueError):
+            runner.OutputMatcher('fuzzy match', True, command_pass='1')
+
+    def test_command_terminated(self):
+        """A command should be terminated once the result is decided."""
+        executor = runner.ShellExecutor(output=ListOutput())
+        started = time.time()
+        matcher = runner.OutputMatcher('exact match', True, command_pass='1')
+        executor.match('yes', matcher)
+        self.assertTrue(matcher.decided)
+        self.assertEqual(matcher.finish(), runner.CheckResult.no_pass)
+
+        matcher = runner.OutputMatcher('exact match', True, command_pass='1')
+        executor.match('echo " 1 "', matcher)
+        self.assertFalse(matcher.decided)
+        self.assertEqual(matcher.finish(), runner.CheckResult.explicit_pass)
+        self.assertLess(time.time() - started, 5)
+        #"yes" is executed directly, "echo" is a shell builtin
+        self.assertEqual(executor.processes_spawned(), 3)
+
+    def test_shell_free_argv(self):
+        """Only commands that need no shell features should be executed
+        without a shell."""
+        self.assertEqual(
+            runner.shell_free_argv(const.API_PREFIX + 'defaults read '
+                                   'com.apple.dock "auto hide" \'\''),
+            ('defaults', 'read', 'com.apple.dock', 'auto hide', ''))
+        for command in ('java -version 2>&1 | grep version', 'echo 1',
+                        'java_is_installed', 'ls ~/Library', 'ls *.plist',
+                        'PATH=/bin ls', 'ls "$HOME"', 'ls; ls', 'ls \\;',
+                        'ls "unterminated'):
+            self.assertIsNone(runner.shell_free_argv(command), command)
+
+    def test_shell_free_execution(self):
+        """Commands should behave the same with or without a shell."""
+        executor = runner.ShellExecutor(output=ListOutput())
+        self.assertEqual(executor.run_status("printf '%s|' 'a  b' c"),
+                         (0, 'a  b|c|'))
+        self.assertEqual(executor.run_status('/bin/echo "a  b" c'),
+                         (0, 'a  b c\n'))
+        self.assertEqual(executor.processes_spawned(), 3)
+        self.assertEqual(executor.shells_avoided(), 1)
+        status, _ = executor.run_status('no-such-command-for-osx-config-check')
+        self.assertEqual(status, 127)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(FixTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(OutputMatcherTest)
+suite3 = unittest.TestLoader().loadTestsFromTestCase(ReadConfigTest)
+suite4 = unittest.TestLoader().loadTestsFromTestCase(RunnerTest)
+suite5 = unittest.TestLoader().loadTestsFromTestCase(CassetteRunTest)
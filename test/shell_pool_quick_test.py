@@ -0,0 +1,108 @@
+"""Unit tests for shell_pool.py."""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import threading
+import const #const.py
+import runner #runner.py
+import shell_pool #shell_pool.py
+from .helpers import ListOutput
+
+class ShellWorkerTest(unittest.TestCase):
+    """Tests for running commands in a warm shell."""
+
+    def setUp(self):
+        self.worker = shell_pool.ShellWorker()
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_output_and_status(self):
+        """The output and exit status should be exactly those of the
+        command."""
+        self.assertEqual(self.worker.run('echo on'), (0, 'on\n'))
+        self.assertEqual(self.worker.run('printf off'), (0, 'off'))
+        self.assertEqual(self.worker.run('echo "$1" >&2; exit 3'), (3, '\n'))
+        self.assertEqual(self.worker.run("cat <<'EOF'\nline\nEOF"),
+                         (0, 'line\n'))
+        status, output = self.worker.run('head -c 300000 /dev/zero')
+        self.assertEqual((status, len(output)), (0, 300000))
+
+    def test_isolation(self):
+        """A command should not affect the commands after it."""
+        self.worker.run('cd /; SETTING=1; exit 0')
+        self.assertEqual(self.worker.run('echo "[$SETTING]"'), (0, '[]\n'))
+        self.assertNotEqual(self.worker.run('pwd'), (0, '/\n'))
+        self.assertEqual(self.worker.run('echo still running'),
+                         (0, 'still running\n'))
+
+    def test_api_sourced(self):
+        """The functions of the API script should be defined."""
+        self.assertEqual(self.worker.run('type -t homebrew_is_installed'),
+                         (0, 'function\n'))
+
+class ShellPoolTest(unittest.TestCase):
+    """Tests for executing commands in a pool of warm shells."""
+
+    def setUp(self):
+        self.pool = shell_pool.ShellPool(
+            3, runner.ShellExecutor(output=ListOutput()))
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_reuse(self):
+        """Commands should reuse the workers, however many there are."""
+        results = []
+        def _run():
+            for index in range(5):
+                results.append(self.pool.run_status(
+                    const.API_PREFIX + 'echo %d' % index))
+        threads = [threading.Thread(target=_run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results),
+                         sorted([(0, '%d\n' % index) for index in range(5)] *
+                                4))
+        self.assertLessEqual(len(self.pool._idle), 3)
+        self.assertEqual(self.pool.processes_spawned(),
+                         20 + len(self.pool._idle))
+
+    def test_worker_exited(self):
+        """A command whose worker exited should be executed by the fallback
+        executor."""
+        self.pool.run_status('true')
+        worker = self.pool._idle[0]
+        worker.process.kill()
+        worker.process.wait()
+        self.assertEqual(self.pool.run_status("sh -c 'echo fallback'"),
+                         (0, 'fallback\n'))
+        self.assertEqual(self.pool.fallback.processes_spawned(), 1)
+        self.assertEqual(self.pool.run_status('echo warm'), (0, 'warm\n'))
+
+    def test_broken_worker_stopped(self):
+        """A worker that failed should be stopped, not left running."""
+        self.pool.run_status('true')
+        worker = self.pool._idle[0]
+        def broken(_command):
+            raise shell_pool.WorkerError("Broken.")
+        worker.run = broken
+        self.assertEqual(self.pool.run_status("sh -c 'echo fallback'"),
+                         (0, 'fallback\n'))
+        self.assertIsNotNone(worker.process.returncode)
+        self.assertEqual(self.pool._idle, [])
+
+    def test_refresh(self):
+        """The workers should be restarted when the API script changes."""
+        self.pool.run_status('true')
+        self.assertFalse(self.pool.refresh())
+        self.assertEqual(len(self.pool._idle), 1)
+        self.pool._api_stamp = None
+        self.assertTrue(self.pool.refresh())
+        self.assertEqual(len(self.pool._idle), 0)
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(ShellWorkerTest)
+suite2 = unittest.TestLoader().loadTestsFromTestCase(ShellPoolTest)
@@ -0,0 +1,92 @@
+"""Unit tests for sudo_helper.py.
+
+A stub `sudo` that simply executes its arguments stands in for the real one, so
+these tests run without privileges, on Linux as well as OS X.
+"""
+
+# pylint: disable=invalid-name, protected-access
+
+import unittest
+import os
+import shutil
+import stat
+import json
+import tempfile
+from StringIO import StringIO
+import sudo_helper #sudo_helper.py
+
+class SudoHelperTest(unittest.TestCase):
+    """Tests for running commands through the helper."""
+
+    def setUp(self):
+        self.stub_dir = tempfile.mkdtemp()
+        self.stub_log = os.path.join(self.stub_dir, 'invocations')
+        stub_sudo = os.path.join(self.stub_dir, 'sudo')
+        with open(stub_sudo, 'w') as stub_file:
+            stub_file.write('#!/bin/sh\necho "$@" >> "%s"\nexec "$@"\n' %
+                            self.stub_log)
+        os.chmod(stub_sudo, stat.S_IRWXU)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.stub_dir + os.pathsep + self.path
+        self.helper = sudo_helper.SudoHelper()
+
+    def tearDown(self):
+        self.helper.close()
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.stub_dir)
+
+    def _invocations(self):
+        with open(self.stub_log, 'r') as log_file:
+            return log_file.read().splitlines()
+
+    def test_single_sudo_for_many_commands(self):
+        """All commands should share one helper started by one sudo."""
+        self.assertFalse(self.helper.started)
+        outputs = [self.helper.run('echo $PPID')[1] for _ in range(3)]
+        self.assertTrue(self.helper.started)
+        self.assertEqual(len(set(outputs)), 1)
+        self.assertEqual(len(self._invocations()), 1)
+
+        #sudo within commands runs inside the helper's process tree
+        self.assertEqual(self.helper.run('sudo echo nested'), (0, 'nested\n'))
+        self.assertEqual(len(self._invocations()), 2)
+
+    def test_status_and_output(self):
+        """Exit statuses, stderr and binary output should come back intact."""
+        self.assertEqual(self.helper.run('echo out; echo err >&2; exit 3'),
+                         (3, 'out\nerr\n'))
+        self.assertEqual(self.helper.run("printf '\\000\\377\\n5 6\\n'"),
+                         (0, '\x00\xff\n5 6\n'))
+        self.assertEqual(self.helper.run('cat'), (0, ''))
+
+    def test_user_environment(self):
+        """Commands should see the invoking user's home directory."""
+        self.assertEqual(self.helper.run('echo ~')[1].strip(),
+                         os.path.expanduser('~'))
+
+    def test_root_path(self):
+        """Commands should not find programs in the invoking user's PATH."""
+        infile, outfile = StringIO(), StringIO()
+        sudo_helper.write_message(infile, 'env', json.dumps(
+            {'PATH': self.stub_dir, 'HOME': self.stub_dir}))
+        sudo_helper.write_message(infile, 'run', 'echo "$PATH"; echo ~')
+        infile.seek(0)
+        sudo_helper.serve(infile, outfile)
+        outfile.seek(0)
+        sudo_helper.read_message(outfile) #the acknowledgement
+        self.assertEqual(sudo_helper.read_message(outfile),
+                         ('0', '%s\n%s\n' % (os.environ['PATH'],
+                                               self.stub_dir)))
+
+    def test_helper_failure(self):
+        """A helper that cannot start should raise `HelperError`."""
+        helper = sudo_helper.SudoHelper(sudo_command=('false',))
+        with self.assertRaises(sudo_helper.HelperError):
+            helper.run('echo never')
+        self.assertFalse(helper.started)
+        helper = sudo_helper.SudoHelper(
+            sudo_command=(os.path.join(self.stub_dir, 'missing'),))
+        with self.assertRaises(sudo_helper.HelperError):
+            helper.run('echo never')
+
+suite1 = unittest.TestLoader().loadTestsFromTestCase(SudoHelperTest)